@@ -10,11 +10,25 @@ including configuration loading, file discovery, parallel processing, and output
 
 import os
 import time
-from config_manager import ConfigManager
-from file_system import get_all_file_paths, create_directory_structure, cleanup_temp_files
+import argparse
+from config_manager import ConfigManager, get_output_profiles
+from file_system import (
+    discover_source_files, select_source_files, get_excluded_groups, get_group_key, get_shard_index,
+    get_shard_suffix, create_directory_structure, cleanup_temp_files, get_run_file_path
+)
 from parallel_processor import process_files_parallel, validate_parallel_config
-from memory_manager import chunked_memory_efficient_processing
+from autotuner import autotune_parameters
+from memory_manager import chunked_memory_efficient_processing, create_worker_pool
+from run_journal import RunJournal, remove_partial_outputs
+from manifest import RunManifest, merge_shard_manifests
+from distributed import parse_address, get_authkey, serve_work_units, run_worker_node
+from family_index import build_family_index
+from stage_metrics import write_metrics_report
+from profiling import prepare_profile_dir, write_profile_report
+from progress import start_metrics_server, stop_metrics_server
 from utils import setup_logging, log_system_info, format_duration
+from sampling import parse_sample_size
+from constants import METRICS_REPORT_NAME, PROFILE_DIR_NAME
 
 # Initialize logging
 logger = setup_logging()
@@ -33,22 +47,46 @@ def log_configuration(config):
     
     # Paths
     logger.info("PATHS:")
-    logger.info(f"  Input directory: {config['vertical_origin_path']}")
+    if config.get('archive_origin_path'):
+        logger.info(f"  Input archives: {config['archive_origin_path']}")
+    else:
+        logger.info(f"  Input directory: {config['vertical_origin_path']}")
     logger.info(f"  Output directory: {config['destination_path']}")
-    logger.info(f"  Patent office: {config['patent_office']}")
+    logger.info(f"  Patent offices: {', '.join(config['patent_offices'])}")
+    if config.get('shard'):
+        logger.info(f"  Shard: {config['shard'][0]} of {config['shard'][1]}")
+    if config.get('sample_size'):
+        sample_size = config['sample_size']
+        sample_label = f"{sample_size * 100:g}%" if isinstance(sample_size, float) else f"{sample_size} patent groups"
+        logger.info(f"  Sample: {sample_label}, seed {config['sample_seed']}, stratified by {config['sample_stratify']}")
     
     # Processing options
     logger.info("PROCESSING OPTIONS:")
     logger.info("  XML Processing: Virtual patents with full hierarchy preservation")
-    logger.info(f"  Max text length: {config['max_text_length']}")
-    logger.info(f"  Output formats: {', '.join(config['output_formats'])}")
+    if config['fusion_level'] == 'family':
+        office_order = config['family_office_order'] or config['patent_offices']
+        logger.info(f"  Fusion level: family (publications in office order {', '.join(office_order)})")
+    else:
+        logger.info("  Fusion level: publication")
+    if config['output_profiles']:
+        for profile_config in get_output_profiles(config):
+            logger.info(f"  Output profile '{profile_config['name']}': {', '.join(profile_config['output_formats'])}, "
+                        f"max text length {profile_config['max_text_length']}, "
+                        f"languages {profile_config.get('parse_lang', 'ALL')} -> {profile_config['destination_path']}")
+    else:
+        logger.info(f"  Max text length: {config['max_text_length']}")
+        logger.info(f"  Output formats: {', '.join(config['output_formats'])}")
     
     # Performance settings
     logger.info("PERFORMANCE SETTINGS:")
-    logger.info(f"  CPU cores: {config['cpu_count']}")
-    logger.info(f"  Batch size: {config['batch_size']}")
-    logger.info(f"  Chunk size: {config['chunk_size']}")
+    # AUTO parameters start from these values and are tuned during the warm-up
+    for key, label in [('cpu_count', 'CPU cores'), ('batch_size', 'Batch size'), ('chunk_size', 'Chunk size')]:
+        auto_note = " (AUTO, tuned at warm-up)" if key in config['autotune_params'] else ""
+        logger.info(f"  {label}: {config[key]}{auto_note}")
+    logger.info(f"  Executor backend: {config['executor_backend']}")
+    logger.info(f"  Worker pinning: {'Enabled' if config['pin_workers'] else 'Disabled'}")
     logger.info(f"  Memory limit: {config['memory_limit']}GB")
+    logger.info(f"  Worker memory limit: {config['worker_memory_limit']:.2f}GB" if config['worker_memory_limit'] else "  Worker memory limit: disabled")
     
     # Parse flags for output filtering
     logger.info("OUTPUT FILTER FLAGS:")
@@ -74,22 +112,132 @@ def log_configuration(config):
     logger.info("=" * 50)
 
 
-def main():
+def parse_shard(value):
+    """
+    Parse a --shard value of the form i/N (1 <= i <= N)
+    
+    Args:
+        value (str): Command line value
+        
+    Returns:
+        tuple: (shard_index, shard_count)
+    """
+    try:
+        shard_index, shard_count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid shard '{value}', expected i/N (e.g. 2/4)")
+    if not 1 <= shard_index <= shard_count:
+        raise argparse.ArgumentTypeError(f"invalid shard '{value}', i must be between 1 and N")
+    return shard_index, shard_count
+
+
+def parse_arguments(argv=None):
+    """
+    Parse the command line
+    
+    Args:
+        argv (list, optional): Command line arguments (defaults to sys.argv[1:])
+        
+    Returns:
+        argparse.Namespace: Parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="Create virtual patents from the WPI dataset")
+    parser.add_argument('config_path', nargs='?', default=None, help="Configuration file (default: config.ini next to this script)")
+    parser.add_argument('--resume', action='store_true',
+                        help="Continue an interrupted run from the run journal in the destination folder")
+    parser.add_argument('--delta', action='store_true',
+                        help="Only fuse patent groups that are new or changed since the previous run's manifest")
+    parser.add_argument('--shard', type=parse_shard, default=None, metavar='i/N',
+                        help="Only process the patent groups whose number hashes into shard i of N")
+    parser.add_argument('--merge-manifests', action='store_true',
+                        help="Check that the shard manifests cover every patent group and merge them into manifest.json")
+    parser.add_argument('--sample', metavar='SIZE', default=None,
+                        help="Only fuse a deterministic sample of the patent groups: a fraction (0.01 or 1%%) or a "
+                             "number of groups; overrides [Sample] sample (0 disables sampling)")
+    parser.add_argument('--coordinator', metavar='HOST:PORT', default=None,
+                        help="Serve the patent groups as leased work units to worker nodes instead of processing them")
+    parser.add_argument('--worker', metavar='HOST:PORT', default=None,
+                        help="Process work units leased from the coordinator at HOST:PORT")
+    parser.add_argument('--profile', action='store_true',
+                        help="Profile every worker with cProfile and merge the statistics into profile/profile.pstats "
+                             "in the destination folder")
+    parser.add_argument('--profile-memory', metavar='N', type=int, default=0,
+                        help="With --profile: take a tracemalloc snapshot every N patent groups and write the top "
+                             "allocation sites to profile/allocations.txt")
+    args = parser.parse_args(argv)
+    if args.profile_memory and not args.profile:
+        parser.error("--profile-memory requires --profile")
+    if args.profile_memory < 0:
+        parser.error("--profile-memory must not be negative")
+    if args.merge_manifests and (args.shard or args.resume or args.delta):
+        parser.error("--merge-manifests cannot be combined with --shard, --resume or --delta")
+    if args.worker and (args.coordinator or args.shard or args.resume or args.delta or args.merge_manifests):
+        parser.error("--worker takes its work from the coordinator and cannot be combined with other run options")
+    if args.sample is not None:
+        try:
+            parse_sample_size(args.sample)
+        except ValueError as e:
+            parser.error(str(e))
+    for address in (args.coordinator, args.worker):
+        if address:
+            try:
+                parse_address(address)
+            except ValueError as e:
+                parser.error(str(e))
+    return args
+
+
+def finish_manifest(manifest, journal):
+    """
+    Write the manifest of a completed run and, in delta mode, the delta report
+    
+    Args:
+        manifest (RunManifest): Inventory of this run
+        journal (RunJournal): Run journal holding the saved outputs and quarantined groups
+    """
+    # Groups that were not parsed and saved stay outdated, so the next delta run fuses them again
+    manifest.save(journal.saved_outputs, journal.get_completed_groups())
+    if manifest.delta:
+        manifest.write_report()
+
+
+def main(argv=None):
     """
     Main orchestration function that coordinates the entire patent processing pipeline
     
+    Args:
+        argv (list, optional): Command line arguments (defaults to sys.argv[1:])
+    
     Returns:
         int: Exit code (0 for success, 1 for error)
     """
     start_time = time.time()
+    pool = None
+    journal = None
+    profile_dir = None
+    metrics_server = None
+    args = parse_arguments(argv)
     
     try:
         # 1. CONFIGURATION LOADING AND VALIDATION
         logger.info("Starting PatentFusion processing...")
         
         # Load configuration
-        config_manager = ConfigManager()
+        if args.config_path and not os.path.exists(args.config_path):
+            logger.error(f"Configuration file not found: {args.config_path}")
+            return 1
+        config_manager = ConfigManager(args.config_path)
         config = config_manager.get_all()
+        config['shard'] = args.shard
+        if args.sample is not None:
+            config['sample_size'] = parse_sample_size(args.sample)
+        if args.shard:
+            # Shards share the destination folder but each keeps its own temp files
+            config['temp_dir'] = f"{config['temp_dir']}{get_shard_suffix(args.shard)}"
+        if args.profile:
+            # Workers profile their tasks into this folder (see profiling.py)
+            config['profile_dir'] = get_run_file_path(config, PROFILE_DIR_NAME)
+            config['profile_memory_interval'] = args.profile_memory
         
         # Log configuration
         log_configuration(config)
@@ -102,40 +250,165 @@ def main():
             logger.error("Invalid parallel processing configuration")
             return 1
         
+        if args.shard and config['fusion_level'] == 'family':
+            # Shards are cut by patent group, so the publications of a family would end up in different shards
+            logger.error("fusion_level = family cannot be combined with --shard (use --coordinator to distribute family fusion)")
+            return 1
+        
+        if args.coordinator or args.worker:
+            # Fail before discovery when the shared secret of a coordinated run is missing
+            try:
+                get_authkey(config, args.coordinator or args.worker)
+            except ValueError as e:
+                logger.error(str(e))
+                return 1
+        
+        if args.worker:
+            # Worker node of a coordinated run: discovery, journal and manifest belong to the coordinator
+            return run_worker_node(args.worker, config)
+        
+        if args.merge_manifests:
+            # Final step of a sharded run: validate coverage against the inventory and merge the shard manifests
+            if config.get('sample_size'):
+                logger.error("Sample runs write no manifests; run --merge-manifests without a sample")
+                return 1
+            pool = create_worker_pool(config)
+            pool.start()
+            all_file_paths, _ = discover_source_files(config, pool)
+            selected_file_paths = select_source_files(all_file_paths, config)
+            return 0 if merge_shard_manifests(config, all_file_paths, selected_file_paths) else 1
+        
         # 2. DIRECTORY SETUP AND VALIDATION
         logger.info("Setting up directory structure...")
         
         # Create necessary directories
         create_directory_structure(config)
         
+        # Open the run journal; when resuming, work out what the interrupted run completed
+        try:
+            journal = RunJournal(config, resume=args.resume)
+        except ValueError as e:
+            logger.error(str(e))
+            return 1
+        skip_groups, resume_temp_files = journal.get_resume_state()
+        if args.resume:
+            removed = remove_partial_outputs(config['destination_path'], shard=args.shard)
+            # Profiles may write outside the destination folder
+            destination = os.path.abspath(config['destination_path'])
+            for profile_config in get_output_profiles(config):
+                profile_destination = os.path.abspath(profile_config['destination_path'])
+                if profile_destination != destination and not profile_destination.startswith(destination + os.sep):
+                    removed += remove_partial_outputs(profile_destination, shard=args.shard)
+            logger.info(f"Resuming run {journal.run_number}: {len(skip_groups)} patent groups already parsed, "
+                       f"{len(resume_temp_files)} temp files left to save, {removed} partially written files removed")
+        
+        # 3. WORKER POOL - created once and shared by discovery, parsing and saving
+        if args.profile:
+            profile_dir = config['profile_dir']
+            prepare_profile_dir(profile_dir)
+        pool = create_worker_pool(config)
+        pool.start()
+        # Live counters for monitoring while the run is going (metrics_port)
+        metrics_server = start_metrics_server(config['metrics_port'])
+        
         # 4. DIRECTORY SCANNING AND FILE DISCOVERY (includes statistics reporting)
-        all_file_paths, folder_order = get_all_file_paths(config['vertical_origin_path'], config['cpu_count'])
+        all_file_paths, folder_order = discover_source_files(config, pool)
+        
+        # Family fusion: index the patent families, so batches and work units hold whole families
+        family_index = build_family_index(all_file_paths, config, pool) if config['fusion_level'] == 'family' else None
+        
+        if args.shard:
+            shard_index, shard_count = args.shard
+            all_file_paths = [file_path for file_path in all_file_paths
+                              if get_shard_index(get_group_key(file_path), shard_count) == shard_index]
+            logger.info(f"Shard {shard_index}/{shard_count}: {len(all_file_paths)} files")
+        
+        # Lists and sample restrict what is fused, not the inventory: groups left out keep their outputs
+        selected_file_paths = select_source_files(all_file_paths, config, family_index)
+        selected_groups = None
+        if selected_file_paths is not all_file_paths:
+            selected_groups = {get_group_key(file_path) for file_path in selected_file_paths}
+        
+        # Excluded groups, unlike groups left out by an include list or the sample, lose their earlier outputs
+        excluded_groups = get_excluded_groups(all_file_paths, config, family_index) if args.delta else set()
+        
+        # Compare the inventory against the previous run's manifest; in delta mode only changed groups are fused
+        manifest = RunManifest(config, all_file_paths, delta=args.delta, selected_groups=selected_groups,
+                               excluded_groups=excluded_groups)
+        if selected_groups is not None:
+            logger.info(f"{len(set(manifest.inventory) - selected_groups - excluded_groups)} discovered patent groups "
+                        f"are not fused in this run; their outputs from earlier runs are kept")
+        all_file_paths = selected_file_paths
+        if args.delta:
+            if family_index is not None:
+                # A family is fused again as a whole when any of its publications was added, changed or removed
+                manifest.mark_updated(family_index.expand_groups(manifest.get_changed_groups() | manifest.removed))
+            changed_groups = manifest.get_changed_groups()
+            # Outputs of groups already re-fused by an interrupted delta run are kept
+            deleted = manifest.remove_outputs((manifest.updated - skip_groups) | manifest.removed | manifest.excluded)
+            logger.info(f"Delta mode: {len(changed_groups)} of {len(manifest.inventory)} patent groups new or changed, "
+                       f"{len(manifest.removed)} removed, {len(manifest.excluded)} excluded "
+                       f"({deleted} outdated output files deleted)")
+            all_file_paths = [file_path for file_path in all_file_paths if get_group_key(file_path) in changed_groups]
+        
+        if skip_groups:
+            # Groups parsed by the interrupted run are not parsed again
+            all_file_paths = [file_path for file_path in all_file_paths if get_group_key(file_path) not in skip_groups]
         
         total_files = len(all_file_paths)
-        if total_files == 0:
-            logger.warning("No XML files found to process")
+        if total_files == 0 and not resume_temp_files:
+            if args.delta:
+                logger.info("No new or changed patent groups to fuse")
+                finish_manifest(manifest, journal)
+                cleanup_temp_files([], config['temp_dir'])
+            else:
+                logger.warning("No XML files found to process")
+            return 0
+        
+        if args.coordinator:
+            # 5-7. Worker nodes parse and save the work units; the coordinator only hands them out
+            if resume_temp_files:
+                chunked_memory_efficient_processing(resume_temp_files, config, pool=pool, journal=journal)
+            # Free this machine's cores for a worker node running next to the coordinator
+            pool.close()
+            pool = None
+            if not serve_work_units(args.coordinator, all_file_paths, folder_order, config, journal, family_index):
+                return 1
+            finish_manifest(manifest, journal)
+            cleanup_temp_files([], config['temp_dir'])
             return 0
         
-        # 5. PARALLEL PROCESSING AND BATCH CREATION
+        # 5. THROUGHPUT AUTOTUNING (batch_size, cpu_count and chunk_size set to AUTO)
+        warmup_temp_files, remaining_file_paths = autotune_parameters(all_file_paths, folder_order, config,
+                                                                      pool=pool, journal=journal,
+                                                                      family_index=family_index)
         
-        # Process files in parallel
-        all_temp_files = process_files_parallel(
-            all_file_paths, 
+        # 6. PARALLEL PROCESSING AND BATCH CREATION
+        
+        # Process files in parallel (files processed during the warm-up are not repeated)
+        all_temp_files = resume_temp_files + warmup_temp_files + process_files_parallel(
+            remaining_file_paths, 
             folder_order, 
-            config
+            config,
+            pool=pool,
+            journal=journal,
+            family_index=family_index
         )
         
         if not all_temp_files:
             logger.warning("No temporary files generated from processing")
+            finish_manifest(manifest, journal)
             return 0
         
-        # 6. MEMORY-EFFICIENT MERGING AND OUTPUT GENERATION
+        # 7. MEMORY-EFFICIENT MERGING AND OUTPUT GENERATION
         logger.info(f"Starting memory-efficient processing and output generation with {config['memory_limit']}GB memory limit")
         
         # Process with memory-efficient approach
         result = chunked_memory_efficient_processing(
             all_temp_files=all_temp_files,
-            config=config
+            config=config,
+            pool=pool,
+            journal=journal
         )
         
         if result != 0:
@@ -143,12 +416,13 @@ def main():
             return 1
         
         logger.info("Memory-efficient processing completed successfully")
+        finish_manifest(manifest, journal)
         
-        # 7. CLEANUP - Only clean up remaining files (intermediate CSVs, etc.)
+        # 8. CLEANUP - Only clean up remaining files (intermediate CSVs, etc.)
         # Temp files are now deleted immediately after processing to save disk space
         cleanup_temp_files([], config['temp_dir'])  # Empty list since temp files already deleted
         
-        # 8. FINAL SUMMARY
+        # 9. FINAL SUMMARY
         end_time = time.time()
         total_time = end_time - start_time
         
@@ -157,10 +431,15 @@ def main():
         logger.info("=" * 50)
         logger.info(f"Total files processed: {total_files}")
         logger.info(f"Total processing time: {format_duration(total_time)}")
-        logger.info(f"Average time per file: {total_time/total_files:.4f} seconds")
+        if total_files:
+            logger.info(f"Average time per file: {total_time/total_files:.4f} seconds")
+        # Stage times, throughput and the slowest patents and files of all workers
+        write_metrics_report(pool.stage_metrics, get_run_file_path(config, METRICS_REPORT_NAME), total_time,
+                             config['prometheus_metrics_file'])
         logger.info(f"Output directory: {config['destination_path']}")
-        logger.info(f"Output formats: {', '.join(config['output_formats'])}")
-        logger.info(f"Individual VPatent files saved to: {config['individual_vp_dir']}")
+        for profile_config in get_output_profiles(config):
+            logger.info(f"Output formats: {', '.join(profile_config['output_formats'])}")
+            logger.info(f"Individual VPatent files saved to: {profile_config['individual_vp_dir']}")
         
         logger.info("PatentFusion processing completed successfully!")
         logger.info("=" * 50)
@@ -174,6 +453,16 @@ def main():
     except Exception as e:
         logger.error(f"Unexpected error during processing: {str(e)}", exc_info=True)
         return 1
+    
+    finally:
+        stop_metrics_server(metrics_server)
+        if pool is not None:
+            pool.close()
+        if journal is not None:
+            journal.close()
+        if profile_dir is not None:
+            # Workers have dumped their statistics once the pool is closed
+            write_profile_report(profile_dir)
 
 
 def validate_environment():
@@ -213,17 +502,4 @@ if __name__ == "__main__":
     if not validate_environment():
         sys.exit(1)
     
-    # Handle command line arguments
-    if len(sys.argv) > 1:
-        config_path = sys.argv[1]
-        if os.path.exists(config_path):
-            # Use custom config path - simplified approach
-            logger.info(f"Using configuration file: {config_path}")
-            exit_code = main()  # Note: This will still use default config, but user can modify config.ini manually
-        else:
-            logger.error(f"Configuration file not found: {config_path}")
-            exit_code = 1
-    else:
-        exit_code = main()
-    
-    sys.exit(exit_code)
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
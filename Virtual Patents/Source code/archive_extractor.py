@@ -0,0 +1,320 @@
+# Licensed under the MIT License. See LICENSE-CODE in the repository root for details.
+# Copyright (c) 2025 Christos Papadopoulos
+
+"""
+Archive Extractor for PatentFusion
+
+This module extracts the WPI 7z/zip archives in parallel (one archive per worker),
+keeping only the members of the selected offices, kind codes and date folders and
+writing them directly into the Office/Date/Kind/... layout used by PatentFusion.
+Completed archives are recorded in an extraction log so an interrupted run can be
+resumed.
+
+Usage:
+    python archive_extractor.py /path/to/WPI/7z /path/to/WPI-Dataset --offices EP,WO --kinds A1,B1
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import zipfile
+import logging
+import argparse
+import multiprocessing
+from constants import VALID_PATENT_OFFICES
+from archive_source import find_archives, list_archive_members, py7zr
+from utils import setup_logging, format_duration, ensure_directory_exists, get_effective_cpu_count
+
+logger = logging.getLogger(__name__)
+
+# Name of the resume log written to the destination directory
+EXTRACTION_LOG_NAME = "extraction_log.jsonl"
+
+
+def parse_member_layout(member_name):
+    """
+    Locate the Office/Date/Kind components of an archive member name
+
+    Args:
+        member_name (str): Member name inside the archive (e.g. 'WPI/EP/20140108/A1/000002/61/57/47/EP-2615747-A1.xml')
+
+    Returns:
+        tuple: (office, date_folder, kind_code, relative_path) or None if the member
+            does not follow the WPI layout. relative_path starts at the office folder.
+    """
+    parts = [part for part in member_name.split('/') if part]
+    for index, part in enumerate(parts):
+        if part in VALID_PATENT_OFFICES and index + 3 < len(parts):
+            return part, parts[index + 1], parts[index + 2], '/'.join(parts[index:])
+    return None
+
+
+def member_matches_filters(layout, filters):
+    """
+    Check if a member's Office/Date/Kind matches the selected filters
+
+    Args:
+        layout (tuple): Result of parse_member_layout
+        filters (dict): Dictionary with optional 'offices', 'kinds' and 'dates' lists
+
+    Returns:
+        bool: True if the member should be extracted
+    """
+    office, date_folder, kind_code, relative_path = layout
+    if not relative_path.endswith('.xml'):
+        return False
+    if filters.get('offices') and office not in filters['offices']:
+        return False
+    if filters.get('kinds') and kind_code not in filters['kinds']:
+        return False
+    if filters.get('dates') and date_folder not in filters['dates']:
+        return False
+    return True
+
+
+def get_archive_signature(archive_path, filters):
+    """
+    Build the record used to recognise an archive that was already extracted
+
+    Args:
+        archive_path (str): Path to the archive
+        filters (dict): Selected filters
+
+    Returns:
+        dict: Signature with archive path, size, mtime and filters
+    """
+    stat = os.stat(archive_path)
+    return {
+        'archive': os.path.abspath(archive_path),
+        'size': stat.st_size,
+        'mtime': int(stat.st_mtime),
+        'filters': {key: sorted(value) for key, value in filters.items() if value}
+    }
+
+
+def load_completed_archives(destination_path):
+    """
+    Load the signatures of archives completed by previous runs
+
+    Args:
+        destination_path (str): Extraction destination directory
+
+    Returns:
+        list: List of signature dictionaries
+    """
+    log_path = os.path.join(destination_path, EXTRACTION_LOG_NAME)
+    completed = []
+    if not os.path.exists(log_path):
+        return completed
+
+    with open(log_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                completed.append(record['signature'])
+            except (ValueError, KeyError):
+                # Ignore a truncated last line from an interrupted run
+                continue
+    return completed
+
+
+def _install_file(source_path, target_path):
+    """Move an extracted file into its final location"""
+    ensure_directory_exists(os.path.dirname(target_path))
+    os.replace(source_path, target_path)
+
+
+def extract_archive(extract_args):
+    """
+    Extract the selected members of one archive into the Office/Date/Kind layout
+
+    Members already present with the expected size are skipped, so a partially
+    extracted archive continues where it stopped.
+
+    Args:
+        extract_args (tuple): (archive_path, destination_path, filters)
+
+    Returns:
+        dict: Per-archive report with counts, sizes, duration and throughput
+    """
+    archive_path, destination_path, filters = extract_args
+    start_time = time.time()
+    report = {
+        'archive': archive_path,
+        'members_selected': 0,
+        'members_extracted': 0,
+        'members_skipped': 0,
+        'bytes_extracted': 0,
+        'error': None
+    }
+
+    try:
+        # Select members and drop those that already exist from a previous partial run
+        pending = {}
+        for member_name, size in list_archive_members(archive_path):
+            layout = parse_member_layout(member_name)
+            if layout is None or not member_matches_filters(layout, filters):
+                continue
+            report['members_selected'] += 1
+            target_path = os.path.join(destination_path, *layout[3].split('/'))
+            if os.path.exists(target_path) and os.path.getsize(target_path) == size:
+                report['members_skipped'] += 1
+                continue
+            pending[member_name] = (target_path, size)
+
+        if pending and archive_path.lower().endswith('.zip'):
+            with zipfile.ZipFile(archive_path) as archive:
+                for member_name, (target_path, size) in pending.items():
+                    # Write to a temporary name first so partial files are never mistaken for complete ones
+                    temp_path = f"{target_path}.part"
+                    ensure_directory_exists(os.path.dirname(target_path))
+                    with archive.open(member_name) as source, open(temp_path, 'wb') as target:
+                        shutil.copyfileobj(source, target)
+                    os.replace(temp_path, target_path)
+                    report['members_extracted'] += 1
+                    report['bytes_extracted'] += size
+
+        elif pending:
+            if py7zr is None:
+                raise ImportError(f"Extracting {archive_path} requires the 'py7zr' package (pip install py7zr)")
+
+            # Extract in a single decompression pass into a staging folder on the same filesystem,
+            # then move each member into place (a rename, not a copy)
+            staging_dir = os.path.join(destination_path, '.staging', os.path.basename(archive_path))
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            ensure_directory_exists(staging_dir)
+            with py7zr.SevenZipFile(archive_path, mode='r') as archive:
+                archive.extract(path=staging_dir, targets=list(pending.keys()))
+
+            for member_name, (target_path, size) in pending.items():
+                staged_path = os.path.join(staging_dir, *member_name.split('/'))
+                if os.path.exists(staged_path):
+                    _install_file(staged_path, target_path)
+                    report['members_extracted'] += 1
+                    report['bytes_extracted'] += size
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+    except Exception as e:
+        report['error'] = str(e)
+
+    report['duration_seconds'] = time.time() - start_time
+    report['throughput_mb_s'] = (report['bytes_extracted'] / (1024 * 1024)) / max(report['duration_seconds'], 1e-9)
+    report['throughput_files_s'] = report['members_extracted'] / max(report['duration_seconds'], 1e-9)
+    return report
+
+
+def extract_archives(archive_root, destination_path, filters=None, cpu_count=None, resume=True):
+    """
+    Extract all archives in archive_root in parallel
+
+    Args:
+        archive_root (str): Directory containing WPI archives (or a single archive)
+        destination_path (str): Destination root; files are written to Office/Date/Kind/...
+        filters (dict, optional): Optional 'offices', 'kinds' and 'dates' lists
+        cpu_count (int, optional): Number of worker processes. If None, uses all available.
+        resume (bool): Skip archives recorded as completed in the extraction log
+
+    Returns:
+        list: Per-archive reports
+    """
+    filters = filters or {}
+    if cpu_count is None:
+        cpu_count = get_effective_cpu_count()
+
+    ensure_directory_exists(destination_path)
+    archives = find_archives(archive_root)
+    if not archives:
+        logger.warning(f"No archives found in {archive_root}")
+        return []
+
+    # Skip archives that were fully extracted with the same filters
+    completed = load_completed_archives(destination_path) if resume else []
+    pending_archives = []
+    for archive_path in archives:
+        if get_archive_signature(archive_path, filters) in completed:
+            logger.info(f"Skipping already extracted archive: {archive_path}")
+        else:
+            pending_archives.append(archive_path)
+
+    logger.info(f"Extracting {len(pending_archives)} of {len(archives)} archives with {min(cpu_count, max(1, len(pending_archives)))} workers")
+    start_time = time.time()
+    reports = []
+    log_path = os.path.join(destination_path, EXTRACTION_LOG_NAME)
+
+    if pending_archives:
+        extract_args = [(archive_path, destination_path, filters) for archive_path in pending_archives]
+        with multiprocessing.Pool(processes=min(cpu_count, len(pending_archives))) as pool, \
+                open(log_path, 'a', encoding='utf-8') as log_file:
+            # Report each archive as soon as it finishes
+            for report in pool.imap_unordered(extract_archive, extract_args):
+                reports.append(report)
+                if report['error']:
+                    logger.error(f"Failed to extract {report['archive']}: {report['error']}")
+                    continue
+
+                logger.info(f"Extracted {report['archive']}: {report['members_extracted']} files "
+                           f"({report['bytes_extracted'] / (1024 * 1024):.2f} MB, {report['members_skipped']} already present) "
+                           f"in {format_duration(report['duration_seconds'])} - "
+                           f"{report['throughput_mb_s']:.2f} MB/s, {report['throughput_files_s']:.1f} files/s")
+
+                # Record completion so a later run can resume
+                record = {'signature': get_archive_signature(report['archive'], filters), 'report': report}
+                log_file.write(json.dumps(record) + "\n")
+                log_file.flush()
+
+    shutil.rmtree(os.path.join(destination_path, '.staging'), ignore_errors=True)
+
+    total_files = sum(report['members_extracted'] for report in reports)
+    total_mb = sum(report['bytes_extracted'] for report in reports) / (1024 * 1024)
+    total_time = time.time() - start_time
+    logger.info(f"Extraction complete: {total_files} files, {total_mb:.2f} MB in {format_duration(total_time)}")
+
+    return reports
+
+
+def _split_list_argument(value):
+    """Split a comma-separated command line value into a list"""
+    return [item.strip() for item in value.split(',') if item.strip()] if value else []
+
+
+def main(argv=None):
+    """
+    Command line entry point
+
+    Args:
+        argv (list, optional): Command line arguments (defaults to sys.argv[1:])
+
+    Returns:
+        int: Exit code (0 for success, 1 for error)
+    """
+    parser = argparse.ArgumentParser(description="Extract WPI archives into the Office/Date/Kind layout used by PatentFusion")
+    parser.add_argument('archive_root', help="Directory containing the WPI .7z/.zip archives (or a single archive)")
+    parser.add_argument('destination_path', help="Root directory for the extracted collection")
+    parser.add_argument('--offices', default='', help="Comma-separated patent offices to extract (e.g. EP,WO)")
+    parser.add_argument('--kinds', default='', help="Comma-separated kind codes to extract (e.g. A1,B1)")
+    parser.add_argument('--dates', default='', help="Comma-separated date folders to extract (e.g. 20140108,20140115)")
+    parser.add_argument('--workers', type=int, default=get_effective_cpu_count(), help="Number of worker processes")
+    parser.add_argument('--no-resume', action='store_true', help="Re-extract archives recorded as completed")
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    filters = {
+        'offices': [office.upper() for office in _split_list_argument(args.offices)],
+        'kinds': [kind.upper() for kind in _split_list_argument(args.kinds)],
+        'dates': _split_list_argument(args.dates)
+    }
+
+    invalid_offices = [office for office in filters['offices'] if office not in VALID_PATENT_OFFICES]
+    if invalid_offices:
+        logger.error(f"Invalid patent office(s): {', '.join(invalid_offices)}. Must be one of: {', '.join(VALID_PATENT_OFFICES)}")
+        return 1
+
+    reports = extract_archives(args.archive_root, args.destination_path, filters,
+                               cpu_count=max(1, args.workers), resume=not args.no_resume)
+    return 1 if any(report['error'] for report in reports) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,439 @@
+# Licensed under the MIT License. See LICENSE-CODE in the repository root for details.
+# Copyright (c) 2025 Christos Papadopoulos
+
+"""
+Archive Source for PatentFusion
+
+This module lets PatentFusion read patent XML files directly from the WPI 7z/zip
+archives or from corpus pack containers (.wpk, see corpus_pack.py), without
+extracting the collection to disk first. Archive members are
+addressed with virtual paths of the form '<archive path>!/<member name>', so the
+rest of the pipeline (grouping, priority sorting, original directory structure)
+keeps working on plain path strings.
+"""
+
+import os
+import zipfile
+import threading
+import logging
+from constants import ARCHIVE_EXTENSIONS, ARCHIVE_MEMBER_SEPARATOR
+from corpus_pack import PACK_EXTENSION, list_pack_members, read_pack_members
+from utils import get_effective_cpu_count
+from worker_pool import WorkerPool, use_pool
+
+try:
+    import py7zr
+except ImportError:
+    # py7zr is only needed when reading .7z archives
+    py7zr = None
+
+logger = logging.getLogger(__name__)
+
+# Per-process cache of member sizes (each worker process keeps its own copy)
+_member_sizes = {}
+
+# Open archives and prefetched members belong to the batch of one worker, so with the
+# thread executor backend every worker thread keeps its own copy
+_thread_caches = threading.local()
+
+
+def _get_thread_cache(name):
+    """Return a cache dictionary private to the current worker thread"""
+    cache = getattr(_thread_caches, name, None)
+    if cache is None:
+        cache = {}
+        setattr(_thread_caches, name, cache)
+    return cache
+
+
+def is_archive_member_path(file_path):
+    """
+    Check if a path is a virtual archive member path
+
+    Args:
+        file_path (str): File path to check
+
+    Returns:
+        bool: True if the path points inside an archive
+    """
+    return ARCHIVE_MEMBER_SEPARATOR in file_path
+
+
+def make_archive_member_path(archive_path, member_name):
+    """
+    Build a virtual path for a member of an archive
+
+    Args:
+        archive_path (str): Path to the archive file
+        member_name (str): Name of the member inside the archive
+
+    Returns:
+        str: Virtual path '<archive path>!/<member name>'
+    """
+    return f"{archive_path}{ARCHIVE_MEMBER_SEPARATOR}{member_name.lstrip('/')}"
+
+
+def split_archive_member_path(file_path):
+    """
+    Split a virtual archive member path into archive path and member name
+
+    Args:
+        file_path (str): Virtual archive member path
+
+    Returns:
+        tuple: (archive_path, member_name)
+    """
+    archive_path, member_name = file_path.split(ARCHIVE_MEMBER_SEPARATOR, 1)
+    return archive_path, member_name
+
+
+def find_archives(archive_root):
+    """
+    Find all supported archives in a directory (or accept a single archive file)
+
+    Args:
+        archive_root (str): Directory containing archives, or a single archive path
+
+    Returns:
+        list: Sorted list of archive file paths
+    """
+    if os.path.isfile(archive_root):
+        return [archive_root] if archive_root.lower().endswith(tuple(ARCHIVE_EXTENSIONS)) else []
+
+    archives = []
+    for root, dirs, files in os.walk(archive_root):
+        dirs.sort()
+        for file in sorted(files):
+            if file.lower().endswith(tuple(ARCHIVE_EXTENSIONS)):
+                archives.append(os.path.join(root, file))
+    return archives
+
+
+def _require_py7zr(archive_path):
+    """Raise a helpful error if a .7z archive is used without py7zr installed"""
+    if py7zr is None:
+        raise ImportError(f"Reading {archive_path} requires the 'py7zr' package (pip install py7zr)")
+
+
+def list_archive_members(archive_path):
+    """
+    List the files stored in an archive together with their uncompressed sizes
+
+    Args:
+        archive_path (str): Path to a .7z or .zip archive, or a .wpk corpus pack container
+
+    Returns:
+        list: List of (member_name, size_in_bytes) tuples in archive order
+    """
+    if archive_path.endswith(PACK_EXTENSION):
+        return list_pack_members(archive_path)
+
+    if archive_path.lower().endswith('.zip'):
+        with zipfile.ZipFile(archive_path) as archive:
+            return [(info.filename, info.file_size) for info in archive.infolist() if not info.is_dir()]
+
+    _require_py7zr(archive_path)
+    with py7zr.SevenZipFile(archive_path, mode='r') as archive:
+        return [(info.filename, info.uncompressed) for info in archive.list() if not info.is_directory]
+
+
+def get_source_file_size(file_path):
+    """
+    Get the uncompressed size of a source file or archive member
+
+    Args:
+        file_path (str): File path or virtual archive member path
+
+    Returns:
+        int: Size in bytes (0 if it cannot be determined)
+    """
+    try:
+        if not is_archive_member_path(file_path):
+            return os.path.getsize(file_path)
+
+        archive_path, member_name = split_archive_member_path(file_path)
+        sizes = _member_sizes.get(archive_path)
+        if sizes is None:
+            sizes = dict(list_archive_members(archive_path))
+            _member_sizes[archive_path] = sizes
+        return sizes.get(member_name, 0)
+    except Exception as e:
+        logger.debug(f"Could not determine size of {file_path}: {e}")
+        return 0
+
+
+def get_source_file_mtime(file_path):
+    """
+    Get the modification time of a source file (of the containing archive for archive members)
+
+    Args:
+        file_path (str): File path or virtual archive member path
+
+    Returns:
+        float: Modification time in seconds since the epoch (0 if it cannot be determined)
+    """
+    try:
+        if is_archive_member_path(file_path):
+            file_path = split_archive_member_path(file_path)[0]
+        return os.path.getmtime(file_path)
+    except OSError as e:
+        logger.debug(f"Could not determine modification time of {file_path}: {e}")
+        return 0
+
+
+def scan_archive(scan_args):
+    """
+    Scan a single archive for XML members of the requested patent offices and collect statistics
+
+    Args:
+        scan_args (tuple): (archive_path, patent_offices)
+
+    Returns:
+        tuple: (archive_path, list_of_member_paths, archive_stats)
+            - archive_stats: dict with file counts and sizes for this archive
+    """
+    archive_path, patent_offices = scan_args
+    file_paths = []
+    archive_stats = {
+        'total_files': 0,
+        'xml_files': 0,
+        'total_size_mb': 0,
+        'xml_file_sizes': []
+    }
+
+    try:
+        for member_name, size in list_archive_members(archive_path):
+            archive_stats['total_files'] += 1
+            size_mb = size / (1024 * 1024)
+            archive_stats['total_size_mb'] += size_mb
+
+            # Only keep XML members that belong to the requested patent offices
+            if member_name.endswith('.xml') and not patent_offices.isdisjoint(member_name.split('/')):
+                file_paths.append(make_archive_member_path(archive_path, member_name))
+                archive_stats['xml_files'] += 1
+                archive_stats['xml_file_sizes'].append(size_mb)
+    except Exception as e:
+        logger.warning(f"Error scanning archive {archive_path}: {e}")
+
+    return archive_path, file_paths, archive_stats
+
+
+def get_archive_file_paths(archive_root, patent_offices, cpu_count=None, pool=None):
+    """
+    Get all XML member paths of the given patent offices from the archives in archive_root
+
+    Archives are listed in parallel (one archive per worker). The result has the same
+    shape as file_system.get_all_file_paths so it can be used as a drop-in replacement.
+
+    Args:
+        archive_root (str): Directory containing the WPI archives (or a single archive)
+        patent_offices (list): Patent office codes to keep (e.g., ['EP', 'WO'])
+        cpu_count (int, optional): Number of CPU cores to use. If None, uses all available.
+        pool (WorkerPool, optional): Shared worker pool (a temporary pool is created if None)
+
+    Returns:
+        tuple: (all_file_paths, folder_order)
+            - all_file_paths: List of virtual archive member paths
+            - folder_order: Dictionary mapping member directory paths to order indices
+    """
+    if cpu_count is None:
+        cpu_count = get_effective_cpu_count()
+
+    if not os.path.exists(archive_root):
+        raise ValueError(f"Archive path does not exist: {archive_root}")
+
+    archives = find_archives(archive_root)
+    if not archives:
+        logger.warning(f"No {', '.join(ARCHIVE_EXTENSIONS)} archives found in {archive_root}")
+        return [], {}
+
+    scan_args = [(archive_path, frozenset(patent_offices)) for archive_path in archives]
+    try:
+        with use_pool(pool, lambda: WorkerPool(min(cpu_count, len(archives)))) as scan_pool:
+            results = scan_pool.map(scan_archive, scan_args, chunksize=1)
+    except Exception as e:
+        logger.error(f"Error during parallel archive scanning: {e}")
+        # Fallback to sequential processing
+        results = [scan_archive(args) for args in scan_args]
+
+    all_file_paths = []
+    folder_order = {}
+    total_stats = {'total_files': 0, 'xml_files': 0, 'total_size_mb': 0}
+    all_xml_sizes = []
+
+    for archive_path, files, archive_stats in results:
+        all_file_paths.extend(files)
+        total_stats['total_files'] += archive_stats['total_files']
+        total_stats['xml_files'] += archive_stats['xml_files']
+        total_stats['total_size_mb'] += archive_stats['total_size_mb']
+        all_xml_sizes.extend(archive_stats['xml_file_sizes'])
+
+    # Sort to keep archives (and members within an archive) contiguous and deterministic
+    all_file_paths.sort()
+    for file_path in all_file_paths:
+        member_dir = os.path.dirname(split_archive_member_path(file_path)[1])
+        if member_dir not in folder_order:
+            folder_order[member_dir] = len(folder_order)
+
+    logger.info(f"Archive Statistics for {archive_root} ({', '.join(patent_offices)}):")
+    logger.info(f"  Total archives: {len(archives)}")
+    logger.info(f"  Total members: {total_stats['total_files']}")
+    logger.info(f"  XML members: {total_stats['xml_files']}")
+    logger.info(f"  Total uncompressed size: {total_stats['total_size_mb']:.2f} MB")
+    if all_xml_sizes:
+        logger.info(f"  Largest XML member: {max(all_xml_sizes):.2f} MB")
+        logger.info(f"  Smallest XML member: {min(all_xml_sizes):.2f} MB")
+
+    return all_file_paths, folder_order
+
+
+def get_archive_batch_ranges(batches):
+    """
+    Split a list of batches into contiguous ranges that read from the same archive
+
+    Used to assign independent archives to different workers so decompression
+    runs in parallel and no archive is decompressed by several workers.
+
+    Args:
+        batches (list): List of batches (each a list of virtual archive member paths)
+
+    Returns:
+        list: List of (start, end) batch index ranges, one per archive
+    """
+    ranges = []
+    current_archive = None
+    range_start = 0
+
+    for index, batch in enumerate(batches):
+        batch_archive = split_archive_member_path(batch[0])[0] if batch and is_archive_member_path(batch[0]) else None
+        if index > 0 and batch_archive != current_archive:
+            ranges.append((range_start, index))
+            range_start = index
+        current_archive = batch_archive
+
+    if batches:
+        ranges.append((range_start, len(batches)))
+
+    return ranges
+
+
+def interleave_archive_batches(batches):
+    """
+    Reorder batches so consecutive batches come from different archives
+
+    Workers pick up batches in order, so interleaving the archives round-robin makes
+    independent archives be read (and decompressed) by different workers in parallel.
+
+    Args:
+        batches (list): List of batches ordered by archive
+
+    Returns:
+        list: Reordered list of batches
+    """
+    ranges = [list(range(start, end)) for start, end in get_archive_batch_ranges(batches)]
+    interleaved = []
+    for position in range(max((len(indices) for indices in ranges), default=0)):
+        for indices in ranges:
+            if position < len(indices):
+                interleaved.append(batches[indices[position]])
+    return interleaved
+
+
+def _get_zip_archive(archive_path):
+    """Return a cached open ZipFile for this worker"""
+    open_zip_archives = _get_thread_cache('open_zip_archives')
+    archive = open_zip_archives.get(archive_path)
+    if archive is None:
+        archive = zipfile.ZipFile(archive_path)
+        open_zip_archives[archive_path] = archive
+    return archive
+
+
+def _read_7z_members(archive_path, member_names):
+    """
+    Read several members of a .7z archive in a single decompression pass
+
+    Args:
+        archive_path (str): Path to the .7z archive
+        member_names (list): Member names to read
+
+    Returns:
+        dict: Mapping member_name -> bytes
+    """
+    _require_py7zr(archive_path)
+    with py7zr.SevenZipFile(archive_path, mode='r') as archive:
+        if hasattr(archive, 'read'):
+            # py7zr < 1.0
+            contents = archive.read(targets=member_names)
+        else:
+            factory = py7zr.io.BytesIOFactory(limit=2**40)
+            archive.extract(targets=member_names, factory=factory)
+            contents = factory.products
+
+    members = {}
+    for member_name, stream in contents.items():
+        stream.seek(0)
+        members[member_name] = stream.read()
+    return members
+
+
+def prefetch_archive_members(file_paths):
+    """
+    Decompress the archive members of a batch ahead of parsing
+
+    7z archives are read with one extraction call per archive instead of one per
+    file, which avoids re-decompressing solid blocks for every member. Corpus pack
+    members are read in offset order so the container is accessed sequentially.
+
+    Args:
+        file_paths (list): File paths of a batch (non-archive paths are ignored)
+    """
+    prefetched_members = _get_thread_cache('prefetched_members')
+    members_by_archive = {}
+    for file_path in file_paths:
+        if is_archive_member_path(file_path) and file_path not in prefetched_members:
+            archive_path, member_name = split_archive_member_path(file_path)
+            members_by_archive.setdefault(archive_path, []).append(member_name)
+
+    for archive_path, member_names in members_by_archive.items():
+        if archive_path.endswith(PACK_EXTENSION):
+            read_members = read_pack_members
+        elif archive_path.lower().endswith('.7z'):
+            read_members = _read_7z_members
+        else:
+            # Zip members are compressed individually and cheap to read on demand
+            continue
+        try:
+            for member_name, content in read_members(archive_path, member_names).items():
+                prefetched_members[make_archive_member_path(archive_path, member_name)] = content
+        except Exception as e:
+            logger.error(f"Error prefetching members from {archive_path}: {e}")
+
+
+def release_prefetched_members():
+    """Drop prefetched archive members once a batch has been processed"""
+    _get_thread_cache('prefetched_members').clear()
+
+
+def read_archive_member(file_path):
+    """
+    Read the raw bytes of an archive member
+
+    Args:
+        file_path (str): Virtual archive member path
+
+    Returns:
+        bytes: Member content
+    """
+    content = _get_thread_cache('prefetched_members').pop(file_path, None)
+    if content is not None:
+        return content
+
+    archive_path, member_name = split_archive_member_path(file_path)
+    if archive_path.endswith(PACK_EXTENSION):
+        return read_pack_members(archive_path, [member_name])[member_name]
+
+    if archive_path.lower().endswith('.zip'):
+        return _get_zip_archive(archive_path).read(member_name)
+
+    return _read_7z_members(archive_path, [member_name])[member_name]
@@ -0,0 +1,337 @@
+# Licensed under the MIT License. See LICENSE-CODE in the repository root for details.
+# Copyright (c) 2025 Christos Papadopoulos
+
+"""
+Throughput Autotuner for PatentFusion
+
+When batch_size, cpu_count or chunk_size are set to AUTO in config.ini, this module
+runs a short warm-up before the main run. Each warm-up trial processes a contiguous
+run of real patent groups with one batch size and worker count and measures files/s,
+MB/s and the peak RSS per worker; the fastest setting that fits the memory limits is
+locked in for the rest of the run. chunk_size is derived from the measured memory
+per virtual patent instead of a fixed per-file estimate.
+
+Warm-up work is not thrown away: the temp files of every trial are handed to the
+output phase and the sampled files are removed from the main run.
+"""
+
+import os
+import glob
+import time
+import logging
+from constants import (
+    AUTOTUNE_BATCH_SIZES, AUTOTUNE_TRIAL_ROUNDS, AUTOTUNE_MIN_TRIAL_FILES,
+    AUTOTUNE_MAX_SAMPLE_FRACTION, AUTOTUNE_TOLERANCE, MEMORY_PAUSE_FRACTION,
+    MIN_CHUNK_SIZE, MAX_CHUNK_SIZE, CHUNK_MEMORY_FRACTION
+)
+from xml_parser import group_files_by_patent
+from archive_source import get_source_file_size
+from file_system import cleanup_single_temp_file, get_patent_groups
+from parallel_processor import BatchFaultHandler, process_batch_task
+from memory_manager import create_worker_pool, measure_temp_file_task
+from worker_pool import use_pool
+from utils import format_duration
+
+logger = logging.getLogger(__name__)
+
+
+def get_trial_file_count(batch_size, workers):
+    """
+    Get the number of files a warm-up trial processes
+
+    Args:
+        batch_size (int): Batch size of the trial
+        workers (int): Worker count of the trial
+
+    Returns:
+        int: Files per trial (enough for AUTOTUNE_TRIAL_ROUNDS batches per worker)
+    """
+    return max(AUTOTUNE_TRIAL_ROUNDS * batch_size * workers, AUTOTUNE_MIN_TRIAL_FILES)
+
+
+def get_worker_candidates(cpu_count):
+    """
+    Get the worker counts to try, largest first
+
+    Args:
+        cpu_count (int): Maximum number of workers
+
+    Returns:
+        list: Distinct worker counts (all, three quarters and half of cpu_count)
+    """
+    return sorted({cpu_count, max(1, cpu_count * 3 // 4), max(1, cpu_count // 2)}, reverse=True)
+
+
+def take_trial_groups(patent_groups, start_index, file_count):
+    """
+    Take a contiguous run of patent groups starting at start_index
+
+    Contiguous groups behave like a real batch (same folders, same archive),
+    while different trials start in different parts of the collection.
+
+    Args:
+        patent_groups (list): List of patent groups (lists of file paths)
+        start_index (int): Index of the first group to take
+        file_count (int): Minimum number of files to take
+
+    Returns:
+        list: List of patent groups
+    """
+    groups = []
+    files_taken = 0
+    for files in patent_groups[start_index:]:
+        groups.append(files)
+        files_taken += len(files)
+        if files_taken >= file_count:
+            break
+    return groups
+
+
+def run_trial(pool, trial_id, groups, batch_size, workers, faults):
+    """
+    Process a set of patent groups with one batch size and worker count and measure throughput
+
+    Args:
+        pool (WorkerPool): Worker pool whose context holds config and folder_order
+        trial_id (int): Trial number (used in temp file names)
+        groups (list): Patent groups to process
+        batch_size (int): Files per batch
+        workers (int): Number of workers to use
+        faults (BatchFaultHandler): Retries failed batches group by group and quarantines bad groups
+
+    Returns:
+        dict: Trial measurements (files, bytes, duration, throughput, peak worker RSS, temp files)
+    """
+    # Pack whole patent groups into batches of about batch_size files
+    batches = []
+    current_batch = []
+    for files in groups:
+        current_batch.extend(files)
+        if len(current_batch) >= batch_size:
+            batches.append(current_batch)
+            current_batch = []
+    if current_batch:
+        batches.append(current_batch)
+
+    trial = {
+        'batch_size': batch_size,
+        'workers': workers,
+        'files': sum(len(batch) for batch in batches),
+        'bytes': sum(get_source_file_size(file_path) for batch in batches for file_path in batch),
+        'patents': 0,
+        'errors': 0,
+        'peak_worker_rss': 0,
+        'shared_memory': pool.shared_memory,
+        'temp_files': [],
+        'file_paths': [file_path for batch in batches for file_path in batch]
+    }
+
+    def on_result(result):
+        trial['peak_worker_rss'] = max(trial['peak_worker_rss'], result['rss'])
+        if result['error']:
+            trial['errors'] += 1
+        elif result['result']:
+            trial['temp_files'].extend(result['result']['temp_files'])
+            trial['patents'] += result['result']['patents']
+        # Warm-up output is kept, so failed batches are retried group by group like in the main run
+        return faults.handle_result(result)
+
+    tasks = [(process_batch_task, (batch, f"{faults.batch_prefix}autotune{trial_id}_{index}")) for index, batch in enumerate(batches)]
+    start_time = time.time()
+    pool.run(tasks, on_result, on_submit=faults.on_submit, max_workers=workers, task_timeout=faults.task_timeout)
+    trial['duration'] = max(time.time() - start_time, 1e-9)
+
+    trial['files_per_second'] = trial['files'] / trial['duration']
+    trial['mb_per_second'] = trial['bytes'] / (1024 * 1024) / trial['duration']
+    return trial
+
+
+def fits_memory_limits(trial, config):
+    """
+    Check if a trial's memory usage scaled to all its workers stays within the limits
+
+    Args:
+        trial (dict): Trial measurements
+        config (dict): Configuration dictionary
+
+    Returns:
+        bool: True if the setting stays below the worker ceiling and the governor's pause threshold
+    """
+    memory_budget = config['memory_limit'] * 1024**3 * MEMORY_PAUSE_FRACTION
+    if trial['shared_memory']:
+        # Thread and serial workers report the RSS of the whole driver process
+        return trial['peak_worker_rss'] <= memory_budget
+
+    worker_ceiling = config['worker_memory_limit'] * 1024**3
+    if worker_ceiling and trial['peak_worker_rss'] > worker_ceiling:
+        return False
+    return trial['peak_worker_rss'] * trial['workers'] <= memory_budget
+
+
+def select_best_trial(trials, cost_key, config):
+    """
+    Select the fastest trial, preferring the cheaper setting when throughput is within tolerance
+
+    Args:
+        trials (list): Trial measurements
+        cost_key (str): Trial key whose smaller values are cheaper ('batch_size' or 'workers')
+        config (dict): Configuration dictionary
+
+    Returns:
+        dict: Selected trial
+    """
+    eligible = [trial for trial in trials if fits_memory_limits(trial, config)] or trials
+    best_throughput = max(trial['files_per_second'] for trial in eligible)
+    close_enough = [trial for trial in eligible if trial['files_per_second'] >= best_throughput * (1 - AUTOTUNE_TOLERANCE)]
+    return min(close_enough, key=lambda trial: trial[cost_key])
+
+
+def tune_chunk_size(pool, temp_files, config):
+    """
+    Derive chunk_size from the measured memory per virtual patent
+
+    The largest warm-up temp file is loaded in a worker and its RSS growth
+    is divided by the number of virtual patents it holds.
+
+    Args:
+        pool (WorkerPool): Worker pool
+        temp_files (list): Warm-up temp files
+        config (dict): Configuration dictionary
+
+    Returns:
+        tuple: (chunk_size, bytes_per_patent), or (None, None) if nothing could be measured
+    """
+    if not temp_files:
+        return None, None
+
+    largest_temp_file = max(temp_files, key=os.path.getsize)
+    measurements = []
+    pool.run([(measure_temp_file_task, (largest_temp_file,))], measurements.append, max_workers=1)
+
+    if not measurements or measurements[0]['error']:
+        return None, None
+    patents_count, rss_growth = measurements[0]['result']
+    if patents_count == 0 or rss_growth <= 0:
+        return None, None
+
+    bytes_per_patent = rss_growth / patents_count
+    worker_budget_gb = config['worker_memory_limit'] or config['memory_limit'] / config['cpu_count']
+    chunk_size = int(worker_budget_gb * 1024**3 * CHUNK_MEMORY_FRACTION / bytes_per_patent)
+    return max(MIN_CHUNK_SIZE, min(chunk_size, MAX_CHUNK_SIZE)), bytes_per_patent
+
+
+def log_trial(trial):
+    """Log the measurements of one warm-up trial"""
+    logger.info(f"  batch_size={trial['batch_size']:>4}, workers={trial['workers']:>3}: "
+               f"{trial['files']} files in {format_duration(trial['duration'])} - "
+               f"{trial['files_per_second']:.1f} files/s, {trial['mb_per_second']:.2f} MB/s, "
+               f"peak worker RSS {trial['peak_worker_rss'] / 1024**3:.2f} GB")
+
+
+def autotune_parameters(all_file_paths, folder_order, config, pool=None, journal=None, family_index=None):
+    """
+    Measure and lock in batch_size, cpu_count and chunk_size for the parameters set to AUTO
+
+    batch_size is tuned first with all workers, then the worker count with the chosen
+    batch size. The selected values are written into config, so the rest of the run
+    (both processing phases) uses them.
+
+    Args:
+        all_file_paths (list): List of all file paths to process
+        folder_order (dict): Dictionary mapping folder names to order indices
+        config (dict): Configuration dictionary (updated in place)
+        pool (WorkerPool, optional): Shared worker pool (a temporary pool is created if None)
+        journal (RunJournal, optional): Run journal receiving every parsed warm-up batch
+        family_index (FamilyIndex, optional): Warm up on whole patent families (family fusion)
+
+    Returns:
+        tuple: (warmup_temp_files, remaining_file_paths)
+            - warmup_temp_files: Temp files produced during the warm-up
+            - remaining_file_paths: Files not processed during the warm-up
+    """
+    params = config.get('autotune_params', [])
+    if not params:
+        return [], all_file_paths
+
+    max_workers = config['cpu_count']
+    batch_candidates = list(AUTOTUNE_BATCH_SIZES) if 'batch_size' in params else [config['batch_size']]
+    worker_candidates = get_worker_candidates(max_workers) if 'cpu_count' in params else [max_workers]
+
+    # Drop the largest batch sizes until the warm-up fits in its share of the collection
+    sample_budget = int(len(all_file_paths) * AUTOTUNE_MAX_SAMPLE_FRACTION)
+    def planned_files():
+        return (sum(get_trial_file_count(batch_size, max_workers) for batch_size in batch_candidates) +
+                sum(get_trial_file_count(max(batch_candidates), workers) for workers in worker_candidates[1:]))
+    while len(batch_candidates) > 1 and planned_files() > sample_budget:
+        batch_candidates.pop()
+
+    if planned_files() > sample_budget:
+        logger.info(f"Autotune: collection too small for a warm-up ({len(all_file_paths)} files), using "
+                   f"batch_size={config['batch_size']}, cpu_count={config['cpu_count']}, chunk_size={config['chunk_size']}")
+        return [], all_file_paths
+
+    if family_index is not None:
+        # A family fused during the warm-up must not be fused again from its remaining files
+        patent_groups = [files for unit_key, files in get_patent_groups(all_file_paths, family_index).items()
+                         if unit_key != 'unparseable']
+    else:
+        patent_groups = list(group_files_by_patent(all_file_paths).values())
+    planned_trials = len(batch_candidates) + len(worker_candidates) - 1
+    trials = []
+    warmup_temp_files = []
+    used_file_paths = set()
+    faults = BatchFaultHandler(config, journal, family_index)
+
+    def run_next_trial(pool, batch_size, workers):
+        # Every trial starts in a different part of the collection
+        trial_id = len(trials)
+        start_index = trial_id * len(patent_groups) // planned_trials
+        groups = take_trial_groups(patent_groups, start_index, get_trial_file_count(batch_size, workers))
+        trial = run_trial(pool, trial_id, groups, batch_size, workers, faults)
+        trials.append(trial)
+        warmup_temp_files.extend(trial['temp_files'])
+        used_file_paths.update(trial['file_paths'])
+        log_trial(trial)
+        return trial
+
+    logger.info(f"Autotune: warming up {', '.join(params)} on {planned_files()} files "
+               f"(batch sizes {batch_candidates}, worker counts {worker_candidates})")
+    start_time = time.time()
+
+    try:
+        with use_pool(pool, lambda: create_worker_pool(config)) as pool:
+            pool.set_context(folder_order=folder_order, config=config)
+
+            # 1. Batch size, with all workers
+            batch_trials = [run_next_trial(pool, batch_size, max_workers) for batch_size in batch_candidates]
+            best_trial = select_best_trial(batch_trials, 'batch_size', config)
+
+            # 2. Worker count, with the selected batch size
+            worker_trials = [best_trial] + [run_next_trial(pool, best_trial['batch_size'], workers)
+                                            for workers in worker_candidates[1:]]
+            best_trial = select_best_trial(worker_trials, 'workers', config)
+
+            config['batch_size'] = best_trial['batch_size']
+            config['cpu_count'] = best_trial['workers']
+
+            if 'chunk_size' in params:
+                chunk_size, bytes_per_patent = tune_chunk_size(pool, warmup_temp_files, config)
+                if chunk_size is not None:
+                    logger.info(f"Autotune: measured {bytes_per_patent / 1024:.1f} KB per loaded virtual patent")
+                    config['chunk_size'] = chunk_size
+    except Exception as e:
+        # Keep the configured values; files of an interrupted trial go back to the main run
+        logger.error(f"Autotune warm-up failed, keeping configured values: {e}")
+        for temp_file_path in glob.glob(os.path.join(config['temp_dir'], f"temp_batch_{faults.batch_prefix}autotune{len(trials)}_*")):
+            cleanup_single_temp_file(temp_file_path)
+        return warmup_temp_files, [file_path for file_path in all_file_paths if file_path not in used_file_paths]
+
+    faults.log_summary()
+    remaining_file_paths = [file_path for file_path in all_file_paths if file_path not in used_file_paths]
+    logger.info(f"Autotune complete in {format_duration(time.time() - start_time)}: {len(used_file_paths)} files processed during warm-up, "
+               f"{len(remaining_file_paths)} remaining")
+    logger.info(f"Autotune selected batch_size = {config['batch_size']}, cpu_count = {config['cpu_count']}, "
+               f"chunk_size = {config['chunk_size']} ({best_trial['files_per_second']:.1f} files/s) - "
+               f"pin these values in config.ini [Performance] to skip the warm-up")
+
+    return warmup_temp_files, remaining_file_paths
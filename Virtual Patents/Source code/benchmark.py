@@ -0,0 +1,428 @@
+# Licensed under the MIT License. See LICENSE-CODE in the repository root for details.
+# Copyright (c) 2025 Christos Papadopoulos
+
+"""
+Benchmark Suite for PatentFusion
+
+Measures PatentFusion on synthetic corpora (see synthetic_corpus.py) at several scales
+and worker counts, so the effect of a change can be compared across commits:
+
+    python benchmark.py --scales 500,5000 --workers 1,4,8 --output bench-new.json
+    python benchmark.py --scales 500,5000 --workers 1,4,8 --compare bench-old.json
+
+For every scale (number of inventions) a corpus is generated once in the work folder
+and reused by later benchmarks with the same corpus settings. Then:
+
+    stages      discovery and batching are timed directly; the patent groups are fused
+                and saved in this process, one batch at a time, and the stage metrics
+                (stage_metrics.py) give read, parse, deepcopy, merge, finalize, filter,
+                serialize_xml / serialize_csv / serialize_json and write
+    end_to_end  PatentFusion.py runs on the corpus once per worker count, with fixed
+                batch_size, chunk_size and cpu_count (no warm-up), and its metrics.json
+                gives the throughput
+
+Each measurement is repeated --repeat times; the median and the minimum are kept.
+Results are written as JSON together with the commit, Python version and machine.
+With --compare the results are checked against an earlier file and every measurement
+more than --threshold slower is reported as a regression (exit code 1).
+"""
+
+import os
+import sys
+import copy
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import statistics
+import tempfile
+import subprocess
+import configparser
+from constants import DEFAULT_CONFIG, METRICS_REPORT_NAME, VALID_OUTPUT_FORMATS
+from config_manager import ConfigManager
+from file_system import discover_source_files, get_file_batches
+from xml_parser import process_file_batch
+from data_processor import save_individual_vpatents_sequential
+from stage_metrics import StageMetrics, drain_stage_metrics, build_metrics_report
+from synthetic_corpus import CORPUS_SUMMARY_NAME, generate_corpus
+from utils import setup_logging, format_duration, ensure_directory_exists, get_effective_cpu_count, atomic_output_path
+
+logger = logging.getLogger(__name__)
+
+SCRIPT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+# Offices of the benchmark corpora and the seed they are generated with
+BENCHMARK_OFFICES = ['EP', 'WO', 'US']
+BENCHMARK_SEED = 1
+
+
+def get_git_revision():
+    """
+    Get the commit of the working tree
+
+    Returns:
+        dict: 'commit' (hash, or '' outside a git checkout) and 'dirty' (uncommitted changes)
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=SCRIPT_DIRECTORY, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=SCRIPT_DIRECTORY,
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': '', 'dirty': False}
+    return {'commit': commit, 'dirty': bool(status)}
+
+
+def summarize_runs(seconds):
+    """
+    Summarize repeated measurements
+
+    Args:
+        seconds (list): Durations of the repetitions
+
+    Returns:
+        dict: median and minimum seconds and the repetitions
+    """
+    return {'seconds': round(statistics.median(seconds), 4), 'min_seconds': round(min(seconds), 4),
+            'runs': [round(value, 4) for value in seconds]}
+
+
+def prepare_corpus(work_dir, patents, corpus_options):
+    """
+    Generate the corpus of a scale, or reuse the one generated with the same settings
+
+    Args:
+        work_dir (str): Benchmark work folder
+        patents (int): Number of inventions
+        corpus_options (dict): Further generate_corpus arguments
+
+    Returns:
+        tuple: (corpus path, corpus summary)
+    """
+    corpus_path = os.path.join(work_dir, f"corpus-{patents}")
+    summary_path = os.path.join(corpus_path, CORPUS_SUMMARY_NAME)
+    expected = dict(corpus_options, patents=patents, offices=BENCHMARK_OFFICES, seed=BENCHMARK_SEED)
+    if os.path.exists(summary_path):
+        with open(summary_path, 'r', encoding='utf-8') as f:
+            summary = json.load(f)
+        if all(summary.get(key) == value for key, value in expected.items()):
+            logger.info(f"Reusing corpus {corpus_path} ({summary['documents']} documents)")
+            return corpus_path, summary
+        shutil.rmtree(corpus_path)
+    summary = generate_corpus(corpus_path, **expected)
+    return corpus_path, summary
+
+
+def write_benchmark_config(base_config_path, config_path, corpus_path, destination_path, workers):
+    """
+    Write the config.ini of a benchmark run: the base configuration on the synthetic corpus
+
+    AUTO performance settings are replaced by fixed values, so no warm-up is measured
+    and runs with different worker counts fuse the same batches.
+
+    Args:
+        base_config_path (str): config.ini whose parse flags, priorities and formats are used
+        config_path (str): Path of the benchmark config.ini
+        corpus_path (str): Synthetic corpus root
+        destination_path (str): Output folder of the run
+        workers (int): cpu_count of the run
+    """
+    parser = configparser.ConfigParser()
+    parser.optionxform = str
+    parser.read(base_config_path, encoding='utf-8')
+    for section in ('Paths', 'General', 'Performance', 'Sample'):
+        if not parser.has_section(section):
+            parser.add_section(section)
+    parser.set('Paths', 'vertical_origin_path', corpus_path)
+    parser.set('Paths', 'archive_origin_path', '')
+    parser.set('Paths', 'patent_office', ','.join(BENCHMARK_OFFICES))
+    parser.set('Paths', 'destination_path', destination_path)
+    parser.set('General', 'output_formats', ','.join(VALID_OUTPUT_FORMATS))
+    for setting in ('batch_size', 'chunk_size'):
+        value = parser.get('Performance', setting, fallback='AUTO')
+        if not value.strip().isdigit():
+            parser.set('Performance', setting, str(DEFAULT_CONFIG[setting]))
+    parser.set('Performance', 'cpu_count', str(workers))
+    parser.set('Performance', 'progress_mode', 'log')
+    parser.set('Performance', 'metrics_port', '0')
+    # The whole synthetic corpus is fused
+    parser.set('Paths', 'include_lists', '')
+    parser.set('Paths', 'exclude_lists', '')
+    parser.set('Sample', 'sample', '')
+    with atomic_output_path(config_path) as temp_path, open(temp_path, 'w', encoding='utf-8') as f:
+        parser.write(f)
+
+
+def benchmark_stages(config, repeat):
+    """
+    Time discovery, batching and the fusion and save stages in this process
+
+    Args:
+        config (dict): Configuration of the benchmark corpus
+        repeat (int): Repetitions of each measurement
+
+    Returns:
+        dict: 'stages' (stage -> summary, see summarize_runs), fuse and save 'latency', and the numbers
+            of 'files', 'batches' and 'virtual_patents'
+    """
+    discovery_runs = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        file_paths, folder_order = discover_source_files(config)
+        discovery_runs.append(time.perf_counter() - start_time)
+
+    batching_runs = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        batches = get_file_batches(file_paths, config['batch_size'])
+        batching_runs.append(time.perf_counter() - start_time)
+
+    # One batch at a time, so memory stays bounded at any scale
+    stage_runs = {}
+    save_root = os.path.join(config['destination_path'], 'stage_outputs')
+    for _ in range(repeat):
+        metrics = StageMetrics()
+        patents = 0
+        drain_stage_metrics()
+        for batch_id, batch in enumerate(batches):
+            virtual_patents = process_file_batch(batch, folder_order, batch_id, config)
+            patents += len(virtual_patents)
+            for fmt in VALID_OUTPUT_FORMATS:
+                # Saving removes the metadata attributes, so every format saves its own copies
+                save_individual_vpatents_sequential([copy.deepcopy(virtual_patent) for virtual_patent in virtual_patents],
+                                                    [fmt], os.path.join(save_root, fmt), config)
+            data = drain_stage_metrics()
+            if data is not None:
+                metrics.merge(data)
+        for stage, (seconds, _) in metrics.stages.items():
+            stage_runs.setdefault(stage, []).append(seconds)
+    # Output directories are remembered once created, so the outputs are only removed at the end
+    shutil.rmtree(save_root, ignore_errors=True)
+
+    stages = {'discovery': summarize_runs(discovery_runs), 'batching': summarize_runs(batching_runs)}
+    for stage, runs in sorted(stage_runs.items()):
+        stages[stage] = summarize_runs(runs)
+    latency = build_metrics_report(metrics, 0)['latency']
+    return {'files': len(file_paths), 'batches': len(batches), 'virtual_patents': patents, 'stages': stages,
+            'latency': {kind: {key: entry[key] for key in ('count', 'mean_ms', 'p50_ms', 'p90_ms', 'p99_ms')}
+                        for kind, entry in latency.items()}}
+
+
+def benchmark_end_to_end(config_path, destination_path, workers, repeat, log_path):
+    """
+    Time complete PatentFusion runs
+
+    Args:
+        config_path (str): Benchmark config.ini
+        destination_path (str): Output folder of the runs (emptied before every run)
+        workers (int): cpu_count of the runs
+        repeat (int): Repetitions
+        log_path (str): File receiving the output of the runs
+
+    Returns:
+        dict: summary (see summarize_runs) with the throughput of the fastest run, or 'error'
+    """
+    runs = []
+    throughput = {}
+    for _ in range(repeat):
+        shutil.rmtree(destination_path, ignore_errors=True)
+        start_time = time.perf_counter()
+        with open(log_path, 'a', encoding='utf-8') as log_file:
+            exit_code = subprocess.run([sys.executable, os.path.join(SCRIPT_DIRECTORY, 'PatentFusion.py'), config_path],
+                                       cwd=SCRIPT_DIRECTORY, stdout=log_file, stderr=subprocess.STDOUT).returncode
+        duration = time.perf_counter() - start_time
+        if exit_code != 0:
+            logger.error(f"PatentFusion exited with {exit_code} ({workers} workers), see {log_path}")
+            return {'workers': workers, 'error': f"exit code {exit_code}"}
+        with open(os.path.join(destination_path, METRICS_REPORT_NAME), 'r', encoding='utf-8') as f:
+            report = json.load(f)
+        if not runs or duration < min(runs):
+            throughput = report['throughput']
+        runs.append(duration)
+    return dict(summarize_runs(runs), workers=workers, throughput=throughput)
+
+
+def run_benchmarks(scales, worker_counts, work_dir, base_config_path, repeat=1, corpus_options=None, stages=True,
+                   end_to_end=True):
+    """
+    Run the benchmark suite
+
+    Args:
+        scales (list): Numbers of inventions of the corpora
+        worker_counts (list): cpu_count values of the end-to-end runs
+        work_dir (str): Folder for the corpora, configurations and outputs
+        base_config_path (str): config.ini the benchmark configurations are based on
+        repeat (int): Repetitions of each measurement
+        corpus_options (dict, optional): Further generate_corpus arguments (e.g. pathological)
+        stages (bool): Run the stage benchmarks
+        end_to_end (bool): Run the end-to-end benchmarks
+
+    Returns:
+        dict: Benchmark results
+    """
+    corpus_options = corpus_options or {}
+    ensure_directory_exists(work_dir)
+    results = {
+        'benchmark': dict(get_git_revision(), created=time.strftime('%Y-%m-%d %H:%M:%S'),
+                          python=platform.python_version(), platform=platform.platform(),
+                          cpu_count=get_effective_cpu_count()),
+        'settings': {'scales': scales, 'workers': worker_counts, 'repeat': repeat, 'offices': BENCHMARK_OFFICES,
+                     'seed': BENCHMARK_SEED, 'corpus': corpus_options},
+        'scales': []
+    }
+
+    for patents in scales:
+        corpus_path, corpus = prepare_corpus(work_dir, patents, corpus_options)
+        scale = {'patents': patents,
+                 'corpus': {key: corpus[key] for key in ('patent_groups', 'documents', 'bytes', 'pathological_groups')}}
+
+        if stages:
+            destination_path = os.path.join(work_dir, f"out-{patents}-stages")
+            config_path = os.path.join(work_dir, f"config-{patents}-stages.ini")
+            write_benchmark_config(base_config_path, config_path, corpus_path, destination_path, 1)
+            config = ConfigManager(config_path).get_all()
+            logger.info(f"Stage benchmarks on {corpus['documents']} documents ({patents} inventions)")
+            scale.update(benchmark_stages(config, repeat))
+
+        if end_to_end:
+            scale['end_to_end'] = []
+            for workers in worker_counts:
+                destination_path = os.path.join(work_dir, f"out-{patents}-w{workers}")
+                config_path = os.path.join(work_dir, f"config-{patents}-w{workers}.ini")
+                write_benchmark_config(base_config_path, config_path, corpus_path, destination_path, workers)
+                logger.info(f"End-to-end benchmark: {patents} inventions, {workers} workers")
+                scale['end_to_end'].append(benchmark_end_to_end(config_path, destination_path, workers, repeat,
+                                                                os.path.join(work_dir, f"run-{patents}-w{workers}.log")))
+        results['scales'].append(scale)
+    return results
+
+
+def flatten_results(results):
+    """
+    Get the timed measurements of benchmark results
+
+    Args:
+        results (dict): Benchmark results
+
+    Returns:
+        dict: 'scale=<n> stage=<stage>' / 'scale=<n> end_to_end workers=<w>' -> median seconds
+    """
+    measurements = {}
+    for scale in results['scales']:
+        for stage, entry in scale.get('stages', {}).items():
+            measurements[f"scale={scale['patents']} stage={stage}"] = entry['seconds']
+        for entry in scale.get('end_to_end', []):
+            if 'seconds' in entry:
+                measurements[f"scale={scale['patents']} end_to_end workers={entry['workers']}"] = entry['seconds']
+    return measurements
+
+
+def compare_results(baseline, current, threshold=0.1, min_seconds=0.01):
+    """
+    Compare benchmark results with earlier results
+
+    Args:
+        baseline (dict): Earlier benchmark results
+        current (dict): New benchmark results
+        threshold (float): Relative slowdown reported as a regression (0.1 = 10% slower)
+        min_seconds (float): Measurements faster than this in both results are too noisy to compare
+
+    Returns:
+        list: (measurement, baseline seconds, current seconds, ratio, regression) for common measurements
+    """
+    before = flatten_results(baseline)
+    after = flatten_results(current)
+    rows = []
+    for measurement in sorted(before.keys() & after.keys()):
+        old, new = before[measurement], after[measurement]
+        if max(old, new) < min_seconds:
+            continue
+        ratio = new / old if old > 0 else float('inf')
+        rows.append((measurement, old, new, ratio, ratio > 1 + threshold))
+    return rows
+
+
+def log_comparison(rows, baseline, threshold):
+    """Log a comparison table and the regressions"""
+    commit = baseline['benchmark'].get('commit', '')[:10] or 'unknown'
+    logger.info(f"Comparison with commit {commit} (regression: more than {threshold:.0%} slower)")
+    for measurement, old, new, ratio, regression in rows:
+        logger.info(f"  {measurement:<45} {old:10.3f}s -> {new:10.3f}s  x{ratio:5.2f}{'  REGRESSION' if regression else ''}")
+    regressions = sum(1 for row in rows if row[4])
+    logger.info(f"{regressions} of {len(rows)} measurements regressed")
+
+
+def _parse_int_list(value):
+    """Parse a comma-separated list of positive integers"""
+    numbers = [int(item) for item in value.split(',') if item.strip()]
+    if not numbers or min(numbers) < 1:
+        raise argparse.ArgumentTypeError(f"expected comma-separated positive numbers, got '{value}'")
+    return numbers
+
+
+def main(argv=None):
+    """
+    Command line entry point
+
+    Args:
+        argv (list, optional): Command line arguments (defaults to sys.argv[1:])
+
+    Returns:
+        int: Exit code (0 for success, 1 for errors or regressions)
+    """
+    parser = argparse.ArgumentParser(description="Benchmark PatentFusion on synthetic WPI corpora")
+    parser.add_argument('--scales', type=_parse_int_list, default=[200, 2000], help="Inventions per corpus, e.g. 200,2000")
+    parser.add_argument('--workers', type=_parse_int_list, default=[1, get_effective_cpu_count()],
+                        help="Worker counts of the end-to-end runs, e.g. 1,4,8")
+    parser.add_argument('--repeat', type=int, default=1, help="Repetitions of each measurement (median is kept)")
+    parser.add_argument('--config', default=os.path.join(SCRIPT_DIRECTORY, 'config.ini'),
+                        help="config.ini the benchmark configurations are based on (parse flags, priorities)")
+    parser.add_argument('--work-dir', default=os.path.join(tempfile.gettempdir(), 'patentfusion-benchmark'),
+                        help="Folder for the corpora (reused between benchmarks), configurations and outputs")
+    parser.add_argument('--output', default=None, help="Results file (default: benchmark-<commit>.json)")
+    parser.add_argument('--pathological', type=float, default=0.01, help="Share of pathological patent groups")
+    parser.add_argument('--description-words', type=int, default=800, help="Median description length in words")
+    parser.add_argument('--stages-only', action='store_true', help="Skip the end-to-end runs")
+    parser.add_argument('--end-to-end-only', action='store_true', help="Skip the stage benchmarks")
+    parser.add_argument('--compare', metavar='RESULTS', default=None, help="Earlier results file to compare with")
+    parser.add_argument('--threshold', type=float, default=0.1, help="Slowdown reported as a regression (0.1 = 10%%)")
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    if args.stages_only and args.end_to_end_only:
+        logger.error("--stages-only and --end-to-end-only cannot be combined")
+        return 1
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    start_time = time.time()
+    corpus_options = {'pathological': args.pathological, 'description_words': args.description_words}
+    results = run_benchmarks(args.scales, args.workers, os.path.abspath(args.work_dir), os.path.abspath(args.config),
+                             max(1, args.repeat), corpus_options, stages=not args.end_to_end_only,
+                             end_to_end=not args.stages_only)
+
+    output_path = args.output or f"benchmark-{results['benchmark']['commit'][:10] or 'nogit'}.json"
+    failed = any('error' in entry for scale in results['scales'] for entry in scale.get('end_to_end', []))
+    regressed = False
+    if baseline is not None:
+        rows = compare_results(baseline, results, args.threshold)
+        log_comparison(rows, baseline, args.threshold)
+        results['comparison'] = {'baseline_commit': baseline['benchmark'].get('commit', ''), 'threshold': args.threshold,
+                                 'measurements': {row[0]: {'baseline_seconds': row[1], 'seconds': row[2],
+                                                           'ratio': round(row[3], 4), 'regression': row[4]}
+                                                  for row in rows}}
+        regressed = any(row[4] for row in rows)
+
+    with atomic_output_path(output_path) as temp_path, open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    logger.info(f"Benchmark complete in {format_duration(time.time() - start_time)}: {output_path}")
+    return 1 if failed or regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,15 +9,19 @@ configuration settings throughout the application.
 """
 
 import os
+import re
+import glob
 import configparser
-import multiprocessing
-import psutil
 import logging
 
 logger = logging.getLogger(__name__)
 
 # Import constants
-from constants import VALID_PATENT_OFFICES, VALID_OUTPUT_FORMATS, DEFAULT_CONFIG
+from constants import VALID_PATENT_OFFICES, VALID_OUTPUT_FORMATS, VALID_EXECUTOR_BACKENDS, VALID_PROGRESS_MODES, DEFAULT_CONFIG, DEFAULT_EXECUTOR_BACKEND
+from constants import FIELD_PRIORITY_SECTIONS, FIELD_PRIORITY_ELEMENTS, FIELD_PRIORITY_ATTRIBUTES
+from constants import OUTPUT_PROFILE_SECTION_PREFIX, OUTPUT_PROFILE_SETTINGS, SAMPLE_STRATIFY_OPTIONS, FUSION_LEVELS
+from sampling import parse_sample_size
+from utils import get_effective_cpu_count, get_effective_memory_gb
 
 
 def load_config(config_file_path):
@@ -45,14 +49,18 @@ def load_config(config_file_path):
     settings['vertical_origin_path'] = config.get('Paths', 'vertical_origin_path')
     settings['destination_path'] = config.get('Paths', 'destination_path')
     
-    # Get patent office code and construct full vertical path
-    patent_office = config.get('Paths', 'patent_office')
-    if patent_office in VALID_PATENT_OFFICES:
-        settings['patent_office'] = patent_office
-        # Combine the base path with the patent office code
-        settings['vertical_origin_path'] = os.path.join(settings['vertical_origin_path'], patent_office)
-    else:
-        raise ValueError(f"Invalid patent_office value: '{patent_office}'. Must be one of: {', '.join(VALID_PATENT_OFFICES)}")
+    # Optional archive input: read XML members straight from the WPI 7z/zip archives
+    archive_origin_path = config.get('Paths', 'archive_origin_path', fallback='').strip()
+    settings['archive_origin_path'] = archive_origin_path or None
+    
+    # Get patent office code(s): one office, a comma-separated list or ALL
+    settings['patent_offices'] = parse_patent_offices(config.get('Paths', 'patent_office'),
+                                                      settings['vertical_origin_path'],
+                                                      settings['archive_origin_path'])
+    
+    # Optional include/exclude lists of patents (ground-truth CSV files, see patent_lists.py)
+    settings['include_lists'] = parse_path_list(config.get('Paths', 'include_lists', fallback=''))
+    settings['exclude_lists'] = parse_path_list(config.get('Paths', 'exclude_lists', fallback=''))
     
     # Parse General section
     
@@ -99,7 +107,16 @@ def load_config(config_file_path):
             settings[key] = config.getint('ParseFlags', key)
     
     # Parse Performance section
-    settings['batch_size'] = config.getint('Performance', 'batch_size')
+    # Parameters set to AUTO are measured by the autotuner during a warm-up (see autotuner.py)
+    settings['autotune_params'] = []
+    
+    # Handle batch_size special case - AUTO starts from the default and is tuned at warm-up
+    batch_value = config.get('Performance', 'batch_size')
+    if batch_value.upper() == "AUTO":
+        settings['batch_size'] = DEFAULT_CONFIG['batch_size']
+        settings['autotune_params'].append('batch_size')
+    else:
+        settings['batch_size'] = config.getint('Performance', 'batch_size')
     
     # Handle chunk_size special case - support AUTO calculation
     try:
@@ -108,39 +125,126 @@ def load_config(config_file_path):
             # Import here to avoid circular imports
             from utils import calculate_optimal_chunk_size
             settings['chunk_size'] = calculate_optimal_chunk_size()
+            settings['autotune_params'].append('chunk_size')
         else:
             settings['chunk_size'] = int(chunk_value)
     except (ValueError, configparser.NoOptionError):
         # If it's not defined or not valid, calculate automatically
         from utils import calculate_optimal_chunk_size
         settings['chunk_size'] = calculate_optimal_chunk_size()
+        settings['autotune_params'].append('chunk_size')
         logger.warning("chunk_size not specified or invalid, using auto-calculation")
     
     # Handle cpu_count special case
+    # Cores are counted from the CPU affinity mask and cgroup quota, not the host
+    effective_cpu_count = get_effective_cpu_count()
     try:
         cpu_value = config.get('Performance', 'cpu_count')
-        if cpu_value.upper() == "ALL" or int(cpu_value) == 0:
-            settings['cpu_count'] = multiprocessing.cpu_count()
+        if cpu_value.upper() == "AUTO":
+            # Start from all cores; the autotuner may settle on fewer workers
+            settings['cpu_count'] = effective_cpu_count
+            settings['autotune_params'].append('cpu_count')
+        elif cpu_value.upper() == "ALL" or int(cpu_value) == 0:
+            settings['cpu_count'] = effective_cpu_count
         else:
-            settings['cpu_count'] = min(int(cpu_value), multiprocessing.cpu_count())
+            settings['cpu_count'] = min(int(cpu_value), effective_cpu_count)
     except (ValueError, configparser.NoOptionError):
         # If it's not defined or not valid, default to all cores
-        settings['cpu_count'] = multiprocessing.cpu_count()
+        settings['cpu_count'] = effective_cpu_count
+    
+    # Handle executor_backend setting - process pool, thread pool or serial execution in the driver
+    settings['executor_backend'] = config.get('Performance', 'executor_backend', fallback=DEFAULT_EXECUTOR_BACKEND).strip().lower()
+    if settings['executor_backend'] == 'serial':
+        # A serial run has exactly one worker, so there is no worker count to tune
+        settings['cpu_count'] = 1
+        if 'cpu_count' in settings['autotune_params']:
+            settings['autotune_params'].remove('cpu_count')
+    
+    # Handle pin_workers setting - bind each worker process to its own core
+    try:
+        settings['pin_workers'] = config.getboolean('Performance', 'pin_workers')
+    except (configparser.NoOptionError, ValueError):
+        settings['pin_workers'] = False
+    
+    # Handle group_timeout: seconds a worker may spend on one patent group before it is restarted
+    try:
+        settings['group_timeout'] = config.getfloat('Performance', 'group_timeout', fallback=DEFAULT_CONFIG['group_timeout'])
+    except ValueError:
+        settings['group_timeout'] = DEFAULT_CONFIG['group_timeout']
+        logger.warning(f"group_timeout invalid, using {DEFAULT_CONFIG['group_timeout']} seconds")
+    
+    # Handle lease_timeout and work_unit_size of coordinated runs (--coordinator / --worker)
+    try:
+        settings['lease_timeout'] = config.getfloat('Performance', 'lease_timeout', fallback=DEFAULT_CONFIG['lease_timeout'])
+    except ValueError:
+        settings['lease_timeout'] = DEFAULT_CONFIG['lease_timeout']
+        logger.warning(f"lease_timeout invalid, using {DEFAULT_CONFIG['lease_timeout']} seconds")
+    try:
+        settings['work_unit_size'] = config.getint('Performance', 'work_unit_size', fallback=DEFAULT_CONFIG['work_unit_size'])
+    except ValueError:
+        settings['work_unit_size'] = DEFAULT_CONFIG['work_unit_size']
+        logger.warning(f"work_unit_size invalid, using {DEFAULT_CONFIG['work_unit_size']} files")
+    settings['coordinator_key_file'] = config.get('Performance', 'coordinator_key_file',
+                                                  fallback=DEFAULT_CONFIG['coordinator_key_file']).strip()
     
     # Handle memory_limit special case
     try:
         memory_value = config.get('Performance', 'memory_limit')
         if memory_value.upper() == "ALL":
-            # Use 80% of available memory (leave 20% for OS and other processes)
-            total_memory_gb = psutil.virtual_memory().total / (1024**3)
-            settings['memory_limit'] = int(total_memory_gb * 0.8)
+            # Use 80% of the memory available to this process (host memory or the cgroup limit,
+            # whichever is smaller) and leave 20% for the OS and other processes
+            total_memory_gb, _ = get_effective_memory_gb()
+            settings['memory_limit'] = round(total_memory_gb * 0.8, 2)
         else:
-            settings['memory_limit'] = config.getint('Performance', 'memory_limit')
+            settings['memory_limit'] = config.getfloat('Performance', 'memory_limit')
     except (ValueError, configparser.NoOptionError):
         # If it's not defined or not valid, default to 8GB
         settings['memory_limit'] = DEFAULT_CONFIG['memory_limit']
         logger.warning("Memory limit not specified or invalid, defaulting to 8GB")
     
+    # Handle worker_memory_limit: per-process RSS ceiling above which a worker is recycled
+    try:
+        worker_memory_value = config.get('Performance', 'worker_memory_limit', fallback=DEFAULT_CONFIG['worker_memory_limit'])
+        if worker_memory_value.upper() == "AUTO":
+            # Allow each worker 1.5x its fair share of memory_limit before recycling it
+            settings['worker_memory_limit'] = settings['memory_limit'] * 1.5 / settings['cpu_count']
+        else:
+            settings['worker_memory_limit'] = float(worker_memory_value)
+    except ValueError:
+        settings['worker_memory_limit'] = settings['memory_limit'] * 1.5 / settings['cpu_count']
+        logger.warning("worker_memory_limit invalid, using AUTO")
+    
+    # Handle large_document_mb: files larger than this many MB are streamed (see large_documents.py), 0 = never
+    try:
+        settings['large_document_mb'] = config.getfloat('Performance', 'large_document_mb',
+                                                        fallback=DEFAULT_CONFIG['large_document_mb'])
+    except ValueError:
+        settings['large_document_mb'] = DEFAULT_CONFIG['large_document_mb']
+        logger.warning(f"large_document_mb invalid, using {DEFAULT_CONFIG['large_document_mb']} MB")
+    
+    # Handle prometheus_metrics_file: optional Prometheus text file with the stage metrics of each run
+    settings['prometheus_metrics_file'] = config.get('Performance', 'prometheus_metrics_file',
+                                                     fallback=DEFAULT_CONFIG['prometheus_metrics_file']).strip()
+    
+    # Handle progress_mode, progress_log_interval and metrics_port: progress display and live metrics endpoint
+    settings['progress_mode'] = config.get('Performance', 'progress_mode', fallback=DEFAULT_CONFIG['progress_mode']).strip().lower()
+    try:
+        settings['progress_log_interval'] = config.getfloat('Performance', 'progress_log_interval',
+                                                            fallback=DEFAULT_CONFIG['progress_log_interval'])
+    except ValueError:
+        settings['progress_log_interval'] = DEFAULT_CONFIG['progress_log_interval']
+        logger.warning(f"progress_log_interval invalid, using {DEFAULT_CONFIG['progress_log_interval']} seconds")
+    try:
+        settings['metrics_port'] = config.getint('Performance', 'metrics_port', fallback=DEFAULT_CONFIG['metrics_port'])
+    except ValueError:
+        settings['metrics_port'] = DEFAULT_CONFIG['metrics_port']
+        logger.warning("metrics_port invalid, live metrics endpoint disabled")
+    
+    # Parse Sample section (optional): fuse only a deterministic sample of the patent groups
+    settings['sample_size'] = parse_sample_size(config.get('Sample', 'sample', fallback=''))
+    settings['sample_seed'] = config.getint('Sample', 'sample_seed', fallback=0)
+    settings['sample_stratify'] = config.get('Sample', 'sample_stratify', fallback='none').strip().lower()
+    
     # Create temp directory path based on destination path
     settings['temp_dir'] = os.path.join(settings['destination_path'], "temp_files")
     
@@ -159,6 +263,10 @@ def load_config(config_file_path):
             if option != 'global_priority' and option.endswith('_priority'):
                 # Extract field name (remove '_priority' suffix)
                 field_name = option[:-9]  # Remove '_priority'
+                if field_name not in FIELD_PRIORITY_SECTIONS and field_name not in FIELD_PRIORITY_ELEMENTS \
+                        and field_name not in FIELD_PRIORITY_ATTRIBUTES:
+                    logger.warning(f"Unknown field-specific priority '{option}' ignored")
+                    continue
                 if value.strip():
                     field_priority = [k.strip().upper() for k in value.split(',') if k.strip()]
                     settings['field_priorities'][field_name] = field_priority
@@ -166,12 +274,114 @@ def load_config(config_file_path):
         settings['global_priority'] = DEFAULT_CONFIG['global_priority']
         settings['field_priorities'] = DEFAULT_CONFIG['field_priorities']
     
+    # Parse the fusion level: one virtual patent per publication or per patent family (see family_index.py)
+    settings['fusion_level'] = config.get('vpatent_creation', 'fusion_level',
+                                          fallback=DEFAULT_CONFIG['fusion_level']).strip().lower()
+    family_office_order_str = config.get('vpatent_creation', 'family_office_order', fallback='')
+    settings['family_office_order'] = [o.strip().upper() for o in family_office_order_str.split(',') if o.strip()]
+    
     # Create individual VP directory path
     settings['individual_vp_dir'] = os.path.join(settings['destination_path'], "individual_vpatents")
+    
+    # Parse output profiles ([profile:<name>] sections); they inherit the settings above
+    settings['output_profiles'] = [parse_output_profile(config[section], section[len(OUTPUT_PROFILE_SECTION_PREFIX):].strip(), settings)
+                                   for section in config.sections() if section.startswith(OUTPUT_PROFILE_SECTION_PREFIX)]
+    if settings['output_profiles']:
+        # Virtual patents are merged once for all profiles, so they must keep everything any profile outputs
+        flags = {key for profile in settings['output_profiles'] for key in profile if key.startswith('parse_')}
+        for key in flags - {'parse_lang'}:
+            settings[key] = int(any(profile.get(key, 1) for profile in settings['output_profiles']))
+        languages = {profile.get('parse_lang', 'ALL') for profile in settings['output_profiles']}
+        settings['parse_lang'] = languages.pop() if len(languages) == 1 else 'ALL'
 
     return settings
 
 
+def parse_output_profile(section, name, settings):
+    """
+    Parse an output profile section
+    
+    A profile writes the same virtual patents with its own parse flags, text length,
+    formats and destination. Settings it does not set are taken from the main sections.
+    
+    Args:
+        section (configparser.SectionProxy): [profile:<name>] section
+        name (str): Profile name
+        settings (dict): Settings of the main sections
+        
+    Returns:
+        dict: Output settings of the profile (merge with the main settings, see get_output_profiles)
+        
+    Raises:
+        ValueError: If the profile has no name or an invalid value
+    """
+    if not name:
+        raise ValueError(f"Output profile section [{section.name}] needs a name")
+    
+    profile = {key: value for key, value in settings.items()
+               if key in OUTPUT_PROFILE_SETTINGS or key.startswith('parse_')}
+    profile['name'] = name
+    profile['destination_path'] = os.path.join(settings['destination_path'], name)
+    
+    for key, value in section.items():
+        if key == 'destination_path':
+            profile[key] = value.strip()
+        elif key == 'max_text_length':
+            profile[key] = "ALL" if value.strip().upper() == "ALL" else section.getint(key)
+        elif key == 'output_formats':
+            formats = [fmt.strip() for fmt in value.lower().split(',') if fmt.strip()]
+            invalid_formats = [fmt for fmt in formats if fmt not in VALID_OUTPUT_FORMATS]
+            if invalid_formats or not formats:
+                raise ValueError(f"Invalid output_formats in output profile '{name}': '{value}'")
+            profile[key] = formats
+        elif key in ('enable_merged_inspection', 'original_directory_structure'):
+            profile[key] = section.getboolean(key)
+        elif key == 'parse_lang':
+            profile[key] = value.strip()
+        elif key.startswith('parse_'):
+            profile[key] = section.getint(key)
+        else:
+            logger.warning(f"Unknown setting '{key}' in output profile '{name}' ignored")
+    
+    profile['individual_vp_dir'] = os.path.join(profile['destination_path'], "individual_vpatents")
+    return profile
+
+
+def get_output_profiles(config):
+    """
+    Get the configuration of every output profile
+    
+    Args:
+        config (dict): Configuration dictionary
+        
+    Returns:
+        list: One configuration dictionary per profile; without profiles, the configuration itself
+    """
+    if not config.get('output_profiles'):
+        return [config]
+    return [dict(config, **profile) for profile in config['output_profiles']]
+
+
+def get_profile_config(config, profile):
+    """
+    Get the configuration of an output profile
+    
+    Args:
+        config (dict): Configuration dictionary
+        profile (str): Output profile name
+    
+    Returns:
+        dict: Configuration dictionary of the profile
+    
+    Raises:
+        ValueError: If the configuration has no such profile
+    """
+    for profile_config in get_output_profiles(config):
+        if profile_config.get('name') == profile:
+            return profile_config
+    raise ValueError(f"Unknown output profile: {profile}")
+
+
 def get_default_config_path():
     """
     Get the default configuration file path relative to the script directory
@@ -183,6 +393,56 @@ def get_default_config_path():
     return os.path.join(script_directory, "config.ini")
 
 
+def parse_path_list(value):
+    """
+    Parse a list of file paths or glob patterns, one per line or separated by semicolons
+    
+    Commas are not separators, since the ground-truth folder names contain them.
+    
+    Args:
+        value (str): Setting value
+        
+    Returns:
+        list: Paths or patterns
+    """
+    return [path.strip() for path in re.split(r'[;\n]', value) if path.strip()]
+
+
+def parse_patent_offices(value, vertical_origin_path, archive_origin_path=None):
+    """
+    Parse the patent_office setting into a list of patent office codes
+    
+    ALL selects every office folder found in the vertical (or every valid office
+    when reading archives, whose members are filtered by office while scanning).
+    
+    Args:
+        value (str): Setting value, e.g. 'EP', 'EP,WO' or 'ALL'
+        vertical_origin_path (str): Root path of the extracted dataset (holding one folder per office)
+        archive_origin_path (str, optional): Archive directory, if reading from archives
+        
+    Returns:
+        list: Patent office codes in a fixed order
+        
+    Raises:
+        ValueError: If an office code is invalid or ALL finds no office folders
+    """
+    if value.strip().upper() == "ALL":
+        if archive_origin_path:
+            return list(VALID_PATENT_OFFICES)
+        offices = [office for office in VALID_PATENT_OFFICES
+                   if os.path.isdir(os.path.join(vertical_origin_path, office))]
+        if not offices:
+            raise ValueError(f"No patent office folders ({', '.join(VALID_PATENT_OFFICES)}) found in {vertical_origin_path}")
+        return offices
+    
+    offices = [office.strip().upper() for office in value.split(',') if office.strip()]
+    invalid_offices = [office for office in offices if office not in VALID_PATENT_OFFICES]
+    if invalid_offices or not offices:
+        raise ValueError(f"Invalid patent_office value: '{value}'. Must be ALL or one or more of: {', '.join(VALID_PATENT_OFFICES)}")
+    # Keep the order of VALID_PATENT_OFFICES so the same offices always give the same run
+    return [office for office in VALID_PATENT_OFFICES if office in offices]
+
+
 def validate_config(config):
     """
     Validate configuration settings
@@ -193,23 +453,48 @@ def validate_config(config):
     Raises:
         ValueError: If configuration is invalid
     """
-    # Validate that input paths exist
-    input_paths = ['vertical_origin_path']
-    for path_key in input_paths:
-        if not os.path.exists(config[path_key]):
-            raise ValueError(f"Input path does not exist: {config[path_key]} (from {path_key})")
+    # Validate that input paths exist (the extracted vertical is not needed when reading archives)
+    if config.get('archive_origin_path'):
+        if not os.path.exists(config['archive_origin_path']):
+            raise ValueError(f"Input path does not exist: {config['archive_origin_path']} (from archive_origin_path)")
+    else:
+        for office in config['patent_offices']:
+            office_path = os.path.join(config['vertical_origin_path'], office)
+            if not os.path.exists(office_path):
+                raise ValueError(f"Input path does not exist: {office_path} (from vertical_origin_path)")
     
     # Note: destination_path will be created if it doesn't exist, so we don't validate its existence
     
-    # Validate patent office
-    if config['patent_office'] not in VALID_PATENT_OFFICES:
-        raise ValueError(f"Invalid patent office: {config['patent_office']}")
+    # Validate patent offices
+    for office in config['patent_offices']:
+        if office not in VALID_PATENT_OFFICES:
+            raise ValueError(f"Invalid patent office: {office}")
     
     # Validate output formats
     for fmt in config['output_formats']:
         if fmt not in VALID_OUTPUT_FORMATS:
             raise ValueError(f"Invalid output format: {fmt}")
     
+    if config.get('fusion_level', 'publication') not in FUSION_LEVELS:
+        raise ValueError(f"Invalid fusion_level: {config['fusion_level']}. Must be one of: {', '.join(FUSION_LEVELS)}")
+    
+    for office in config.get('family_office_order', []):
+        if office not in VALID_PATENT_OFFICES:
+            raise ValueError(f"Invalid patent office in family_office_order: {office}")
+    
+    if config.get('sample_stratify', 'none') not in SAMPLE_STRATIFY_OPTIONS:
+        raise ValueError(f"Invalid sample_stratify: {config['sample_stratify']}. Must be one of: {', '.join(SAMPLE_STRATIFY_OPTIONS)}")
+    
+    # Validate patent lists
+    for pattern in config.get('include_lists', []) + config.get('exclude_lists', []):
+        if not glob.glob(pattern):
+            raise ValueError(f"No patent list file matches {pattern} (from include_lists/exclude_lists)")
+    
+    # Output profiles need their own destinations
+    profile_destinations = [os.path.abspath(profile['destination_path']) for profile in config.get('output_profiles', [])]
+    if len(set(profile_destinations)) < len(profile_destinations):
+        raise ValueError("Output profiles must have different destination paths")
+    
     # Validate performance settings
     if config['batch_size'] <= 0:
         raise ValueError("batch_size must be greater than 0")
@@ -219,6 +504,33 @@ def validate_config(config):
     
     if config['memory_limit'] <= 0:
         raise ValueError("memory_limit must be greater than 0")
+    
+    if config['worker_memory_limit'] < 0:
+        raise ValueError("worker_memory_limit must not be negative")
+    
+    if config['group_timeout'] < 0:
+        raise ValueError("group_timeout must not be negative")
+    
+    if config['large_document_mb'] < 0:
+        raise ValueError("large_document_mb must not be negative")
+    
+    if config['lease_timeout'] <= 0:
+        raise ValueError("lease_timeout must be positive")
+    
+    if config['work_unit_size'] < 1:
+        raise ValueError("work_unit_size must be at least 1")
+    
+    if config['executor_backend'] not in VALID_EXECUTOR_BACKENDS:
+        raise ValueError(f"Invalid executor_backend: {config['executor_backend']}. Must be one of: {', '.join(VALID_EXECUTOR_BACKENDS)}")
+    
+    if config['progress_mode'] not in VALID_PROGRESS_MODES:
+        raise ValueError(f"Invalid progress_mode: {config['progress_mode']}. Must be one of: {', '.join(VALID_PROGRESS_MODES)}")
+    
+    if config['progress_log_interval'] <= 0:
+        raise ValueError("progress_log_interval must be positive")
+    
+    if not 0 <= config['metrics_port'] <= 65535:
+        raise ValueError("metrics_port must be between 0 (off) and 65535")
 
 
 class ConfigManager:
@@ -10,6 +10,12 @@ This module contains shared constants used across the application.
 # Valid patent office codes
 VALID_PATENT_OFFICES = ['CN', 'EP', 'JP', 'KR', 'US', 'WO']
 
+# Archive formats that can be read directly (see archive_source.py and corpus_pack.py)
+ARCHIVE_EXTENSIONS = ['.7z', '.zip', '.wpk']
+
+# Separator between archive path and member name in virtual archive member paths
+ARCHIVE_MEMBER_SEPARATOR = '!/'
+
 # Valid output formats
 VALID_OUTPUT_FORMATS = ['csv', 'xml', 'json']
 
@@ -19,15 +25,116 @@ LANGUAGE_PRIORITY = ['EN', 'ZH', 'JA', 'KO']
 # Progress reporting intervals
 PROGRESS_REPORT_INTERVAL = 100000  # Report every 100K records
 
+# Executor backends for the worker pool (see worker_pool.py)
+VALID_EXECUTOR_BACKENDS = ['process', 'thread', 'serial']
+DEFAULT_EXECUTOR_BACKEND = 'process'
+
+# Progress display of the parse and save phases (see progress.py): tqdm bars, periodic log
+# lines, or bars only when stderr is a terminal
+VALID_PROGRESS_MODES = ['auto', 'bars', 'log']
+
+# Run journal for --resume (written to destination_path), and the suffix of files being written
+# (renamed to their final name once complete)
+RUN_JOURNAL_NAME = 'run_journal.jsonl'
+PARTIAL_FILE_SUFFIX = '.part'
+
+# Settings that do not change the content of the outputs (left out of the configuration fingerprint):
+# performance settings, the temp folder, the shard of a sharded run, the name of a worker node and the
+# patent offices (outputs are per office, and the manifest tracks every office's groups separately)
+OUTPUT_NEUTRAL_SETTINGS = ['autotune_params', 'batch_size', 'chunk_size', 'cpu_count', 'executor_backend',
+                           'group_timeout', 'lease_timeout', 'memory_limit', 'pin_workers', 'work_unit_size',
+                           'coordinator_key_file',
+                           'worker_memory_limit', 'shard', 'temp_dir', 'worker_name', 'patent_offices',
+                           'include_lists', 'exclude_lists', 'sample_size', 'sample_seed', 'sample_stratify',
+                           'large_document_mb', 'prometheus_metrics_file', 'profile_dir', 'profile_memory_interval',
+                           'progress_mode', 'progress_log_interval', 'metrics_port']
+
+# Quarantine list of patent groups that crashed, hung or failed on their own (written to destination_path)
+QUARANTINE_FILE_NAME = 'quarantine.csv'
+QUARANTINE_COLUMNS = ['time', 'patent_group', 'reason', 'error', 'file_path']
+
+# Coordinated runs (--coordinator / --worker): seconds between a worker's lease renewals and
+# polls for new work units, and how many times a work unit is handed out before it is given up
+LEASE_RENEWAL_FRACTION = 1 / 3
+WORKER_POLL_SECONDS = 2
+MAX_WORK_UNIT_ATTEMPTS = 3
+# Environment variable holding the shared secret of a coordinated run (overrides coordinator_key_file)
+COORDINATOR_KEY_ENV = 'PATENTFUSION_COORDINATOR_KEY'
+
+# Manifest of the inputs and outputs of every patent group, compared by --delta (written to destination_path)
+MANIFEST_NAME = 'manifest.json'
+# Shard manifests written by --shard i/N and combined by --merge-manifests (manifest.shard-2-of-4.json)
+SHARD_MANIFEST_PATTERN = r'^manifest\.shard-(\d+)-of-(\d+)\.json$'
+DELTA_REPORT_NAME = 'delta_report.csv'
+DELTA_REPORT_COLUMNS = ['patent_group', 'change']
+
+# Family index of family fusion (written to destination_path, see family_index.py), and the
+# number of bytes read from the start of a file to find the family-id of its root element
+FAMILY_INDEX_NAME = 'family_index.json'
+FAMILY_SCAN_BYTES = 16384
+
+# Stage metrics report of a run (written to destination_path, see stage_metrics.py): number of slowest
+# patents and files listed, and the upper bounds (seconds) of the per-patent latency histogram buckets
+METRICS_REPORT_NAME = 'metrics.json'
+METRICS_TOP_N = 20
+METRICS_LATENCY_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+# Profiling mode (--profile, see profiling.py): folder in destination_path receiving the worker statistics,
+# and the number of functions and allocation sites listed in the merged reports
+PROFILE_DIR_NAME = 'profile'
+PROFILE_REPORT_FUNCTIONS = 40
+PROFILE_TOP_ALLOCATIONS = 30
+
+# Memory governor: fractions of memory_limit at which dispatching pauses and resumes
+MEMORY_PAUSE_FRACTION = 0.90
+MEMORY_RESUME_FRACTION = 0.75
+
+# Smallest fraction of batch_size the memory governor may shrink batches to,
+# and the number of pressure-free tasks before the batch size is doubled again
+MIN_BATCH_SCALE = 0.125
+BATCH_SCALE_RECOVERY_TASKS = 50
+
+# Garbage collection policy: RSS growth (MB) that triggers a collection, and its adaptive upper bound
+GC_GROWTH_THRESHOLD_MB = 256
+GC_MAX_THRESHOLD_MB = 4096
+
+# Throughput autotuner (batch_size/cpu_count/chunk_size = AUTO): candidate batch sizes,
+# rounds of batches per worker in each warm-up trial, minimum files per trial,
+# largest fraction of the collection used for warm-up, and the throughput tolerance
+# within which the cheaper setting (smaller batches, fewer workers) is preferred
+AUTOTUNE_BATCH_SIZES = [25, 50, 100, 200, 400]
+AUTOTUNE_TRIAL_ROUNDS = 2
+AUTOTUNE_MIN_TRIAL_FILES = 200
+AUTOTUNE_MAX_SAMPLE_FRACTION = 0.2
+AUTOTUNE_TOLERANCE = 0.05
+
+# chunk_size bounds (virtual patents per temp file) and the fraction of a worker's
+# memory budget that the virtual patents of one temp file may occupy
+MIN_CHUNK_SIZE = 50
+MAX_CHUNK_SIZE = 5000
+CHUNK_MEMORY_FRACTION = 0.25
+
 # Default configuration values
 DEFAULT_CONFIG = {
     'max_text_length': 300,
     'memory_limit': 8,
+    'worker_memory_limit': 'AUTO',
     'output_formats': ['csv'],
     'global_priority': [],
     'field_priorities': {},
     'batch_size': 50,
     'chunk_size': 250,
+    'group_timeout': 300,
+    'lease_timeout': 600,
+    'work_unit_size': 2000,
+    'coordinator_key_file': '',
+    'large_document_mb': 64,
+    'prometheus_metrics_file': '',
+    'progress_mode': 'auto',
+    'progress_log_interval': 30,
+    'metrics_port': 0,
+    'fusion_level': 'publication',
+    'family_office_order': [],
     'parse_lang': 'ALL'
 }
 
@@ -35,6 +142,54 @@ DEFAULT_CONFIG = {
 # Supported languages for patent documents
 SUPPORTED_LANGUAGES = ['EN', 'ZH', 'JA', 'KO', 'FR', 'DE', 'ES', 'IT', 'RU', 'PT', 'NL', 'SV', 'DA', 'NO', 'FI']
 
+# Fusion levels ([vpatent_creation] fusion_level): one virtual patent per publication or per patent family
+FUSION_LEVELS = ['publication', 'family']
+
+# Strata of sample runs ([Sample] sample_stratify, see sampling.py)
+SAMPLE_STRATIFY_OPTIONS = ['none', 'date_folder', 'kind_pattern']
+
+# Level 1 sections of oversized documents that are parsed into the virtual patent; all other
+# sections are streamed from the source file when the outputs are written (see large_documents.py)
+LARGE_DOCUMENT_PARSED_SECTIONS = ['bibliographic-data', 'abstract', 'copyright']
+
+# Columns of ground-truth CSV files holding the patent, in order of preference (see patent_lists.py)
+PATENT_LIST_COLUMNS = ['ucid', 'xml_file_name']
+
+# Config sections [profile:<name>] define output profiles; these settings (and every parse flag) can be set per profile
+OUTPUT_PROFILE_SECTION_PREFIX = 'profile:'
+OUTPUT_PROFILE_SETTINGS = ['destination_path', 'max_text_length', 'output_formats', 'enable_merged_inspection',
+                           'original_directory_structure']
+
+# Fields of the field-specific priorities (<field>_priority in [vpatent_creation]) and where they are found:
+# Level 1 sections of the patent document, elements under bibliographic-data, or root attributes
+FIELD_PRIORITY_SECTIONS = {
+    'abstract': 'abstract',
+    'description': 'description',
+    'claims': 'claims'
+}
+FIELD_PRIORITY_ELEMENTS = {
+    'title': 'technical-data/invention-title',
+    'main_classification': 'technical-data/main-classification',
+    'further_classification': 'technical-data/further-classification',
+    'classification_ipcr': 'technical-data/classifications-ipcr',
+    'classification_cpc': 'technical-data/classifications-cpc',
+    'applicants': 'parties/applicants',
+    'inventors': 'parties/inventors',
+    'agents': 'parties/agents'
+}
+FIELD_PRIORITY_ATTRIBUTES = {
+    'date': 'date',
+    'country': 'country'
+}
+
+# Level 1 sections that are not parsed from lower-priority files when their parse flag is 0 (see merge_planner.py)
+SECTION_PARSE_FLAGS = {
+    'abstract': 'parse_abstract',
+    'description': 'parse_description',
+    'claims': 'parse_claims',
+    'drawings': 'parse_drawings'
+}
+
 # Default primary language priority order
 PRIMARY_LANGUAGE_PRIORITY = ['EN', 'FR', 'DE', 'ES', 'IT', 'ZH', 'JA', 'KO', 'RU']
 
@@ -0,0 +1,359 @@
+# Licensed under the MIT License. See LICENSE-CODE in the repository root for details.
+# Copyright (c) 2025 Christos Papadopoulos
+
+"""
+Corpus Pack for PatentFusion
+
+This module packs the source XML files of a vertical into a few large container
+files (.wpk) plus a CSV offset index, so a full vertical can be scanned
+sequentially instead of opening millions of small files. Every document is
+compressed individually with zlib, which keeps random access possible.
+
+Each container pack_NNNNN.wpk has an index pack_NNNNN.wpk.idx.csv with the columns
+office, number, kind, date_folder, member, offset, length, size. The member column
+holds the path inside the dataset starting at the office folder
+(e.g. EP/20140108/A1/000002/61/57/47/EP-2615747-A1.xml).
+
+Pack directories can be used as PatentFusion input through archive_origin_path,
+and scripts can read documents with iter_pack_documents() or read_pack_member().
+
+Usage:
+    python corpus_pack.py /path/to/WPI-Dataset/EP /path/to/packs/EP --container-size 2048
+"""
+
+import os
+import sys
+import csv
+import time
+import zlib
+import logging
+import argparse
+import threading
+import multiprocessing
+from utils import setup_logging, format_duration, ensure_directory_exists, get_effective_cpu_count
+
+logger = logging.getLogger(__name__)
+
+# Container file extension and index suffix
+PACK_EXTENSION = '.wpk'
+PACK_INDEX_SUFFIX = '.idx.csv'
+PACK_INDEX_COLUMNS = ['office', 'number', 'kind', 'date_folder', 'member', 'offset', 'length', 'size']
+
+# Per-process cache of container indexes (each worker process keeps its own copy)
+_pack_indexes = {}
+
+# Open container handles are seeked and read per batch, so with the thread executor
+# backend every worker thread keeps its own handles
+_thread_caches = threading.local()
+
+
+def get_pack_index_path(container_path):
+    """
+    Get the index file path of a container
+
+    Args:
+        container_path (str): Path to a .wpk container
+
+    Returns:
+        str: Path to the container's CSV index
+    """
+    return f"{container_path}{PACK_INDEX_SUFFIX}"
+
+
+def build_container(build_args):
+    """
+    Write one container file and its index
+
+    Args:
+        build_args (tuple): (container_path, list of (file_path, layout) tuples, compression_level)
+            layout is (office, date_folder, kind_code, member)
+
+    Returns:
+        dict: Container statistics (documents, bytes in, bytes out, duration)
+    """
+    container_path, entries, compression_level = build_args
+    start_time = time.time()
+    bytes_in = 0
+    offset = 0
+    index_rows = []
+
+    # Write under temporary names and rename at the end so half-built containers are never used
+    temp_container_path = f"{container_path}.part"
+    with open(temp_container_path, 'wb') as container:
+        for file_path, (office, date_folder, kind_code, member) in entries:
+            try:
+                with open(file_path, 'rb') as f:
+                    content = f.read()
+            except OSError as e:
+                logger.warning(f"Skipping unreadable file {file_path}: {e}")
+                continue
+
+            compressed = zlib.compress(content, compression_level)
+            container.write(compressed)
+
+            file_name = os.path.basename(member)
+            number = file_name.split(".")[0].split("-")[1] if file_name.count("-") >= 2 else ''
+            index_rows.append([office, number, kind_code, date_folder, member, offset, len(compressed), len(content)])
+            offset += len(compressed)
+            bytes_in += len(content)
+
+    temp_index_path = f"{get_pack_index_path(container_path)}.part"
+    with open(temp_index_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(PACK_INDEX_COLUMNS)
+        writer.writerows(index_rows)
+
+    os.replace(temp_container_path, container_path)
+    os.replace(temp_index_path, get_pack_index_path(container_path))
+
+    return {
+        'container': container_path,
+        'documents': len(index_rows),
+        'bytes_in': bytes_in,
+        'bytes_out': offset,
+        'duration_seconds': time.time() - start_time
+    }
+
+
+def build_corpus_pack(source_path, pack_path, container_size_mb=2048, cpu_count=None, compression_level=6):
+    """
+    Pack all XML files under source_path into containers in pack_path
+
+    Files are sorted by path and split into containers of roughly container_size_mb
+    (uncompressed); containers are written in parallel, one per worker.
+
+    Args:
+        source_path (str): Vertical root (e.g. /WPI-Dataset/EP) or any folder above the office folders
+        pack_path (str): Output directory for the containers and indexes
+        container_size_mb (int): Target uncompressed size of each container in MB
+        cpu_count (int, optional): Number of worker processes. If None, uses all available.
+        compression_level (int): zlib compression level (1-9)
+
+    Returns:
+        list: Per-container statistics
+    """
+    # Imported here to keep corpus_pack light for readers
+    from file_system import get_all_file_paths
+    from archive_extractor import parse_member_layout
+
+    if cpu_count is None:
+        cpu_count = get_effective_cpu_count()
+
+    all_file_paths, _ = get_all_file_paths(source_path, cpu_count)
+
+    # Split files into containers by cumulative size, keeping dataset order
+    containers = []
+    current_entries = []
+    current_size = 0
+    container_size_bytes = container_size_mb * 1024 * 1024
+    skipped = 0
+    for file_path in all_file_paths:
+        layout = parse_member_layout('/'.join(os.path.abspath(file_path).split(os.sep)))
+        if layout is None:
+            skipped += 1
+            continue
+        current_entries.append((file_path, layout))
+        current_size += os.path.getsize(file_path)
+        if current_size >= container_size_bytes:
+            containers.append(current_entries)
+            current_entries = []
+            current_size = 0
+    if current_entries:
+        containers.append(current_entries)
+
+    if skipped:
+        logger.warning(f"Skipped {skipped} files outside the Office/Date/Kind layout")
+
+    ensure_directory_exists(pack_path)
+    build_args = [(os.path.join(pack_path, f"pack_{index:05d}{PACK_EXTENSION}"), entries, compression_level)
+                  for index, entries in enumerate(containers)]
+
+    logger.info(f"Packing {len(all_file_paths) - skipped} files into {len(build_args)} containers in {pack_path}")
+    start_time = time.time()
+    if not build_args:
+        return []
+
+    with multiprocessing.Pool(processes=min(cpu_count, len(build_args))) as pool:
+        results = pool.map(build_container, build_args)
+
+    for result in results:
+        logger.info(f"  {os.path.basename(result['container'])}: {result['documents']} documents, "
+                   f"{result['bytes_in'] / (1024 * 1024):.2f} MB -> {result['bytes_out'] / (1024 * 1024):.2f} MB")
+
+    total_in = sum(result['bytes_in'] for result in results) / (1024 * 1024)
+    total_out = sum(result['bytes_out'] for result in results) / (1024 * 1024)
+    logger.info(f"Corpus pack complete in {format_duration(time.time() - start_time)}: {total_in:.2f} MB -> {total_out:.2f} MB")
+    return results
+
+
+def find_pack_containers(pack_path):
+    """
+    Find all containers in a pack directory
+
+    Args:
+        pack_path (str): Pack directory (or a single container path)
+
+    Returns:
+        list: Sorted list of container paths
+    """
+    if os.path.isfile(pack_path):
+        return [pack_path] if pack_path.endswith(PACK_EXTENSION) else []
+    return sorted(os.path.join(pack_path, name) for name in os.listdir(pack_path) if name.endswith(PACK_EXTENSION))
+
+
+def read_pack_index(container_path):
+    """
+    Read the index rows of a container
+
+    Args:
+        container_path (str): Path to a .wpk container
+
+    Returns:
+        list: List of index row dictionaries in container order (offset and sizes as int)
+    """
+    rows = []
+    with open(get_pack_index_path(container_path), 'r', encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            row['offset'] = int(row['offset'])
+            row['length'] = int(row['length'])
+            row['size'] = int(row['size'])
+            rows.append(row)
+    return rows
+
+
+def _get_member_index(container_path):
+    """Return the cached member -> (offset, length) lookup of a container for this process"""
+    member_index = _pack_indexes.get(container_path)
+    if member_index is None:
+        member_index = {row['member']: (row['offset'], row['length']) for row in read_pack_index(container_path)}
+        _pack_indexes[container_path] = member_index
+    return member_index
+
+
+def _get_open_pack(container_path):
+    """Return a cached open file handle of a container for this worker thread"""
+    open_packs = getattr(_thread_caches, 'open_packs', None)
+    if open_packs is None:
+        open_packs = {}
+        _thread_caches.open_packs = open_packs
+    handle = open_packs.get(container_path)
+    if handle is None:
+        handle = open(container_path, 'rb')
+        open_packs[container_path] = handle
+    return handle
+
+
+def list_pack_members(container_path):
+    """
+    List the documents of a container with their uncompressed sizes
+
+    Args:
+        container_path (str): Path to a .wpk container
+
+    Returns:
+        list: List of (member, size_in_bytes) tuples in container order
+    """
+    return [(row['member'], row['size']) for row in read_pack_index(container_path)]
+
+
+def read_pack_members(container_path, members):
+    """
+    Read several documents from a container in offset order (sequential disk access)
+
+    Args:
+        container_path (str): Path to a .wpk container
+        members (list): Member paths to read
+
+    Returns:
+        dict: Mapping member -> uncompressed bytes
+    """
+    member_index = _get_member_index(container_path)
+    handle = _get_open_pack(container_path)
+    contents = {}
+    for member in sorted(members, key=lambda name: member_index[name][0]):
+        offset, length = member_index[member]
+        handle.seek(offset)
+        contents[member] = zlib.decompress(handle.read(length))
+    return contents
+
+
+def read_pack_member(container_path, member):
+    """
+    Read a single document from a container
+
+    Args:
+        container_path (str): Path to a .wpk container
+        member (str): Member path (e.g. 'EP/20140108/A1/000002/61/57/47/EP-2615747-A1.xml')
+
+    Returns:
+        bytes: Uncompressed XML content
+    """
+    return read_pack_members(container_path, [member])[member]
+
+
+def iter_pack_documents(pack_path, offices=None, kinds=None, date_folders=None):
+    """
+    Sequentially scan all documents of a pack directory
+
+    Intended for scripts that used to walk the extracted dataset, e.g.:
+
+        for row, content in iter_pack_documents('/packs/EP', kinds=['B1']):
+            soup = BeautifulSoup(content, 'xml')
+
+    Args:
+        pack_path (str): Pack directory (or a single container path)
+        offices (list, optional): Only yield documents of these offices
+        kinds (list, optional): Only yield documents with these kind codes
+        date_folders (list, optional): Only yield documents from these date folders
+
+    Yields:
+        tuple: (index_row, xml_bytes)
+    """
+    for container_path in find_pack_containers(pack_path):
+        # Containers are read front to back with a large buffer, so the whole pack is scanned at disk bandwidth
+        with open(container_path, 'rb', buffering=8 * 1024 * 1024) as container:
+            position = 0
+            for row in read_pack_index(container_path):
+                if row['offset'] != position:
+                    container.seek(row['offset'])
+                data = container.read(row['length'])
+                position = row['offset'] + row['length']
+                if offices and row['office'] not in offices:
+                    continue
+                if kinds and row['kind'] not in kinds:
+                    continue
+                if date_folders and row['date_folder'] not in date_folders:
+                    continue
+                yield row, zlib.decompress(data)
+
+
+def main(argv=None):
+    """
+    Command line entry point
+
+    Args:
+        argv (list, optional): Command line arguments (defaults to sys.argv[1:])
+
+    Returns:
+        int: Exit code (0 for success, 1 for error)
+    """
+    parser = argparse.ArgumentParser(description="Pack the XML files of a WPI vertical into indexed container files")
+    parser.add_argument('source_path', help="Vertical root directory (e.g. /WPI-Dataset/EP)")
+    parser.add_argument('pack_path', help="Output directory for the containers and indexes")
+    parser.add_argument('--container-size', type=int, default=2048, help="Target uncompressed container size in MB")
+    parser.add_argument('--compression-level', type=int, default=6, choices=range(1, 10), help="zlib compression level")
+    parser.add_argument('--workers', type=int, default=get_effective_cpu_count(), help="Number of worker processes")
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    try:
+        build_corpus_pack(args.source_path, args.pack_path, args.container_size,
+                          cpu_count=max(1, args.workers), compression_level=args.compression_level)
+    except Exception as e:
+        logger.error(f"Corpus pack failed: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,30 +9,69 @@ including format conversion, filtering, and file output generation.
 """
 
 import os
+import copy
 import json
+import shutil
 import logging
 import pandas as pd
 from lxml import etree
 from output_manager import construct_original_directory_path, xml_to_hierarchical_dict
 from output_manager import remove_metadata_attributes, apply_text_truncation_to_xml, xml_to_flat_dict, has_kind_merging
-from utils import ensure_directory_exists
+from utils import ensure_directory_exists, atomic_output_path
+from config_manager import get_output_profiles
+from xml_parser import filter_virtual_patent_by_config
+from large_documents import has_streamed_sections, write_streamed_output
+from stage_metrics import get_stage_metrics, StageTimer
+from profiling import count_profiled_group
 
 logger = logging.getLogger(__name__)
 
-def save_individual_vpatents_sequential(virtual_patents, patent_office, output_formats, destination_path, config):
+# Output directories already created by this worker (avoids one exists() check per saved file)
+_created_directories = set()
+
+def ensure_output_directory(directory_path):
+    """
+    Ensure an output directory exists, remembering directories this worker already created
+    
+    Args:
+        directory_path (str): Path to the directory
+    """
+    if directory_path not in _created_directories:
+        ensure_directory_exists(directory_path)
+        _created_directories.add(directory_path)
+
+def write_output_file(output_path, data):
+    """
+    Write serialized output to a file atomically
+    
+    Args:
+        output_path (str): Path to the output file
+        data (bytes): File content
+    """
+    with atomic_output_path(output_path) as temp_path, open(temp_path, 'wb') as f:
+        f.write(data)
+
+def save_individual_vpatents_sequential(virtual_patents, output_formats, destination_path, config, saved_outputs=None):
     """
     Save individual virtual patent files sequentially (without multiprocessing)
     to avoid daemon process issues when called from multiprocessing workers
 
+    Each format is serialized once and the same bytes are written to the output and
+    inspection files; serializing and writing are timed separately in the stage metrics.
+
     Args:
-        virtual_patents (list): List of virtual patent XML elements
-        patent_office (str): Patent office code (e.g., 'EP', 'CN')
+        virtual_patents (list): List of virtual patent XML elements (of any patent office)
         output_formats (list): List of formats to save ('csv', 'xml', 'json')
         destination_path (str): Destination directory path
         config (dict): Configuration dictionary
+        saved_outputs (dict, optional): Receives group key (e.g. 'EP-2615747') -> list of written file paths
 
     Returns:
         tuple: (files_saved, merged_patents_count)
+
+    Raises:
+        RuntimeError: If any output could not be written; the other virtual patents are
+            still saved first, so the caller only has to keep the temp file for a retry
     """
     if not virtual_patents:
         return 0, 0
@@ -40,9 +79,13 @@ def save_individual_vpatents_sequential(virtual_patents, patent_office, output_f
 
     files_saved = 0
     merged_patents_count = 0
+    metrics = get_stage_metrics()
+    # Outputs that could not be written (a full disk must not pass for a saved virtual patent)
+    failures = []
 
     # Process each virtual patent sequentially
     for virtual_patent in virtual_patents:
+        timer = StageTimer(metrics)
         try:
             # Extract patent information
             ucid = virtual_patent.get('ucid', '')
@@ -51,16 +94,25 @@ def save_individual_vpatents_sequential(virtual_patents, patent_office, output_f
             else:
                 patent_number = 'UNKNOWN'
 
-            # Create base filename: PatentOffice-PatentNumber-VP
-            base_filename = f"{patent_office}-{patent_number}-VP"
+            # Extract source file path before removing metadata (needed for the patent office
+            # and the original directory structure)
+            source_file_path = virtual_patent.get('_source_file_path', '')
+
+            # Outputs are routed by the patent office of the source files (file names start with it)
+            patent_office = os.path.basename(source_file_path).split('-')[0] if source_file_path else ucid.split('-')[0]
+            group_key = f"{patent_office}-{patent_number}"
+
+            # Create base filename: PatentOffice-PatentNumber-VP (FAMILY-FamilyId-VP for family fusion)
+            family_key = virtual_patent.get('_family_key')
+            base_filename = f"{family_key or group_key}-VP"
 
             # Check if this is a merged patent
             is_merged_patent = has_kind_merging(virtual_patent)
             enable_merged_inspection = config.get('enable_merged_inspection', True)
             save_to_inspection = is_merged_patent and enable_merged_inspection
-
-            # Extract source file path before removing metadata (needed for original directory structure)
-            source_file_path = virtual_patent.get('_source_file_path', '')
+            
+            # Virtual patents of oversized documents hold placeholders for their large sections
+            streamed = has_streamed_sections(virtual_patent)
 
             # Remove metadata attributes before any processing
             remove_metadata_attributes(virtual_patent)
@@ -96,7 +148,7 @@ def save_individual_vpatents_sequential(virtual_patents, patent_office, output_f
                         format_dir = os.path.join(office_dir, fmt)
 
                     # Ensure directories exist
-                    ensure_directory_exists(format_dir)
+                    ensure_output_directory(format_dir)
 
                     output_path = os.path.join(format_dir, f"{base_filename}.{fmt}")
 
@@ -124,47 +176,111 @@ def save_individual_vpatents_sequential(virtual_patents, patent_office, output_f
                             # Use regular structure
                             inspection_dir = os.path.join(base_dest_path, "merged_patents_inspection", patent_office, fmt)
 
-                        ensure_directory_exists(inspection_dir)
+                        ensure_output_directory(inspection_dir)
                         inspection_path = os.path.join(inspection_dir, f"{base_filename}.{fmt}")
 
-                    if fmt == 'xml':
-                        # Save XML format
-                        # Config-based filtering is applied during virtual patent creation
-                        apply_text_truncation_to_xml(virtual_patent, config)
-
-                        tree = etree.ElementTree(virtual_patent)
-                        tree.write(output_path, encoding="utf-8", xml_declaration=True, pretty_print=True)
-
+                    timer.skip()
+                    if streamed:
+                        # The large sections are streamed from the source files into the output
+                        if fmt == 'xml':
+                            apply_text_truncation_to_xml(virtual_patent, config)
+                        xml_truncated = 'xml' in output_formats[:output_formats.index(fmt)]
+                        write_streamed_output(virtual_patent, fmt, output_path, config, truncate=xml_truncated)
+                        # Streamed outputs are serialized while they are written
+                        timer.lap(f'serialize_{fmt}')
+                        output_size = os.path.getsize(output_path)
+                        
                         if inspection_path:
-                            tree.write(inspection_path, encoding="utf-8", xml_declaration=True, pretty_print=True)
-
-                    elif fmt == 'csv':
-                        # Save CSV format
-                        record_dict = xml_to_flat_dict(virtual_patent, config)
-                        df = pd.DataFrame([record_dict])
-                        df.to_csv(output_path, sep=';', index=False)
-
-                        if inspection_path:
-                            df.to_csv(inspection_path, sep=';', index=False)
-
-                    elif fmt == 'json':
-                        # Save JSON format - use hierarchical dictionary to preserve XML structure
-                        hierarchical_dict = xml_to_hierarchical_dict(virtual_patent, config)
-                        with open(output_path, 'w', encoding='utf-8') as f:
-                            json.dump(hierarchical_dict, f, ensure_ascii=False, indent=4)
-
+                            with atomic_output_path(inspection_path) as temp_path:
+                                shutil.copyfile(output_path, temp_path)
+                    
+                    else:
+                        if fmt == 'xml':
+                            # Save XML format
+                            # Config-based filtering is applied during virtual patent creation
+                            apply_text_truncation_to_xml(virtual_patent, config)
+                            data = etree.tostring(etree.ElementTree(virtual_patent), encoding="UTF-8",
+                                                  xml_declaration=True, pretty_print=True)
+
+                        elif fmt == 'csv':
+                            # Save CSV format
+                            record_dict = xml_to_flat_dict(virtual_patent, config)
+                            data = pd.DataFrame([record_dict]).to_csv(sep=';', index=False).encode('utf-8')
+
+                        elif fmt == 'json':
+                            # Save JSON format - use hierarchical dictionary to preserve XML structure
+                            hierarchical_dict = xml_to_hierarchical_dict(virtual_patent, config)
+                            data = json.dumps(hierarchical_dict, ensure_ascii=False, indent=4).encode('utf-8')
+                        timer.lap(f'serialize_{fmt}')
+
+                        write_output_file(output_path, data)
                         if inspection_path:
-                            with open(inspection_path, 'w', encoding='utf-8') as f:
-                                json.dump(hierarchical_dict, f, ensure_ascii=False, indent=4)
+                            write_output_file(inspection_path, data)
+                        output_size = len(data)
+                    timer.lap('write')
 
+                    written_files = 2 if inspection_path else 1
+                    metrics.count('files_written', written_files)
+                    metrics.count('bytes_out', output_size * written_files)
                     files_saved += 1
+                    if saved_outputs is not None:
+                        written = saved_outputs.setdefault(group_key, [])
+                        written.append(output_path)
+                        if inspection_path:
+                            written.append(inspection_path)
 
                 except Exception as e:
                     logger.error(f"Error saving {fmt} format for patent {base_filename}: {e}")
+                    failures.append(f"{base_filename}.{fmt}: {e}")
                     continue
 
+            metrics.count('patents_saved')
+            metrics.add_latency('save', family_key or group_key, timer.elapsed())
+            count_profiled_group()
+
         except Exception as e:
             logger.error(f"Error processing virtual patent: {e}")
+            failures.append(f"{virtual_patent.get('ucid', 'virtual patent')}: {e}")
             continue
 
-    return files_saved, merged_patents_count
\ No newline at end of file
+    if failures:
+        raise RuntimeError(f"{len(failures)} outputs could not be saved (first: {failures[0]})")
+    return files_saved, merged_patents_count
+
+def save_virtual_patents(virtual_patents, config, saved_outputs=None):
+    """
+    Save virtual patents with every output profile
+    
+    Without output profiles this is save_individual_vpatents_sequential with the configured
+    formats and destination. With profiles, the virtual patents (merged once for all
+    profiles) are filtered by each profile's parse flags and saved with its settings.
+    
+    Args:
+        virtual_patents (list): List of virtual patent XML elements
+        config (dict): Configuration dictionary
+        saved_outputs (dict, optional): Receives group key -> list of written file paths (of all profiles)
+        
+    Returns:
+        tuple: (files_saved, merged_patents_count)
+    """
+    if not config.get('output_profiles'):
+        return save_individual_vpatents_sequential(virtual_patents, config['output_formats'],
+                                                   config['individual_vp_dir'], config, saved_outputs=saved_outputs)
+    
+    profiles = get_output_profiles(config)
+    files_saved = 0
+    merged_patents_count = 0
+    for index, profile_config in enumerate(profiles):
+        # Filtering and saving change the elements, so every profile but the last works on copies
+        if index < len(profiles) - 1:
+            profile_patents = [copy.deepcopy(virtual_patent) for virtual_patent in virtual_patents]
+        else:
+            profile_patents = virtual_patents
+        for virtual_patent in profile_patents:
+            filter_virtual_patent_by_config(virtual_patent, profile_config)
+        profile_files, merged_patents_count = save_individual_vpatents_sequential(
+            profile_patents, profile_config['output_formats'], profile_config['individual_vp_dir'], profile_config,
+            saved_outputs=saved_outputs
+        )
+        files_saved += profile_files
+    return files_saved, merged_patents_count
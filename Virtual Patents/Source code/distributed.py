@@ -0,0 +1,477 @@
+# Licensed under the MIT License. See LICENSE-CODE in the repository root for details.
+# Copyright (c) 2025 Christos Papadopoulos
+
+"""
+Coordinated Runs for PatentFusion
+
+This module spreads one run over several machines of different speed. The
+coordinator (python PatentFusion.py --coordinator HOST:PORT) discovers the input,
+splits it into work units of whole patent groups and serves them over TCP
+(multiprocessing.managers, no external services). Worker nodes
+(python PatentFusion.py --worker HOST:PORT) lease one work unit at a time, run
+the usual parse and save pipeline on it with their own worker pool, and
+acknowledge it with the output files written. Workers renew their lease while
+they work; the unit of a worker that stops renewing is handed to another worker
+once its lease expires.
+
+The coordinator journals every acknowledged unit, so --resume, --delta and the
+manifest work as in a local run. Manager connections exchange pickled messages, so
+the authentication key is an HMAC of the output settings under a shared secret
+(coordinator_key_file or the PATENTFUSION_COORDINATOR_KEY environment variable):
+only workers holding the secret and the same output configuration can connect. A
+coordinator on a non-loopback address refuses to start without a secret.
+Output and bookkeeping paths must be reachable from every node (shared filesystem).
+"""
+
+import os
+import hmac
+import stat
+import time
+import socket
+import hashlib
+import logging
+import ipaddress
+import threading
+import collections
+from multiprocessing.managers import BaseManager
+from constants import LEASE_RENEWAL_FRACTION, WORKER_POLL_SECONDS, MAX_WORK_UNIT_ATTEMPTS, METRICS_REPORT_NAME
+from constants import PROFILE_DIR_NAME, COORDINATOR_KEY_ENV
+from file_system import get_file_batches, get_patent_groups, create_directory_structure, cleanup_temp_files, get_run_file_path
+from parallel_processor import process_files_parallel
+from memory_manager import chunked_memory_efficient_processing, create_worker_pool
+from run_journal import get_config_fingerprint
+from stage_metrics import write_metrics_report
+from profiling import prepare_profile_dir, write_profile_report
+from progress import create_progress, get_live_status, start_metrics_server, stop_metrics_server
+from utils import format_duration
+
+logger = logging.getLogger(__name__)
+
+
+class WorkQueueManager(BaseManager):
+    """Manager serving the work queue of a coordinated run"""
+
+
+def parse_address(address):
+    """
+    Parse a HOST:PORT address
+
+    Args:
+        address (str): Address such as 'localhost:5800' or '0.0.0.0:5800'
+
+    Returns:
+        tuple: (host, port)
+
+    Raises:
+        ValueError: If the address is not of the form HOST:PORT
+    """
+    host, separator, port = address.rpartition(':')
+    if not separator or not port.isdigit():
+        raise ValueError(f"Invalid address '{address}', expected HOST:PORT")
+    return host or 'localhost', int(port)
+
+
+def is_loopback_host(host):
+    """
+    Check whether a host only accepts connections from this machine
+
+    Args:
+        host (str): Host name or IP address
+
+    Returns:
+        bool: True for 'localhost' and loopback addresses
+    """
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host.strip('[]')).is_loopback
+    except ValueError:
+        return False
+
+
+def read_coordinator_secret(config):
+    """
+    Read the shared secret of a coordinated run
+
+    Args:
+        config (dict): Configuration dictionary (coordinator_key_file)
+
+    Returns:
+        bytes: Secret from the PATENTFUSION_COORDINATOR_KEY environment variable or the key file,
+            or None if neither is set
+
+    Raises:
+        ValueError: If the key file cannot be read or is empty
+    """
+    secret = os.environ.get(COORDINATOR_KEY_ENV, '').strip()
+    if secret:
+        return secret.encode('utf-8')
+    key_file = config.get('coordinator_key_file')
+    if not key_file:
+        return None
+    key_file = os.path.expanduser(key_file)
+    try:
+        with open(key_file, 'rb') as f:
+            secret = f.read().strip()
+        mode = os.stat(key_file).st_mode
+    except OSError as e:
+        raise ValueError(f"Cannot read coordinator_key_file {key_file}: {e}")
+    if not secret:
+        raise ValueError(f"coordinator_key_file {key_file} is empty")
+    if os.name == 'posix' and mode & (stat.S_IRWXG | stat.S_IRWXO):
+        logger.warning(f"coordinator_key_file {key_file} is readable by other users; restrict it with chmod 600")
+    return secret
+
+
+def get_authkey(config, address):
+    """
+    Get the authentication key shared by the coordinator and its workers
+
+    The key is an HMAC of the output settings under the shared secret, so a worker needs
+    both the secret and the coordinator's output configuration. Without a secret the key
+    is derived from the output settings alone, which is only accepted for loopback addresses.
+
+    Args:
+        config (dict): Configuration dictionary
+        address (str): HOST:PORT of the coordinator
+
+    Returns:
+        bytes: Authentication key
+
+    Raises:
+        ValueError: If no secret is set for a non-loopback address, or the key file is unusable
+    """
+    fingerprint = get_config_fingerprint(config).encode('ascii')
+    secret = read_coordinator_secret(config)
+    if secret is not None:
+        return hmac.new(secret, fingerprint, hashlib.sha256).digest()
+    host, _ = parse_address(address)
+    if not is_loopback_host(host):
+        raise ValueError(f"Coordinated runs on {address} need a shared secret: set coordinator_key_file in "
+                         f"config.ini or the {COORDINATOR_KEY_ENV} environment variable on every node")
+    return fingerprint
+
+
+class WorkQueue:
+    """
+    Leased work units of a coordinated run (lives in the coordinator, called by workers over TCP)
+    """
+
+    def __init__(self, units, folder_order, lease_timeout, journal=None):
+        """
+        Initialize the queue
+
+        Args:
+            units (list): Work units, each a list of file paths of whole patent groups
+            folder_order (dict): Dictionary mapping folder names to order indices
+            lease_timeout (float): Seconds a lease stays valid without renewal
+            journal (RunJournal, optional): Run journal receiving every acknowledged unit
+        """
+        self.units = dict(enumerate(units))
+        self.folder_order = folder_order
+        self.lease_timeout = lease_timeout
+        self.journal = journal
+        self.pending = collections.deque(self.units)
+        self.leases = {}
+        self.attempts = collections.Counter()
+        self.completed = set()
+        self.failed = set()
+        self.worker_units = collections.Counter()
+        # Worker nodes that asked for a unit, including those still on their first one
+        self.joined_workers = set()
+        self.lock = threading.Lock()
+
+    def get_run_info(self):
+        """
+        Get what a worker needs before leasing units
+
+        Returns:
+            dict: folder_order and lease_timeout
+        """
+        return {'folder_order': self.folder_order, 'lease_timeout': self.lease_timeout}
+
+    def lease(self, worker_name):
+        """
+        Lease the next pending work unit
+
+        Args:
+            worker_name (str): Name of the leasing worker
+
+        Returns:
+            dict: {'unit_id', 'file_paths'} of the leased unit, {'wait': seconds} if all remaining
+                units are leased to other workers, or None when the run is finished
+        """
+        with self.lock:
+            self.joined_workers.add(worker_name)
+            self._expire_leases()
+            if not self.pending:
+                return {'wait': WORKER_POLL_SECONDS} if self.leases else None
+            unit_id = self.pending.popleft()
+            self.attempts[unit_id] += 1
+            self.leases[unit_id] = (worker_name, time.time() + self.lease_timeout)
+            return {'unit_id': unit_id, 'file_paths': self.units[unit_id]}
+
+    def renew(self, unit_id, worker_name):
+        """
+        Extend the lease of a unit a worker is still processing
+
+        Args:
+            unit_id (int): Work unit id
+            worker_name (str): Name of the worker holding the lease
+
+        Returns:
+            bool: False if the lease expired and the unit was handed to another worker
+        """
+        with self.lock:
+            lease = self.leases.get(unit_id)
+            if lease is None or lease[0] != worker_name:
+                return False
+            self.leases[unit_id] = (worker_name, time.time() + self.lease_timeout)
+            return True
+
+    def acknowledge(self, unit_id, worker_name, saved_outputs, quarantined_groups):
+        """
+        Mark a work unit as done
+
+        A unit acknowledged after its lease was reassigned still counts (its outputs
+        were written); the later acknowledgement of the other worker is ignored.
+
+        Args:
+            unit_id (int): Work unit id
+            worker_name (str): Name of the worker
+            saved_outputs (dict): group_key -> written file paths
+            quarantined_groups (list): Group keys the worker quarantined
+        """
+        with self.lock:
+            if unit_id in self.completed:
+                return
+            self.leases.pop(unit_id, None)
+            if unit_id in self.pending:
+                self.pending.remove(unit_id)
+            self.completed.add(unit_id)
+            self.failed.discard(unit_id)
+            self.worker_units[worker_name] += 1
+            if self.journal is not None:
+                if quarantined_groups:
+                    self.journal.record_quarantined(quarantined_groups)
+                groups = set(get_patent_groups(self.units[unit_id])) - set(quarantined_groups)
+                self.journal.record_parsed(sorted(groups), [], saved_outputs)
+
+    def _expire_leases(self):
+        """Return units whose lease ran out to the front of the queue (lock must be held)"""
+        now = time.time()
+        for unit_id, (worker_name, expires) in list(self.leases.items()):
+            if expires > now:
+                continue
+            del self.leases[unit_id]
+            if self.attempts[unit_id] >= MAX_WORK_UNIT_ATTEMPTS:
+                self.failed.add(unit_id)
+                logger.error(f"Work unit {unit_id} was lost {self.attempts[unit_id]} times (last by {worker_name}); giving up")
+            else:
+                self.pending.appendleft(unit_id)
+                logger.warning(f"Lease of work unit {unit_id} by {worker_name} expired; reassigning")
+
+    def get_progress(self):
+        """
+        Get the state of the queue (and expire overdue leases)
+
+        Returns:
+            tuple: (completed units, failed units, leased units)
+        """
+        with self.lock:
+            self._expire_leases()
+            return len(self.completed), len(self.failed), len(self.leases)
+
+
+def serve_work_units(address, file_paths, folder_order, config, journal=None, family_index=None):
+    """
+    Coordinator: serve the patent groups of file_paths as leased work units until all are done
+
+    Args:
+        address (str): HOST:PORT to listen on
+        file_paths (list): Source file paths to distribute
+        folder_order (dict): Dictionary mapping folder names to order indices
+        config (dict): Configuration dictionary
+        journal (RunJournal, optional): Run journal receiving every acknowledged unit
+        family_index (FamilyIndex, optional): Keep whole patent families in one work unit (family fusion)
+
+    Returns:
+        bool: True if every work unit was acknowledged
+    """
+    try:
+        authkey = get_authkey(config, address)
+    except ValueError as e:
+        logger.error(str(e))
+        return False
+
+    units = get_file_batches(file_paths, config['work_unit_size'], family_index)
+    queue = WorkQueue(units, folder_order, config['lease_timeout'], journal)
+
+    WorkQueueManager.register('get_queue', callable=lambda: queue)
+    manager = WorkQueueManager(address=parse_address(address), authkey=authkey)
+    server = manager.get_server()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    start_time = time.time()
+    logger.info(f"Coordinator listening on {address}: {len(units)} work units of up to "
+               f"{config['work_unit_size']} files, lease timeout {config['lease_timeout']:.0f}s")
+    logger.info(f"Start worker nodes with: python PatentFusion.py --worker {address}")
+
+    # Progress bar, or periodic progress log lines when headless (worker nodes join at any time)
+    progress = create_progress(config, 'coordinate', 'coordinated run', len(units), 'work unit', 0, None)
+    completed, failed, leased = 0, 0, 0
+    finished = 0
+    while finished < len(units):
+        time.sleep(WORKER_POLL_SECONDS)
+        completed, failed, leased = queue.get_progress()
+        # Pending units wait in the queue; leased units keep a worker node busy
+        get_live_status().set_queue(len(units) - completed - failed - leased, leased)
+        progress.update(completed + failed - finished)
+        finished = completed + failed
+        progress.set_workers(len(queue.joined_workers))
+        progress.set_info({"Leased": leased, "Workers": len(queue.joined_workers)})
+        progress.poll()
+    progress.close()
+
+    logger.info(f"Coordinated run finished in {format_duration(time.time() - start_time)}")
+    for worker_name, count in sorted(queue.worker_units.items()):
+        logger.info(f"  {worker_name}: {count} work units")
+    if failed:
+        logger.error(f"{failed} work units were not completed; rerun with --resume to retry them")
+    return failed == 0
+
+
+class UnitRecorder:
+    """
+    Collects the outputs and quarantined groups of one work unit on a worker node
+
+    Stands in for the run journal of the local pipeline (process_files_parallel and
+    chunked_memory_efficient_processing); the coordinator journals the unit as a whole.
+    """
+
+    def __init__(self, unit_id):
+        """
+        Args:
+            unit_id (int): Work unit id
+        """
+        # Temp files of different units never collide
+        self.batch_prefix = f"u{unit_id}_"
+        self.saved_outputs = {}
+        self.quarantined_groups = set()
+
+    def record_parsed(self, groups, temp_files, saved_outputs=None):
+        """Parsed batches are only journaled by the coordinator"""
+
+    def record_quarantined(self, groups):
+        """Collect quarantined patent groups"""
+        self.quarantined_groups.update(groups)
+
+    def record_saved(self, temp_file_path, saved_outputs=None):
+        """Collect the output files of a saved temp file"""
+        for group_key, paths in (saved_outputs or {}).items():
+            self.saved_outputs.setdefault(group_key, []).extend(paths)
+
+
+def _renew_lease(queue, unit_id, worker_name, interval, stop_event):
+    """Renew a lease every interval seconds until stop_event is set"""
+    while not stop_event.wait(interval):
+        try:
+            if not queue.renew(unit_id, worker_name):
+                logger.warning(f"Lease of work unit {unit_id} was lost")
+                return
+        except (OSError, EOFError) as e:
+            logger.warning(f"Could not renew lease of work unit {unit_id}: {e}")
+
+
+def run_worker_node(address, config):
+    """
+    Worker node: lease work units from a coordinator, process and acknowledge them
+
+    Args:
+        address (str): HOST:PORT of the coordinator
+        config (dict): Configuration dictionary (same output settings as the coordinator)
+
+    Returns:
+        int: Exit code (0 for success, 1 for error)
+    """
+    worker_name = f"{socket.gethostname()}-{os.getpid()}"
+    config['worker_name'] = worker_name
+    config['temp_dir'] = f"{config['temp_dir']}.worker-{worker_name}"
+    if config.get('profile_dir'):
+        # Each worker node profiles into its own folder (profile.worker-<name>)
+        config['profile_dir'] = get_run_file_path(config, PROFILE_DIR_NAME)
+
+    try:
+        authkey = get_authkey(config, address)
+    except ValueError as e:
+        logger.error(str(e))
+        return 1
+    WorkQueueManager.register('get_queue')
+    manager = WorkQueueManager(address=parse_address(address), authkey=authkey)
+    try:
+        manager.connect()
+    except ConnectionRefusedError:
+        logger.error(f"No coordinator listening on {address}")
+        return 1
+    except Exception as e:
+        # AuthenticationError when the secret or the output settings differ from the coordinator's
+        logger.error(f"Could not join the coordinator at {address} ({e}); check that the shared secret and "
+                     f"config.ini match the coordinator's")
+        return 1
+    queue = manager.get_queue()
+    run_info = queue.get_run_info()
+    renewal_interval = run_info['lease_timeout'] * LEASE_RENEWAL_FRACTION
+
+    create_directory_structure(config)
+    if config.get('profile_dir'):
+        prepare_profile_dir(config['profile_dir'])
+    pool = create_worker_pool(config)
+    pool.start()
+    metrics_server = start_metrics_server(config['metrics_port'])
+    start_time = time.time()
+    units_done = 0
+    logger.info(f"Worker {worker_name} joined the coordinator at {address}")
+
+    try:
+        while True:
+            try:
+                unit = queue.lease(worker_name)
+            except (OSError, EOFError):
+                logger.info("Coordinator closed the run")
+                break
+            if unit is None:
+                break
+            if 'wait' in unit:
+                time.sleep(unit['wait'])
+                continue
+
+            unit_id = unit['unit_id']
+            logger.info(f"Processing work unit {unit_id} ({len(unit['file_paths'])} files)")
+            stop_renewal = threading.Event()
+            threading.Thread(target=_renew_lease, args=(queue, unit_id, worker_name, renewal_interval, stop_renewal),
+                             daemon=True).start()
+            try:
+                recorder = UnitRecorder(unit_id)
+                temp_files = process_files_parallel(unit['file_paths'], run_info['folder_order'], config,
+                                                    pool=pool, journal=recorder)
+                if temp_files and chunked_memory_efficient_processing(temp_files, config, pool=pool, journal=recorder) != 0:
+                    logger.error(f"Saving work unit {unit_id} failed; leaving it to be reassigned")
+                    continue
+            finally:
+                stop_renewal.set()
+
+            queue.acknowledge(unit_id, worker_name, recorder.saved_outputs, sorted(recorder.quarantined_groups))
+            units_done += 1
+    finally:
+        stop_metrics_server(metrics_server)
+        pool.close()
+        cleanup_temp_files([], config['temp_dir'])
+        if config.get('profile_dir'):
+            write_profile_report(config['profile_dir'])
+
+    duration = time.time() - start_time
+    logger.info(f"Worker {worker_name} processed {units_done} work units in {format_duration(duration)}")
+    # Each worker node reports the stages of its own work units (metrics.worker-<name>.json)
+    write_metrics_report(pool.stage_metrics, get_run_file_path(config, METRICS_REPORT_NAME), duration,
+                         config['prometheus_metrics_file'])
+    return 0
@@ -0,0 +1,266 @@
+# Licensed under the MIT License. See LICENSE-CODE in the repository root for details.
+# Copyright (c) 2025 Christos Papadopoulos
+
+"""
+Family Index for PatentFusion
+
+With fusion_level = family ([vpatent_creation]) one virtual patent is fused per patent
+family (e.g. the EP, WO and US publications of an invention) instead of per publication.
+Families are identified by the family-id attribute of the root element, so before
+batching a lightweight scan reads only the start of one file per patent group and
+builds a compact index:
+
+    {"families": {"17": ["EP-1000017", "WO-1000017"], ...},
+     "signatures": {"EP-1000017": "3f2a...", ...}}
+
+Batches, retries and warm-up trials then keep whole families together (see
+get_patent_groups in file_system.py), and the workers fuse the files of each family
+with the regular merge (see group_patent_families in xml_parser.py).
+
+The index is saved as family_index.json in the destination folder. A patent group is
+only scanned again when its files (paths, sizes, modification times) changed, so later
+runs over the same vertical start batching right away.
+"""
+
+import os
+import re
+import json
+import hashlib
+import logging
+from constants import FAMILY_INDEX_NAME, FAMILY_SCAN_BYTES
+from archive_source import is_archive_member_path, read_archive_member, get_source_file_size, get_source_file_mtime
+from file_system import get_patent_groups, get_run_file_path
+from utils import atomic_output_path
+
+logger = logging.getLogger(__name__)
+
+# The root start tag (the first tag that is not a declaration, comment or processing instruction)
+_ROOT_TAG_PATTERN = re.compile(rb'<(?![?!])[^>]*>')
+_FAMILY_ID_PATTERN = re.compile(rb'\sfamily-id\s*=\s*["\']([^"\']*)["\']')
+
+
+def read_family_id(file_path):
+    """
+    Read the family-id attribute of a patent document's root element
+
+    Only the start of the file is read.
+
+    Args:
+        file_path (str): File path or virtual archive member path
+
+    Returns:
+        str: Family id, or '' if the root element has none
+    """
+    try:
+        if is_archive_member_path(file_path):
+            head = read_archive_member(file_path)[:FAMILY_SCAN_BYTES]
+        else:
+            with open(file_path, 'rb') as f:
+                head = f.read(FAMILY_SCAN_BYTES)
+    except OSError as e:
+        logger.warning(f"Could not read the family of {file_path}: {e}")
+        return ''
+    root = _ROOT_TAG_PATTERN.search(head)
+    if root is None:
+        return ''
+    family_id = _FAMILY_ID_PATTERN.search(root.group(0))
+    return family_id.group(1).decode('utf-8').strip() if family_id else ''
+
+
+def read_group_family_id(file_list):
+    """
+    Get the family of a patent group: the family-id of its first file (in path order) that has one
+
+    Args:
+        file_list (list): File paths of the group
+
+    Returns:
+        str: Family id, or '' if no file of the group has one
+    """
+    for file_path in sorted(file_list):
+        family_id = read_family_id(file_path)
+        if family_id:
+            return family_id
+    return ''
+
+
+def get_family_key(family_id):
+    """
+    Get the key of a patent family (e.g. 17 -> FAMILY-17)
+
+    Args:
+        family_id (str): Family id
+
+    Returns:
+        str: Family key
+    """
+    return f"FAMILY-{family_id}"
+
+
+def get_group_signature(file_list):
+    """
+    Hash the paths, sizes and modification times of the files of a patent group
+
+    Args:
+        file_list (list): File paths of the group
+
+    Returns:
+        str: Hex digest that changes whenever a file of the group is added, removed or modified
+    """
+    digest = hashlib.blake2b(digest_size=8)
+    for file_path in sorted(file_list):
+        digest.update(f"{file_path}\0{get_source_file_size(file_path)}\0{get_source_file_mtime(file_path)}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+class FamilyIndex:
+    """
+    Patent families of the discovered patent groups
+
+    Patent groups without a family-id form a family of their own.
+    """
+
+    def __init__(self, group_families, previous_families=None):
+        """
+        Build the index
+
+        Args:
+            group_families (dict): group_key -> family id ('' for groups without one)
+            previous_families (dict, optional): group_key -> family id of groups of the saved
+                index that were not discovered again (their family is fused again in delta mode)
+        """
+        self.group_families = group_families
+        self.previous_families = previous_families or {}
+        self.families = {}
+        for group_key, family_id in sorted(group_families.items()):
+            if family_id:
+                self.families.setdefault(family_id, []).append(group_key)
+
+    def __len__(self):
+        return len(self.families)
+
+    def get_unit_key(self, group_key):
+        """
+        Get the key of the work unit a patent group is fused in
+
+        Args:
+            group_key (str): Group key 'OFFICE-NUMBER'
+
+        Returns:
+            str: Family key (see get_family_key), or the group key for groups without a family
+        """
+        family_id = self.group_families.get(group_key, '')
+        return get_family_key(family_id) if family_id else group_key
+
+    def expand_groups(self, group_keys):
+        """
+        Get every discovered patent group of the families of some patent groups
+
+        Args:
+            group_keys (iterable): Group keys (groups that were not discovered again count with
+                the family they had in the saved index)
+
+        Returns:
+            set: The given groups that were discovered, and all groups of their families
+        """
+        expanded = set()
+        for group_key in group_keys:
+            family_id = self.group_families.get(group_key, self.previous_families.get(group_key, ''))
+            if family_id:
+                expanded.update(self.families.get(family_id, []))
+            elif group_key in self.group_families:
+                expanded.add(group_key)
+        return expanded
+
+
+def load_family_index(index_path):
+    """
+    Read a saved family index
+
+    Args:
+        index_path (str): Path to a family_index.json file
+
+    Returns:
+        dict: group_key -> (family id, group signature); empty if there is no (readable) index
+    """
+    if not os.path.exists(index_path):
+        return {}
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable family index {index_path}: {e}")
+        return {}
+    group_families = {group_key: family_id for family_id, group_keys in saved.get('families', {}).items()
+                      for group_key in group_keys}
+    return {group_key: (group_families.get(group_key, ''), signature)
+            for group_key, signature in saved.get('signatures', {}).items()}
+
+
+def save_family_index(index_path, entries):
+    """
+    Write a family index atomically
+
+    Args:
+        index_path (str): Path to the family_index.json file
+        entries (dict): group_key -> (family id, group signature)
+    """
+    families = {}
+    for group_key, (family_id, _) in sorted(entries.items()):
+        if family_id:
+            families.setdefault(family_id, []).append(group_key)
+    with atomic_output_path(index_path) as temp_path, open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({'families': families,
+                   'signatures': {group_key: signature for group_key, (_, signature) in entries.items()}},
+                  f, sort_keys=True)
+
+
+def build_family_index(file_paths, config, pool=None, persist=True):
+    """
+    Build the family index of the discovered files
+
+    Groups whose files are unchanged since the saved index keep their family; the
+    other groups are scanned (on the pool, if one is given).
+
+    Args:
+        file_paths (list): Discovered source file paths
+        config (dict): Configuration dictionary
+        pool (WorkerPool, optional): Started worker pool for the scan
+        persist (bool): Save the index to the destination folder
+
+    Returns:
+        FamilyIndex: Families of the patent groups of file_paths
+    """
+    index_path = get_run_file_path(config, FAMILY_INDEX_NAME)
+    saved = load_family_index(index_path)
+    patent_groups = get_patent_groups(file_paths)
+    patent_groups.pop('unparseable', None)
+
+    entries = {}
+    to_scan = []
+    for group_key, file_list in patent_groups.items():
+        signature = get_group_signature(file_list)
+        if group_key in saved and saved[group_key][1] == signature:
+            entries[group_key] = saved[group_key]
+        else:
+            entries[group_key] = ('', signature)
+            to_scan.append(group_key)
+
+    if to_scan:
+        scan_lists = [patent_groups[group_key] for group_key in to_scan]
+        if pool is not None:
+            family_ids = pool.map(read_group_family_id, scan_lists)
+        else:
+            family_ids = [read_group_family_id(file_list) for file_list in scan_lists]
+        for group_key, family_id in zip(to_scan, family_ids):
+            entries[group_key] = (family_id, entries[group_key][1])
+
+    if persist and to_scan:
+        # Groups of other runs (other offices or shards of the vertical) stay in the saved index
+        save_family_index(index_path, dict(saved, **entries))
+
+    index = FamilyIndex({group_key: family_id for group_key, (family_id, _) in entries.items()},
+                        {group_key: family_id for group_key, (family_id, _) in saved.items() if group_key not in entries})
+    logger.info(f"Family index: {len(patent_groups)} patent groups in {len(index)} families "
+                f"({len(to_scan)} groups scanned, {len(patent_groups) - len(to_scan)} reused from {index_path})")
+    return index
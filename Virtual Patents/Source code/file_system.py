@@ -9,9 +9,14 @@ for patent XML processing.
 """
 
 import os
+import zlib
 import logging
-import multiprocessing
-from utils import ensure_directory_exists
+from utils import ensure_directory_exists, get_effective_cpu_count
+from worker_pool import WorkerPool, use_pool
+from archive_source import get_archive_file_paths
+from config_manager import get_output_profiles
+from patent_lists import load_patent_lists
+from sampling import select_sample
 
 logger = logging.getLogger(__name__)
 
@@ -80,13 +85,14 @@ def get_dirs_chunk(start_dir):
     
     return dirs_found
 
-def get_all_file_paths(root_dir, cpu_count=None):
+def get_all_file_paths(root_dir, cpu_count=None, pool=None):
     """
     Get all file paths in a directory structure with ordered traversal using multiprocessing
     
     Args:
         root_dir (str): Root directory to scan
         cpu_count (int, optional): Number of CPU cores to use. If None, uses all available.
+        pool (WorkerPool, optional): Shared worker pool (a temporary pool is created if None)
         
     Returns:
         tuple: (all_file_paths, folder_order)
@@ -94,7 +100,7 @@ def get_all_file_paths(root_dir, cpu_count=None):
             - folder_order: Dictionary mapping relative directory paths to order indices
     """
     if cpu_count is None:
-        cpu_count = multiprocessing.cpu_count()
+        cpu_count = get_effective_cpu_count()
     
     # Validate root directory
     if not os.path.exists(root_dir):
@@ -119,8 +125,8 @@ def get_all_file_paths(root_dir, cpu_count=None):
     
     # Use multiprocessing to discover directories in parallel
     try:
-        with multiprocessing.Pool(processes=cpu_count) as pool:
-            nested_dirs_results = pool.map(get_dirs_chunk, immediate_subdirs)
+        with use_pool(pool, lambda: WorkerPool(cpu_count)) as discovery_pool:
+            nested_dirs_results = discovery_pool.map(get_dirs_chunk, immediate_subdirs, chunksize=1)
     except Exception as e:
         logger.error(f"Error during parallel directory discovery: {e}")
         # Fallback to sequential processing
@@ -139,8 +145,8 @@ def get_all_file_paths(root_dir, cpu_count=None):
     
     # Use multiprocessing to scan directories in parallel
     try:
-        with multiprocessing.Pool(processes=cpu_count) as pool:
-            results = pool.map(scan_directory, all_dirs)
+        with use_pool(pool, lambda: WorkerPool(cpu_count)) as scan_pool:
+            results = scan_pool.map(scan_directory, all_dirs)
     except Exception as e:
         logger.error(f"Error during parallel directory scanning: {e}")
         # Fallback to sequential processing
@@ -195,6 +201,149 @@ def get_all_file_paths(root_dir, cpu_count=None):
     
     return all_file_paths, folder_order
 
+def discover_source_files(config, pool=None):
+    """
+    Discover the source XML files of the configured patent offices in the vertical or archives
+    
+    The files of all offices form one list, so they are batched and scheduled on the
+    shared pool together (patent groups are keyed on office and number, see get_group_key).
+    
+    Args:
+        config (dict): Configuration dictionary
+        pool (WorkerPool, optional): Shared worker pool (a temporary pool is created if None)
+        
+    Returns:
+        tuple: (all_file_paths, folder_order)
+    """
+    patent_offices = config['patent_offices']
+    if config.get('archive_origin_path'):
+        # Read XML members straight from the archives (no extraction step needed)
+        all_file_paths, folder_order = get_archive_file_paths(config['archive_origin_path'], patent_offices,
+                                                              config['cpu_count'], pool=pool)
+    elif len(patent_offices) == 1:
+        all_file_paths, folder_order = get_all_file_paths(os.path.join(config['vertical_origin_path'], patent_offices[0]),
+                                                          config['cpu_count'], pool=pool)
+    else:
+        all_file_paths = []
+        folder_order = {}
+        for office in patent_offices:
+            office_file_paths, office_folder_order = get_all_file_paths(
+                os.path.join(config['vertical_origin_path'], office), config['cpu_count'], pool=pool)
+            all_file_paths.extend(office_file_paths)
+            # Folder paths are relative to each office folder; prefix them so offices do not collide
+            for relative_dir in sorted(office_folder_order, key=office_folder_order.get):
+                folder_order[os.path.join(office, relative_dir)] = len(folder_order)
+    return all_file_paths, folder_order
+
+
+def select_source_files(file_paths, config, family_index=None):
+    """
+    Get the discovered files to fuse: those kept by the include/exclude lists and the sample
+    
+    Discovery itself returns the files of every patent group, so the run manifest
+    sees the whole inventory and only the fusion is restricted to the selected groups.
+    With a family index the lists and the sample keep or drop whole patent families,
+    so a family virtual patent is always fused from all of its publications.
+    
+    Args:
+        file_paths (list): Discovered file paths
+        config (dict): Configuration dictionary
+        family_index (FamilyIndex, optional): Select patent families instead of patent groups
+        
+    Returns:
+        list: File paths of the selected patent groups (file_paths itself if nothing is dropped)
+    """
+    file_paths = filter_by_patent_lists(file_paths, config, family_index)
+    if config.get('sample_size'):
+        file_paths = sample_file_paths(file_paths, config, family_index)
+    return file_paths
+
+
+def filter_by_patent_lists(file_paths, config, family_index=None):
+    """
+    Drop the files of patent groups excluded by the include/exclude lists
+    
+    With include lists only listed patent groups are kept; patent groups on an
+    exclude list are always dropped (see patent_lists.py). With a family index a
+    family is kept if any of its groups is listed, and dropped if any of its groups
+    is excluded, so excluded patents never reach a family record through a sibling.
+    
+    Args:
+        file_paths (list): File paths
+        config (dict): Configuration dictionary
+        family_index (FamilyIndex, optional): Keep or drop whole patent families
+        
+    Returns:
+        list: File paths of the remaining patent groups
+    """
+    include = load_patent_lists(config.get('include_lists'))
+    exclude = load_patent_lists(config.get('exclude_lists'))
+    if include is None and exclude is None:
+        return file_paths
+    
+    patent_groups = get_patent_groups(file_paths, family_index)
+    kept_units = set()
+    for unit_key, unit_files in patent_groups.items():
+        group_keys = {get_group_key(file_path) for file_path in unit_files}
+        if ((include is None or any(group_key in include for group_key in group_keys))
+                and (exclude is None or not any(group_key in exclude for group_key in group_keys))):
+            kept_units.add(unit_key)
+    kept_paths = [file_path for file_path in file_paths if get_unit_key(file_path, family_index) in kept_units]
+    dropped_units = len(patent_groups) - len(kept_units)
+    unit_name = 'patent families' if family_index is not None else 'patent groups'
+    logger.info(f"Patent lists: dropped {dropped_units} {unit_name} ({len(file_paths) - len(kept_paths)} files), "
+                f"{len(kept_paths)} files left")
+    return kept_paths
+
+
+def get_excluded_groups(file_paths, config, family_index=None):
+    """
+    Get the patent groups dropped by the exclude lists
+    
+    Unlike groups left out by an include list or the sample, excluded groups must not
+    keep anything from earlier runs: delta runs delete their outputs and manifest entries.
+    With a family index every group of a family with an excluded group is excluded.
+    
+    Args:
+        file_paths (list): File paths
+        config (dict): Configuration dictionary
+        family_index (FamilyIndex, optional): Exclude whole patent families
+        
+    Returns:
+        set: Group keys of the excluded patent groups (empty without exclude lists)
+    """
+    exclude = load_patent_lists(config.get('exclude_lists'))
+    if exclude is None:
+        return set()
+    
+    excluded = set()
+    for unit_files in get_patent_groups(file_paths, family_index).values():
+        group_keys = {get_group_key(file_path) for file_path in unit_files}
+        if any(group_key in exclude for group_key in group_keys):
+            excluded |= group_keys
+    return excluded
+
+
+def sample_file_paths(file_paths, config, family_index=None):
+    """
+    Keep only the files of the patent groups in the configured sample (see sampling.py)
+    
+    Args:
+        file_paths (list): File paths
+        config (dict): Configuration dictionary
+        family_index (FamilyIndex, optional): Sample whole patent families
+        
+    Returns:
+        list: File paths of the sampled patent groups
+    """
+    patent_groups = get_patent_groups(file_paths, family_index)
+    selected = select_sample(patent_groups, config)
+    unit_name = 'patent families' if family_index is not None else 'patent groups'
+    logger.info(f"Sample: {len(selected)} of {len(patent_groups)} {unit_name} "
+                f"(seed {config.get('sample_seed', 0)}, stratified by {config.get('sample_stratify', 'none')})")
+    return [file_path for file_path in file_paths if get_unit_key(file_path, family_index) in selected]
+
+
 def create_directory_structure(config):
     """
     Create necessary directory structure for processing
@@ -203,59 +352,72 @@ def create_directory_structure(config):
         config (dict): Configuration dictionary
         
     Returns:
-        dict: Dictionary with created directory paths
+        dict: Dictionary with created directory paths ('individual_vp' and 'merged' are lists,
+            one entry per output profile)
     """
-    directories = {}
+    directories = {'individual_vp': [], 'merged': []}
     
     # Create output directory if it doesn't exist
     ensure_directory_exists(config['destination_path'])
     directories['output'] = config['destination_path']
     
+    # Create a temporary directory for intermediate files
+    ensure_directory_exists(config['temp_dir'])
+    directories['temp'] = config['temp_dir']
+    
+    for profile_config in get_output_profiles(config):
+        create_output_directories(profile_config, config['patent_offices'], directories)
+    
+    return directories
+
+def create_output_directories(profile_config, patent_offices, directories):
+    """
+    Create the output directories of one output profile (or of a run without profiles)
+    
+    Args:
+        profile_config (dict): Configuration dictionary of the profile
+        patent_offices (list): Patent office codes of the run
+        directories (dict): Receives the created directory paths
+    """
     # Create individual VP directory (always needed for virtual patent workflow)
-    ensure_directory_exists(config['individual_vp_dir'])
-    directories['individual_vp'] = config['individual_vp_dir']
-    logger.info(f"Individual VP files will be saved to: {config['individual_vp_dir']}")
+    ensure_directory_exists(profile_config['individual_vp_dir'])
+    directories['individual_vp'].append(profile_config['individual_vp_dir'])
+    logger.info(f"Individual VP files will be saved to: {profile_config['individual_vp_dir']}")
     
-    # Pre-create subdirectories for all output formats and patent office
+    # Pre-create subdirectories for all output formats and patent offices
     # This prevents race conditions in multiprocessing
-    patent_office = config['patent_office']
-    output_formats = config['output_formats']
+    output_formats = profile_config['output_formats']
     
     # Create subdirectories for individual virtual patents (only if not using original directory structure)
-    use_original_structure = config.get('original_directory_structure', False)
+    use_original_structure = profile_config.get('original_directory_structure', False)
     if not use_original_structure:
-        for fmt in output_formats:
-            format_dir = os.path.join(config['individual_vp_dir'], patent_office, fmt)
-            ensure_directory_exists(format_dir)
-            logger.debug(f"Created format directory: {format_dir}")
+        for patent_office in patent_offices:
+            for fmt in output_formats:
+                format_dir = os.path.join(profile_config['individual_vp_dir'], patent_office, fmt)
+                ensure_directory_exists(format_dir)
+                logger.debug(f"Created format directory: {format_dir}")
     else:
         logger.info("Skipping pre-creation of format directories due to original_directory_structure setting")
     
-    # Create a temporary directory for intermediate files
-    ensure_directory_exists(config['temp_dir'])
-    directories['temp'] = config['temp_dir']
-    
     # Create merged patents inspection directory conditionally
-    enable_merged_inspection = config.get('enable_merged_inspection', True)
+    enable_merged_inspection = profile_config.get('enable_merged_inspection', True)
     if enable_merged_inspection:
-        merged_dir = os.path.join(config['destination_path'], "merged_patents_inspection")
+        merged_dir = os.path.join(profile_config['destination_path'], "merged_patents_inspection")
         ensure_directory_exists(merged_dir)
-        directories['merged'] = merged_dir
+        directories['merged'].append(merged_dir)
         logger.info(f"Merged patents inspection folder ready: {merged_dir}")
         
         # Pre-create subdirectories for merged patents inspection (only if not using original directory structure)
         if not use_original_structure:
-            for fmt in output_formats:
-                format_dir = os.path.join(merged_dir, patent_office, fmt)
-                ensure_directory_exists(format_dir)
-                logger.debug(f"Created merged patents format directory: {format_dir}")
+            for patent_office in patent_offices:
+                for fmt in output_formats:
+                    format_dir = os.path.join(merged_dir, patent_office, fmt)
+                    ensure_directory_exists(format_dir)
+                    logger.debug(f"Created merged patents format directory: {format_dir}")
         else:
             logger.info("Skipping pre-creation of merged inspection format directories due to original_directory_structure setting")
     else:
-        directories['merged'] = None
         logger.info("Merged patents inspection directory creation disabled in config")
-    
-    return directories
 
 def cleanup_temp_files(temp_file_paths, temp_dir):
     """
@@ -323,7 +485,7 @@ def cleanup_single_temp_file(temp_file_path):
         logger.warning(f"Failed to remove temp file {temp_file_path}: {str(e)}")
         return False
 
-def get_file_batches(file_paths, batch_size):
+def get_file_batches(file_paths, batch_size, family_index=None):
     """
     Split file paths into batches of specified size while keeping files 
     for the same patent number together
@@ -331,26 +493,14 @@ def get_file_batches(file_paths, batch_size):
     Args:
         file_paths (list): List of file paths
         batch_size (int): Number of files per batch
+        family_index (FamilyIndex, optional): Keep whole patent families together (family fusion)
         
     Returns:
         list: List of batches (each batch is a list of file paths)
     """
-    # First, group files by patent number to ensure they stay together
-    patent_groups = {}
-    for file_path in file_paths:
-        try:
-            file_name = os.path.basename(file_path)
-            patent_number = file_name.split(".")[0].split("-")[1]
-            
-            if patent_number not in patent_groups:
-                patent_groups[patent_number] = []
-            patent_groups[patent_number].append(file_path)
-        except Exception as e:
-            logger.debug(f"Could not extract patent number from {file_name}: {e}")
-            # Add files we can't parse to a special group
-            if 'unparseable' not in patent_groups:
-                patent_groups['unparseable'] = []
-            patent_groups['unparseable'].append(file_path)
+    # First, group files by patent office and number to ensure they stay together
+    # (files we can't parse end up in a special 'unparseable' group)
+    patent_groups = get_patent_groups(file_paths, family_index)
     
     # Now create batches ensuring patent groups stay together
     # Minimum batch size to handle edge cases (e.g., patents with many kind codes)
@@ -400,6 +550,155 @@ def get_file_batches(file_paths, batch_size):
     return batches
 
 
+def get_group_key(file_path):
+    """
+    Get the patent group of a file: patent office and number (e.g. EP-2615747-A1.xml -> EP-2615747)
+    
+    Patent numbers are only unique within an office, so files are grouped by both.
+    
+    Args:
+        file_path (str): File path
+        
+    Returns:
+        str: Group key 'OFFICE-NUMBER', or 'unparseable' if the name does not follow the naming scheme
+    """
+    parts = os.path.basename(file_path).split(".")[0].split("-")
+    if len(parts) < 2:
+        return 'unparseable'
+    return f"{parts[0]}-{parts[1]}"
+
+
+def get_group_office(group_key):
+    """
+    Get the patent office of a patent group (e.g. EP-2615747 -> EP)
+    
+    Args:
+        group_key (str): Group key (see get_group_key)
+        
+    Returns:
+        str: Patent office code
+    """
+    return group_key.split("-")[0]
+
+
+def get_shard_index(group_key, shard_count):
+    """
+    Get the shard a patent group belongs to
+    
+    Uses CRC-32 of the group key, which (unlike hash()) is the same on every
+    machine and in every Python process.
+    
+    Args:
+        group_key (str): Group key of the patent group (see get_group_key)
+        shard_count (int): Total number of shards
+        
+    Returns:
+        int: Shard index from 1 to shard_count
+    """
+    return zlib.crc32(group_key.encode('utf-8')) % shard_count + 1
+
+
+def get_shard_suffix(shard):
+    """
+    Get the file name suffix of a shard's bookkeeping files
+    
+    Args:
+        shard (tuple): (shard_index, shard_count), or None when not sharding
+        
+    Returns:
+        str: Suffix such as '.shard-2-of-4' ('' when not sharding)
+    """
+    if not shard:
+        return ""
+    return f".shard-{shard[0]}-of-{shard[1]}"
+
+
+def get_run_file_path(config, file_name):
+    """
+    Get the path of a run bookkeeping file (journal, manifest, quarantine list) in the destination folder
+    
+    Sharded runs and the worker nodes of a coordinated run share the destination folder,
+    so each shard or worker gets its own file (e.g. manifest.shard-2-of-4.json).
+    
+    Args:
+        config (dict): Configuration dictionary
+        file_name (str): File name (e.g. 'manifest.json')
+        
+    Returns:
+        str: File path
+    """
+    stem, extension = os.path.splitext(file_name)
+    suffix = get_shard_suffix(config.get('shard'))
+    if config.get('worker_name'):
+        suffix += f".worker-{config['worker_name']}"
+    return os.path.join(config['destination_path'], f"{stem}{suffix}{extension}")
+
+
+def get_unit_key(file_path, family_index=None):
+    """
+    Get the key of the patent group, or with a family index the patent family, of a file
+    
+    Args:
+        file_path (str): File path
+        family_index (FamilyIndex, optional): Key files by patent family
+        
+    Returns:
+        str: Group key (see get_group_key) or family key
+    """
+    group_key = get_group_key(file_path)
+    return family_index.get_unit_key(group_key) if family_index is not None else group_key
+
+
+def get_patent_groups(file_batch, family_index=None):
+    """
+    Group the files of a batch by patent office and number, preserving batch order
+    
+    With a family index the files are grouped by patent family instead, so every
+    group is a unit of family fusion (see family_index.py).
+    
+    Args:
+        file_batch (list): List of file paths in one batch
+        family_index (FamilyIndex, optional): Group by patent family
+        
+    Returns:
+        dict: Dictionary mapping group key (see get_group_key) or family key -> list of file paths
+    """
+    patent_groups = {}
+    for file_path in file_batch:
+        patent_groups.setdefault(get_unit_key(file_path, family_index), []).append(file_path)
+    return patent_groups
+
+
+def split_file_batch(file_batch, parts, family_index=None):
+    """
+    Split a batch into smaller batches while keeping files for the same patent number together
+    
+    Args:
+        file_batch (list): List of file paths in one batch
+        parts (int): Number of smaller batches to create (at most one per patent group)
+        family_index (FamilyIndex, optional): Keep whole patent families together (family fusion)
+        
+    Returns:
+        list: List of smaller batches
+    """
+    patent_groups = get_patent_groups(file_batch, family_index)
+    
+    parts = max(1, min(parts, len(patent_groups)))
+    target_size = len(file_batch) / parts
+    
+    smaller_batches = []
+    current_batch = []
+    for files in patent_groups.values():
+        current_batch.extend(files)
+        if len(current_batch) >= target_size and len(smaller_batches) < parts - 1:
+            smaller_batches.append(current_batch)
+            current_batch = []
+    if current_batch:
+        smaller_batches.append(current_batch)
+    
+    return smaller_batches
+
+
 def create_temp_file_path(temp_dir, batch_id, file_type='csv'):
     """
     Create a temporary file path for intermediate processing
@@ -0,0 +1,549 @@
+# Licensed under the MIT License. See LICENSE-CODE in the repository root for details.
+# Copyright (c) 2025 Christos Papadopoulos
+
+"""
+Large Documents for PatentFusion
+
+Some US and WO documents have descriptions and sequence listings of tens or hundreds
+of MB. Parsing such a file, copying it into the virtual patent, keeping it in a temp
+file and serializing it multiplies that in memory. Files larger than large_document_mb
+([Performance]) therefore take a streaming path:
+
+- the file is read with iterparse. bibliographic-data, abstracts and copyright are
+  parsed as usual; every other Level 1 section (description, claims, sequence
+  listings, ...) is dropped element by element while it is parsed and replaced by an
+  empty placeholder that keeps its tag and attributes and points at the section in
+  the source file
+- merging, field priorities and filtering treat a placeholder like the section it
+  stands for, so the virtual patent and its temp file stay small
+- when the outputs are written, every placeholder is streamed from the source file
+  child by child (paragraph, claim, sequence, ...): each child is filtered, truncated
+  and written to the XML, CSV or JSON file, then dropped before the next one is parsed
+
+Peak memory is bounded by the largest child of a section, whatever the size of the
+document. Only files on disk are streamed; archive members are parsed as usual.
+"""
+
+import io
+import os
+import csv
+import json
+import shutil
+import logging
+import tempfile
+from xml.sax.saxutils import escape
+from lxml import etree
+from constants import LARGE_DOCUMENT_PARSED_SECTIONS
+from archive_source import is_archive_member_path
+from output_manager import apply_text_truncation_to_xml, iter_flat_fields, get_child_field_prefix
+from output_manager import element_to_hierarchical_dict, sanitize_for_json, METADATA_FIELD_KEYWORDS
+from utils import truncate_text, atomic_output_path
+
+logger = logging.getLogger(__name__)
+
+# Attributes of a placeholder: the source file and the position of the section among the Level 1 elements
+STREAM_SOURCE_ATTRIBUTE = '_stream_source'
+STREAM_INDEX_ATTRIBUTE = '_stream_index'
+
+# Marks the position of a streamed section in the JSON output of the rest of the virtual patent
+# (XML text cannot hold NUL characters, so the marker never matches document content)
+_JSON_SECTION_MARKER = '\x00section:'
+
+
+def is_large_document(file_path, config):
+    """
+    Check whether a patent file is large enough to take the streaming path
+
+    Args:
+        file_path (str): File path or virtual archive member path
+        config (dict): Configuration dictionary (large_document_mb, 0 = never stream)
+
+    Returns:
+        bool: True if the file is on disk and larger than large_document_mb
+    """
+    threshold = config.get('large_document_mb', 0)
+    if not threshold or is_archive_member_path(file_path):
+        return False
+    try:
+        return os.path.getsize(file_path) > threshold * 1024 * 1024
+    except OSError:
+        return False
+
+
+def _iterparse(file_path):
+    """Incremental parser of a patent file (huge_tree allows text nodes above 10 MB)"""
+    return etree.iterparse(file_path, events=('start', 'end', 'comment'), recover=True, huge_tree=True)
+
+
+def parse_document_skeleton(file_path):
+    """
+    Parse a patent file with its large sections replaced by placeholders
+
+    Args:
+        file_path (str): Path of the patent file
+
+    Returns:
+        etree.Element: Root element; streamed sections are empty elements with their
+        attributes plus the placeholder attributes
+    """
+    logger.info(f"Large document {file_path} ({os.path.getsize(file_path) / (1024 * 1024):.0f} MB): "
+                f"sections are streamed into the outputs")
+    root = None
+    section = None
+    section_index = -1
+    section_has_children = False
+    depth = 0
+    for event, element in _iterparse(file_path):
+        if event == 'comment':
+            continue
+        if event == 'start':
+            depth += 1
+            if depth == 1:
+                root = element
+            elif depth == 2:
+                section_index += 1
+                if element.tag not in LARGE_DOCUMENT_PARSED_SECTIONS:
+                    section = element
+                    section_has_children = False
+            continue
+
+        depth -= 1
+        if section is None:
+            continue
+        if depth == 2:
+            # A child of a streamed section: only the fact that there is one is kept
+            section_has_children = True
+            _drop_used(element)
+        elif depth == 1:
+            _make_placeholder(section, file_path, section_index, section_has_children or len(section) > 0)
+            section = None
+    return root
+
+
+def _make_placeholder(section, file_path, section_index, has_children):
+    """Turn a parsed section into its placeholder (sections without content are kept as they are)"""
+    if not has_children and not (section.text and section.text.strip()):
+        return
+    attributes = list(section.attrib.items())
+    section.clear(keep_tail=True)
+    for name, value in attributes:
+        section.set(name, value)
+    section.set(STREAM_SOURCE_ATTRIBUTE, file_path)
+    section.set(STREAM_INDEX_ATTRIBUTE, str(section_index))
+
+
+def is_streamed_section(element):
+    """
+    Check whether an element is the placeholder of a streamed section
+
+    Args:
+        element: XML element
+
+    Returns:
+        bool: True for placeholders
+    """
+    return element.get(STREAM_SOURCE_ATTRIBUTE) is not None
+
+
+def has_streamed_sections(virtual_patent):
+    """
+    Check whether a virtual patent has sections that are streamed from its source files
+
+    Args:
+        virtual_patent: Virtual patent XML element
+
+    Returns:
+        bool: True if any Level 1 element is a placeholder
+    """
+    return any(isinstance(child.tag, str) and is_streamed_section(child) for child in virtual_patent)
+
+
+def _get_output_attributes(placeholder):
+    """Attributes of a streamed section as they appear in the outputs"""
+    return {name: value for name, value in placeholder.attrib.items()
+            if name not in (STREAM_SOURCE_ATTRIBUTE, STREAM_INDEX_ATTRIBUTE)}
+
+
+def _iter_source_section(placeholder):
+    """
+    Stream a section from its source file
+
+    Yields:
+        tuple: (section, child) for every child element or comment of the section, then
+        (section, None) once the section is complete. A child is dropped as soon as the
+        next one is requested, so it must be used (or moved) before.
+
+    Raises:
+        ValueError: If the source file no longer has the section
+    """
+    file_path = placeholder.get(STREAM_SOURCE_ATTRIBUTE)
+    target_index = int(placeholder.get(STREAM_INDEX_ATTRIBUTE))
+    section = None
+    section_index = -1
+    depth = 0
+    # A child is handed out once the next one starts: only then is its tail text parsed
+    pending = None
+    for event, element in _iterparse(file_path):
+        if event == 'start':
+            depth += 1
+            if depth == 2:
+                section_index += 1
+                if section_index == target_index:
+                    section = element
+            elif depth == 3 and pending is not None:
+                yield section, pending
+                _drop(pending)
+                pending = None
+            continue
+        if event == 'comment':
+            if depth == 2 and section is not None:
+                if pending is not None:
+                    yield section, pending
+                    _drop(pending)
+                pending = element
+            continue
+
+        depth -= 1
+        if depth == 2:
+            if section is None:
+                # Child of another section
+                _drop_used(element)
+            else:
+                pending = element
+        elif depth == 1:
+            if section is not None:
+                if pending is not None:
+                    yield section, pending
+                    _drop(pending)
+                yield section, None
+                return
+            _drop_used(element)
+    raise ValueError(f"Section {target_index} not found in {file_path}")
+
+
+def _drop(element):
+    """Remove a used element from its tree (it must not be the element the parser just ended)"""
+    parent = element.getparent()
+    if parent is not None:
+        parent.remove(element)
+
+
+def _drop_used(element):
+    """Drop the content of an element the parser just ended, and its previous siblings"""
+    element.clear(keep_tail=True)
+    parent = element.getparent()
+    while element.getprevious() is not None:
+        del parent[0]
+
+
+def _filter_child(child, filter_config):
+    """Apply the parse flags to a child of a streamed section; returns None if the child itself is removed"""
+    # xml_parser imports this module
+    from xml_parser import filter_virtual_patent_by_config
+
+    holder = etree.Element('section')
+    holder.append(child)
+    filter_virtual_patent_by_config(holder, filter_config)
+    return child if len(holder) else None
+
+
+def _iter_output_children(placeholder, config, truncate):
+    """
+    Stream the children of a section as they appear in the outputs
+
+    Args:
+        placeholder: Placeholder of the section
+        config (dict): Configuration dictionary (parse flags, max_text_length)
+        truncate (bool): Apply the text truncation of the XML output to every child
+
+    Yields:
+        tuple: (section, child) as _iter_source_section, without the children removed by the parse flags
+    """
+    # Languages were already selected on the Level 1 sections
+    filter_config = dict(config, parse_lang='ALL')
+    for section, child in _iter_source_section(placeholder):
+        if child is not None:
+            child = _filter_child(child, filter_config)
+            if child is None:
+                continue
+            if truncate:
+                apply_text_truncation_to_xml(child, config)
+        yield section, child
+
+
+def _get_section_text(section, config, truncate):
+    """Own text of a streamed section, truncated as apply_text_truncation_to_xml does if requested"""
+    if truncate and section.text and section.text.strip():
+        return truncate_text(section.text.strip(), config.get('max_text_length', 300))
+    return section.text
+
+
+def load_streamed_sections(virtual_patent, config):
+    """
+    Replace the placeholders of a virtual patent by the sections they stand for
+
+    For consumers that need the whole virtual patent in memory (see vpatent_stream.py);
+    the memory use is then that of the full documents.
+
+    Args:
+        virtual_patent: Virtual patent XML element
+        config (dict): Configuration dictionary (parse flags)
+    """
+    filter_config = dict(config, parse_lang='ALL')
+    parser = etree.XMLParser(recover=True, huge_tree=True)
+    for placeholder in [child for child in virtual_patent if isinstance(child.tag, str) and is_streamed_section(child)]:
+        source_root = etree.parse(placeholder.get(STREAM_SOURCE_ATTRIBUTE), parser).getroot()
+        section = [child for child in source_root if isinstance(child.tag, str)][int(placeholder.get(STREAM_INDEX_ATTRIBUTE))]
+        section.attrib.clear()
+        for name, value in _get_output_attributes(placeholder).items():
+            section.set(name, value)
+        section.tail = placeholder.tail
+        for child in list(section):
+            if _filter_child(child, filter_config) is not None:
+                section.append(child)
+        virtual_patent.replace(placeholder, section)
+
+
+def write_streamed_output(virtual_patent, fmt, output_path, config, truncate=False):
+    """
+    Write an output file of a virtual patent with streamed sections
+
+    The files have the content that save_individual_vpatents_sequential writes for the
+    fully parsed virtual patent.
+
+    Args:
+        virtual_patent: Virtual patent XML element (metadata attributes already removed)
+        fmt (str): 'xml', 'csv' or 'json'
+        output_path (str): Output file path
+        config (dict): Configuration dictionary
+        truncate (bool): The XML output was written first, so the virtual patent is truncated as for XML
+    """
+    if fmt == 'xml':
+        _write_streamed_xml(virtual_patent, output_path, config)
+    elif fmt == 'csv':
+        _write_streamed_csv(virtual_patent, output_path, config, truncate)
+    elif fmt == 'json':
+        _write_streamed_json(virtual_patent, output_path, config, truncate)
+
+
+def _write_streamed_xml(virtual_patent, output_path, config):
+    """Write the XML output, streaming the sections into it"""
+    with atomic_output_path(output_path) as temp_path, open(temp_path, 'wb') as f:
+        with etree.xmlfile(f, encoding='UTF-8') as xml_file:
+            xml_file.write_declaration()
+            with xml_file.element(virtual_patent.tag, dict(virtual_patent.attrib)):
+                if virtual_patent.text:
+                    xml_file.write(virtual_patent.text)
+                for child in virtual_patent:
+                    if isinstance(child.tag, str) and is_streamed_section(child):
+                        _write_section_xml(xml_file, child, config)
+                    else:
+                        xml_file.write(child)
+        # As ElementTree.write: the tail of the root element, then a line break
+        f.write(escape(virtual_patent.tail or '').encode('utf-8') + b'\n')
+
+
+def _write_section_xml(xml_file, placeholder, config):
+    """Write a streamed section to an XML file"""
+    with xml_file.element(placeholder.tag, _get_output_attributes(placeholder)):
+        text_written = False
+        for section, child in _iter_output_children(placeholder, config, True):
+            if not text_written:
+                text = _get_section_text(section, config, True)
+                if text:
+                    xml_file.write(text)
+                text_written = True
+            if child is not None:
+                xml_file.write(child)
+    if placeholder.tail:
+        xml_file.write(placeholder.tail)
+
+
+def _format_csv_field(value):
+    """Quote a CSV field as the csv module (and pandas) does in a ';' separated row"""
+    if value == '':
+        return ''
+    buffer = io.StringIO()
+    csv.writer(buffer, delimiter=';', lineterminator='\n').writerow([value])
+    return buffer.getvalue()[:-1]
+
+
+def _write_streamed_csv(virtual_patent, output_path, config, truncate):
+    """Write the CSV output (header and one row), streaming the sections into it"""
+    output_dir = os.path.dirname(output_path)
+    with atomic_output_path(output_path) as temp_path, open(temp_path, 'w', encoding='utf-8', newline='') as f, \
+            tempfile.TemporaryFile('w+', encoding='utf-8', newline='', dir=output_dir) as values:
+        # The header is written to the file and the row to a spool file that is appended afterwards
+        separator = ''
+        for field_name, value in _iter_csv_fields(virtual_patent, config, truncate):
+            if any(keyword in field_name for keyword in METADATA_FIELD_KEYWORDS):
+                continue
+            f.write(separator + _format_csv_field(field_name))
+            values.write(separator + _format_csv_field(value))
+            separator = ';'
+        f.write('\n')
+        values.seek(0)
+        shutil.copyfileobj(values, f)
+        f.write('\n')
+
+
+def _shallow_element(tag, attributes, text, tail):
+    """Element without children, to flatten the own fields of an element"""
+    element = etree.Element(tag, attributes)
+    element.text = text
+    element.tail = tail
+    return element
+
+
+def _iter_csv_fields(virtual_patent, config, truncate):
+    """(field name, value) pairs of the CSV output, as flatten_xml_element produces them"""
+    yield from iter_flat_fields(_shallow_element(virtual_patent.tag, dict(virtual_patent.attrib),
+                                                 virtual_patent.text, virtual_patent.tail), '', config)
+    field_name = virtual_patent.tag
+    total_counts = {}
+    for child in virtual_patent:
+        if isinstance(child.tag, str):
+            total_counts[child.tag] = total_counts.get(child.tag, 0) + 1
+    child_tag_counts = {}
+    for child in virtual_patent:
+        if not isinstance(child.tag, str):
+            continue
+        child_tag_counts[child.tag] = child_tag_counts.get(child.tag, 0) + 1
+        prefix = get_child_field_prefix(field_name, child.tag, child_tag_counts[child.tag], total_counts[child.tag])
+        if is_streamed_section(child):
+            yield from _iter_section_csv_fields(child, prefix, config, truncate)
+        else:
+            yield from iter_flat_fields(child, prefix, config)
+
+
+def _iter_section_csv_fields(placeholder, prefix, config, truncate):
+    """(field name, value) pairs of a streamed section"""
+    # Field names of repeated children are indexed, so the children are counted in a first pass
+    total_counts = {}
+    section_text = None
+    for section, child in _iter_output_children(placeholder, config, False):
+        section_text = _get_section_text(section, config, truncate)
+        if child is not None and isinstance(child.tag, str):
+            total_counts[child.tag] = total_counts.get(child.tag, 0) + 1
+
+    tail = placeholder.tail
+    yield from iter_flat_fields(_shallow_element(placeholder.tag, _get_output_attributes(placeholder), section_text, tail),
+                                prefix, config)
+    field_name = f"{prefix}_{placeholder.tag}"
+    child_tag_counts = {}
+    for _, child in _iter_output_children(placeholder, config, truncate):
+        if child is None or not isinstance(child.tag, str):
+            continue
+        child_tag_counts[child.tag] = child_tag_counts.get(child.tag, 0) + 1
+        yield from iter_flat_fields(child, get_child_field_prefix(field_name, child.tag, child_tag_counts[child.tag],
+                                                                  total_counts[child.tag]), config)
+
+
+def _dump_json(value, level):
+    """Serialize a value as json.dump(indent=4) does at a nesting level"""
+    return json.dumps(value, ensure_ascii=False, indent=4).replace('\n', '\n' + '    ' * level)
+
+
+def _write_streamed_json(virtual_patent, output_path, config, truncate):
+    """Write the JSON output, streaming the sections into it"""
+    # The rest of the virtual patent is small: it is serialized with markers where the sections go
+    hierarchical_dict = {}
+    for attr_name, attr_value in virtual_patent.attrib.items():
+        hierarchical_dict[f"@{attr_name}"] = attr_value
+    if virtual_patent.text and virtual_patent.text.strip():
+        hierarchical_dict["#text"] = truncate_text(virtual_patent.text.strip(), config.get('max_text_length', 300))
+    placeholders = []
+    for child in virtual_patent:
+        if not isinstance(child.tag, str):
+            continue
+        if is_streamed_section(child):
+            child_dict = f"{_JSON_SECTION_MARKER}{len(placeholders)}"
+            placeholders.append(child)
+        else:
+            child_dict = element_to_hierarchical_dict(child, config)
+        if child.tag in hierarchical_dict:
+            if not isinstance(hierarchical_dict[child.tag], list):
+                hierarchical_dict[child.tag] = [hierarchical_dict[child.tag]]
+            hierarchical_dict[child.tag].append(child_dict)
+        else:
+            hierarchical_dict[child.tag] = child_dict
+    if virtual_patent.tail and virtual_patent.tail.strip():
+        hierarchical_dict["#tail"] = virtual_patent.tail.strip()
+    text = json.dumps(sanitize_for_json(hierarchical_dict), ensure_ascii=False, indent=4)
+
+    with atomic_output_path(output_path) as temp_path, open(temp_path, 'w', encoding='utf-8') as f:
+        position = 0
+        for index, placeholder in enumerate(placeholders):
+            marker = json.dumps(f"{_JSON_SECTION_MARKER}{index}", ensure_ascii=False)
+            start = text.index(marker, position)
+            line = text[text.rfind('\n', 0, start) + 1:start]
+            f.write(text[position:start])
+            _write_section_json(f, placeholder, (len(line) - len(line.lstrip(' '))) // 4, config, truncate)
+            position = start + len(marker)
+        f.write(text[position:])
+
+
+def _write_section_json(f, placeholder, level, config, truncate):
+    """Write the hierarchical dictionary of a streamed section (as element_to_hierarchical_dict builds it)"""
+    max_length = config.get('max_text_length', 300)
+    output_dir = os.path.dirname(f.name)
+    spools = {}
+    counts = {}
+    section_text = None
+    has_children = False
+    try:
+        # The children are grouped by tag, so every tag's children are spooled (one per line) first
+        for section, child in _iter_output_children(placeholder, config, truncate):
+            section_text = _get_section_text(section, config, truncate)
+            if child is None:
+                continue
+            has_children = True
+            if not isinstance(child.tag, str):
+                continue
+            if child.tag not in spools:
+                spools[child.tag] = tempfile.TemporaryFile('w+', encoding='utf-8', newline='\n', dir=output_dir)
+                counts[child.tag] = 0
+            spools[child.tag].write(json.dumps(sanitize_for_json(element_to_hierarchical_dict(child, config)),
+                                               ensure_ascii=False) + '\n')
+            counts[child.tag] += 1
+
+        if section_text and section_text.strip() and not has_children:
+            # Leaf element with only text
+            f.write(_dump_json(truncate_text(section_text.strip(), max_length), level))
+            return
+
+        head = [(f"@{name}", value) for name, value in _get_output_attributes(placeholder).items()]
+        if section_text and section_text.strip():
+            head.append(("#text", truncate_text(section_text.strip(), max_length)))
+        tail = []
+        if placeholder.tail and placeholder.tail.strip():
+            tail.append(("#tail", placeholder.tail.strip()))
+        if not head and not spools and not tail:
+            f.write('{}')
+            return
+
+        indent = '\n' + '    ' * (level + 1)
+        separator = '{' + indent
+        for key, value in head:
+            f.write(separator + json.dumps(key, ensure_ascii=False) + ': ' + _dump_json(value, level + 1))
+            separator = ',' + indent
+        for tag, spool in spools.items():
+            f.write(separator + json.dumps(tag, ensure_ascii=False) + ': ')
+            separator = ',' + indent
+            spool.seek(0)
+            if counts[tag] == 1:
+                f.write(_dump_json(json.loads(spool.readline()), level + 1))
+                continue
+            item_indent = '\n' + '    ' * (level + 2)
+            item_separator = '[' + item_indent
+            for line in spool:
+                f.write(item_separator + _dump_json(json.loads(line), level + 2))
+                item_separator = ',' + item_indent
+            f.write('\n' + '    ' * (level + 1) + ']')
+        for key, value in tail:
+            f.write(separator + json.dumps(key, ensure_ascii=False) + ': ' + _dump_json(value, level + 1))
+            separator = ',' + indent
+        f.write('\n' + '    ' * level + '}')
+    finally:
+        for spool in spools.values():
+            spool.close()
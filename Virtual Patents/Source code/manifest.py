@@ -0,0 +1,361 @@
+# Licensed under the MIT License. See LICENSE-CODE in the repository root for details.
+# Copyright (c) 2025 Christos Papadopoulos
+
+"""
+Run Manifest for PatentFusion
+
+This module keeps a manifest (manifest.json in the destination folder) of the last
+completed run: the configuration fingerprint, and for every patent group its input
+files (path, size, modification time) and the output files written for it:
+
+    {"fingerprint": "...",
+     "groups": {"EP-2615747": {"inputs": [["/WPI/EP/.../EP-2615747-A1.xml", 15324, 1704700800.0], ...],
+                               "outputs": ["individual_vpatents/EP/xml/EP-2615747-VP.xml", ...]}}}
+
+With --delta the current inventory is compared against the manifest, so only patent
+groups whose inputs changed (or all groups, if output settings changed) are fused
+again, and the outputs of groups whose source files disappeared are deleted.
+
+Sharded runs (--shard i/N) each write their own manifest.shard-i-of-N.json;
+--merge-manifests checks that the shards together cover every patent group and
+combines them into manifest.json.
+"""
+
+import os
+import re
+import csv
+import json
+import logging
+from constants import (
+    MANIFEST_NAME, SHARD_MANIFEST_PATTERN, DELTA_REPORT_NAME, DELTA_REPORT_COLUMNS, QUARANTINE_FILE_NAME
+)
+from archive_source import get_source_file_size, get_source_file_mtime
+from file_system import get_group_key, get_group_office, get_shard_index, get_run_file_path
+from run_journal import get_config_fingerprint
+from utils import atomic_output_path
+
+logger = logging.getLogger(__name__)
+
+
+def build_inventory(file_paths):
+    """
+    Describe the input files of every patent group
+
+    Args:
+        file_paths (list): Discovered source file paths (plain or virtual archive member paths)
+
+    Returns:
+        dict: Dictionary mapping group_key -> list of [file_path, size, mtime]
+    """
+    inventory = {}
+    for file_path in file_paths:
+        inventory.setdefault(get_group_key(file_path), []).append(
+            [file_path, get_source_file_size(file_path), get_source_file_mtime(file_path)])
+    return inventory
+
+
+def load_manifest(manifest_path):
+    """
+    Read a manifest
+
+    Args:
+        manifest_path (str): Path to a manifest.json file
+
+    Returns:
+        dict: Manifest with 'fingerprint' and 'groups', or None if there is none
+    """
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(manifest_path, manifest):
+    """
+    Write a manifest atomically
+
+    Args:
+        manifest_path (str): Path to the manifest.json file
+        manifest (dict): Manifest with 'fingerprint' and 'groups'
+    """
+    with atomic_output_path(manifest_path) as temp_path, open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, sort_keys=True)
+
+
+class RunManifest:
+    """
+    Inventory of the current run, compared against the manifest of the previous run
+    """
+
+    def __init__(self, config, file_paths, delta=False, selected_groups=None, excluded_groups=None):
+        """
+        Build the inventory and, in delta mode, classify the patent groups
+
+        Without delta mode (or without a previous manifest) every group counts as added.
+        Groups left out by an include list or the sample are not fused: they keep their
+        previous entry and their outputs, and never count as removed. Groups on an exclude
+        list that the previous run recorded count as excluded: their entries are dropped
+        and their outputs have to be deleted (see remove_outputs).
+
+        Args:
+            config (dict): Configuration dictionary
+            file_paths (list): Discovered source file paths (the whole inventory)
+            delta (bool): Compare against the manifest of the previous run
+            selected_groups (set, optional): Group keys this run fuses (defaults to the whole inventory)
+            excluded_groups (set, optional): Group keys dropped by the exclude lists
+        """
+        self.destination_path = config['destination_path']
+        self.path = get_run_file_path(config, MANIFEST_NAME)
+        self.report_path = get_run_file_path(config, DELTA_REPORT_NAME)
+        self.fingerprint = get_config_fingerprint(config)
+        self.inventory = build_inventory(file_paths)
+        self.delta = delta
+        # A sample run leaves the manifest of the full runs as it is
+        self.sample = bool(config.get('sample_size'))
+
+        self.previous = load_manifest(self.path) if delta else None
+        shard = config.get('shard')
+        if delta and self.previous is None and shard:
+            # First sharded run after a merged (or unsharded) run: use this shard's part of manifest.json
+            merged = load_manifest(os.path.join(self.destination_path, MANIFEST_NAME))
+            if merged is not None:
+                merged['groups'] = {group_key: entry for group_key, entry in merged['groups'].items()
+                                    if get_shard_index(group_key, shard[1]) == shard[0]}
+                self.previous = merged
+        if delta and self.previous is None:
+            logger.warning(f"No manifest found at {self.path}; fusing all patent groups")
+        previous_groups = self.previous['groups'] if self.previous else {}
+        
+        # Groups of patent offices this run does not cover are left as they are (unless
+        # output settings changed, then they are dropped and fused again when their office is run)
+        patent_offices = set(config['patent_offices'])
+        settings_changed = self.previous is not None and self.previous['fingerprint'] != self.fingerprint
+        self.other_offices = {group_key: entry for group_key, entry in previous_groups.items()
+                              if get_group_office(group_key) not in patent_offices and not settings_changed}
+        previous_groups = {group_key: entry for group_key, entry in previous_groups.items()
+                           if get_group_office(group_key) in patent_offices}
+
+        # Discovered groups this run does not fuse are left as they are, like other offices,
+        # unless they are excluded
+        selected = set(self.inventory) if selected_groups is None else set(self.inventory) & set(selected_groups)
+        excluded = (set(excluded_groups or ()) & set(self.inventory)) - selected
+        self.excluded = excluded & set(previous_groups)
+        self.unselected = {group_key: previous_groups[group_key]
+                           for group_key in set(self.inventory) - selected - excluded if group_key in previous_groups and not settings_changed}
+
+        if settings_changed:
+            # Output settings (e.g. global_priority) changed: every existing group is fused again
+            logger.info("Output settings changed since the previous run; all patent groups will be fused again")
+            self.updated = selected & set(previous_groups)
+        else:
+            self.updated = {group_key for group_key in selected if group_key in previous_groups
+                            and previous_groups[group_key]['inputs'] != self.inventory[group_key]}
+        self.added = selected - set(previous_groups)
+        self.removed = set(previous_groups) - set(self.inventory)
+        self.unchanged = selected - self.added - self.updated
+
+    def get_changed_groups(self):
+        """
+        Get the patent groups that have to be fused in this run
+
+        Returns:
+            set: Group keys of added and updated groups
+        """
+        return self.added | self.updated
+
+    def mark_updated(self, groups):
+        """
+        Fuse unchanged patent groups again, e.g. the other publications of a changed patent family
+
+        Args:
+            groups (set): Group keys (added groups and groups not in the inventory are left as they are)
+        """
+        groups = set(groups) & self.unchanged
+        self.updated |= groups
+        self.unchanged -= groups
+
+    def remove_outputs(self, groups):
+        """
+        Delete the output files the previous run wrote for some patent groups
+
+        Args:
+            groups (set): Group keys
+
+        Returns:
+            int: Number of files deleted
+        """
+        previous_groups = self.previous['groups'] if self.previous else {}
+        removed = 0
+        for group_key in groups:
+            for relative_path in previous_groups.get(group_key, {}).get('outputs', []):
+                output_path = os.path.join(self.destination_path, relative_path)
+                try:
+                    os.remove(output_path)
+                    removed += 1
+                except FileNotFoundError:
+                    continue
+                except OSError as e:
+                    logger.warning(f"Could not delete {output_path}: {e}")
+                    continue
+                self._remove_empty_directories(os.path.dirname(output_path))
+        return removed
+
+    def _remove_empty_directories(self, directory):
+        """Remove a directory and its parents as long as they are empty (never the destination itself)"""
+        destination = os.path.abspath(self.destination_path)
+        directory = os.path.abspath(directory)
+        while directory.startswith(destination + os.sep) and not os.listdir(directory):
+            os.rmdir(directory)
+            directory = os.path.dirname(directory)
+
+    def save(self, saved_outputs, completed_groups):
+        """
+        Write the manifest of this run
+
+        Unchanged groups, groups this run did not select and groups of patent offices outside
+        this run keep their previous entry. Changed groups are only recorded once they were
+        parsed and saved; the others (quarantined, unsaved or never parsed) are left out, so
+        the next delta run tries them again. Sample runs write no manifest: the groups they fused again are
+        still outdated in the previous manifest, so the next delta run fuses them once more.
+
+        Args:
+            saved_outputs (dict): group_key -> output paths (relative to the destination) written by this run
+            completed_groups (set): Group keys whose virtual patents were parsed and saved by this run
+        """
+        if self.sample:
+            logger.info(f"Sample run: {self.path} is not written")
+            return
+        previous_groups = self.previous['groups'] if self.previous else {}
+        groups = dict(self.other_offices)
+        groups.update(self.unselected)
+        groups.update({group_key: previous_groups[group_key] for group_key in self.unchanged})
+        for group_key in self.get_changed_groups() & set(completed_groups):
+            groups[group_key] = {'inputs': self.inventory[group_key],
+                                 'outputs': sorted(set(saved_outputs.get(group_key, [])))}
+        save_manifest(self.path, {'fingerprint': self.fingerprint, 'groups': groups})
+
+    def write_report(self):
+        """
+        Write the added, updated, removed and excluded patent groups to the delta report and log the totals
+
+        Returns:
+            str: Path to the delta report
+        """
+        report_path = self.report_path
+        with atomic_output_path(report_path) as temp_path, open(temp_path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(DELTA_REPORT_COLUMNS)
+            for change, groups in (('added', self.added), ('updated', self.updated), ('removed', self.removed),
+                                   ('excluded', self.excluded)):
+                for group_key in sorted(groups):
+                    writer.writerow([group_key, change])
+
+        logger.info(f"Virtual patents added: {len(self.added)}, updated: {len(self.updated)}, "
+                   f"removed: {len(self.removed)}, excluded: {len(self.excluded)}, unchanged: {len(self.unchanged)}")
+        logger.info(f"Delta report: {report_path}")
+        return report_path
+
+
+def read_quarantined_groups(destination_path):
+    """
+    Read the group keys of all quarantine files (of all shards) in a destination folder
+
+    Args:
+        destination_path (str): Destination folder
+
+    Returns:
+        set: Group keys of the quarantined patent groups
+    """
+    stem, extension = os.path.splitext(QUARANTINE_FILE_NAME)
+    quarantined = set()
+    for file_name in os.listdir(destination_path):
+        if file_name.startswith(stem) and file_name.endswith(extension):
+            with open(os.path.join(destination_path, file_name), 'r', encoding='utf-8', newline='') as f:
+                quarantined.update(row['patent_group'] for row in csv.DictReader(f))
+    return quarantined
+
+
+def merge_shard_manifests(config, file_paths, selected_file_paths=None):
+    """
+    Validate the manifests of a sharded run and merge them into manifest.json
+
+    The shards must all be present, use the same shard count and output settings,
+    and only hold patent groups that hash into their own shard. Every selected
+    patent group must be covered by a shard (or be quarantined).
+
+    Args:
+        config (dict): Configuration dictionary
+        file_paths (list): Discovered source file paths
+        selected_file_paths (list, optional): Source files the shards fused (those kept by the
+            include/exclude lists; defaults to file_paths)
+
+    Returns:
+        bool: True if the shards are complete and were merged
+    """
+    destination_path = config['destination_path']
+    fingerprint = get_config_fingerprint(config)
+    valid = True
+
+    shard_manifests = {}
+    for file_name in sorted(os.listdir(destination_path)):
+        match = re.match(SHARD_MANIFEST_PATTERN, file_name)
+        if match:
+            shard = (int(match.group(1)), int(match.group(2)))
+            shard_manifests[shard] = load_manifest(os.path.join(destination_path, file_name))
+
+    if not shard_manifests:
+        logger.error(f"No shard manifests found in {destination_path}")
+        return False
+
+    shard_counts = {shard_count for _, shard_count in shard_manifests}
+    if len(shard_counts) > 1:
+        logger.error(f"Shard manifests of different shard counts found: {sorted(shard_counts)}; "
+                     f"remove the manifests of the old shard layout")
+        return False
+    shard_count = shard_counts.pop()
+
+    missing_shards = [index for index in range(1, shard_count + 1) if (index, shard_count) not in shard_manifests]
+    if missing_shards:
+        logger.error(f"Missing manifests of shards {', '.join(f'{index}/{shard_count}' for index in missing_shards)}")
+        valid = False
+
+    groups = {}
+    for (index, _), shard_manifest in sorted(shard_manifests.items()):
+        if shard_manifest['fingerprint'] != fingerprint:
+            logger.error(f"Shard {index}/{shard_count} was run with different output settings")
+            valid = False
+        misplaced = [group_key for group_key in shard_manifest['groups']
+                     if get_shard_index(group_key, shard_count) != index]
+        if misplaced:
+            logger.error(f"Shard {index}/{shard_count} holds {len(misplaced)} patent groups of other shards "
+                         f"(e.g. {misplaced[0]})")
+            valid = False
+        logger.info(f"Shard {index}/{shard_count}: {len(shard_manifest['groups'])} patent groups")
+        groups.update(shard_manifest['groups'])
+
+    discovered = {get_group_key(file_path) for file_path in file_paths}
+    selected = discovered
+    if selected_file_paths is not None:
+        selected = {get_group_key(file_path) for file_path in selected_file_paths}
+    quarantined = read_quarantined_groups(destination_path)
+    uncovered = selected - set(groups) - quarantined
+    if uncovered:
+        logger.error(f"{len(uncovered)} patent groups are not covered by any shard "
+                     f"(e.g. {', '.join(sorted(uncovered)[:5])})")
+        valid = False
+    quarantined_only = (selected & quarantined) - set(groups)
+    if quarantined_only:
+        logger.warning(f"{len(quarantined_only)} patent groups were quarantined by the shards")
+    stale = {group_key for group_key in groups if get_group_office(group_key) in config['patent_offices']} - discovered
+    if stale:
+        logger.warning(f"{len(stale)} patent groups in the shard manifests no longer have source files; "
+                       f"run with --delta to remove their outputs")
+
+    if not valid:
+        logger.error("Shard manifests were not merged")
+        return False
+
+    save_manifest(os.path.join(destination_path, MANIFEST_NAME), {'fingerprint': fingerprint, 'groups': groups})
+    logger.info(f"Merged {shard_count} shard manifests ({len(groups)} patent groups) into "
+               f"{os.path.join(destination_path, MANIFEST_NAME)}")
+    return True
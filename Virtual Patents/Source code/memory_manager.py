@@ -13,23 +13,249 @@ import gc
 import time
 import json
 import logging
-import multiprocessing
-import pandas as pd
-import tqdm
+import psutil
 from lxml import etree
-from data_processor import save_individual_vpatents_sequential
+from constants import (
+    GC_GROWTH_THRESHOLD_MB, GC_MAX_THRESHOLD_MB, MEMORY_PAUSE_FRACTION,
+    MEMORY_RESUME_FRACTION, MIN_BATCH_SCALE, BATCH_SCALE_RECOVERY_TASKS
+)
+from data_processor import save_virtual_patents
+from xml_parser import get_compiled_xpath
 from file_system import cleanup_single_temp_file
+from worker_pool import create_executor, get_worker_context, init_pipeline_worker, use_pool
+from stage_metrics import get_stage_metrics, StageTimer
+from progress import create_progress
 from utils import get_memory_usage_gb, format_duration
+from config_manager import get_output_profiles
 
 logger = logging.getLogger(__name__)
 
-def chunked_memory_efficient_processing(all_temp_files, config):
+class CollectionPolicy:
+    """
+    Measured garbage collection policy
+
+    Instead of calling gc.collect() after every batch, a collection runs only when the
+    process RSS has grown by more than a threshold since the last collection. The memory
+    reclaimed by each collection is measured: if collections stop paying off (most lxml
+    memory is not managed by the Python collector), the threshold doubles; if they do
+    reclaim memory it returns to the base value.
+    """
+
+    def __init__(self, growth_threshold_mb=GC_GROWTH_THRESHOLD_MB, max_threshold_mb=GC_MAX_THRESHOLD_MB):
+        """
+        Initialize the collection policy
+
+        Args:
+            growth_threshold_mb (int): RSS growth (MB) since the last collection that triggers a collection
+            max_threshold_mb (int): Upper bound for the adaptive threshold
+        """
+        self.base_threshold_mb = growth_threshold_mb
+        self.threshold_mb = growth_threshold_mb
+        self.max_threshold_mb = max_threshold_mb
+        self.last_rss_mb = None
+        self.collections = 0
+        self.collection_seconds = 0.0
+        self.reclaimed_mb = 0.0
+
+    def maybe_collect(self):
+        """
+        Run a collection if RSS growth since the last one exceeds the threshold
+
+        Returns:
+            bool: True if a collection was run
+        """
+        rss_mb = get_memory_usage_gb() * 1024
+        if self.last_rss_mb is None:
+            self.last_rss_mb = rss_mb
+            return False
+
+        growth_mb = rss_mb - self.last_rss_mb
+        if growth_mb < self.threshold_mb:
+            return False
+
+        start_time = time.time()
+        gc.collect()
+        self.collection_seconds += time.time() - start_time
+        self.collections += 1
+
+        rss_after_mb = get_memory_usage_gb() * 1024
+        reclaimed_mb = max(0.0, rss_mb - rss_after_mb)
+        self.reclaimed_mb += reclaimed_mb
+
+        # Back off when a collection reclaims less than 10% of the growth that triggered it
+        if reclaimed_mb < growth_mb * 0.1:
+            self.threshold_mb = min(self.threshold_mb * 2, self.max_threshold_mb)
+        else:
+            self.threshold_mb = self.base_threshold_mb
+
+        self.last_rss_mb = rss_after_mb
+        return True
+
+
+class MemoryGovernor:
+    """
+    Enforces memory_limit across the driver and all worker processes
+
+    The aggregate RSS of the driver and its workers is sampled before each dispatch.
+    When it reaches the pause threshold, dispatching stops until usage drops below
+    the resume threshold, and the batch scale is halved so subsequent tasks are smaller.
+    The batch scale recovers once enough tasks complete without memory pressure.
+    """
+
+    def __init__(self, memory_limit_gb, pause_fraction=MEMORY_PAUSE_FRACTION, resume_fraction=MEMORY_RESUME_FRACTION):
+        """
+        Initialize the memory governor
+
+        Args:
+            memory_limit_gb (float): Aggregate memory limit in GB (config memory_limit)
+            pause_fraction (float): Fraction of the limit at which dispatching pauses
+            resume_fraction (float): Fraction of the limit below which dispatching resumes
+        """
+        self.memory_limit_bytes = memory_limit_gb * 1024**3
+        self.pause_bytes = self.memory_limit_bytes * pause_fraction
+        self.resume_bytes = self.memory_limit_bytes * resume_fraction
+        self.batch_scale = 1.0
+        self.paused = False
+        self.pause_events = 0
+        self.peak_usage_bytes = 0
+        self.current_usage_bytes = 0
+        self._tasks_since_pressure = 0
+        self._driver = psutil.Process(os.getpid())
+
+    def measure(self, worker_pids):
+        """
+        Measure the aggregate RSS of the driver and the given workers
+
+        Args:
+            worker_pids (list): Process ids of live workers
+
+        Returns:
+            int: Aggregate RSS in bytes
+        """
+        usage = self._driver.memory_info().rss
+        for pid in worker_pids:
+            try:
+                usage += psutil.Process(pid).memory_info().rss
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+        self.current_usage_bytes = usage
+        self.peak_usage_bytes = max(self.peak_usage_bytes, usage)
+        return usage
+
+    def can_dispatch(self, worker_pids):
+        """
+        Decide whether a new task may be dispatched
+
+        Args:
+            worker_pids (list): Process ids of live workers
+
+        Returns:
+            bool: False while aggregate memory usage is above the thresholds
+        """
+        usage = self.measure(worker_pids)
+
+        if not self.paused and usage >= self.pause_bytes:
+            self.paused = True
+            self.pause_events += 1
+            self._tasks_since_pressure = 0
+            self.batch_scale = max(MIN_BATCH_SCALE, self.batch_scale / 2)
+            logger.warning(f"Memory usage {usage / 1024**3:.2f} GB near limit {self.memory_limit_bytes / 1024**3:.2f} GB - "
+                           f"pausing dispatch, batch scale reduced to {self.batch_scale:.3f}")
+        elif self.paused and usage < self.resume_bytes:
+            self.paused = False
+            logger.info(f"Memory usage back to {usage / 1024**3:.2f} GB - resuming dispatch")
+
+        return not self.paused
+
+    def record_task(self):
+        """Record a finished task and let the batch scale recover after sustained low pressure"""
+        self._tasks_since_pressure += 1
+        if self.batch_scale < 1.0 and not self.paused and self._tasks_since_pressure >= BATCH_SCALE_RECOVERY_TASKS:
+            self.batch_scale = min(1.0, self.batch_scale * 2)
+            self._tasks_since_pressure = 0
+            logger.info(f"Memory pressure eased - batch scale restored to {self.batch_scale:.3f}")
+
+    def log_summary(self):
+        """Log peak usage and pause statistics"""
+        logger.info(f"Memory governor: peak usage {self.peak_usage_bytes / 1024**3:.2f} GB of {self.memory_limit_bytes / 1024**3:.2f} GB limit, "
+                   f"{self.pause_events} dispatch pauses")
+
+
+def create_memory_governor(config):
+    """
+    Create a MemoryGovernor from the configuration
+
+    Args:
+        config (dict): Configuration dictionary
+
+    Returns:
+        MemoryGovernor: Governor enforcing config['memory_limit']
+    """
+    return MemoryGovernor(config['memory_limit'])
+
+
+def create_worker_pool(config):
+    """
+    Create the run-wide worker pool from the configuration
+
+    Args:
+        config (dict): Configuration dictionary
+
+    Returns:
+        WorkerPool: Unstarted pool of cpu_count pipeline workers using the configured executor backend
+    """
+    return create_executor(config['cpu_count'], config['executor_backend'], initializer=init_pipeline_worker,
+                           initargs=(config,), rss_ceiling_gb=config['worker_memory_limit'],
+                           collection_policy=CollectionPolicy(), pin_workers=config['pin_workers'])
+
+
+def process_temp_file_task(temp_file_path):
+    """
+    Worker task: save the virtual patents of one temp file
+
+    Args:
+        temp_file_path (str): Path to temporary XML file
+
+    Returns:
+        tuple: (patents_count, merged_patents_count, saved_outputs)
+    """
+    return process_single_temp_file_worker(temp_file_path, get_worker_context()['config'])
+
+
+def measure_temp_file_task(temp_file_path):
+    """
+    Worker task: measure the memory needed to hold the virtual patents of a temp file
+
+    The temp file is only loaded, not saved or deleted, so it is still processed
+    normally by the output phase.
+
+    Args:
+        temp_file_path (str): Path to temporary XML file
+
+    Returns:
+        tuple: (patents_count, rss_growth_bytes)
+    """
+    process = psutil.Process(os.getpid())
+    rss_before = process.memory_info().rss
+    virtual_patents = load_single_temp_file(temp_file_path)
+    rss_growth = process.memory_info().rss - rss_before
+    patents_count = len(virtual_patents)
+    del virtual_patents
+    return patents_count, rss_growth
+
+
+def chunked_memory_efficient_processing(all_temp_files, config, pool=None, journal=None):
     """
     Process virtual patent XML files with streaming multiprocessing approach
 
+    Temp files are dispatched one at a time to a governed worker pool, so dispatching
+    pauses when aggregate memory usage approaches memory_limit.
+
     Args:
         all_temp_files (list): List of temporary XML file paths containing virtual patents
         config (dict): Configuration dictionary
+        pool (WorkerPool, optional): Shared worker pool (a temporary pool is created if None)
+        journal (RunJournal, optional): Run journal receiving every saved temp file and its output files
 
     Returns:
         int: Success code (0 for success)
@@ -40,170 +266,84 @@ def chunked_memory_efficient_processing(all_temp_files, config):
     vp_start_time = time.time()
     
     # Use multiprocessing to process temp files in parallel streams
-    cpu_count = min(config['cpu_count'], len(all_temp_files))
+    effective_cpu_count = min(config['cpu_count'], len(all_temp_files))
     total_files_processed = 0
-    
-    # Create chunks for parallel processing (similar to parsing)
-    chunk_size = max(1, len(all_temp_files) // cpu_count)
-    chunks = []
-    for i in range(0, len(all_temp_files), chunk_size):
-        chunks.append(all_temp_files[i:i + chunk_size])
-    
-    effective_cpu_count = min(cpu_count, len(chunks))
+    total_merged_patents = 0
+    governor = create_memory_governor(config)
     
     try:
-        
-        with multiprocessing.Manager() as manager:
-            progress_dict = manager.dict()
-            progress_lock = manager.Lock()
+        with use_pool(pool, lambda: create_worker_pool(config)) as pool:
+            pool.set_context(config=config)
+            # The shared pool is used by several phases; report only this phase's restarts
+            recycled_before = pool.recycled_workers
             
-            with multiprocessing.Pool(processes=effective_cpu_count) as pool:
-                # Add spacing and header like during parsing
-                print(f"\nStarting virtual patent processing with {len(chunks)} workers:")
-                print("=" * 60)
-                
-                # Create progress bars for each worker
-                progress_bars = {}
-                for chunk_id in range(len(chunks)):
-                    progress_bars[chunk_id] = tqdm.tqdm(total=len(chunks[chunk_id]), 
-                                                       desc=f"Worker {chunk_id}", 
-                                                       position=chunk_id, leave=True, 
-                                                       dynamic_ncols=True, unit="file")
-                
-                # Overall progress bar  
-                overall_pbar = tqdm.tqdm(total=len(all_temp_files), desc="Overall Progress", 
-                                       position=len(chunks), leave=True, 
-                                       dynamic_ncols=True, unit="file")
-                
-                # Initialize progress tracking
-                for chunk_id, chunk in enumerate(chunks):
-                    progress_dict[chunk_id] = {
-                        'current': 0,
-                        'total': len(chunk),
-                        'patents_processed': 0
-                    }
-                
-                # Start async processing
-                chunk_args = []
-                for chunk_id, chunk in enumerate(chunks):
-                    args = (chunk, config, chunk_id, progress_dict, progress_lock)
-                    chunk_args.append(args)
-                
-                async_results = [pool.apply_async(process_temp_file_chunk_worker, args) for args in chunk_args]
-                
-                # Monitor progress
-                completed = False
-                while not completed:
-                    time.sleep(0.1)
-                    
-                    # Update progress bars
-                    overall_current = 0
-                    total_patents = 0
-                    
-                    with progress_lock:
-                        for chunk_id in range(len(chunks)):
-                            if chunk_id in progress_dict:
-                                worker_info = progress_dict[chunk_id]
-                                current = worker_info.get('current', 0)
-                                total = worker_info.get('total', 1)
-                                patents = worker_info.get('patents_processed', 0)
-                                
-                                # Update worker progress bar
-                                progress_bars[chunk_id].n = current
-                                progress_bars[chunk_id].set_postfix({"Patents": patents})
-                                progress_bars[chunk_id].refresh()
-                                
-                                overall_current += current
-                                total_patents += patents
-                    
-                    # Update overall progress bar
-                    overall_pbar.n = overall_current
-                    overall_pbar.set_postfix({"Total Patents": total_patents})
-                    overall_pbar.refresh()
-                    
-                    # Check if all workers are done
-                    completed = all(result.ready() for result in async_results)
-                
-                # Collect results
-                results = []
-                for result in async_results:
-                    try:
-                        results.extend(result.get())
-                    except Exception as e:
-                        logger.error(f"Error getting worker result: {e}")
-                
-                # Close progress bars
-                for pbar in progress_bars.values():
-                    pbar.close()
-                overall_pbar.close()
-                
-                # Add separator like during parsing
-                print("=" * 60)
+            # Per-worker progress bars, or periodic progress log lines when headless
+            progress = create_progress(config, 'save', 'virtual patent processing', len(all_temp_files), 'temp file',
+                                       effective_cpu_count, pool)
+            worker_patents = {worker_id: 0 for worker_id in range(effective_cpu_count)}
+            submitted_temp_files = {}
+            failed_temp_files = []
+            
+            def on_result(result):
+                nonlocal total_files_processed, total_merged_patents
+                worker_id = result['worker_id']
+                temp_file_path = submitted_temp_files.pop(result['task_id'])
+                patents_before = total_files_processed
+                if result['error']:
+                    # The temp file is kept and not journaled as saved, so --resume saves it again
+                    logger.error(f"Error saving temp file {temp_file_path}: {result['error']}")
+                    failed_temp_files.append(temp_file_path)
+                elif result['result'] is not None:
+                    patents_count, merged_count, saved_outputs = result['result']
+                    total_files_processed += patents_count
+                    total_merged_patents += merged_count
+                    worker_patents[worker_id] += patents_count
+                    if journal is not None:
+                        journal.record_saved(temp_file_path, saved_outputs)
                 
-                # Aggregate results - each result is a tuple of (patents_count, merged_count)
-                total_files_processed = sum(result[0] for result in results if result is not None)
-                total_merged_patents = sum(result[1] for result in results if result is not None)
+                # Update worker and overall progress
+                progress.record(result, 1, total_files_processed - patents_before)
+                progress.set_worker_info(worker_id, {"Patents": worker_patents[worker_id],
+                                                     "Memory": f"{result['rss'] / 1024**3:.1f}GB"})
+                progress.set_info({"Total Patents": total_files_processed})
+            
+            def on_submit(task_id, func, args):
+                submitted_temp_files[task_id] = args[0]
+            
+            tasks = [(process_temp_file_task, (temp_file_path,)) for temp_file_path in all_temp_files]
+            pool.run(tasks, on_result, governor=governor, on_submit=on_submit, on_poll=progress.poll,
+                     max_workers=effective_cpu_count)
+            progress.close()
+            
+            recycled_workers = pool.recycled_workers - recycled_before
+            if recycled_workers:
+                logger.info(f"Recycled {recycled_workers} workers that exceeded the {config['worker_memory_limit']:.2f}GB per-process ceiling")
     
     except Exception as e:
         logger.error(f"Error in streaming multiprocessing: {e}")
         return 1
     
+    if failed_temp_files:
+        logger.error(f"{len(failed_temp_files)} of {len(all_temp_files)} temp files could not be saved; "
+                     f"they are kept in {config['temp_dir']} for --resume")
+        return 1
+    
+    governor.log_summary()
+    
     # Calculate virtual patent processing duration
     vp_end_time = time.time()
     vp_duration = vp_end_time - vp_start_time
     logger.info(f"Virtual patent processing complete in {format_duration(vp_duration)}. Processed {total_files_processed} virtual patents from {len(all_temp_files)} temp files")
     
     # Log merged patents inspection if enabled and merged patents were found
-    if config.get('enable_merged_inspection', True) and total_merged_patents > 0:
-        merged_patents_dir = os.path.join(os.path.dirname(config['individual_vp_dir']), "merged_patents_inspection")
-        logger.info(f"Successfully copied {total_merged_patents} merged patents to inspection folder: {merged_patents_dir}")
+    for profile_config in get_output_profiles(config):
+        if profile_config.get('enable_merged_inspection', True) and total_merged_patents > 0:
+            merged_patents_dir = os.path.join(os.path.dirname(profile_config['individual_vp_dir']), "merged_patents_inspection")
+            logger.info(f"Successfully copied {total_merged_patents} merged patents to inspection folder: {merged_patents_dir}")
     
     return 0
 
 
-def process_temp_file_chunk_worker(temp_file_chunk, config, chunk_id, progress_dict, progress_lock):
-    """
-    Worker function to process a chunk of temp files with progress tracking
-
-    Args:
-        temp_file_chunk (list): List of temp file paths to process
-        config (dict): Configuration dictionary
-        chunk_id (int): Worker ID for progress tracking
-        progress_dict (dict): Shared progress dictionary
-        progress_lock: Lock for progress updates
-
-    Returns:
-        list: List of (patents_count, merged_count) tuples from each file
-    """
-    results = []
-    
-    for i, temp_file_path in enumerate(temp_file_chunk):
-        try:
-            # Process single temp file
-            patents_count, merged_count = process_single_temp_file_worker(temp_file_path, config)
-            results.append((patents_count, merged_count))
-            
-            # Update progress
-            with progress_lock:
-                worker_info = dict(progress_dict[chunk_id])
-                worker_info['current'] = i + 1
-                worker_info['patents_processed'] = sum(r[0] for r in results if r is not None)
-                progress_dict[chunk_id] = worker_info
-                
-        except Exception as e:
-            logger.error(f"Error processing temp file {temp_file_path}: {e}")
-            results.append((0, 0))
-            
-            # Update progress even on error
-            with progress_lock:
-                worker_info = dict(progress_dict[chunk_id])
-                worker_info['current'] = i + 1
-                worker_info['patents_processed'] = sum(r[0] for r in results if r is not None)
-                progress_dict[chunk_id] = worker_info
-    
-    return results
-
-
 def process_single_temp_file_worker(temp_file_path, config):
     """
     Worker function to process a single temp file
@@ -213,44 +353,39 @@ def process_single_temp_file_worker(temp_file_path, config):
         config (dict): Configuration dictionary
 
     Returns:
-        tuple: (patents_count, merged_patents_count)
+        tuple: (patents_count, merged_patents_count, saved_outputs)
+            - saved_outputs: Dictionary mapping group key -> list of written file paths
+
+    Raises:
+        Exception: If the temp file cannot be loaded or its virtual patents cannot be saved;
+            the temp file is then kept, so a resumed run saves it again
 
     Note:
         Temp file is immediately deleted after processing to save disk space
     """
-    processed_patents = []  # Initialize to avoid scoping issues
+    saved_outputs = {}
     
-    try:
-        # Load virtual patents from single temp file
-        virtual_patents = load_single_temp_file(temp_file_path)
-        
-        if not virtual_patents:
-            return 0
-        
-        # Save individual virtual patent files WITHOUT nested multiprocessing
-        # Use single-threaded approach to avoid daemon process issues
-        files_saved, merged_count = save_individual_vpatents_sequential(
-            virtual_patents, config['patent_office'], config['output_formats'],
-            config['individual_vp_dir'], config
-        )
-        
-        # Clean up memory
-        patents_count = len(virtual_patents)
-        del virtual_patents
-        gc.collect()
-        
-        # Immediately delete the temp file to save disk space
-        cleanup_single_temp_file(temp_file_path)
-        
-        return patents_count, merged_count
-        
-    except Exception as e:
-        logger.error(f"Error processing temp file {temp_file_path}: {e}")
-        
-        # Clean up temp file even if processing failed to avoid disk space issues
+    # Load virtual patents from single temp file
+    timer = StageTimer(get_stage_metrics())
+    virtual_patents = load_single_temp_file(temp_file_path)
+    timer.lap('temp_load')
+    
+    if not virtual_patents:
         cleanup_single_temp_file(temp_file_path)
-        
-        return 0, 0
+        return 0, 0, saved_outputs
+    
+    # Save individual virtual patent files WITHOUT nested multiprocessing
+    # Use single-threaded approach to avoid daemon process issues
+    files_saved, merged_count = save_virtual_patents(virtual_patents, config, saved_outputs=saved_outputs)
+    
+    # Release references; collection is left to the worker's CollectionPolicy
+    patents_count = len(virtual_patents)
+    del virtual_patents
+    
+    # Immediately delete the temp file to save disk space
+    cleanup_single_temp_file(temp_file_path)
+    
+    return patents_count, merged_count, saved_outputs
 
 
 def load_single_temp_file(temp_file_path):
@@ -262,21 +397,19 @@ def load_single_temp_file(temp_file_path):
         
     Returns:
         list: List of virtual patent XML elements
-    """
-    try:
-        # Parse temp XML file
-        tree = etree.parse(temp_file_path)
-        root = tree.getroot()
-        
-        # Extract virtual patents from the temporary file
-        virtual_patents = root.xpath("//virtual-patents/*")
         
-        # Clean up
-        del tree, root
-        gc.collect()
-        
-        return virtual_patents
-        
-    except Exception as e:
-        logger.error(f"Error loading temp file {temp_file_path}: {e}")
-        return []
+    Raises:
+        OSError, etree.XMLSyntaxError: If the temp file cannot be read (an unreadable temp file
+            must not pass for one without virtual patents)
+    """
+    # Parse temp XML file
+    tree = etree.parse(temp_file_path)
+    root = tree.getroot()
+    
+    # Extract virtual patents from the temporary file
+    virtual_patents = get_compiled_xpath("//virtual-patents/*")(root)
+    
+    # Clean up
+    del tree, root
+    
+    return virtual_patents
@@ -0,0 +1,245 @@
+# Licensed under the MIT License. See LICENSE-CODE in the repository root for details.
+# Copyright (c) 2025 Christos Papadopoulos
+
+"""
+Merge Planner for PatentFusion
+
+A virtual patent takes most of its content (description, claims, ...) from one file
+of the patent group, so fully parsing every lower-priority kind file wastes most of
+the parsing work. The planner first scans the raw bytes of every file for its Level 1
+sections (tag, language, size, empty or not) without building a tree, then decides
+which sections can end up in the virtual patent:
+
+- bibliographic-data is always merged, so it is always parsed
+- sections of fields with a field-specific priority (<field>_priority in [vpatent_creation])
+  are only parsed from the files of the kinds that priority selects
+- abstracts are parsed from every file (they are merged with duplicate detection)
+- any other section is only parsed from the first file that has it, as the merge keeps that one
+- sections disabled by the parse flags are never parsed
+
+The highest priority (base) file is always parsed completely. Of every other file
+only a partial document made of its prolog, root element and the selected sections
+is parsed. Files that cannot be scanned safely (CDATA sections, internal DTD subsets,
+unexpected structure) are parsed completely.
+"""
+
+import re
+from collections import namedtuple
+from constants import FIELD_PRIORITY_SECTIONS, SECTION_PARSE_FLAGS
+
+# A Level 1 section of a patent document: byte range (including the whitespace that follows it),
+# language and whether it has any content (attributes, text or children)
+Section = namedtuple('Section', ['tag', 'start', 'end', 'lang', 'has_content'])
+
+# Byte layout of a patent document: end of the root start tag, start of the root end tag, and its sections
+SectionScan = namedtuple('SectionScan', ['root_end', 'closing', 'sections'])
+
+_TAG_PATTERN = re.compile(rb'<([A-Za-z_][\w.:-]*)((?:\s+[^\s=/>]+\s*=\s*(?:"[^"]*"|\'[^\']*\'))*)\s*(/?)>')
+_LANG_PATTERN = re.compile(rb'\blang\s*=\s*["\']([^"\']*)["\']')
+_NAME_END = b' \t\r\n/>'
+
+
+def _skip_markup(data, position):
+    """Get the position after a comment or processing instruction, or None for other markup (DOCTYPE, CDATA)"""
+    if data.startswith(b'<!--', position):
+        end = data.find(b'-->', position)
+        return None if end == -1 else end + 3
+    if data.startswith(b'<?', position):
+        end = data.find(b'?>', position)
+        return None if end == -1 else end + 2
+    return None
+
+
+def _find_element_end(data, tag, content_start, limit):
+    """Get the position after the end tag matching an element start tag (nested elements of the same name are skipped)"""
+    open_tag = b'<' + tag
+    close_tag = b'</' + tag
+    depth = 1
+    position = content_start
+    while depth:
+        close = data.find(close_tag, position, limit)
+        if close == -1:
+            return None
+        opening = data.find(open_tag, position, close)
+        if opening != -1:
+            position = opening + len(open_tag)
+            if data[position:position + 1] in _NAME_END:
+                end = data.find(b'>', position)
+                if end == -1:
+                    return None
+                if data[end - 1:end] != b'/':
+                    depth += 1
+                position = end + 1
+            continue
+        position = close + len(close_tag)
+        if data[position:position + 1] not in _NAME_END:
+            continue
+        end = data.find(b'>', position)
+        if end == -1:
+            return None
+        depth -= 1
+        position = end + 1
+    return position
+
+
+def scan_sections(data):
+    """
+    Scan a patent document for its Level 1 sections without parsing it
+
+    Args:
+        data (bytes): Raw XML document
+
+    Returns:
+        SectionScan: Section layout, or None if the document cannot be scanned safely
+    """
+    if b'<![CDATA[' in data:
+        return None
+
+    # Skip the prolog (XML declaration, comments); a DOCTYPE is only accepted without an internal subset
+    position = data.find(b'<')
+    while position != -1 and data[position + 1:position + 2] in (b'?', b'!'):
+        if data.startswith(b'<!DOCTYPE', position):
+            end = data.find(b'>', position)
+            if end == -1 or b'[' in data[position:end]:
+                return None
+            position = data.find(b'<', end + 1)
+            continue
+        end = _skip_markup(data, position)
+        if end is None:
+            return None
+        position = data.find(b'<', end)
+    if position == -1:
+        return None
+
+    root = _TAG_PATTERN.match(data, position)
+    if root is None or root.group(3):
+        return None
+    root_end = root.end()
+    closing = data.rfind(b'</' + root.group(1))
+    if closing < root_end:
+        return None
+
+    sections = []
+    position = root_end
+    while True:
+        start = data.find(b'<', position, closing)
+        if start == -1:
+            break
+        if data[start + 1:start + 2] in (b'!', b'?'):
+            position = _skip_markup(data, start)
+            if position is None:
+                return None
+            continue
+        match = _TAG_PATTERN.match(data, start)
+        if match is None:
+            return None
+        tag, attributes, self_closing = match.groups()
+        if self_closing:
+            end = match.end()
+            has_content = bool(attributes.strip())
+        else:
+            end = _find_element_end(data, tag, match.end(), closing)
+            if end is None:
+                return None
+            inner = data[match.end():data.rfind(b'</', match.end(), end)]
+            has_content = bool(attributes.strip()) or bool(inner.strip())
+        # Keep the whitespace that follows the element (its tail), as a full parse would
+        tail_end = data.find(b'<', end, closing)
+        tail_end = closing if tail_end == -1 else tail_end
+        lang = _LANG_PATTERN.search(attributes)
+        sections.append(Section(tag.decode('utf-8'), start, tail_end, lang.group(1).decode('utf-8') if lang else '',
+                                has_content))
+        position = tail_end
+
+    return SectionScan(root_end, closing, sections)
+
+
+def get_field_order(kind_codes, field_priority):
+    """
+    Order the files of a group by a field-specific priority
+
+    Args:
+        kind_codes (list): Kind code of every file of the group, in global priority order
+        field_priority (list): Kind codes in field priority order
+
+    Returns:
+        list: Indices of the files whose kind is listed, highest field priority first
+    """
+    return [index for kind_code in field_priority for index, file_kind in enumerate(kind_codes) if file_kind == kind_code]
+
+
+def plan_merge(kind_codes, scans, config):
+    """
+    Decide which sections of every file of a group have to be parsed
+
+    Mirrors the merge rules (see merge_element_recursive in xml_parser.py and
+    apply_field_priorities), so the virtual patent is the same as with full parsing.
+
+    Args:
+        kind_codes (list): Kind code of every file, in global priority order (index 0 is the base file)
+        scans (list): SectionScan (or None) of every file
+        config (dict): Configuration dictionary
+
+    Returns:
+        list: For every file a list of the Section entries to parse, or None to parse the whole file
+    """
+    field_priorities = config.get('field_priorities') or {}
+    configured = {FIELD_PRIORITY_SECTIONS[field]: field for field in field_priorities if field in FIELD_PRIORITY_SECTIONS}
+    disabled = {tag for tag, flag in SECTION_PARSE_FLAGS.items() if not config.get(flag, True)}
+
+    # Files whose sections count for each field with a field priority
+    field_files = {}
+    for tag, field in configured.items():
+        order = get_field_order(kind_codes, field_priorities[field])
+        if tag == 'abstract':
+            field_files[tag] = set(order)
+        else:
+            winner = next((index for index in order if scans[index] is None or
+                           any(section.tag == tag and section.has_content for section in scans[index].sections)), None)
+            field_files[tag] = {winner} if winner is not None else set()
+
+    plan = [None]
+    if scans[0] is None:
+        # Without the base file's layout the merge of first-come sections cannot be predicted
+        return plan + [None] * (len(scans) - 1)
+    taken = {section.tag for section in scans[0].sections}
+
+    for index in range(1, len(scans)):
+        scan = scans[index]
+        if scan is None:
+            plan.append(None)
+            continue
+        selected = []
+        for section in scan.sections:
+            tag = section.tag
+            if tag == 'bibliographic-data':
+                selected.append(section)
+            elif tag in disabled or not section.has_content:
+                continue
+            elif tag in field_files:
+                if index in field_files[tag]:
+                    selected.append(section)
+            elif tag == 'abstract' or tag not in taken:
+                selected.append(section)
+        plan.append(selected)
+        # The merge compares against the virtual patent as it was before this file
+        taken.update(section.tag for section in selected)
+    return plan
+
+
+def build_partial_document(data, scan, sections):
+    """
+    Build a document holding only some sections of a patent document
+
+    Args:
+        data (bytes): Raw XML document
+        scan (SectionScan): Section layout of the document
+        sections (list): Sections to keep
+
+    Returns:
+        bytes: Prolog, root start tag, the kept sections and the root end tag
+    """
+    parts = [data[:scan.root_end]]
+    parts.extend(data[section.start:section.end] for section in sections)
+    parts.append(data[scan.closing:])
+    return b''.join(parts)
@@ -11,9 +11,13 @@ individual patent file creation, and sample generation for inspection.
 import os
 import logging
 from utils import truncate_text
+from archive_source import is_archive_member_path, split_archive_member_path
 
 logger = logging.getLogger(__name__)
 
+# Fields of the metadata attributes, left out of the CSV output (checked for both simple and flattened names)
+METADATA_FIELD_KEYWORDS = {'xml_file_name', 'relative_dir', 'folder_index'}
+
 def construct_original_directory_path(source_file_path, patent_office, base_output_dir):
     """
     Construct the output path using the original dataset directory structure.
@@ -31,6 +35,10 @@ def construct_original_directory_path(source_file_path, patent_office, base_outp
         Output: '/results/CN/20140820/VP/000103/99/27/45/'
     """
     try:
+        # For archive members only the path inside the archive describes the dataset layout
+        if is_archive_member_path(source_file_path):
+            source_file_path = os.sep.join(split_archive_member_path(source_file_path)[1].split('/'))
+        
         # Parse the source file path to extract components
         # Expected format: .../PatentOffice/Date/KindCode/DocPath/FileName.xml
         path_parts = source_file_path.split(os.sep)
@@ -90,63 +98,74 @@ def apply_text_truncation_to_xml(element, config):
     for child in element:
         apply_text_truncation_to_xml(child, config)
 
-def flatten_xml_element(element, prefix, record_dict, config):
+def get_child_field_prefix(field_name, child_tag, occurrence, total_count):
     """
-    Recursively flatten XML element into a dictionary with text truncation
+    Get the field name prefix of a child element, indexed if its tag occurs more than once
+    
+    Args:
+        field_name (str): Field name of the parent element
+        child_tag (str): Tag of the child element
+        occurrence (int): Occurrence of the tag among the children (1 for the first)
+        total_count (int): Number of children with the tag
+        
+    Returns:
+        str: Prefix for the field names of the child
+    """
+    if total_count > 1:
+        return f"{field_name}_{child_tag}_{occurrence}"
+    return field_name
+
+def iter_flat_fields(element, prefix, config):
+    """
+    Recursively flatten XML element into (field name, value) pairs with text truncation
     
     Args:
         element: XML element to flatten
         prefix (str): Current prefix for field names
-        record_dict (dict): Dictionary to store flattened data
         config (dict): Configuration dictionary with max_text_length
+        
+    Yields:
+        tuple: (field name, value) in document order
     """
     # Create field name
     field_name = f"{prefix}_{element.tag}" if prefix else element.tag
     
     # Add attributes as separate fields
     for attr_name, attr_value in element.attrib.items():
-        attr_field_name = f"{field_name}_attr_{attr_name}"
-        record_dict[attr_field_name] = attr_value
+        yield f"{field_name}_attr_{attr_name}", attr_value
     
     # Handle text content with truncation
     if element.text and element.text.strip():
-        max_length = config.get('max_text_length', 300)
-        original_text = element.text.strip()
-        text_content = truncate_text(original_text, max_length)
-        record_dict[field_name] = text_content
-        
-        # Debug logging removed
+        yield field_name, truncate_text(element.text.strip(), config.get('max_text_length', 300))
     
     # Handle tail text (text that follows this element)
     if element.tail and element.tail.strip():
-        tail_content = truncate_text(element.tail.strip(), config.get('max_text_length', 300))
-        tail_field_name = f"{field_name}_tail"
-        record_dict[tail_field_name] = tail_content
+        yield f"{field_name}_tail", truncate_text(element.tail.strip(), config.get('max_text_length', 300))
     
     # Process child elements with indexing for duplicate tag names
+    total_counts = {}
+    for child in element:
+        if isinstance(child.tag, str):
+            total_counts[child.tag] = total_counts.get(child.tag, 0) + 1
     child_tag_counts = {}
     for child in element:
-        if hasattr(child, 'tag') and isinstance(child.tag, str):
-            child_tag = child.tag
-            
-            # Track how many times we've seen this tag
-            if child_tag not in child_tag_counts:
-                child_tag_counts[child_tag] = 0
-            else:
-                child_tag_counts[child_tag] += 1
-            
-            # Create indexed field name for duplicate tags
-            if child_tag_counts[child_tag] > 0:
-                indexed_field_name = f"{field_name}_{child_tag}_{child_tag_counts[child_tag] + 1}"
-            else:
-                # First occurrence, check if there will be more
-                total_count = sum(1 for c in element if hasattr(c, 'tag') and c.tag == child_tag)
-                if total_count > 1:
-                    indexed_field_name = f"{field_name}_{child_tag}_1"
-                else:
-                    indexed_field_name = field_name
-            
-            flatten_xml_element(child, indexed_field_name, record_dict, config)
+        if isinstance(child.tag, str):
+            child_tag_counts[child.tag] = child_tag_counts.get(child.tag, 0) + 1
+            indexed_field_name = get_child_field_prefix(field_name, child.tag, child_tag_counts[child.tag],
+                                                        total_counts[child.tag])
+            yield from iter_flat_fields(child, indexed_field_name, config)
+
+def flatten_xml_element(element, prefix, record_dict, config):
+    """
+    Recursively flatten XML element into a dictionary with text truncation
+    
+    Args:
+        element: XML element to flatten
+        prefix (str): Current prefix for field names
+        record_dict (dict): Dictionary to store flattened data
+        config (dict): Configuration dictionary with max_text_length
+    """
+    record_dict.update(iter_flat_fields(element, prefix, config))
 
 
 def remove_metadata_attributes(xml_element):
@@ -156,7 +175,7 @@ def remove_metadata_attributes(xml_element):
     Args:
         xml_element: XML element to clean
     """
-    metadata_attrs = ['xml_file_name', 'relative_dir', 'folder_index', '_source_file_path']
+    metadata_attrs = ['xml_file_name', 'relative_dir', 'folder_index', '_source_file_path', '_family_key']
     for attr in metadata_attrs:
         if attr in xml_element.attrib:
             del xml_element.attrib[attr]
@@ -178,14 +197,80 @@ def xml_to_flat_dict(virtual_patent, config):
     flatten_xml_element(virtual_patent, '', record_dict, config)
     
     # Remove metadata fields (check for both simple and flattened names)
-    metadata_keywords = {'xml_file_name', 'relative_dir', 'folder_index'}
     cleaned_record_dict = {field_name: field_value for field_name, field_value in record_dict.items() 
-                          if not any(metadata_keyword in field_name for metadata_keyword in metadata_keywords)}
+                          if not any(metadata_keyword in field_name for metadata_keyword in METADATA_FIELD_KEYWORDS)}
     
     # Apply config-based filtering (remove fields that are disabled)
     # Config-based filtering is applied during virtual patent creation
     return cleaned_record_dict
 
+def element_to_hierarchical_dict(elem, config):
+    """
+    Convert XML element to dictionary recursively
+    
+    Args:
+        elem: XML element
+        config (dict): Configuration dictionary with max_text_length
+        
+    Returns:
+        dict or str: Dictionary of the element, or its (truncated) text for leaf elements with text
+    """
+    result = {}
+    
+    # Add attributes with @attr prefix to distinguish from elements
+    # Only include string attributes to avoid cython function serialization issues
+    for attr_name, attr_value in elem.attrib.items():
+        if isinstance(attr_name, str) and isinstance(attr_value, (str, int, float, bool, type(None))):
+            result[f"@{attr_name}"] = attr_value
+    
+    # Handle text content with truncation
+    if elem.text and elem.text.strip():
+        text_content = truncate_text(elem.text.strip(), config.get('max_text_length', 300))
+        if len(elem) == 0:  # Leaf element with only text
+            return text_content
+        else:  # Element with both text and children
+            result["#text"] = text_content
+    
+    # Handle child elements
+    for child in elem:
+        # Ensure child.tag is a string to avoid cython function issues
+        if hasattr(child, 'tag') and isinstance(child.tag, str):
+            child_tag = child.tag
+            child_dict = element_to_hierarchical_dict(child, config)
+            
+            if child_tag in result:
+                # Multiple elements with same tag - convert to array
+                if not isinstance(result[child_tag], list):
+                    result[child_tag] = [result[child_tag]]
+                result[child_tag].append(child_dict)
+            else:
+                result[child_tag] = child_dict
+    
+    # Handle tail text (text after element)
+    if elem.tail and elem.tail.strip():
+        result["#tail"] = elem.tail.strip()
+    
+    return result
+
+def sanitize_for_json(obj):
+    """Recursively sanitize object to ensure JSON compatibility"""
+    if isinstance(obj, dict):
+        sanitized = {}
+        for k, v in obj.items():
+            # Only include keys that are strings
+            if isinstance(k, str):
+                sanitized_value = sanitize_for_json(v)
+                if sanitized_value is not None:  # Skip None values
+                    sanitized[k] = sanitized_value
+        return sanitized
+    elif isinstance(obj, list):
+        return [sanitize_for_json(item) for item in obj if sanitize_for_json(item) is not None]
+    elif isinstance(obj, (str, int, float, bool, type(None))):
+        return obj
+    else:
+        # Skip any other types that can't be JSON serialized (like cython functions)
+        return None
+
 def xml_to_hierarchical_dict(virtual_patent, config):
     """
     Convert virtual patent XML to hierarchical dictionary preserving XML structure for JSON
@@ -197,68 +282,10 @@ def xml_to_hierarchical_dict(virtual_patent, config):
     Returns:
         dict: Hierarchical dictionary representation of the patent
     """
-    def element_to_dict(elem):
-        """Convert XML element to dictionary recursively"""
-        result = {}
-        
-        # Add attributes with @attr prefix to distinguish from elements
-        # Only include string attributes to avoid cython function serialization issues
-        for attr_name, attr_value in elem.attrib.items():
-            if isinstance(attr_name, str) and isinstance(attr_value, (str, int, float, bool, type(None))):
-                result[f"@{attr_name}"] = attr_value
-        
-        # Handle text content with truncation
-        if elem.text and elem.text.strip():
-            text_content = truncate_text(elem.text.strip(), config.get('max_text_length', 300))
-            if len(elem) == 0:  # Leaf element with only text
-                return text_content
-            else:  # Element with both text and children
-                result["#text"] = text_content
-        
-        # Handle child elements
-        for child in elem:
-            # Ensure child.tag is a string to avoid cython function issues
-            if hasattr(child, 'tag') and isinstance(child.tag, str):
-                child_tag = child.tag
-                child_dict = element_to_dict(child)
-                
-                if child_tag in result:
-                    # Multiple elements with same tag - convert to array
-                    if not isinstance(result[child_tag], list):
-                        result[child_tag] = [result[child_tag]]
-                    result[child_tag].append(child_dict)
-                else:
-                    result[child_tag] = child_dict
-        
-        # Handle tail text (text after element)
-        if elem.tail and elem.tail.strip():
-            result["#tail"] = elem.tail.strip()
-        
-        return result
-    
     # Convert the virtual patent element to hierarchical dictionary
-    hierarchical_dict = element_to_dict(virtual_patent)
+    hierarchical_dict = element_to_hierarchical_dict(virtual_patent, config)
     
     # Ensure all keys and values are JSON serializable
-    def sanitize_for_json(obj):
-        """Recursively sanitize object to ensure JSON compatibility"""
-        if isinstance(obj, dict):
-            sanitized = {}
-            for k, v in obj.items():
-                # Only include keys that are strings
-                if isinstance(k, str):
-                    sanitized_value = sanitize_for_json(v)
-                    if sanitized_value is not None:  # Skip None values
-                        sanitized[k] = sanitized_value
-            return sanitized
-        elif isinstance(obj, list):
-            return [sanitize_for_json(item) for item in obj if sanitize_for_json(item) is not None]
-        elif isinstance(obj, (str, int, float, bool, type(None))):
-            return obj
-        else:
-            # Skip any other types that can't be JSON serialized (like cython functions)
-            return None
-    
     sanitized_dict = sanitize_for_json(hierarchical_dict)
     
     # Config-based filtering is applied during virtual patent creation
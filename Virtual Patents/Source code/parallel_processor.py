@@ -9,102 +9,186 @@ parallel processing of patent data for optimal performance.
 """
 
 import os
-import gc
+import csv
+import math
 import time
 import logging
-import multiprocessing
-import threading
-import tqdm
-from file_system import get_file_batches, create_temp_file_path
+from constants import QUARANTINE_FILE_NAME, QUARANTINE_COLUMNS
+from file_system import get_file_batches, split_file_batch, get_patent_groups, get_group_key, create_temp_file_path, get_run_file_path
+from family_index import build_family_index
 from xml_parser import process_file_batch
-from utils import get_memory_usage_gb, format_duration
+from archive_source import interleave_archive_batches
+from memory_manager import create_memory_governor, create_worker_pool
+from worker_pool import get_worker_context, use_pool
+from stage_metrics import get_stage_metrics, StageTimer
+from progress import create_progress
+from utils import format_duration, get_effective_cpu_count, atomic_output_path
 from lxml import etree
 
 logger = logging.getLogger(__name__)
 
-def chunk_processor_with_progress(chunk_args):
+def process_batch_task(batch, batch_id):
     """
-    Process a chunk of batches with shared progress tracking
+    Worker task: create the virtual patents of one batch and save them to temp files
+    
+    Each temp file holds at most chunk_size virtual patents, so the output phase
+    never loads more than chunk_size virtual patents per worker at a time. The worker
+    context must hold config and folder_order (see WorkerPool.set_context).
     
     Args:
-        chunk_args (tuple): Tuple containing (batches, folder_order, chunk_id, chunk_start, chunk_end, config, progress_dict, progress_lock)
+        batch (list): List of file paths (patent groups kept together)
+        batch_id (str): Batch identifier used for the temp file names
         
     Returns:
-        list: List of result file paths
+        dict: 'temp_files' (list of temp file paths), 'patents' (number of virtual patents) and
+            'failed_groups' (list of (group_key, file_list, error) for groups that raised)
     """
-    batches, folder_order, chunk_id, chunk_start, chunk_end, config, progress_dict, progress_lock = chunk_args
+    context = get_worker_context()
+    config = context['config']
     
-    # Get process ID for uniqueness
-    pid = os.getpid()
+    # Process batch
+    failed_groups = []
+    result_data = process_file_batch(batch, context['folder_order'], batch_id, config, failed_groups=failed_groups)
+    if not result_data:
+        return {'temp_files': [], 'patents': 0, 'failed_groups': failed_groups}
     
-    results_files = []
-    total_batches = chunk_end - chunk_start
+    # Save virtual patents to temporary files of at most chunk_size virtual patents
+    chunk_size = config['chunk_size']
+    chunks = [result_data[start:start + chunk_size] for start in range(0, len(result_data), chunk_size)]
+    temp_files = []
+    timer = StageTimer(get_stage_metrics())
+    for chunk_index, chunk in enumerate(chunks):
+        chunk_id = batch_id if len(chunks) == 1 else f"{batch_id}_c{chunk_index}"
+        temp_file_path = create_temp_file_path(config['temp_dir'], chunk_id, 'xml')
+        save_virtual_patents_to_temp_file(chunk, temp_file_path)
+        timer.lap('temp_write')
+        if os.path.exists(temp_file_path) and os.path.getsize(temp_file_path) > 0:
+            temp_files.append(temp_file_path)
     
-    # Initialize progress tracking for this worker
-    with progress_lock:
-        progress_dict[chunk_id] = {
-            'current': 0,
-            'total': total_batches,
-            'memory': 0.0,
-            'desc': f"Worker {chunk_id}"
-        }
+    patents_count = len(result_data)
+    del result_data, chunks
     
+    return {'temp_files': temp_files, 'patents': patents_count, 'failed_groups': failed_groups}
+
+def split_batch_task(task, batch_scale, family_index=None):
+    """
+    Split a batch task into smaller tasks when the memory governor shrinks the batch size
     
-    try:
-        for i, batch in enumerate(batches[chunk_start:chunk_end]):
-            batch_id = f"{chunk_id}_{i}_{pid}"
+    Args:
+        task (tuple): (process_batch_task, (batch, batch_id))
+        batch_scale (float): Fraction of the configured batch size to use
+        family_index (FamilyIndex, optional): Keep whole patent families together (family fusion)
+        
+    Returns:
+        list: List of smaller (func, args) tasks
+    """
+    func, (batch, batch_id) = task
+    pieces = split_file_batch(batch, math.ceil(1 / batch_scale), family_index)
+    if len(pieces) <= 1:
+        return [task]
+    return [(func, (piece, f"{batch_id}_{index}")) for index, piece in enumerate(pieces)]
+
+class BatchFaultHandler:
+    """
+    Isolates failing patent groups so one bad input never discards a whole batch
+    
+    A batch whose worker crashed, timed out (no progress within group_timeout) or raised
+    is resubmitted as one task per patent group. A group that still fails on its own, and
+    groups whose virtual patent creation raised inside a batch, are appended to the
+    quarantine file in the destination folder. Parsed batches and quarantined groups
+    are recorded in the run journal, if one is given. With family fusion the units that
+    are retried and quarantined are whole patent families.
+    """
+    
+    def __init__(self, config, journal=None, family_index=None):
+        """
+        Initialize the fault handler
+        
+        Args:
+            config (dict): Configuration dictionary
+            journal (RunJournal, optional): Run journal receiving parsed batches and quarantined groups
+            family_index (FamilyIndex, optional): Retry failed batches family by family (family fusion)
+        """
+        self.journal = journal
+        self.family_index = family_index
+        # Prefix for batch ids, so temp files of a resumed run never collide with kept ones
+        self.batch_prefix = journal.batch_prefix if journal is not None else ""
+        self.task_timeout = config['group_timeout'] or None
+        self.quarantine_path = get_run_file_path(config, QUARANTINE_FILE_NAME)
+        self.submitted = {}
+        self.resubmitted_batches = 0
+        self.quarantined_groups = 0
+    
+    def on_submit(self, task_id, func, args):
+        """
+        Remember a dispatched batch task so it can be resubmitted if it fails
+        
+        Args:
+            task_id: Task identifier
+            func (callable): Task function (process_batch_task)
+            args (tuple): (batch, batch_id)
+        """
+        self.submitted[task_id] = (func, args)
+    
+    def handle_result(self, result):
+        """
+        Quarantine failed groups of a result and work out which groups must be retried
+        
+        Args:
+            result (dict): Result dictionary from the worker pool
             
-            try:
-                # Process batch
-                result_data = process_file_batch(batch, folder_order, batch_id, config)
-                
-                # Save virtual patents to temporary file
-                if result_data:
-                    temp_file_path = create_temp_file_path(config['temp_dir'], batch_id, 'xml')
-                    
-                    # Save virtual patents as XML
-                    save_virtual_patents_to_temp_file(result_data, temp_file_path)
-                    
-                    if os.path.exists(temp_file_path) and os.path.getsize(temp_file_path) > 0:
-                        results_files.append(temp_file_path)
-                    
-                    # Clear memory
-                    del result_data
-                    gc.collect()
-                
-                # Update progress in shared dictionary (replace entire dict for manager sync)
-                with progress_lock:
-                    worker_info = dict(progress_dict[chunk_id])
-                    worker_info['current'] = i + 1
-                    progress_dict[chunk_id] = worker_info
-                
-                # Update memory usage periodically
-                if (i + 1) % 10 == 0:
-                    memory_usage = get_memory_usage_gb()
-                    with progress_lock:
-                        worker_info = dict(progress_dict[chunk_id])
-                        worker_info['memory'] = memory_usage
-                        progress_dict[chunk_id] = worker_info
-                
-            except Exception as e:
-                logger.error(f"Error processing batch {batch_id}: {e}")
-                with progress_lock:
-                    worker_info = dict(progress_dict[chunk_id])
-                    worker_info['current'] = i + 1
-                    progress_dict[chunk_id] = worker_info
-                continue
+        Returns:
+            list: Follow-up (func, args) tasks, one per patent group of a failed multi-group batch
+        """
+        func, (batch, batch_id) = self.submitted.pop(result['task_id'])
+        if not result['error']:
+            for group_key, file_list, error in result['result'].get('failed_groups', []):
+                self.quarantine(group_key, file_list, 'error', error)
+            if self.journal is not None:
+                self.journal.record_parsed(get_patent_groups(batch).keys(), result['result']['temp_files'])
+            return []
+        
+        patent_groups = list(get_patent_groups(batch, self.family_index).items())
+        if len(patent_groups) > 1:
+            self.resubmitted_batches += 1
+            logger.warning(f"Batch {batch_id} failed ({result['error']}); retrying its {len(patent_groups)} patent groups one by one")
+            return [(func, (file_list, f"{batch_id}_g{index}")) for index, (_, file_list) in enumerate(patent_groups)]
+        
+        group_key, file_list = patent_groups[0]
+        self.quarantine(group_key, file_list, result['failure'], result['error'])
+        return []
     
-    finally:
-        # Mark as completed
-        with progress_lock:
-            worker_info = dict(progress_dict[chunk_id])
-            worker_info['current'] = total_batches
-            progress_dict[chunk_id] = worker_info
+    def quarantine(self, group_key, file_list, reason, error):
+        """
+        Append the files of a patent group to the quarantine file
         
-        # Clean up worker resources
-        gc.collect()
+        Args:
+            group_key (str): Group key of the patent group (family key with family fusion)
+            file_list (list): File paths of the group
+            reason (str): 'crash', 'timeout' or 'error'
+            error (str): Error message
+        """
+        self.quarantined_groups += 1
+        logger.error(f"Quarantined patent group {group_key} ({reason}): {error}")
+        if self.journal is not None:
+            # A quarantined family quarantines all of its patent groups
+            self.journal.record_quarantined(list(get_patent_groups(file_list)))
+        
+        write_header = not os.path.exists(self.quarantine_path)
+        timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
+        with open(self.quarantine_path, 'a', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            if write_header:
+                writer.writerow(QUARANTINE_COLUMNS)
+            for file_path in file_list:
+                writer.writerow([timestamp, get_group_key(file_path), reason, error, file_path])
     
-    return results_files
+    def log_summary(self):
+        """Log the number of retried batches and quarantined groups"""
+        if self.resubmitted_batches:
+            logger.info(f"Retried {self.resubmitted_batches} failed batches group by group")
+        if self.quarantined_groups:
+            logger.warning(f"Quarantined {self.quarantined_groups} patent groups - see {self.quarantine_path}")
 
 def save_virtual_patents_to_temp_file(virtual_patents, temp_file_path):
     """
@@ -124,172 +208,120 @@ def save_virtual_patents_to_temp_file(virtual_patents, temp_file_path):
         
         # Write to file
         tree = etree.ElementTree(root)
-        tree.write(temp_file_path, encoding="utf-8", xml_declaration=True, pretty_print=True)
+        with atomic_output_path(temp_file_path) as temp_path:
+            tree.write(temp_path, encoding="utf-8", xml_declaration=True, pretty_print=True)
         
     except Exception as e:
         logger.error(f"Error saving virtual patents to temp file {temp_file_path}: {e}")
         raise
 
-def parallel_batch_processor(all_file_paths, folder_order, config):
+def parallel_batch_processor(all_file_paths, folder_order, config, pool=None, journal=None, family_index=None):
     """
-    Process file batches in parallel using multiprocessing
+    Process file batches in parallel using a memory-governed worker pool
+    
+    Batches are dispatched one at a time to idle workers. When aggregate memory usage
+    nears memory_limit the governor pauses dispatching and remaining batches are split
+    into smaller ones; workers above worker_memory_limit are restarted after their task.
     
     Args:
         all_file_paths (list): List of all file paths to process
         folder_order (dict): Dictionary mapping folder names to order indices
         config (dict): Configuration dictionary
+        pool (WorkerPool, optional): Shared worker pool (a temporary pool is created if None)
+        journal (RunJournal, optional): Run journal receiving every parsed batch
+        family_index (FamilyIndex, optional): Family index of the files (built here if family fusion
+            is configured and none is given)
         
     Returns:
         list: List of temporary file paths containing results
+        
+    Raises:
+        Exception: If parallel processing fails (parsed batches keep their temp files)
     """
     batch_size = config['batch_size']
     cpu_count = config['cpu_count']
     
-    # Create batches
-    batches = get_file_batches(all_file_paths, batch_size)
+    if family_index is None and config.get('fusion_level') == 'family':
+        family_index = build_family_index(all_file_paths, config, pool, persist=False)
     
-    # Calculate chunk size for parallel processing
-    chunk_size = max(1, len(batches) // cpu_count)
+    # Create batches
+    batches = get_file_batches(all_file_paths, batch_size, family_index)
     
-    # Create chunks for parallel processing
-    chunks = []
-    for i in range(0, len(batches), chunk_size):
-        chunks.append((i, min(i + chunk_size, len(batches))))
+    if config.get('archive_origin_path'):
+        # Interleave archives so independent archives are decompressed by different workers
+        batches = interleave_archive_batches(batches)
     
-    # If we have fewer chunks than CPU cores, adjust the CPU count
-    effective_cpu_count = min(cpu_count, len(chunks))
+    # If we have fewer batches than CPU cores, adjust the CPU count
+    effective_cpu_count = max(1, min(cpu_count, len(batches)))
     
-    logger.info(f"Processing {len(batches)} batches in {len(chunks)} chunks using {effective_cpu_count} processes")
+    logger.info(f"Processing {len(batches)} batches using {effective_cpu_count} processes")
     
-    # Process chunks in parallel with individual progress bars
+    # Process batches in parallel with individual progress bars
     all_temp_files = []
+    governor = create_memory_governor(config)
+    faults = BatchFaultHandler(config, journal, family_index)
     
     try:
-        # Create shared progress dictionary with proper locking
-        with multiprocessing.Manager() as manager:
-            progress_dict = manager.dict()
-            progress_lock = manager.Lock()
+        with use_pool(pool, lambda: create_worker_pool(config)) as pool:
+            pool.set_context(folder_order=folder_order, config=config)
+            # The shared pool is used by several phases; report only this phase's restarts
+            recycled_before = pool.recycled_workers
             
-            with multiprocessing.Pool(processes=effective_cpu_count) as pool:
-                # Create arguments for each chunk
-                chunk_args = []
-                for chunk_id, (chunk_start, chunk_end) in enumerate(chunks):
-                    args = (batches, folder_order, chunk_id, chunk_start, chunk_end, config, progress_dict, progress_lock)
-                    chunk_args.append(args)
-                
-                # Add some spacing for the progress bars
-                print(f"\nStarting parallel processing with {len(chunks)} workers:")
-                print("=" * 60)
-                
-                # Create progress bars for each worker (start with total=1, will be updated)
-                progress_bars = {}
-                for chunk_id in range(len(chunks)):
-                    progress_bars[chunk_id] = tqdm.tqdm(total=1, desc=f"Worker {chunk_id}", 
-                                                       position=chunk_id, leave=True, 
-                                                       dynamic_ncols=True)
-                
-                # Overall progress bar
-                overall_pbar = tqdm.tqdm(total=len(batches), desc="Overall Progress", 
-                                       position=len(chunks), leave=True, dynamic_ncols=True)
-                
-                
-                # Start all workers
-                results = []
-                for args in chunk_args:
-                    result = pool.apply_async(chunk_processor_with_progress, (args,))
-                    results.append(result)
-                
-                # Monitor progress in a separate thread
-                def monitor_progress():
-                    last_totals = {}
-                    loop_count = 0
-                    
-                    while any(not r.ready() for r in results):
-                        overall_total = 0
-                        loop_count += 1
-                        
-                        try:
-                            # Create a copy of the dictionary to avoid concurrent access issues
-                            with progress_lock:
-                                progress_data = dict(progress_dict)
-                            
-                            for chunk_id in range(len(chunks)):
-                                if chunk_id in progress_data:
-                                    worker_info = progress_data[chunk_id]
-                                    current = worker_info['current']
-                                    total = worker_info['total']
-                                    memory = worker_info.get('memory', 0.0)
-                                    
-                                    # Update individual worker progress bar
-                                    if chunk_id not in last_totals:
-                                        progress_bars[chunk_id].total = total
-                                        last_totals[chunk_id] = 0
-                                    
-                                    if current > last_totals[chunk_id]:
-                                        diff = current - last_totals[chunk_id]
-                                        progress_bars[chunk_id].update(diff)
-                                        last_totals[chunk_id] = current
-                                    
-                                    # Update postfix with memory info
-                                    if memory > 0:
-                                        progress_bars[chunk_id].set_postfix({"Memory": f"{memory:.1f}GB"})
-                                    
-                                    overall_total += current
-                            
-                            # Update overall progress
-                            if overall_total > overall_pbar.n:
-                                overall_pbar.update(overall_total - overall_pbar.n)
-                                
-                        except Exception as e:
-                            logger.error(f"Error in progress monitoring: {e}")
-                        
-                        time.sleep(0.05)  # Much faster polling
-                
-                # Start monitoring thread AFTER results are defined
-                monitor_thread = threading.Thread(target=monitor_progress)
-                monitor_thread.daemon = True
-                monitor_thread.start()
-                
-                # Give the monitoring thread a moment to start
-                time.sleep(0.1)
-                
-                # Wait for all results
-                for result in results:
-                    try:
-                        temp_files = result.get(timeout=86400)  # 24 hour timeout
-                        all_temp_files.extend(temp_files)
-                    except Exception as e:
-                        logger.error(f"Error getting result from worker: {e}")
-                
-                # Wait for monitoring thread to finish
-                monitor_thread.join(timeout=1)
-                
-                # Close all progress bars
-                for pbar in progress_bars.values():
-                    pbar.close()
-                overall_pbar.close()
-                
-                # Clear references to manager objects to prevent leaks
-                progress_dict.clear()
-                del progress_dict
+            # Per-worker progress bars, or periodic progress log lines when headless
+            progress = create_progress(config, 'parse', 'parallel processing', len(all_file_paths), 'file',
+                                       effective_cpu_count, pool)
+            
+            tasks = [(process_batch_task, (batch, f"{faults.batch_prefix}{batch_id}")) for batch_id, batch in enumerate(batches)]
+            task_sizes = {}
+            
+            def on_result(result):
+                worker_id = result['worker_id']
+                if not result['error'] and result['result']:
+                    all_temp_files.extend(result['result']['temp_files'])
                 
-                # Add spacing after progress bars
-                print("=" * 60 + "\n")
+                # Failed batches are retried group by group (the handler logs the error)
+                retry_tasks = faults.handle_result(result)
+                files_done = task_sizes.pop(result['task_id'], 0)
+                # Files of retried groups are counted when their retry finishes
+                patents = result['result']['patents'] if not result['error'] and result['result'] else 0
+                progress.record(result, 0 if retry_tasks else files_done, patents)
+                progress.set_worker_info(worker_id, {"Memory": f"{result['rss'] / 1024**3:.1f}GB"})
+                if governor.batch_scale < 1.0:
+                    progress.set_info({"Batch scale": f"{governor.batch_scale:.3f}"})
+                return retry_tasks
+            
+            def on_submit(task_id, func, args):
+                # Track the number of files of every dispatched task for progress reporting
+                task_sizes[task_id] = len(args[0])
+                faults.on_submit(task_id, func, args)
+            
+            def split_task(task, batch_scale):
+                return split_batch_task(task, batch_scale, family_index)
+            
+            pool.run(tasks, on_result, governor=governor, split_task=split_task, on_submit=on_submit,
+                     on_poll=progress.poll, max_workers=effective_cpu_count, task_timeout=faults.task_timeout)
+            progress.close()
+            
+            recycled_workers = pool.recycled_workers - recycled_before
+            if recycled_workers:
+                logger.info(f"Recycled {recycled_workers} workers that exceeded the {config['worker_memory_limit']:.2f}GB per-process ceiling")
     
     except Exception as e:
+        # The batches parsed so far are journaled, so --resume continues from them
         logger.error(f"Error during parallel processing: {e}")
-        # Force cleanup of any remaining resources
-        gc.collect()
+        raise
     
-    # Parallel processing complete - detailed logging handled by process_files_parallel
+    finally:
+        governor.log_summary()
+        faults.log_summary()
     
-    # Final cleanup to prevent semaphore leaks
-    gc.collect()
+    # Keep temp files in batch order for deterministic downstream processing
+    all_temp_files.sort()
     
     return all_temp_files
 
 
-def process_files_parallel(file_paths, folder_order, config):
+def process_files_parallel(file_paths, folder_order, config, pool=None, journal=None, family_index=None):
     """
     High-level function to process files in parallel
     
@@ -297,6 +329,9 @@ def process_files_parallel(file_paths, folder_order, config):
         file_paths (list): List of file paths to process
         folder_order (dict): Dictionary mapping folder names to order indices
         config (dict): Configuration dictionary
+        pool (WorkerPool, optional): Shared worker pool (a temporary pool is created if None)
+        journal (RunJournal, optional): Run journal receiving every parsed batch
+        family_index (FamilyIndex, optional): Family index of the files (family fusion)
         
     Returns:
         list: List of temporary file paths containing virtual patents
@@ -309,7 +344,7 @@ def process_files_parallel(file_paths, folder_order, config):
     logger.info(f"Starting parallel processing of {len(file_paths)} files")
     
     # Process files in parallel
-    temp_files = parallel_batch_processor(file_paths, folder_order, config)
+    temp_files = parallel_batch_processor(file_paths, folder_order, config, pool, journal, family_index)
     
     # Log completion
     end_time = time.time()
@@ -335,8 +370,8 @@ def validate_parallel_config(config):
             logger.error("CPU count must be greater than 0")
             return False
         
-        if config['cpu_count'] > multiprocessing.cpu_count():
-            logger.warning(f"Requested CPU count {config['cpu_count']} exceeds available {multiprocessing.cpu_count()}")
+        if config['cpu_count'] > get_effective_cpu_count():
+            logger.warning(f"Requested CPU count {config['cpu_count']} exceeds available {get_effective_cpu_count()}")
         
         # Check batch size
         if config['batch_size'] <= 0:
@@ -0,0 +1,148 @@
+# Licensed under the MIT License. See LICENSE-CODE in the repository root for details.
+# Copyright (c) 2025 Christos Papadopoulos
+
+"""
+Patent Lists for PatentFusion
+
+Include and exclude lists restrict a run to, or keep out of it, the patents of the
+ground truths (e.g. the CLTS classification test sets, the SMTS summarization test
+sets or a TopicSet), so test patents never leak into a training vertical. The lists
+are read straight from the ground-truth CSV files: the patent is taken from their
+ucid or xml_file_name column (e.g. EP-1628142-B1), or from the first column of a
+file without a header. Every kind of a listed patent is matched, since virtual
+patents are fused from all kinds of a patent group.
+
+The patent groups are kept in a PatentKeySet, a sorted array of 64-bit hashes
+(8 bytes per patent group), and the groups are dropped from the discovered files
+before batching, so their files are never opened.
+"""
+
+import os
+import re
+import csv
+import glob
+import hashlib
+import logging
+from array import array
+from bisect import bisect_left
+from constants import PATENT_LIST_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+# Ground-truth label columns can be long
+csv.field_size_limit(16 * 1024 * 1024)
+
+# A patent entry: office and number, optionally followed by the kind code and a file extension
+_PATENT_ENTRY_PATTERN = re.compile(r'^([A-Za-z]{2})-([A-Za-z0-9]+)(?:-[A-Za-z0-9]+)?(?:\.xml)?$')
+
+
+def get_list_group_key(entry):
+    """
+    Get the group key of a patent list entry (ucid, XML file name or group key)
+
+    Args:
+        entry (str): List entry, e.g. 'EP-1628142-B1', 'EP-1628142-B1.xml' or 'EP-1628142'
+
+    Returns:
+        str: Group key 'OFFICE-NUMBER', or None if the entry is not a patent
+    """
+    match = _PATENT_ENTRY_PATTERN.match(os.path.basename(entry.strip()))
+    if match is None:
+        return None
+    return f"{match.group(1).upper()}-{match.group(2)}"
+
+
+def _hash_group_key(group_key):
+    """Hash a group key to a 64-bit integer"""
+    return int.from_bytes(hashlib.blake2b(group_key.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class PatentKeySet:
+    """
+    Compact, read-only set of patent group keys
+
+    Stores a sorted array of 64-bit hashes and looks keys up by binary search. With
+    64-bit hashes a false match is negligible even for millions of listed patents.
+    """
+
+    def __init__(self, group_keys):
+        """
+        Build the set
+
+        Args:
+            group_keys (iterable): Group keys ('OFFICE-NUMBER')
+        """
+        self._hashes = array('Q', sorted({_hash_group_key(group_key) for group_key in group_keys}))
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def __contains__(self, group_key):
+        key_hash = _hash_group_key(group_key)
+        index = bisect_left(self._hashes, key_hash)
+        return index < len(self._hashes) and self._hashes[index] == key_hash
+
+
+def read_patent_list(file_path):
+    """
+    Read the group keys of a patent list file
+
+    Args:
+        file_path (str): CSV file with a ucid or xml_file_name column, or a file with one patent per line
+
+    Returns:
+        list: Group keys of the listed patents
+
+    Raises:
+        ValueError: If the file has no patent column
+    """
+    with open(file_path, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return []
+
+        columns = [name.strip().lower() for name in header]
+        column = next((columns.index(name) for name in PATENT_LIST_COLUMNS if name in columns), None)
+        group_keys = []
+        if column is None:
+            # Without a known column the file must list one patent per line
+            if not header or get_list_group_key(header[0]) is None:
+                raise ValueError(f"No patent column ({', '.join(PATENT_LIST_COLUMNS)}) in patent list {file_path}")
+            column = 0
+            group_keys.append(get_list_group_key(header[0]))
+
+        for row in reader:
+            if len(row) > column:
+                group_key = get_list_group_key(row[column])
+                if group_key is not None:
+                    group_keys.append(group_key)
+    return group_keys
+
+
+def load_patent_lists(patterns):
+    """
+    Load patent list files into one PatentKeySet
+
+    Args:
+        patterns (list): File paths or glob patterns (e.g. /ground-truths/CLTSep_PatDocs_cpc_*.csv)
+
+    Returns:
+        PatentKeySet: Group keys of all listed patents, or None if no patterns are given
+
+    Raises:
+        ValueError: If a pattern matches no file, or a file has no patent column
+    """
+    if not patterns:
+        return None
+
+    group_keys = []
+    for pattern in patterns:
+        file_paths = sorted(glob.glob(pattern))
+        if not file_paths:
+            raise ValueError(f"No patent list file matches {pattern}")
+        for file_path in file_paths:
+            file_group_keys = read_patent_list(file_path)
+            logger.info(f"Patent list {file_path}: {len(file_group_keys)} patents")
+            group_keys.extend(file_group_keys)
+    return PatentKeySet(group_keys)
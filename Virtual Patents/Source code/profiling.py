@@ -0,0 +1,219 @@
+# Licensed under the MIT License. See LICENSE-CODE in the repository root for details.
+# Copyright (c) 2025 Christos Papadopoulos
+
+"""
+Profiling Mode for PatentFusion
+
+The work of a run happens inside the pool workers, out of reach of a profiler started
+around PatentFusion.py. With --profile every worker profiles the tasks it runs with
+cProfile and, with --profile-memory N, takes a tracemalloc snapshot after every N patent
+groups fused or saved, remembering the largest live size seen per allocation site.
+After each task the worker dumps its statistics to the profile folder in the destination
+folder:
+
+    profile/worker-<slot>-<pid>-<thread>.prof          cProfile statistics of a worker
+    profile/worker-<slot>-<pid>-<thread>.alloc.json    allocation sites of a worker
+
+so workers that are recycled or restarted keep what they measured. At the end of the run
+the driver merges them into profile.pstats (for pstats, snakeviz, ...), a text report of
+the hottest functions (profile_report.txt) and a top-allocations report (allocations.txt).
+"""
+
+import os
+import json
+import glob
+import pstats
+import logging
+import cProfile
+import threading
+import tracemalloc
+from constants import PROFILE_REPORT_FUNCTIONS, PROFILE_TOP_ALLOCATIONS
+from utils import atomic_output_path
+
+logger = logging.getLogger(__name__)
+
+# Profiler of the current worker (thread-local, so thread backend workers keep their own)
+_worker_local = threading.local()
+
+# Allocation sites left out of the reports: the profiling itself and module imports
+_IGNORED_ALLOCATION_FILES = {tracemalloc.__file__, cProfile.__file__, pstats.__file__, __file__,
+                             '<frozen importlib._bootstrap>', '<frozen importlib._bootstrap_external>', '<unknown>'}
+
+
+class WorkerProfiler:
+    """
+    cProfile and tracemalloc statistics of one worker, dumped to the profile folder after every task
+    """
+
+    def __init__(self, profile_dir, worker_id, memory_interval=0):
+        """
+        Initialize the profiler
+
+        Args:
+            profile_dir (str): Folder receiving the worker's statistics
+            worker_id (int): Worker slot
+            memory_interval (int): Patent groups between allocation snapshots (0 = no tracemalloc)
+        """
+        name = f"worker-{worker_id}-{os.getpid()}-{threading.get_ident()}"
+        os.makedirs(profile_dir, exist_ok=True)
+        self.stats_path = os.path.join(profile_dir, f"{name}.prof")
+        self.allocations_path = os.path.join(profile_dir, f"{name}.alloc.json")
+        self.memory_interval = memory_interval
+        self.profiler = cProfile.Profile()
+        self.enabled = True
+        self.groups = 0
+        self.snapshots = 0
+        self.allocations = {}
+        if memory_interval and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def start_task(self):
+        """Start profiling a task"""
+        if not self.enabled:
+            return
+        try:
+            self.profiler.enable()
+        except ValueError as e:
+            # Python 3.12+ allows one active profiler per process (thread backend)
+            logger.warning(f"Profiling disabled in this worker: {e}")
+            self.enabled = False
+
+    def finish_task(self):
+        """Stop profiling a task and dump the statistics collected so far"""
+        if not self.enabled:
+            return
+        self.profiler.disable()
+        # Atomic, so a worker killed while dumping leaves its previous statistics intact
+        with atomic_output_path(self.stats_path) as temp_path:
+            self.profiler.dump_stats(temp_path)
+        if self.snapshots:
+            with atomic_output_path(self.allocations_path) as temp_path, open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'snapshots': self.snapshots, 'peak_traced_bytes': tracemalloc.get_traced_memory()[1],
+                           'allocations': self.allocations}, f)
+
+    def count_group(self):
+        """Count a patent group and take an allocation snapshot every memory_interval groups"""
+        self.groups += 1
+        if self.memory_interval and self.groups % self.memory_interval == 0:
+            self.take_snapshot()
+
+    def take_snapshot(self):
+        """Remember the largest live size (and its number of blocks) seen per allocation site"""
+        # The snapshot is not part of the profiled work
+        if self.enabled:
+            self.profiler.disable()
+        statistics = tracemalloc.take_snapshot().statistics('lineno')
+        kept = 0
+        for statistic in statistics:
+            frame = statistic.traceback[0]
+            if frame.filename in _IGNORED_ALLOCATION_FILES:
+                continue
+            site = f"{frame.filename}:{frame.lineno}"
+            if statistic.size > self.allocations.get(site, (0, 0))[0]:
+                self.allocations[site] = (statistic.size, statistic.count)
+            kept += 1
+            if kept == PROFILE_TOP_ALLOCATIONS * 4:
+                break
+        self.snapshots += 1
+        if self.enabled:
+            self.profiler.enable()
+
+
+def get_worker_profiler(config, worker_id=0):
+    """
+    Get the profiler of the current worker, creating it on first use
+
+    Args:
+        config (dict): Configuration dictionary (profile_dir set by --profile), or None
+        worker_id (int): Worker slot
+
+    Returns:
+        WorkerProfiler: Profiler of this worker, or None if profiling is off
+    """
+    profiler = getattr(_worker_local, 'profiler', None)
+    if profiler is None and config and config.get('profile_dir'):
+        profiler = WorkerProfiler(config['profile_dir'], worker_id, config.get('profile_memory_interval', 0))
+        _worker_local.profiler = profiler
+    return profiler
+
+
+def count_profiled_group():
+    """Count a patent group fused or saved by the current worker (drives the allocation snapshots)"""
+    profiler = getattr(_worker_local, 'profiler', None)
+    if profiler is not None:
+        profiler.count_group()
+
+
+def prepare_profile_dir(profile_dir):
+    """
+    Create the profile folder and remove the statistics of an earlier run
+
+    Args:
+        profile_dir (str): Profile folder
+    """
+    os.makedirs(profile_dir, exist_ok=True)
+    for pattern in ('worker-*.prof', 'worker-*.alloc.json'):
+        for path in glob.glob(os.path.join(profile_dir, pattern)):
+            os.remove(path)
+
+
+def _write_allocations_report(allocation_files, report_path):
+    """Merge the allocation sites of all workers into a text report, largest first"""
+    sites = {}
+    snapshots = 0
+    peaks = []
+    for path in allocation_files:
+        with open(path, 'r', encoding='utf-8') as f:
+            worker = json.load(f)
+        snapshots += worker['snapshots']
+        peaks.append(worker['peak_traced_bytes'])
+        for site, (size, count) in worker['allocations'].items():
+            entry = sites.setdefault(site, [0, 0, 0])
+            entry[0] = max(entry[0], size)
+            entry[1] = max(entry[1], count)
+            entry[2] += 1
+
+    lines = [f"Top allocation sites: largest live size at a snapshot ({snapshots} snapshots of {len(peaks)} workers, "
+             f"peak traced memory per worker {max(peaks) / 1024**2:.1f} MiB)", "",
+             f"{'KiB':>12} {'blocks':>10} {'workers':>8}  site"]
+    for site, (size, count, workers) in sorted(sites.items(), key=lambda item: -item[1][0])[:PROFILE_TOP_ALLOCATIONS]:
+        lines.append(f"{size / 1024:12.1f} {count:10d} {workers:8d}  {site}")
+    with atomic_output_path(report_path) as temp_path, open(temp_path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def write_profile_report(profile_dir):
+    """
+    Merge the statistics of all workers into profile.pstats, profile_report.txt and allocations.txt
+
+    Args:
+        profile_dir (str): Profile folder
+
+    Returns:
+        bool: True if any worker statistics were found
+    """
+    stats_files = sorted(glob.glob(os.path.join(profile_dir, 'worker-*.prof')))
+    if not stats_files:
+        logger.warning(f"No worker profiles found in {profile_dir}")
+        return False
+
+    stats = pstats.Stats(*stats_files)
+    pstats_path = os.path.join(profile_dir, 'profile.pstats')
+    with atomic_output_path(pstats_path) as temp_path:
+        stats.dump_stats(temp_path)
+
+    report_path = os.path.join(profile_dir, 'profile_report.txt')
+    with atomic_output_path(report_path) as temp_path, open(temp_path, 'w', encoding='utf-8') as f:
+        stats.stream = f
+        f.write(f"Merged profile of {len(stats_files)} workers\n\n")
+        for sort_key in ('tottime', 'cumulative'):
+            f.write(f"=== Top {PROFILE_REPORT_FUNCTIONS} functions by {sort_key} ===\n")
+            stats.sort_stats(sort_key).print_stats(PROFILE_REPORT_FUNCTIONS)
+
+    allocation_files = sorted(glob.glob(os.path.join(profile_dir, 'worker-*.alloc.json')))
+    if allocation_files:
+        _write_allocations_report(allocation_files, os.path.join(profile_dir, 'allocations.txt'))
+
+    logger.info(f"Profile of {len(stats_files)} workers: {pstats_path} (report: {report_path}"
+                + (f", allocations: {os.path.join(profile_dir, 'allocations.txt')})" if allocation_files else ")"))
+    return True
@@ -0,0 +1,435 @@
+# Licensed under the MIT License. See LICENSE-CODE in the repository root for details.
+# Copyright (c) 2025 Christos Papadopoulos
+
+"""
+Progress Reporting for PatentFusion
+
+The parsing phase (parallel_batch_processor), the output phase
+(chunked_memory_efficient_processing) and the coordinator of a coordinated run
+(serve_work_units) report their progress through a phase progress object, selected
+with progress_mode in config.ini:
+
+    bars    one tqdm bar per worker plus an overall bar (interactive terminals)
+    log     headless: every progress_log_interval seconds one structured log line, e.g.
+            progress phase=parse unit=file done=1200 total=8000 rate=41.3 patents=11800
+            patents_per_s=406.9 mb_in_per_s=12.10 mb_out_per_s=0.00 queue=129 busy=8 workers=8
+            rss_gb=3.41 eta_s=165
+    auto    bars when stderr is a terminal, log otherwise (batch servers, redirected output)
+
+Both also update the live status of the run. With metrics_port set, a local HTTP endpoint
+serves it while the run is going: /metrics in the Prometheus text format and /status as
+JSON (files/s, patents/s, bytes/s, per-worker RSS, queue depth, ETA).
+"""
+
+import sys
+import json
+import time
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import tqdm
+from utils import format_duration
+
+logger = logging.getLogger(__name__)
+
+# Counters of the stage metrics (see stage_metrics.py) summed up by the live status
+LIVE_COUNTERS = ['files_read', 'patents_fused', 'patents_saved', 'bytes_in', 'bytes_out']
+
+
+class LiveStatus:
+    """
+    Counters of the running phase, shared by the driver (writer) and the metrics endpoint (reader)
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.run_start = time.time()
+        self.phase = None
+        self.unit = None
+        self.phase_start = self.run_start
+        self.total = 0
+        self.done = 0
+        self.patents = 0
+        self.counters = dict.fromkeys(LIVE_COUNTERS, 0)
+        self.phase_counters = dict(self.counters)
+        self.pool = None
+        self.queue_depth = 0
+        self.busy_workers = 0
+
+    def start_phase(self, phase, total, unit, pool):
+        """
+        Start counting a phase
+
+        Args:
+            phase (str): Phase name ('parse', 'save' or 'coordinate')
+            total (int): Units of work of the phase
+            unit (str): Unit of work ('file', 'temp file' or 'work unit')
+            pool (WorkerPool): Pool running the phase (for worker RSS and queue depth), or None
+        """
+        with self.lock:
+            self.phase = phase
+            self.unit = unit
+            self.phase_start = time.time()
+            self.total = total
+            self.done = 0
+            self.patents = 0
+            self.phase_counters = dict(self.counters)
+            self.pool = pool
+            self.queue_depth = 0
+            self.busy_workers = 0
+
+    def set_queue(self, queue_depth, busy_workers):
+        """
+        Set the queue depth and busy workers of a phase without a pool (e.g. work units and leases)
+
+        Args:
+            queue_depth (int): Units of work waiting for a worker
+            busy_workers (int): Workers running a unit of work
+        """
+        with self.lock:
+            self.queue_depth = queue_depth
+            self.busy_workers = busy_workers
+
+    def record(self, result, units, patents=0):
+        """
+        Count a finished task of the phase
+
+        Args:
+            result (dict): Result dictionary of the worker pool (its stage metrics are counted)
+            units (int): Units of work completed by the task
+            patents (int): Virtual patents created or saved by the task
+        """
+        metrics = result.get('metrics') or {}
+        with self.lock:
+            self.done += units
+            self.patents += patents
+            for counter, value in metrics.get('counters', {}).items():
+                if counter in self.counters:
+                    self.counters[counter] += value
+
+    def snapshot(self):
+        """
+        Get the live status
+
+        Returns:
+            dict: Phase, progress, rates (per second since the phase started), queue depth,
+                busy workers, per-worker RSS and ETA
+        """
+        with self.lock:
+            now = time.time()
+            elapsed = max(now - self.phase_start, 1e-9)
+            rate = self.done / elapsed
+            phase_delta = {counter: self.counters[counter] - self.phase_counters[counter] for counter in LIVE_COUNTERS}
+            pool = self.pool
+            queue_depth, busy_workers = self.queue_depth, self.busy_workers
+            status = {
+                'phase': self.phase,
+                'unit': self.unit,
+                'done': self.done,
+                'total': self.total,
+                'patents': self.patents,
+                'run_seconds': round(now - self.run_start, 1),
+                'phase_seconds': round(elapsed, 1),
+                'units_per_second': round(rate, 3),
+                'files_per_second': round(phase_delta['files_read'] / elapsed, 3),
+                'patents_per_second': round(self.patents / elapsed, 3),
+                'bytes_in_per_second': round(phase_delta['bytes_in'] / elapsed, 1),
+                'bytes_out_per_second': round(phase_delta['bytes_out'] / elapsed, 1),
+                'eta_seconds': round((self.total - self.done) / rate, 1) if rate > 0 and self.total > self.done else None,
+                'counters': dict(self.counters)
+            }
+        status['queue_depth'] = pool.queue_depth if pool is not None else queue_depth
+        status['busy_workers'] = len(pool.busy) if pool is not None else busy_workers
+        status['worker_rss_bytes'] = {str(worker_id): rss for worker_id, rss in dict(pool.worker_rss).items()} if pool is not None else {}
+        return status
+
+
+# Live status of the run in this process (read by the metrics endpoint)
+_live_status = LiveStatus()
+
+
+def get_live_status():
+    """
+    Get the live status of the run in this process
+
+    Returns:
+        LiveStatus: Shared live status
+    """
+    return _live_status
+
+
+class PhaseProgress:
+    """
+    Progress of a phase: counts finished tasks in the live status and shows them
+    """
+
+    def record(self, result, units, patents=0):
+        """
+        Count a finished task
+
+        Args:
+            result (dict): Result dictionary of the worker pool
+            units (int): Units of work completed by the task
+            patents (int): Virtual patents created or saved by the task
+        """
+        get_live_status().record(result, units, patents)
+        self.advance(result['worker_id'], units)
+
+    def update(self, units):
+        """
+        Count units completed outside the pool (e.g. work units acknowledged by worker nodes)
+
+        Args:
+            units (int): Units of work completed
+        """
+        get_live_status().record({}, units)
+        self.advance(None, units)
+
+    def advance(self, worker_id, units):
+        """Show completed units of a worker (None for units without a pool worker)"""
+
+    def set_workers(self, workers):
+        """Show the number of workers of a phase whose workers come and go (e.g. worker nodes)"""
+
+    def set_worker_info(self, worker_id, info):
+        """Show details (e.g. memory) of a worker"""
+
+    def set_info(self, info):
+        """Show details (e.g. total patents) of the phase"""
+
+    def poll(self):
+        """Called by the pool between results"""
+
+    def close(self):
+        """Finish showing the phase"""
+
+
+class BarProgress(PhaseProgress):
+    """
+    Phase progress shown as one tqdm bar per worker plus an overall bar
+    """
+
+    def __init__(self, title, total, unit, workers):
+        """
+        Create the progress bars
+
+        Args:
+            title (str): Phase title (e.g. 'parallel processing')
+            total (int): Units of work of the phase
+            unit (str): Unit of work
+            workers (int): Number of workers
+        """
+        print(f"\nStarting {title}" + (f" with {workers} workers:" if workers else ":"))
+        print("=" * 60)
+        self.worker_bars = {worker_id: tqdm.tqdm(desc=f"Worker {worker_id}", unit=unit, position=worker_id,
+                                                 leave=True, dynamic_ncols=True)
+                            for worker_id in range(workers)}
+        self.overall_bar = tqdm.tqdm(total=total, desc="Overall Progress", unit=unit, position=workers,
+                                     leave=True, dynamic_ncols=True)
+
+    def advance(self, worker_id, units):
+        """Show completed units of a worker"""
+        if worker_id in self.worker_bars:
+            self.worker_bars[worker_id].update(units)
+        self.overall_bar.update(units)
+
+    def set_worker_info(self, worker_id, info):
+        """Show details (e.g. memory) next to a worker's bar"""
+        self.worker_bars[worker_id].set_postfix(info)
+
+    def set_info(self, info):
+        """Show details (e.g. total patents) next to the overall bar"""
+        self.overall_bar.set_postfix(info)
+
+    def close(self):
+        """Close the bars"""
+        for bar in self.worker_bars.values():
+            bar.close()
+        self.overall_bar.close()
+        print("=" * 60)
+
+
+class LogProgress(PhaseProgress):
+    """
+    Headless phase progress: periodic structured log lines instead of bars
+    """
+
+    def __init__(self, title, total, unit, workers, interval):
+        """
+        Start logging the progress of a phase
+
+        Args:
+            title (str): Phase title (e.g. 'parallel processing')
+            total (int): Units of work of the phase
+            unit (str): Unit of work
+            workers (int): Number of workers
+            interval (float): Seconds between progress lines
+        """
+        self.workers = workers
+        self.interval = interval
+        self.last_log = time.time()
+        logger.info(f"Starting {title}" + (f" with {workers} workers" if workers else "") + f": {total} {unit}s")
+
+    def set_workers(self, workers):
+        """Count the workers of a phase whose workers come and go (e.g. worker nodes)"""
+        self.workers = workers
+
+    def poll(self):
+        """Log a progress line when the interval has passed"""
+        if time.time() - self.last_log >= self.interval:
+            self.log_line()
+
+    def log_line(self):
+        """Log the progress of the phase as one line of key=value pairs"""
+        self.last_log = time.time()
+        status = get_live_status().snapshot()
+        rss = sum(status['worker_rss_bytes'].values())
+        eta = status['eta_seconds']
+        logger.info(f"progress phase={status['phase']} unit={status['unit'].replace(' ', '_')} done={status['done']} "
+                    f"total={status['total']} rate={status['units_per_second']:.1f} patents={status['patents']} "
+                    f"patents_per_s={status['patents_per_second']:.1f} "
+                    f"mb_in_per_s={status['bytes_in_per_second'] / 1024**2:.2f} "
+                    f"mb_out_per_s={status['bytes_out_per_second'] / 1024**2:.2f} queue={status['queue_depth']} "
+                    f"busy={status['busy_workers']} workers={self.workers} rss_gb={rss / 1024**3:.2f} "
+                    f"eta_s={eta if eta is not None else 0:.0f}")
+
+    def close(self):
+        """Log the final line of the phase"""
+        self.log_line()
+        status = get_live_status().snapshot()
+        logger.info(f"Finished phase {status['phase']}: {status['done']} {status['unit']}s in "
+                    f"{format_duration(status['phase_seconds'])}")
+
+
+def use_log_progress(config):
+    """
+    Check whether progress is logged instead of shown as bars
+
+    Args:
+        config (dict): Configuration dictionary (progress_mode)
+
+    Returns:
+        bool: True for progress_mode 'log', or 'auto' without a terminal
+    """
+    mode = config.get('progress_mode', 'auto')
+    if mode == 'auto':
+        return not sys.stderr.isatty()
+    return mode == 'log'
+
+
+def create_progress(config, phase, title, total, unit, workers, pool):
+    """
+    Create the progress display of a phase and start its live status
+
+    Args:
+        config (dict): Configuration dictionary (progress_mode, progress_log_interval)
+        phase (str): Phase name in the live status ('parse', 'save' or 'coordinate')
+        title (str): Phase title (e.g. 'parallel processing')
+        total (int): Units of work of the phase
+        unit (str): Unit of work ('file', 'temp file' or 'work unit')
+        workers (int): Number of workers (0 if they are not known in advance)
+        pool (WorkerPool): Pool running the phase, or None
+
+    Returns:
+        PhaseProgress: BarProgress or LogProgress
+    """
+    get_live_status().start_phase(phase, total, unit, pool)
+    if use_log_progress(config):
+        return LogProgress(title, total, unit, workers, config.get('progress_log_interval', 30))
+    return BarProgress(title, total, unit, workers)
+
+
+def format_live_metrics(status):
+    """
+    Format the live status in the Prometheus text exposition format
+
+    Args:
+        status (dict): Live status as returned by LiveStatus.snapshot()
+
+    Returns:
+        str: Gauges of the running phase and counters of the run
+    """
+    phase = status['phase'] or 'none'
+    gauges = [
+        ('patentfusion_live_done', "Units of work completed in the current phase", status['done']),
+        ('patentfusion_live_total', "Units of work of the current phase", status['total']),
+        ('patentfusion_live_files_per_second', "Source files read per second in the current phase", status['files_per_second']),
+        ('patentfusion_live_units_per_second', "Units of work completed per second in the current phase", status['units_per_second']),
+        ('patentfusion_live_patents_per_second', "Virtual patents per second in the current phase", status['patents_per_second']),
+        ('patentfusion_live_bytes_in_per_second', "Bytes read per second in the current phase", status['bytes_in_per_second']),
+        ('patentfusion_live_bytes_out_per_second', "Bytes written per second in the current phase", status['bytes_out_per_second']),
+        ('patentfusion_live_queue_depth', "Tasks waiting for a worker", status['queue_depth']),
+        ('patentfusion_live_busy_workers', "Workers running a task", status['busy_workers']),
+        ('patentfusion_live_eta_seconds', "Estimated seconds until the current phase is done", status['eta_seconds'] or 0)
+    ]
+    lines = []
+    for name, help_text, value in gauges:
+        lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f'{name}{{phase="{phase}"}} {value}'])
+    lines.extend(["# HELP patentfusion_live_worker_rss_bytes Resident memory of each worker",
+                  "# TYPE patentfusion_live_worker_rss_bytes gauge"])
+    lines.extend(f'patentfusion_live_worker_rss_bytes{{worker="{worker_id}"}} {rss}'
+                 for worker_id, rss in sorted(status['worker_rss_bytes'].items()))
+    for counter, value in sorted(status['counters'].items()):
+        name = f"patentfusion_live_{counter}_total"
+        lines.extend([f"# HELP {name} Total {counter.replace('_', ' ')} of the run", f"# TYPE {name} counter",
+                      f"{name} {value}"])
+    return '\n'.join(lines) + '\n'
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    """Serves /metrics (Prometheus text format) and /status (JSON)"""
+
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+        if path == '/metrics':
+            body = format_live_metrics(get_live_status().snapshot()).encode('utf-8')
+            content_type = 'text/plain; version=0.0.4; charset=utf-8'
+        elif path in ('/', '/status'):
+            body = json.dumps(get_live_status().snapshot(), indent=2).encode('utf-8')
+            content_type = 'application/json'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"Metrics endpoint: {format % args}")
+
+
+def start_metrics_server(port):
+    """
+    Serve the live status on localhost in a background thread
+
+    Args:
+        port (int): TCP port (0 disables the endpoint)
+
+    Returns:
+        ThreadingHTTPServer: Running server (stop it with stop_metrics_server), or None
+    """
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer(('127.0.0.1', port), _MetricsRequestHandler)
+    except OSError as e:
+        logger.warning(f"Live metrics endpoint not started on port {port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-endpoint', daemon=True).start()
+    logger.info(f"Live metrics at http://127.0.0.1:{port}/metrics (JSON: /status)")
+    return server
+
+
+def stop_metrics_server(server):
+    """
+    Stop the live metrics endpoint
+
+    Args:
+        server (ThreadingHTTPServer): Server returned by start_metrics_server, or None
+    """
+    if server is not None:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,256 @@
+# Licensed under the MIT License. See LICENSE-CODE in the repository root for details.
+# Copyright (c) 2025 Christos Papadopoulos
+
+"""
+Run Journal for PatentFusion
+
+This module records the progress of a run in an append-only journal (one JSON record
+per line) in the destination folder, so an interrupted run can be resumed with
+--resume instead of starting over from discovery:
+
+    start        - a run (or resumed run) began, with the configuration fingerprint
+    parsed       - a batch was parsed: its patent groups and the temp files holding them (a work unit
+                   done by a worker node is parsed and saved at once: no temp files, with its outputs)
+    saved        - the virtual patents of a temp file were written, with the output files per patent group
+    quarantined  - patent groups that failed on their own (see BatchFaultHandler)
+
+A patent group is complete once its batch is parsed and all temp files of that batch
+are saved. Output and temp files are written under a temporary name and renamed when
+complete (see atomic_output_path in utils.py), so a file that exists is never half written.
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+from constants import RUN_JOURNAL_NAME, OUTPUT_NEUTRAL_SETTINGS, PARTIAL_FILE_SUFFIX
+from file_system import cleanup_single_temp_file, get_group_key, get_shard_index, get_run_file_path
+
+logger = logging.getLogger(__name__)
+
+
+def get_config_fingerprint(config):
+    """
+    Hash the settings that affect the content of the outputs
+
+    Performance settings (batch size, workers, memory limits, ...) and the shard are
+    left out, so a run can be resumed with different performance settings and the
+    manifests of all shards can be merged.
+
+    Args:
+        config (dict): Configuration dictionary
+
+    Returns:
+        str: Hex digest of the output-relevant settings
+    """
+    relevant = {key: value for key, value in config.items() if key not in OUTPUT_NEUTRAL_SETTINGS}
+    encoded = json.dumps(relevant, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def remove_partial_outputs(directory, shard=None):
+    """
+    Delete files left under their temporary name by an interrupted write
+
+    Args:
+        directory (str): Directory to scan recursively
+        shard (tuple, optional): (shard_index, shard_count); only partial files of this
+            shard's patent groups are removed, since other shards may be writing side by side
+
+    Returns:
+        int: Number of partial files removed
+    """
+    removed = 0
+    for dir_path, _, file_names in os.walk(directory):
+        for file_name in file_names:
+            if not file_name.endswith(PARTIAL_FILE_SUFFIX):
+                continue
+            if shard and get_shard_index(get_group_key(file_name), shard[1]) != shard[0]:
+                continue
+            os.remove(os.path.join(dir_path, file_name))
+            removed += 1
+    return removed
+
+
+class RunJournal:
+    """
+    Append-only journal of completed work, used to resume interrupted runs
+    """
+
+    def __init__(self, config, resume=False):
+        """
+        Open the journal of the destination folder
+
+        Without resume the previous journal is discarded. With resume the previous
+        records are loaded; the configuration must match the journaled run.
+
+        Args:
+            config (dict): Configuration dictionary
+            resume (bool): Continue the run recorded in the existing journal
+
+        Raises:
+            ValueError: If resuming with output-relevant settings that differ from the journaled run
+        """
+        self.destination_path = config['destination_path']
+        self.path = get_run_file_path(config, RUN_JOURNAL_NAME)
+        self.temp_dir = config['temp_dir']
+        self.fingerprint = get_config_fingerprint(config)
+        self.parsed_batches = []
+        self.saved_temp_files = set()
+        self.saved_outputs = {}
+        self.quarantined_groups = set()
+        self.run_number = 1
+
+        if resume:
+            self._load()
+
+        # Temp files of resumed runs get a run prefix, so they never collide with kept ones
+        self.batch_prefix = f"r{self.run_number}_" if self.run_number > 1 else ""
+        self._file = open(self.path, 'a' if resume else 'w', encoding='utf-8')
+        self._write({'event': 'start', 'run': self.run_number, 'fingerprint': self.fingerprint,
+                     'time': time.strftime('%Y-%m-%d %H:%M:%S')})
+
+    def _load(self):
+        """Read the records of the previous run(s)"""
+        if not os.path.exists(self.path):
+            logger.warning(f"No run journal found at {self.path}; starting a new run")
+            return
+
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Ignore a truncated last line from an interrupted run
+                    continue
+                event = record.get('event')
+                if event == 'start':
+                    if record['fingerprint'] != self.fingerprint:
+                        raise ValueError("Output settings changed since the journaled run; "
+                                         "run without --resume to start over")
+                    self.run_number = record['run'] + 1
+                elif event == 'parsed':
+                    self.parsed_batches.append(record)
+                    self._add_outputs(record.get('outputs', {}))
+                elif event == 'saved':
+                    self.saved_temp_files.add(record['temp_file'])
+                    self._add_outputs(record.get('outputs', {}))
+                elif event == 'quarantined':
+                    self.quarantined_groups.update(record['groups'])
+
+    def _write(self, record):
+        """Append a record and force it to disk"""
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _relative_outputs(self, saved_outputs):
+        """Make output paths relative to the destination folder"""
+        return {group_key: [os.path.relpath(path, self.destination_path) for path in paths]
+                for group_key, paths in (saved_outputs or {}).items()}
+
+    def record_parsed(self, groups, temp_files, saved_outputs=None):
+        """
+        Record a parsed batch
+
+        Args:
+            groups (list): Group keys of the batch
+            temp_files (list): Temp file paths holding the batch's virtual patents
+            saved_outputs (dict, optional): group_key -> written file paths, for batches
+                that were already saved (work units of worker nodes)
+        """
+        record = {'event': 'parsed', 'groups': list(groups),
+                  'temp_files': [os.path.basename(path) for path in temp_files]}
+        if saved_outputs:
+            record['outputs'] = self._relative_outputs(saved_outputs)
+            self._add_outputs(record['outputs'])
+        self._write(record)
+        self.parsed_batches.append(record)
+
+    def _add_outputs(self, outputs):
+        """Collect the output files of saved patent groups"""
+        for group_key, paths in outputs.items():
+            self.saved_outputs.setdefault(group_key, []).extend(paths)
+
+    def record_saved(self, temp_file_path, saved_outputs=None):
+        """
+        Record that the virtual patents of a temp file were saved
+
+        Args:
+            temp_file_path (str): Temp file path
+            saved_outputs (dict, optional): group_key -> list of written file paths
+        """
+        # Output paths are kept relative to the destination folder
+        outputs = self._relative_outputs(saved_outputs)
+        self._add_outputs(outputs)
+        self._write({'event': 'saved', 'temp_file': os.path.basename(temp_file_path), 'outputs': outputs})
+        self.saved_temp_files.add(os.path.basename(temp_file_path))
+
+    def record_quarantined(self, groups):
+        """
+        Record patent groups that were quarantined (skipped when resuming)
+
+        Args:
+            groups (list): Group keys
+        """
+        self.quarantined_groups.update(groups)
+        self._write({'event': 'quarantined', 'groups': list(groups)})
+
+    def get_resume_state(self):
+        """
+        Work out what the previous run(s) completed
+
+        Groups of parsed batches whose unsaved temp files are all still present need no
+        re-parsing; those temp files only have to be saved. Other temp files (written
+        by a batch that was never journaled) are deleted, and their groups parsed again.
+
+        Returns:
+            tuple: (set of group keys to skip during parsing, list of temp file paths to save)
+        """
+        skip_groups = set(self.quarantined_groups)
+        pending_temp_files = []
+        resumed_batches = []
+        for record in self.parsed_batches:
+            unsaved = [name for name in record['temp_files'] if name not in self.saved_temp_files]
+            if all(os.path.exists(os.path.join(self.temp_dir, name)) for name in unsaved):
+                skip_groups.update(record['groups'])
+                pending_temp_files.extend(os.path.join(self.temp_dir, name) for name in unsaved)
+                resumed_batches.append(record)
+        # Batches whose temp files are gone are parsed again (and journaled anew)
+        self.parsed_batches = resumed_batches
+
+        if os.path.isdir(self.temp_dir):
+            keep = set(pending_temp_files)
+            for name in os.listdir(self.temp_dir):
+                path = os.path.join(self.temp_dir, name)
+                if name.startswith('temp_batch_') and path not in keep:
+                    cleanup_single_temp_file(path)
+
+        return skip_groups, sorted(pending_temp_files)
+
+    def get_completed_groups(self):
+        """
+        Get the patent groups whose virtual patents were parsed and saved
+
+        These are the groups of parsed batches whose temp files were all saved (work units
+        of worker nodes are saved when they are journaled). Groups of batches that were
+        never parsed, not saved yet or quarantined must not be recorded as up to date
+        (see RunManifest.save).
+
+        Returns:
+            set: Group keys
+        """
+        completed = set()
+        unsaved = set()
+        for record in self.parsed_batches:
+            if any(name not in self.saved_temp_files for name in record['temp_files']):
+                unsaved.update(record['groups'])
+            else:
+                completed.update(record['groups'])
+        return completed - unsaved - self.quarantined_groups
+
+    def close(self):
+        """Close the journal file"""
+        if not self._file.closed:
+            self._file.close()
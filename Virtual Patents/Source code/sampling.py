@@ -0,0 +1,166 @@
+# Licensed under the MIT License. See LICENSE-CODE in the repository root for details.
+# Copyright (c) 2025 Christos Papadopoulos
+
+"""
+Deterministic Sampling for PatentFusion
+
+A sample run fuses a fixed subset of the patent groups, e.g. 1% of a vertical while
+tuning merge rules or filters, with the full pipeline and all output formats. Groups
+are selected by a seeded hash of their group key: the same seed selects the same
+groups whatever the other settings, and a smaller sample is a subset of a larger one.
+
+The sample can be stratified by the date folder of the virtual patent (that of its
+highest priority file) or by its kind-merging pattern (e.g. 'B1,A1'), so every
+stratum is represented in proportion to its size.
+"""
+
+import os
+import hashlib
+from constants import SAMPLE_STRATIFY_OPTIONS
+from archive_source import is_archive_member_path, split_archive_member_path
+
+
+def parse_sample_size(value):
+    """
+    Parse a sample size: a fraction ('0.01' or '1%') or a number of patent groups ('500')
+
+    Args:
+        value (str): Setting value ('' or '0' for no sampling)
+
+    Returns:
+        float or int: Fraction in (0, 1) or number of patent groups, or None for no sampling
+
+    Raises:
+        ValueError: If the value is not a valid sample size
+    """
+    value = str(value).strip()
+    if not value or value == '0':
+        return None
+    if value.endswith('%'):
+        fraction = float(value[:-1]) / 100
+    elif '.' in value:
+        fraction = float(value)
+    else:
+        count = int(value)
+        if count < 1:
+            raise ValueError(f"Invalid sample size: {value}")
+        return count
+    if not 0 < fraction <= 1:
+        raise ValueError(f"Invalid sample fraction: {value}")
+    return None if fraction == 1 else fraction
+
+
+def get_sample_hash(group_key, seed):
+    """
+    Hash a patent group into [0, 1) for a seed
+
+    Args:
+        group_key (str): Group key 'OFFICE-NUMBER'
+        seed (int): Sample seed
+
+    Returns:
+        float: Uniformly distributed hash value
+    """
+    digest = hashlib.blake2b(f"{seed}:{group_key}".encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') / 2 ** 64
+
+
+def get_date_folder(file_path):
+    """
+    Get the date folder of a patent file (.../Office/Date/Kind/.../OFFICE-NUMBER-KIND.xml)
+
+    Args:
+        file_path (str): File path or virtual archive member path
+
+    Returns:
+        str: Date folder, or '' if the path does not follow the dataset layout
+    """
+    if is_archive_member_path(file_path):
+        parts = split_archive_member_path(file_path)[1].split('/')
+    else:
+        parts = file_path.split(os.sep)
+    name_parts = parts[-1].split('.')[0].split('-')
+    if len(name_parts) < 3:
+        return ''
+    # The date folder is the parent of the kind code folder
+    for index in range(len(parts) - 2, 0, -1):
+        if parts[index] == name_parts[2]:
+            return parts[index - 1]
+    return ''
+
+
+def get_group_stratum(file_list, stratify, global_priority):
+    """
+    Get the stratum of a patent group
+
+    Args:
+        file_list (list): File paths of the group
+        stratify (str): 'date_folder' or 'kind_pattern'
+        global_priority (list): Kind codes in priority order
+
+    Returns:
+        str: Date folder of the highest priority file, or the kind codes of the group in priority order
+    """
+    ranked = []
+    for file_path in file_list:
+        name_parts = os.path.basename(file_path).split('.')[0].split('-')
+        if len(name_parts) >= 3 and name_parts[2] in global_priority:
+            ranked.append((global_priority.index(name_parts[2]), name_parts[2], file_path))
+    ranked.sort()
+    if not ranked:
+        return ''
+    if stratify == 'date_folder':
+        return get_date_folder(ranked[0][2])
+    return ','.join(kind_code for _, kind_code, _ in ranked)
+
+
+def _allocate_quotas(strata_sizes, sample_size):
+    """Number of patent groups to sample from each stratum"""
+    total = sum(strata_sizes.values())
+    if isinstance(sample_size, float):
+        # Every stratum is represented by at least one patent group
+        return {stratum: max(1, round(size * sample_size)) for stratum, size in strata_sizes.items()}
+
+    # A fixed count is split in proportion to the strata sizes (largest remainder method)
+    count = min(sample_size, total)
+    shares = {stratum: count * size / total for stratum, size in strata_sizes.items()}
+    quotas = {stratum: int(share) for stratum, share in shares.items()}
+    remainder = count - sum(quotas.values())
+    for stratum in sorted(shares, key=lambda stratum: (quotas[stratum] - shares[stratum], stratum))[:remainder]:
+        quotas[stratum] += 1
+    return quotas
+
+
+def select_sample(patent_groups, config):
+    """
+    Select the patent groups of the sample
+
+    Args:
+        patent_groups (dict): Group key -> file paths
+        config (dict): Configuration dictionary (sample_size, sample_seed, sample_stratify, global_priority)
+
+    Returns:
+        set: Group keys of the sample
+    """
+    sample_size = config['sample_size']
+    seed = config.get('sample_seed', 0)
+    stratify = config.get('sample_stratify', 'none')
+    hashes = {group_key: get_sample_hash(group_key, seed) for group_key in patent_groups}
+
+    def ordered(group_keys):
+        return sorted(group_keys, key=lambda group_key: (hashes[group_key], group_key))
+
+    if stratify not in SAMPLE_STRATIFY_OPTIONS or stratify == 'none':
+        if isinstance(sample_size, float):
+            return {group_key for group_key, value in hashes.items() if value < sample_size}
+        return set(ordered(hashes)[:sample_size])
+
+    strata = {}
+    for group_key, file_list in patent_groups.items():
+        strata.setdefault(get_group_stratum(file_list, stratify, config['global_priority']), []).append(group_key)
+    quotas = _allocate_quotas({stratum: len(group_keys) for stratum, group_keys in strata.items()}, sample_size)
+
+    selected = set()
+    for stratum, group_keys in strata.items():
+        selected.update(ordered(group_keys)[:quotas[stratum]])
+    return selected
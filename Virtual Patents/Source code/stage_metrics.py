@@ -0,0 +1,367 @@
+# Licensed under the MIT License. See LICENSE-CODE in the repository root for details.
+# Copyright (c) 2025 Christos Papadopoulos
+
+"""
+Stage Metrics for PatentFusion
+
+Workers time every stage of fusing and saving a virtual patent:
+
+    read, parse, deepcopy, merge, finalize, filter    - create_virtual_patent (xml_parser.py)
+    temp_write, temp_load                             - the temp file round trip between the two phases
+    serialize_xml, serialize_csv, serialize_json, write - save_individual_vpatents_sequential (data_processor.py)
+
+together with the bytes read and written, a latency histogram of the patents fused
+and saved, and the slowest patents and source files. The metrics recorded during a
+task travel back with its result (see _execute_task in worker_pool.py) and are summed
+up by the pool in the driver, so at the end of a run one report covers all workers:
+metrics.json in the destination folder and, if prometheus_metrics_file is set, the
+same counters in the Prometheus text format (e.g. for the node exporter's textfile
+collector).
+"""
+
+import json
+import time
+import heapq
+import logging
+import threading
+from constants import METRICS_LATENCY_BUCKETS, METRICS_TOP_N
+from utils import atomic_output_path
+
+logger = logging.getLogger(__name__)
+
+# Metrics of the task running in the current worker (thread-local, so thread backend workers keep their own)
+_worker_local = threading.local()
+
+
+class StageMetrics:
+    """
+    Stage times, byte and patent counters, latency histograms and slowest items
+
+    Used both inside a worker (one task's metrics) and in the driver (summed over all tasks).
+    """
+
+    def __init__(self, top_n=METRICS_TOP_N):
+        """
+        Initialize empty metrics
+
+        Args:
+            top_n (int): Number of slowest patents and files to keep
+        """
+        self.top_n = top_n
+        self.stages = {}
+        self.counters = {}
+        self.latencies = {}
+        self.slowest = {}
+        self.workers = {}
+
+    def is_empty(self):
+        """Check whether anything was recorded"""
+        return not (self.stages or self.counters or self.latencies)
+
+    def add_stage(self, stage, seconds):
+        """
+        Add the time of one pass through a stage
+
+        Args:
+            stage (str): Stage name (e.g. 'parse', 'serialize_json')
+            seconds (float): Time spent
+        """
+        entry = self.stages.setdefault(stage, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+    def count(self, counter, value=1):
+        """
+        Increase a counter (e.g. 'bytes_out', 'patents_saved')
+
+        Args:
+            counter (str): Counter name
+            value (int): Amount to add
+        """
+        self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def add_latency(self, kind, key, seconds):
+        """
+        Record the latency of one patent
+
+        Args:
+            kind (str): 'fuse' (create_virtual_patent) or 'save' (all formats and profiles)
+            key (str): Patent identifier (e.g. 'EP-2615747')
+            seconds (float): Latency
+        """
+        entry = self.latencies.setdefault(kind, {'buckets': [0] * (len(METRICS_LATENCY_BUCKETS) + 1), 'sum': 0.0})
+        index = next((i for i, bound in enumerate(METRICS_LATENCY_BUCKETS) if seconds <= bound),
+                     len(METRICS_LATENCY_BUCKETS))
+        entry['buckets'][index] += 1
+        entry['sum'] += seconds
+        self._keep_slowest(kind, seconds, key)
+
+    def add_file(self, file_path, seconds, size):
+        """
+        Record a source file that was read
+
+        Args:
+            file_path (str): File path or virtual archive member path
+            seconds (float): Time spent reading it (including parsing, for files read while they are parsed)
+            size (int): File size in bytes
+        """
+        self.count('files_read')
+        self.count('bytes_in', size)
+        self._keep_slowest('file', seconds, file_path)
+
+    def _keep_slowest(self, kind, seconds, key):
+        """Keep the top_n largest (seconds, key) entries of a kind (a min-heap)"""
+        heap = self.slowest.setdefault(kind, [])
+        if len(heap) < self.top_n:
+            heapq.heappush(heap, (seconds, key))
+        elif seconds > heap[0][0]:
+            heapq.heapreplace(heap, (seconds, key))
+
+    def record_task(self, worker_id, duration):
+        """
+        Count a finished task of a worker
+
+        Args:
+            worker_id (int): Worker slot
+            duration (float): Task duration in seconds
+        """
+        entry = self.workers.setdefault(worker_id, [0, 0.0])
+        entry[0] += 1
+        entry[1] += duration
+
+    def to_dict(self):
+        """
+        Get the metrics as plain data (sent from workers to the driver)
+
+        Returns:
+            dict: stages, counters, latencies and slowest entries
+        """
+        return {'stages': self.stages, 'counters': self.counters, 'latencies': self.latencies,
+                'slowest': {kind: list(heap) for kind, heap in self.slowest.items()}}
+
+    def merge(self, data):
+        """
+        Add the metrics of a task
+
+        Args:
+            data (dict): Metrics as returned by to_dict()
+        """
+        for stage, (seconds, count) in data['stages'].items():
+            entry = self.stages.setdefault(stage, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += count
+        for counter, value in data['counters'].items():
+            self.count(counter, value)
+        for kind, latency in data['latencies'].items():
+            entry = self.latencies.setdefault(kind, {'buckets': [0] * len(latency['buckets']), 'sum': 0.0})
+            entry['buckets'] = [a + b for a, b in zip(entry['buckets'], latency['buckets'])]
+            entry['sum'] += latency['sum']
+        for kind, items in data['slowest'].items():
+            for seconds, key in items:
+                self._keep_slowest(kind, seconds, key)
+
+
+class StageTimer:
+    """
+    Lap timer attributing the time since the previous lap to a stage
+    """
+
+    def __init__(self, metrics):
+        """
+        Start the timer
+
+        Args:
+            metrics (StageMetrics): Metrics receiving the stage times
+        """
+        self.metrics = metrics
+        self.start = self.last = time.perf_counter()
+
+    def lap(self, stage):
+        """
+        Close a stage
+
+        Args:
+            stage (str): Stage the time since the previous lap was spent in
+
+        Returns:
+            float: Seconds attributed to the stage
+        """
+        now = time.perf_counter()
+        seconds = now - self.last
+        self.last = now
+        self.metrics.add_stage(stage, seconds)
+        return seconds
+
+    def skip(self):
+        """Leave the time since the previous lap out of every stage"""
+        self.last = time.perf_counter()
+
+    def elapsed(self):
+        """Seconds since the timer was started"""
+        return time.perf_counter() - self.start
+
+
+def get_stage_metrics():
+    """
+    Get the metrics of the current worker's task
+
+    Returns:
+        StageMetrics: Metrics collected until the task finishes (see drain_stage_metrics)
+    """
+    metrics = getattr(_worker_local, 'metrics', None)
+    if metrics is None:
+        metrics = StageMetrics()
+        _worker_local.metrics = metrics
+    return metrics
+
+
+def drain_stage_metrics():
+    """
+    Take the metrics recorded since the last call (at the end of a task)
+
+    Returns:
+        dict: Metrics as plain data, or None if nothing was recorded
+    """
+    metrics = getattr(_worker_local, 'metrics', None)
+    _worker_local.metrics = None
+    if metrics is None or metrics.is_empty():
+        return None
+    return metrics.to_dict()
+
+
+def _estimate_percentile(buckets, fraction):
+    """Upper bound (ms) of the histogram bucket holding a percentile, or None above the largest bound"""
+    total = sum(buckets)
+    if not total:
+        return 0.0
+    seen = 0
+    for index, count in enumerate(buckets):
+        seen += count
+        if seen >= fraction * total:
+            return METRICS_LATENCY_BUCKETS[index] * 1000 if index < len(METRICS_LATENCY_BUCKETS) else None
+    return None
+
+
+def build_metrics_report(metrics, duration):
+    """
+    Summarize the metrics of a run
+
+    Args:
+        metrics (StageMetrics): Metrics summed over all tasks of the run
+        duration (float): Wall-clock duration of the run in seconds
+
+    Returns:
+        dict: Report with throughput, stage breakdown, latency histograms, slowest patents and files and workers
+    """
+    counters = metrics.counters
+    stage_total = sum(seconds for seconds, _ in metrics.stages.values()) or 1.0
+    rate = (lambda value: round(value / duration, 3)) if duration > 0 else (lambda value: 0.0)
+
+    latency = {}
+    for kind, entry in metrics.latencies.items():
+        buckets = entry['buckets']
+        count = sum(buckets)
+        labels = [f"<={bound * 1000:g}ms" for bound in METRICS_LATENCY_BUCKETS] + [f">{METRICS_LATENCY_BUCKETS[-1] * 1000:g}ms"]
+        latency[kind] = {
+            'count': count,
+            'mean_ms': round(entry['sum'] / count * 1000, 3) if count else 0.0,
+            'p50_ms': _estimate_percentile(buckets, 0.5),
+            'p90_ms': _estimate_percentile(buckets, 0.9),
+            'p99_ms': _estimate_percentile(buckets, 0.99),
+            'histogram': dict(zip(labels, buckets))
+        }
+
+    def slowest(kind, label):
+        return [{label: key, 'seconds': round(seconds, 4)}
+                for seconds, key in sorted(metrics.slowest.get(kind, []), reverse=True)]
+
+    return {
+        'run': {'finished': time.strftime('%Y-%m-%d %H:%M:%S'), 'duration_seconds': round(duration, 3)},
+        'throughput': {
+            'files_per_second': rate(counters.get('files_read', 0)),
+            'patents_fused_per_second': rate(counters.get('patents_fused', 0)),
+            'patents_saved_per_second': rate(counters.get('patents_saved', 0)),
+            'mb_in_per_second': rate(counters.get('bytes_in', 0) / 1024**2),
+            'mb_out_per_second': rate(counters.get('bytes_out', 0) / 1024**2)
+        },
+        'counters': dict(sorted(counters.items())),
+        'stages': {stage: {'seconds': round(seconds, 4), 'count': count,
+                           'mean_ms': round(seconds / count * 1000, 4) if count else 0.0,
+                           'share': round(seconds / stage_total, 4)}
+                   for stage, (seconds, count) in sorted(metrics.stages.items(), key=lambda item: -item[1][0])},
+        'latency': latency,
+        'slowest_patents': {kind: slowest(kind, 'patent') for kind in ('fuse', 'save') if kind in metrics.slowest},
+        'slowest_files': slowest('file', 'file'),
+        'workers': {str(worker_id): {'tasks': tasks, 'busy_seconds': round(busy, 3)}
+                    for worker_id, (tasks, busy) in sorted(metrics.workers.items())}
+    }
+
+
+def format_prometheus_metrics(metrics, duration):
+    """
+    Format the metrics of a run in the Prometheus text exposition format
+
+    Args:
+        metrics (StageMetrics): Metrics summed over all tasks of the run
+        duration (float): Wall-clock duration of the run in seconds
+
+    Returns:
+        str: Metric families (counters, a gauge and the latency histograms)
+    """
+    lines = []
+
+    def family(name, metric_type, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for labels, value in samples:
+            label_text = '{' + ','.join(f'{key}="{label}"' for key, label in labels.items()) + '}' if labels else ''
+            lines.append(f"{name}{label_text} {value:g}" if isinstance(value, float) else f"{name}{label_text} {value}")
+
+    family('patentfusion_run_duration_seconds', 'gauge', "Wall-clock duration of the run", [({}, float(duration))])
+    family('patentfusion_stage_seconds_total', 'counter', "Time spent in each pipeline stage",
+           [({'stage': stage}, float(seconds)) for stage, (seconds, _) in sorted(metrics.stages.items())])
+    family('patentfusion_stage_calls_total', 'counter', "Passes through each pipeline stage",
+           [({'stage': stage}, count) for stage, (_, count) in sorted(metrics.stages.items())])
+    for counter, value in sorted(metrics.counters.items()):
+        family(f'patentfusion_{counter}_total', 'counter', f"Total {counter.replace('_', ' ')}", [({}, value)])
+
+    for kind, entry in sorted(metrics.latencies.items()):
+        name = f'patentfusion_{kind}_latency_seconds'
+        lines.append(f"# HELP {name} Per-patent {kind} latency")
+        lines.append(f"# TYPE {name} histogram")
+        cumulative = 0
+        for bound, count in zip(METRICS_LATENCY_BUCKETS, entry['buckets']):
+            cumulative += count
+            lines.append(f'{name}_bucket{{le="{bound:g}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{le="+Inf"}} {sum(entry["buckets"])}')
+        lines.append(f"{name}_sum {entry['sum']:g}")
+        lines.append(f"{name}_count {sum(entry['buckets'])}")
+    return '\n'.join(lines) + '\n'
+
+
+def write_metrics_report(metrics, report_path, duration, prometheus_path=None):
+    """
+    Write the metrics report of a run (and optionally the Prometheus text file) and log its highlights
+
+    Args:
+        metrics (StageMetrics): Metrics summed over all tasks of the run
+        report_path (str): Path of the JSON report
+        duration (float): Wall-clock duration of the run in seconds
+        prometheus_path (str, optional): Path of the Prometheus text file
+
+    Returns:
+        dict: The report
+    """
+    report = build_metrics_report(metrics, duration)
+    with atomic_output_path(report_path) as temp_path, open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    if prometheus_path:
+        with atomic_output_path(prometheus_path) as temp_path, open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(format_prometheus_metrics(metrics, duration))
+
+    top_stages = list(report['stages'].items())[:4]
+    if top_stages:
+        logger.info("Stage times: " + ", ".join(f"{stage} {entry['seconds']:.1f}s ({entry['share'] * 100:.0f}%)"
+                                                for stage, entry in top_stages))
+    logger.info(f"Metrics report: {report_path}" + (f" (Prometheus: {prometheus_path})" if prometheus_path else ""))
+    return report
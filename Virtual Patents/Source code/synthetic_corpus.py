@@ -0,0 +1,484 @@
+# Licensed under the MIT License. See LICENSE-CODE in the repository root for details.
+# Copyright (c) 2025 Christos Papadopoulos
+
+"""
+Synthetic WPI Corpus Generator for PatentFusion
+
+The WPI collection cannot ship with the repository, so performance work is measured on
+synthetic corpora written in the same Office/Date/Kind/... layout:
+
+    EP/20140108/A1/000002/61/57/47/EP-2615747-A1.xml
+
+Each invention is published by one office (or, as a patent family sharing a family-id,
+by several) under a kind pattern such as A1+B1 or A2+A3+B1. The corpus is controlled by:
+
+    kind patterns   per-office ratios of the kind codes published per patent group
+    languages       ratios of the publication languages; B kinds of EP carry claims in
+                    EN, DE and FR, and a share of documents has multi-language abstracts
+    document sizes  log-normal distribution of the description length in words
+    pathological    a share of patent groups with one of the PATHOLOGICAL_CASES, e.g.
+                    malformed or empty files, oversized documents or many kind codes
+
+Documents depend only on the seed and their patent group, so a corpus is identical
+whatever the number of workers writing it. A summary (parameters, documents, bytes,
+pathological groups) is written to synthetic_corpus.json next to the office folders.
+
+Usage:
+    python synthetic_corpus.py /tmp/synthetic --patents 10000 --offices EP,WO,US --pathological 0.01
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import datetime
+import multiprocessing
+from constants import VALID_PATENT_OFFICES
+from utils import setup_logging, format_duration, ensure_directory_exists, get_effective_cpu_count, atomic_output_path
+
+logger = logging.getLogger(__name__)
+
+# Summary of a generated corpus, written to its root folder
+CORPUS_SUMMARY_NAME = 'synthetic_corpus.json'
+
+# Kind patterns (kind codes published per patent group, in publication order) and their ratios per office
+DEFAULT_KIND_PATTERNS = {
+    'EP': {'A1': 0.35, 'A1+B1': 0.30, 'A2+A3+B1': 0.12, 'A2+A3': 0.05, 'B1': 0.08, 'A1+B1+B9': 0.05, 'A1+A8+B1': 0.05},
+    'WO': {'A1': 0.60, 'A2': 0.15, 'A2+A3': 0.20, 'A1+A9': 0.05},
+    'US': {'A1': 0.40, 'B1': 0.20, 'A1+B2': 0.35, 'A1+B2+E': 0.05}
+}
+# Kind patterns of offices without their own defaults
+GENERIC_KIND_PATTERNS = {'A1': 0.5, 'A1+B1': 0.35, 'B1': 0.15}
+
+# Ratios of the publication languages
+DEFAULT_LANGUAGES = {'EN': 0.70, 'DE': 0.15, 'FR': 0.10, 'JA': 0.03, 'ZH': 0.02}
+
+# Kind codes of search reports (bibliographic data and citations only) and of corrections
+SEARCH_REPORT_KINDS = {'A3', 'A4'}
+CORRECTION_KINDS = {'A8', 'A9', 'B8', 'B9'}
+
+# Pathological patent groups, assigned in turn to the pathological share of the groups:
+#   malformed            the first publication is cut off in the middle of an element
+#   empty                the first publication is an empty file
+#   oversized            the description is oversized_mb large (large document streaming)
+#   many_kinds           eight kind codes (A1 A2 A3 A4 A8 A9 B1 B9), stress for the merge
+#   many_claims          hundreds of claims with nested claim-text
+#   duplicate_abstracts  every kind carries the same abstracts (duplicate detection)
+#   special_characters   markup characters, CDATA, emoji and combining characters in the texts
+#   no_family            the documents have no family-id
+PATHOLOGICAL_CASES = ['malformed', 'empty', 'oversized', 'many_kinds', 'many_claims', 'duplicate_abstracts',
+                      'special_characters', 'no_family']
+MANY_KINDS_PATTERN = ['A1', 'A2', 'A3', 'A4', 'A8', 'A9', 'B1', 'B9']
+
+# First patent number of each office and the first publication week
+_FIRST_NUMBERS = {'EP': 2600000, 'WO': 2013000000, 'US': 20130000000}
+_FIRST_WEEK = datetime.date(2013, 1, 2)
+
+_WORDS = {
+    'EN': "the a of and to in for with is device method system apparatus unit layer signal control data "
+          "member portion surface first second wherein configured said comprising plurality element housing "
+          "sensor circuit module power cell fluid composition compound process substrate electrode".split(),
+    'DE': "der die das und mit fuer ist eine einer Vorrichtung Verfahren System Einheit Schicht Signal "
+          "Steuerung Daten Element Oberflaeche erste zweite wobei umfassend Gehaeuse Sensor Schaltung".split(),
+    'FR': "le la les de et pour avec est un une dispositif procede systeme unite couche signal commande "
+          "donnees element surface premier second dans lequel comprenant boitier capteur circuit".split(),
+    'ES': "el la los de y para con es un una dispositivo metodo sistema unidad capa senal control datos".split(),
+    'IT': "il la gli di e per con un una dispositivo metodo sistema unita strato segnale controllo dati".split()
+}
+# Scripts of languages without word lists: (first code point, number of code points, characters per word)
+_SCRIPTS = {'JA': (0x3041, 86, 3), 'ZH': (0x4E00, 2000, 2), 'KO': (0xAC00, 2000, 2), 'RU': (0x0430, 32, 7)}
+_SPECIAL_TEXT = " & <tag> \"quoted\" 'single' é́ \U0001F52C   ]]> "
+
+_IPC_CLASSES = ["A61K 31/00", "H04W 4/00", "G06F 17/30", "B60R 21/01", "C07D 401/04", "H01L 21/02",
+                "F16H 57/04", "G01N 33/50", "H04L 29/06", "A47J 31/44"]
+_NAMES = ["ACME CORP", "Siemens AG", "Koninklijke Philips N.V.", "BASF SE", "Sony Corporation",
+          "Robert Bosch GmbH", "LG Electronics Inc.", "Qualcomm Incorporated", "Bayer AG", "Nokia Oyj"]
+
+
+def parse_ratios(value):
+    """
+    Parse ratios given as 'key=weight,key=weight' (e.g. 'A1=0.4,A1+B1=0.6' or 'EN=70,DE=30')
+
+    Args:
+        value (str): Comma-separated key=weight pairs
+
+    Returns:
+        dict: key -> weight (weights need not add up to 1)
+
+    Raises:
+        ValueError: If a pair is not key=weight or a weight is negative
+    """
+    ratios = {}
+    for pair in value.split(','):
+        if not pair.strip():
+            continue
+        key, separator, weight = pair.partition('=')
+        if not separator or float(weight) < 0:
+            raise ValueError(f"Invalid ratio '{pair.strip()}' (expected key=weight)")
+        ratios[key.strip().upper()] = float(weight)
+    return ratios
+
+
+def get_member_path(office, number, kind, date_folder):
+    """
+    Get the path of a document in the Office/Date/Kind/... layout
+
+    The last six digits of the number form three folder levels, the digits before them
+    one zero-padded folder (EP 2615747 A1 -> EP/<date>/A1/000002/61/57/47/EP-2615747-A1.xml).
+
+    Args:
+        office (str): Patent office
+        number (str): Publication number
+        kind (str): Kind code
+        date_folder (str): Publication date folder (YYYYMMDD)
+
+    Returns:
+        str: Relative path of the document
+    """
+    digits = number.zfill(7)
+    tail = digits[-6:]
+    return os.path.join(office, date_folder, kind, digits[:-6].zfill(6), tail[0:2], tail[2:4], tail[4:6],
+                        f"{office}-{number}-{kind}.xml")
+
+
+def _choose(rng, ratios):
+    """Pick a key of a ratio dictionary"""
+    keys = list(ratios)
+    return rng.choices(keys, weights=[ratios[key] for key in keys])[0]
+
+
+def _words(rng, language, count):
+    """Random text of count words in a language"""
+    if language in _SCRIPTS:
+        first, size, length = _SCRIPTS[language]
+        return ' '.join(''.join(chr(first + rng.randrange(size)) for _ in range(length)) for _ in range(count))
+    return ' '.join(rng.choices(_WORDS.get(language, _WORDS['EN']), k=count))
+
+
+def _escape(text):
+    """Escape text for an XML text node or attribute"""
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
+
+
+class PatentGroupSpec:
+    """
+    Everything that is shared by the publications of one patent group
+    """
+
+    def __init__(self, office, number, kinds, language, family_id, description_words, case, seed):
+        self.office = office
+        self.number = number
+        self.kinds = kinds
+        self.language = language
+        self.family_id = family_id
+        self.description_words = description_words
+        self.case = case
+        self.seed = seed
+
+
+def render_document(spec, kind, date, settings):
+    """
+    Render one publication of a patent group as WPI XML
+
+    Args:
+        spec (PatentGroupSpec): Patent group
+        kind (str): Kind code of the publication
+        date (str): Publication date (YYYYMMDD)
+        settings (dict): Generator settings (multi_language, oversized_mb)
+
+    Returns:
+        str: XML document
+    """
+    # Texts shared by the kinds of a group (the same invention) come from the group's seed
+    shared = random.Random(f"{spec.seed}-{spec.office}-{spec.number}")
+    rng = random.Random(f"{spec.seed}-{spec.office}-{spec.number}-{kind}")
+    language = spec.language
+    special = _SPECIAL_TEXT if spec.case == 'special_characters' else ''
+    ucid = f"{spec.office}-{spec.number}-{kind}"
+    family = f' family-id="{spec.family_id}"' if spec.family_id else ''
+
+    title = _escape(f"{_words(shared, language, 8)}{special}")
+    abstract_languages = [language]
+    if shared.random() < settings['multi_language']:
+        abstract_languages += [extra for extra in ('EN', 'FR', 'DE') if extra != language][:2]
+    abstract_source = shared if spec.case == 'duplicate_abstracts' else rng
+    abstracts = ''.join(f'<abstract load-source="{spec.office.lower()}" lang="{abstract_language}"><p>'
+                        f'{_escape(_words(abstract_source, abstract_language, 120) + special)}</p></abstract>\n'
+                        for abstract_language in abstract_languages)
+
+    parts = [
+        '<?xml version="1.0" encoding="UTF-8"?>\n',
+        f'<patent-document ucid="{ucid}" country="{spec.office}" doc-number="{spec.number}" kind="{kind}" '
+        f'date="{date}"{family} file-reference-id="{rng.randrange(10**6)}" date-produced="{date}" status="new" '
+        f'lang="{language}">\n',
+        '<bibliographic-data>\n',
+        f'<publication-reference fvid="{rng.randrange(10**8)}" ucid="{ucid}"><document-id><country>{spec.office}'
+        f'</country><doc-number>{spec.number}</doc-number><kind>{kind}</kind><date>{date}</date><lang>{language}'
+        f'</lang></document-id></publication-reference>\n',
+        f'<application-reference ucid="{spec.office}-{int(spec.number) + 7000000}-A" is-representative="NO">'
+        f'<document-id><country>{spec.office}</country><doc-number>{int(spec.number) + 7000000}</doc-number>'
+        f'<kind>A</kind><date>{date[:4]}0102</date></document-id></application-reference>\n',
+        '<technical-data>\n<classifications-ipcr>',
+        ''.join(f'<classification-ipcr load-source="docdb">{ipc} 20060101AFI{date}BHEP</classification-ipcr>'
+                for ipc in shared.sample(_IPC_CLASSES, 2)),
+        '</classifications-ipcr>\n<classifications-cpc>',
+        ''.join(f'<classification-cpc load-source="docdb">{ipc}</classification-cpc>'
+                for ipc in shared.sample(_IPC_CLASSES, 2)),
+        '</classifications-cpc>\n',
+        f'<invention-title load-source="{spec.office.lower()}" lang="{language}">{title}</invention-title>\n',
+        '</technical-data>\n<parties>\n<applicants>',
+        ''.join(f'<applicant load-source="docdb" sequence="{index + 1}" format="epo"><addressbook><name>'
+                f'{_escape(name)}</name></addressbook></applicant>' for index, name in enumerate(shared.sample(_NAMES, 2))),
+        '</applicants>\n<inventors>',
+        ''.join(f'<inventor load-source="docdb" sequence="{index + 1}" format="epo"><addressbook><name>'
+                f'{_words(shared, "EN", 2).upper()}</name></addressbook></inventor>' for index in range(3)),
+        '</inventors>\n</parties>\n</bibliographic-data>\n'
+    ]
+
+    if kind in SEARCH_REPORT_KINDS:
+        # Search reports hold the cited documents only
+        parts.append('<search-report-data><srep-citations>')
+        parts.extend(f'<citation><patcit ucid="{spec.office}-{rng.randrange(10**6, 10**7)}-A1"/></citation>'
+                     for _ in range(rng.randint(2, 8)))
+        parts.append('</srep-citations></search-report-data>\n')
+    else:
+        if not kind.startswith('B') or spec.office != 'EP':
+            parts.append(abstracts)
+        words = spec.description_words
+        if spec.case == 'oversized':
+            words = int(settings['oversized_mb'] * 1024**2 / 7)
+        # Corrections republish a shortened text
+        if kind in CORRECTION_KINDS:
+            words //= 4
+        parts.append(f'<description load-source="{spec.office.lower()}" lang="{language}">\n')
+        paragraph = 0
+        while words > 0:
+            paragraph += 1
+            length = min(words, rng.randint(40, 160))
+            parts.append(f'<p id="p{paragraph:04d}" num="{paragraph:04d}">{_escape(_words(rng, language, length))}</p>\n')
+            words -= length
+        if special:
+            parts.append(f'<p id="p{paragraph + 1:04d}"><![CDATA[{_SPECIAL_TEXT.replace("]]>", "")} <raw>]]></p>\n')
+        parts.append('</description>\n')
+
+        claim_count = rng.randint(300, 600) if spec.case == 'many_claims' else rng.randint(5, 25)
+        # EP grants carry the claims in the three official languages
+        claim_languages = ['EN', 'DE', 'FR'] if kind.startswith('B') and spec.office == 'EP' else [language]
+        for claim_language in claim_languages:
+            parts.append(f'<claims load-source="{spec.office.lower()}" lang="{claim_language}">\n')
+            for claim in range(1, claim_count + 1):
+                text = _escape(_words(rng, claim_language, rng.randint(20, 80)) + special)
+                if spec.case == 'many_claims':
+                    text = f'{text}<claim-text>{text}<claim-text>{text}</claim-text></claim-text>'
+                parts.append(f'<claim id="c-{claim_language.lower()}-{claim:04d}" num="{claim:04d}">'
+                             f'<claim-text>{text}</claim-text></claim>\n')
+            parts.append('</claims>\n')
+
+    parts.append(f'<copyright>Copyright (c) {date[:4]} Synthetic Corpus</copyright>\n</patent-document>\n')
+    return ''.join(parts)
+
+
+def plan_patent_groups(settings):
+    """
+    Plan the patent groups of a corpus (offices, kinds, languages, families, sizes, pathological cases)
+
+    Args:
+        settings (dict): Generator settings
+
+    Returns:
+        list: PatentGroupSpec per patent group
+    """
+    rng = random.Random(settings['seed'])
+    offices = settings['offices']
+    pathological_every = round(1 / settings['pathological']) if settings['pathological'] > 0 else 0
+    next_numbers = {office: _FIRST_NUMBERS.get(office, 1000000) for office in offices}
+    specs = []
+    family_id = 10000000
+    case_index = 0
+    for invention in range(settings['patents']):
+        family_id += rng.randint(1, 50)
+        # A share of the inventions is published by several offices (one patent family)
+        family_offices = [rng.choice(offices)]
+        if len(offices) > 1 and rng.random() < settings['family_share']:
+            family_offices = rng.sample(offices, rng.randint(2, len(offices)))
+        language = _choose(rng, settings['languages'])
+        description_words = max(50, int(rng.lognormvariate(0, settings['size_sigma']) * settings['description_words']))
+        case = None
+        if pathological_every and invention % pathological_every == pathological_every // 2:
+            case = PATHOLOGICAL_CASES[case_index % len(PATHOLOGICAL_CASES)]
+            case_index += 1
+        for office in family_offices:
+            pattern = _choose(rng, settings['kind_patterns'].get(office, GENERIC_KIND_PATTERNS))
+            kinds = MANY_KINDS_PATTERN if case == 'many_kinds' else pattern.split('+')
+            if case in ('malformed', 'empty') and len(kinds) == 1:
+                kinds = kinds + ['B9']
+            number = str(next_numbers[office])
+            next_numbers[office] += rng.randint(1, 20)
+            specs.append(PatentGroupSpec(office, number, kinds, language, '' if case == 'no_family' else str(family_id),
+                                         description_words, case, settings['seed']))
+    return specs
+
+
+def write_patent_groups(write_args):
+    """
+    Write the documents of some patent groups
+
+    Args:
+        write_args (tuple): (output_path, list of (group index, PatentGroupSpec), settings)
+
+    Returns:
+        dict: Documents, bytes and pathological groups written
+    """
+    output_path, indexed_specs, settings = write_args
+    stats = {'documents': 0, 'bytes': 0, 'pathological': {}}
+    for group_index, spec in indexed_specs:
+        # Kinds are published weeks apart; grants and corrections come later
+        week = group_index // settings['groups_per_week']
+        for kind_index, kind in enumerate(spec.kinds):
+            offset = kind_index * (40 if kind.startswith('B') else 6)
+            date_folder = (_FIRST_WEEK + datetime.timedelta(weeks=week + offset)).strftime('%Y%m%d')
+            document = render_document(spec, kind, date_folder, settings).encode('utf-8')
+            # Only the first publication (the lowest priority with the usual global_priority) is
+            # damaged, so the group still gets its virtual patent from the others
+            if kind_index == 0 and len(spec.kinds) > 1:
+                if spec.case == 'malformed':
+                    document = document[:len(document) // 2]
+                elif spec.case == 'empty':
+                    document = b''
+            file_path = os.path.join(output_path, get_member_path(spec.office, spec.number, kind, date_folder))
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, 'wb') as f:
+                f.write(document)
+            stats['documents'] += 1
+            stats['bytes'] += len(document)
+        if spec.case:
+            stats['pathological'].setdefault(spec.case, []).append(f"{spec.office}-{spec.number}")
+    return stats
+
+
+def generate_corpus(output_path, patents=1000, offices=None, kind_patterns=None, languages=None,
+                    description_words=800, size_sigma=0.8, multi_language=0.1, family_share=0.2,
+                    pathological=0.0, oversized_mb=2.0, seed=0, cpu_count=None):
+    """
+    Generate a synthetic corpus in the Office/Date/Kind/... layout
+
+    Args:
+        output_path (str): Corpus root (office folders are created in it, like vertical_origin_path)
+        patents (int): Number of inventions (each gives one patent group per office publishing it)
+        offices (list, optional): Patent offices (default: EP)
+        kind_patterns (dict, optional): office -> {kind pattern: ratio}, e.g. {'EP': {'A1+B1': 1}}
+            (default: DEFAULT_KIND_PATTERNS)
+        languages (dict, optional): language -> ratio (default: DEFAULT_LANGUAGES)
+        description_words (int): Median description length in words
+        size_sigma (float): Sigma of the log-normal description length (0 = all the same length)
+        multi_language (float): Share of patent groups with abstracts in further languages
+        family_share (float): Share of inventions published by several offices (with several offices)
+        pathological (float): Share of patent groups with a pathological case (see PATHOLOGICAL_CASES)
+        oversized_mb (float): Description size of 'oversized' documents in MB
+        seed (int): Random seed
+        cpu_count (int, optional): Number of worker processes. If None, uses all available.
+
+    Returns:
+        dict: Corpus summary (also written to synthetic_corpus.json)
+    """
+    offices = [office.upper() for office in (offices or ['EP'])]
+    invalid_offices = [office for office in offices if office not in VALID_PATENT_OFFICES]
+    if invalid_offices:
+        raise ValueError(f"Invalid patent office(s): {', '.join(invalid_offices)}")
+    settings = {
+        'patents': patents,
+        'offices': offices,
+        'kind_patterns': kind_patterns or DEFAULT_KIND_PATTERNS,
+        'languages': languages or DEFAULT_LANGUAGES,
+        'description_words': description_words,
+        'size_sigma': size_sigma,
+        'multi_language': multi_language,
+        'family_share': family_share,
+        'pathological': pathological,
+        'oversized_mb': oversized_mb,
+        'seed': seed,
+        # About 200 patent groups per weekly date folder
+        'groups_per_week': 200
+    }
+    if cpu_count is None:
+        cpu_count = get_effective_cpu_count()
+
+    start_time = time.time()
+    ensure_directory_exists(output_path)
+    specs = plan_patent_groups(settings)
+    indexed_specs = list(enumerate(specs))
+    chunk_count = max(1, min(len(indexed_specs), cpu_count * 4))
+    write_args = [(output_path, indexed_specs[index::chunk_count], settings) for index in range(chunk_count)]
+    logger.info(f"Generating {len(specs)} patent groups of {patents} inventions ({', '.join(offices)}) in {output_path}")
+
+    if cpu_count > 1 and len(write_args) > 1:
+        with multiprocessing.Pool(processes=min(cpu_count, len(write_args))) as pool:
+            results = pool.map(write_patent_groups, write_args)
+    else:
+        results = [write_patent_groups(args) for args in write_args]
+
+    pathological_groups = {}
+    for result in results:
+        for case, group_keys in result['pathological'].items():
+            pathological_groups.setdefault(case, []).extend(group_keys)
+    summary = dict(settings, patent_groups=len(specs),
+                   documents=sum(result['documents'] for result in results),
+                   bytes=sum(result['bytes'] for result in results),
+                   pathological_groups={case: sorted(keys) for case, keys in sorted(pathological_groups.items())})
+    with atomic_output_path(os.path.join(output_path, CORPUS_SUMMARY_NAME)) as temp_path, \
+            open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2)
+
+    logger.info(f"Synthetic corpus complete in {format_duration(time.time() - start_time)}: {summary['documents']} "
+                f"documents, {summary['bytes'] / 1024**2:.1f} MB, "
+                f"{sum(len(keys) for keys in pathological_groups.values())} pathological patent groups")
+    return summary
+
+
+def main(argv=None):
+    """
+    Command line entry point
+
+    Args:
+        argv (list, optional): Command line arguments (defaults to sys.argv[1:])
+
+    Returns:
+        int: Exit code (0 for success, 1 for error)
+    """
+    parser = argparse.ArgumentParser(description="Generate a synthetic WPI corpus in the Office/Date/Kind layout")
+    parser.add_argument('output_path', help="Corpus root directory (use it as vertical_origin_path)")
+    parser.add_argument('--patents', type=int, default=1000, help="Number of inventions")
+    parser.add_argument('--offices', default='EP', help="Comma-separated patent offices (e.g. EP,WO,US)")
+    parser.add_argument('--kinds', default='', help="Kind patterns of all offices, e.g. 'A1=40,A1+B1=35,A2+A3+B1=25' "
+                                                    "(default: realistic patterns per office)")
+    parser.add_argument('--languages', default='', help="Language ratios, e.g. 'EN=70,DE=15,FR=15'")
+    parser.add_argument('--description-words', type=int, default=800, help="Median description length in words")
+    parser.add_argument('--size-sigma', type=float, default=0.8, help="Log-normal sigma of the description length")
+    parser.add_argument('--multi-language', type=float, default=0.1, help="Share of groups with multi-language abstracts")
+    parser.add_argument('--family-share', type=float, default=0.2, help="Share of inventions published by several offices")
+    parser.add_argument('--pathological', type=float, default=0.0,
+                        help=f"Share of pathological patent groups ({', '.join(PATHOLOGICAL_CASES)})")
+    parser.add_argument('--oversized-mb', type=float, default=2.0, help="Description size of oversized documents in MB")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed")
+    parser.add_argument('--workers', type=int, default=get_effective_cpu_count(), help="Number of worker processes")
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    try:
+        offices = [office.strip().upper() for office in args.offices.split(',') if office.strip()]
+        kind_patterns = {office: parse_ratios(args.kinds) for office in offices} if args.kinds else None
+        languages = parse_ratios(args.languages) if args.languages else None
+        generate_corpus(args.output_path, args.patents, offices, kind_patterns, languages, args.description_words,
+                        args.size_sigma, args.multi_language, args.family_share, args.pathological,
+                        args.oversized_mb, args.seed, max(1, args.workers))
+    except Exception as e:
+        logger.error(f"Corpus generation failed: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
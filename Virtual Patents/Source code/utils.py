@@ -9,13 +9,15 @@ across the PatentFusion application.
 """
 
 import os
+import math
 import logging
+import contextlib
 import psutil
 
 # Import constants from constants module
 from constants import (
     VALID_PATENT_OFFICES, VALID_OUTPUT_FORMATS,
-    DEFAULT_CONFIG, PROGRESS_REPORT_INTERVAL
+    DEFAULT_CONFIG, PROGRESS_REPORT_INTERVAL, MIN_CHUNK_SIZE, MAX_CHUNK_SIZE, PARTIAL_FILE_SUFFIX
 )
 
 
@@ -113,6 +115,186 @@ def ensure_directory_exists(directory_path):
         raise OSError(f"Failed to create directory {directory_path}: {e}")
 
 
+@contextlib.contextmanager
+def atomic_output_path(file_path):
+    """
+    Write a file under a temporary name and rename it into place once it is complete
+    
+    An interrupted write leaves only a file ending in PARTIAL_FILE_SUFFIX, never a
+    half-written file under the final name.
+    
+        with atomic_output_path(output_path) as temp_path:
+            tree.write(temp_path)
+    
+    Args:
+        file_path (str): Final file path
+        
+    Yields:
+        str: Temporary path to write to
+    """
+    temp_path = f"{file_path}{PARTIAL_FILE_SUFFIX}"
+    try:
+        yield temp_path
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    os.replace(temp_path, file_path)
+
+
+
+# Resource detection (cgroup v1/v2 limits and CPU affinity)
+CGROUP_ROOT = "/sys/fs/cgroup"
+
+def _read_cgroup_value(path):
+    """Read the first line of a cgroup control file, or None if it does not exist"""
+    try:
+        with open(path, 'r') as f:
+            return f.readline().strip()
+    except OSError:
+        return None
+
+def _get_cgroup_dirs(controller):
+    """
+    Get the cgroup directories of this process for a controller, innermost first
+    
+    Limits of parent cgroups also apply, so every existing directory from the
+    process' own cgroup up to the mount root is returned.
+    
+    Args:
+        controller (str): cgroup v1 controller name (e.g. 'memory'), or '' for cgroup v2
+        
+    Returns:
+        list: Existing cgroup directories
+    """
+    mount = os.path.join(CGROUP_ROOT, controller) if controller else CGROUP_ROOT
+    relative_path = "/"
+    try:
+        with open("/proc/self/cgroup", 'r') as f:
+            for line in f:
+                _, controllers, path = line.strip().split(':', 2)
+                if (controller and controller in controllers.split(',')) or (not controller and controllers == ''):
+                    relative_path = path
+                    break
+    except (OSError, ValueError):
+        pass
+    
+    dirs = []
+    parts = [part for part in relative_path.split('/') if part]
+    for depth in range(len(parts), -1, -1):
+        # Inside a cgroup namespace the process path may not exist below the mount
+        directory = os.path.join(mount, *parts[:depth])
+        if os.path.isdir(directory) and directory not in dirs:
+            dirs.append(directory)
+    return dirs
+
+def get_cgroup_cpu_limit():
+    """
+    Get the CPU quota of this process' cgroup in cores
+    
+    Returns:
+        float: Number of cores allowed by the cgroup quota, or None if unlimited
+    """
+    limits = []
+    # cgroup v2: cpu.max contains "<quota> <period>" or "max <period>"
+    for directory in _get_cgroup_dirs(''):
+        value = _read_cgroup_value(os.path.join(directory, 'cpu.max'))
+        if value and not value.startswith('max'):
+            quota, period = value.split()[:2]
+            limits.append(int(quota) / int(period))
+    # cgroup v1: cpu.cfs_quota_us is -1 when unlimited
+    for directory in _get_cgroup_dirs('cpu'):
+        quota = _read_cgroup_value(os.path.join(directory, 'cpu.cfs_quota_us'))
+        period = _read_cgroup_value(os.path.join(directory, 'cpu.cfs_period_us'))
+        if quota and period and int(quota) > 0 and int(period) > 0:
+            limits.append(int(quota) / int(period))
+    return min(limits) if limits else None
+
+def get_cgroup_memory_limit_bytes():
+    """
+    Get the memory limit of this process' cgroup
+    
+    Returns:
+        int: Memory limit in bytes, or None if unlimited
+    """
+    host_total = psutil.virtual_memory().total
+    limits = []
+    # cgroup v2: memory.max contains "max" when unlimited
+    for directory in _get_cgroup_dirs(''):
+        value = _read_cgroup_value(os.path.join(directory, 'memory.max'))
+        if value and value != 'max':
+            limits.append(int(value))
+    # cgroup v1: an unlimited memory.limit_in_bytes is a huge number (above host memory)
+    for directory in _get_cgroup_dirs('memory'):
+        value = _read_cgroup_value(os.path.join(directory, 'memory.limit_in_bytes'))
+        if value and int(value) < host_total:
+            limits.append(int(value))
+    return min(limits) if limits else None
+
+def get_cgroup_memory_usage_bytes():
+    """
+    Get the current memory usage charged to this process' cgroup
+    
+    Returns:
+        int: Usage in bytes, or None if it cannot be read
+    """
+    for directory in _get_cgroup_dirs(''):
+        value = _read_cgroup_value(os.path.join(directory, 'memory.current'))
+        if value:
+            return int(value)
+    for directory in _get_cgroup_dirs('memory'):
+        value = _read_cgroup_value(os.path.join(directory, 'memory.usage_in_bytes'))
+        if value:
+            return int(value)
+    return None
+
+def get_affinity_cores():
+    """
+    Get the CPU cores this process may run on
+    
+    Returns:
+        list: Sorted core ids (all cores if the platform has no affinity support)
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+def get_effective_cpu_count():
+    """
+    Get the number of CPU cores actually available to this process
+    
+    Uses the smaller of the CPU affinity mask and the cgroup CPU quota (rounded up),
+    so containers with a quota are not oversubscribed.
+    
+    Returns:
+        int: Effective number of cores (at least 1)
+    """
+    cpu_count = len(get_affinity_cores())
+    cpu_limit = get_cgroup_cpu_limit()
+    if cpu_limit is not None:
+        cpu_count = min(cpu_count, math.ceil(cpu_limit))
+    return max(1, cpu_count)
+
+def get_effective_memory_gb():
+    """
+    Get the total and available memory of this process, honouring cgroup limits
+    
+    Returns:
+        tuple: (total_memory_gb, available_memory_gb)
+    """
+    virtual_memory = psutil.virtual_memory()
+    total_bytes = virtual_memory.total
+    available_bytes = virtual_memory.available
+    
+    memory_limit = get_cgroup_memory_limit_bytes()
+    if memory_limit is not None:
+        total_bytes = min(total_bytes, memory_limit)
+        available_bytes = min(available_bytes, total_bytes)
+        memory_usage = get_cgroup_memory_usage_bytes()
+        if memory_usage is not None:
+            available_bytes = min(available_bytes, max(0, memory_limit - memory_usage))
+    
+    return total_bytes / (1024**3), available_bytes / (1024**3)
 
 def get_system_info():
     """
@@ -121,11 +303,19 @@ def get_system_info():
     Returns:
         dict: System information dictionary
     """
+    effective_total_gb, effective_available_gb = get_effective_memory_gb()
+    cgroup_memory_limit = get_cgroup_memory_limit_bytes()
     return {
         'total_memory_gb': psutil.virtual_memory().total / (1024**3),
         'available_memory_gb': psutil.virtual_memory().available / (1024**3),
         'cpu_count': psutil.cpu_count(),
         'cpu_count_logical': psutil.cpu_count(logical=True),
+        'affinity_cores': len(get_affinity_cores()),
+        'cgroup_cpu_limit': get_cgroup_cpu_limit(),
+        'cgroup_memory_limit_gb': cgroup_memory_limit / (1024**3) if cgroup_memory_limit is not None else None,
+        'effective_cpu_count': get_effective_cpu_count(),
+        'effective_memory_gb': effective_total_gb,
+        'effective_available_memory_gb': effective_available_gb,
         'current_memory_usage_gb': get_memory_usage_gb()
     }
 
@@ -140,11 +330,20 @@ def log_system_info(logger):
     logger.info(f"System Info - Total Memory: {info['total_memory_gb']:.2f} GB, "
                f"Available: {info['available_memory_gb']:.2f} GB, "
                f"CPU Cores: {info['cpu_count']} physical, {info['cpu_count_logical']} logical")
+    cpu_quota = f"{info['cgroup_cpu_limit']:.2f} cores" if info['cgroup_cpu_limit'] is not None else "none"
+    memory_quota = f"{info['cgroup_memory_limit_gb']:.2f} GB" if info['cgroup_memory_limit_gb'] is not None else "none"
+    logger.info(f"Effective Resources - CPU Cores: {info['effective_cpu_count']} "
+               f"(affinity: {info['affinity_cores']}, cgroup quota: {cpu_quota}), "
+               f"Memory: {info['effective_memory_gb']:.2f} GB, Available: {info['effective_available_memory_gb']:.2f} GB "
+               f"(cgroup limit: {memory_quota})")
 
 def calculate_optimal_chunk_size():
     """
     Calculate optimal chunk size balancing memory usage and multiprocessing efficiency
     
+    This is the starting estimate for chunk_size = AUTO; when the autotuner runs,
+    it replaces the per-file estimate below with the measured memory per virtual patent.
+    
     Uses a balanced approach considering:
     - Available memory (conservative 30% usage)
     - CPU core count for work distribution
@@ -154,9 +353,9 @@ def calculate_optimal_chunk_size():
     Returns:
         int: Optimal chunk size (bounded between 50-5000)
     """
-    # Get system resources
-    available_memory_gb = psutil.virtual_memory().available / (1024**3)
-    cpu_count = psutil.cpu_count()
+    # Get system resources (honouring container limits and CPU affinity)
+    _, available_memory_gb = get_effective_memory_gb()
+    cpu_count = get_effective_cpu_count()
     
     # Conservative estimates for memory usage per file:
     # - XML serialization: ~20KB
@@ -177,8 +376,8 @@ def calculate_optimal_chunk_size():
     calculated_size = min(memory_based_size, cpu_based_size)
     
     # Apply performance-optimized bounds (sweet spot range)
-    min_chunk = 50    # Minimum for efficiency 
-    max_chunk = 5000  # Maximum for good work distribution and cache efficiency
+    min_chunk = MIN_CHUNK_SIZE  # Minimum for efficiency 
+    max_chunk = MAX_CHUNK_SIZE  # Maximum for good work distribution and cache efficiency
     
     bounded_chunk_size = max(min_chunk, min(calculated_size, max_chunk))
     
@@ -0,0 +1,234 @@
+# Licensed under the MIT License. See LICENSE-CODE in the repository root for details.
+# Copyright (c) 2025 Christos Papadopoulos
+
+"""
+Virtual Patent Stream for PatentFusion
+
+This module is the library entry point for consuming virtual patents in-process,
+without the round trip through the files PatentFusion writes:
+
+    from vpatent_stream import iter_virtual_patents
+
+    for virtual_patent in iter_virtual_patents('config.ini', offices=['EP'], workers=8, as_dict=True):
+        features = extract_features(virtual_patent)
+
+Patent groups (or patent families, with fusion_level = family) are fused exactly as
+in a PatentFusion run (group_files_by_patent, create_virtual_patent, text truncation),
+batch by batch, and yielded lazily. With workers the batches are fused by a worker
+pool; results come back in input order (ordered=True) or as soon as a batch is done
+(ordered=False). Only a few batches per worker are in flight at a time, so memory
+stays bounded however slowly the consumer reads.
+"""
+
+import os
+import logging
+from lxml import etree
+from config_manager import ConfigManager, get_profile_config
+from file_system import (
+    discover_source_files, select_source_files, filter_by_patent_lists, get_all_file_paths, get_file_batches
+)
+from file_system import get_group_key, get_group_office
+from family_index import build_family_index
+from large_documents import has_streamed_sections, load_streamed_sections
+from memory_manager import create_worker_pool
+from output_manager import remove_metadata_attributes, apply_text_truncation_to_xml, xml_to_hierarchical_dict
+from worker_pool import get_worker_context
+from xml_parser import process_file_batch, filter_virtual_patent_by_config
+
+logger = logging.getLogger(__name__)
+
+# Batches fused ahead of the consumer, per worker
+BATCHES_AHEAD_PER_WORKER = 2
+
+
+def export_virtual_patent(virtual_patent, config, as_dict=False):
+    """
+    Give a virtual patent the content it has in the saved output files
+
+    Args:
+        virtual_patent: Virtual patent XML element (as created by create_virtual_patent)
+        config (dict): Configuration dictionary
+        as_dict (bool): Convert to the hierarchical dictionary of the JSON output
+
+    Returns:
+        Virtual patent XML element or dictionary
+    """
+    remove_metadata_attributes(virtual_patent)
+    if has_streamed_sections(virtual_patent):
+        # Consumers get the whole virtual patent, also of oversized documents
+        load_streamed_sections(virtual_patent, config)
+    if as_dict:
+        return xml_to_hierarchical_dict(virtual_patent, config)
+    apply_text_truncation_to_xml(virtual_patent, config)
+    return virtual_patent
+
+
+def fuse_batch_task(file_batch, as_dict, serialize, profile=None):
+    """
+    Worker task: fuse the patent groups of a batch
+
+    Args:
+        file_batch (list): File paths of whole patent groups
+        as_dict (bool): Return dictionaries instead of XML elements
+        serialize (bool): Return XML elements as bytes (lxml elements cannot be sent between processes)
+        profile (str, optional): Output profile whose parse flags and text length apply
+
+    Returns:
+        list: Virtual patents (elements, bytes or dictionaries)
+    """
+    context = get_worker_context()
+    config = context['config']
+    virtual_patents = process_file_batch(file_batch, context.get('folder_order', {}), 0, config)
+    if profile is not None:
+        config = get_profile_config(config, profile)
+        for virtual_patent in virtual_patents:
+            filter_virtual_patent_by_config(virtual_patent, config)
+    exported = [export_virtual_patent(virtual_patent, config, as_dict) for virtual_patent in virtual_patents]
+    if serialize and not as_dict:
+        return [etree.tostring(virtual_patent, encoding='utf-8') for virtual_patent in exported]
+    return exported
+
+
+def _collect_source_files(config, paths, pool):
+    """Get the source files of the given files and directories, or of the configured input"""
+    if paths is None:
+        return discover_source_files(config, pool)
+
+    file_paths = []
+    folder_order = {}
+    for path in [paths] if isinstance(paths, str) else paths:
+        if os.path.isdir(path):
+            directory_files, directory_folder_order = get_all_file_paths(path, config['cpu_count'], pool=pool)
+            file_paths.extend(directory_files)
+            for relative_dir in directory_folder_order:
+                folder_order.setdefault(relative_dir, len(folder_order))
+        else:
+            file_paths.append(path)
+    return file_paths, folder_order
+
+
+def iter_virtual_patents(config, paths=None, offices=None, as_dict=False, workers=0, ordered=True, pool=None,
+                         profile=None):
+    """
+    Fuse patent groups into virtual patents and yield them one by one
+
+    Args:
+        config (dict or str): Configuration dictionary, or the path of a config.ini
+        paths (list, optional): XML files (plain or virtual archive member paths) and/or directories
+            to fuse; defaults to the configured vertical or archives
+        offices (list, optional): Only fuse patent groups of these patent offices
+            (defaults to the configured patent offices)
+        as_dict (bool): Yield the hierarchical dictionaries of the JSON output instead of lxml elements
+        workers (int): Number of pool workers fusing batches (0 fuses in the calling process)
+        ordered (bool): Yield virtual patents in input order; if False, batches are yielded as they finish
+        pool (WorkerPool, optional): Started pool to use instead of creating one (workers is then ignored)
+        profile (str, optional): Output profile ([profile:<name>] section) whose content to yield; without
+            it, virtual patents of a configuration with profiles hold what any of the profiles outputs
+
+    Yields:
+        Virtual patent as lxml element (as in the XML output) or dictionary (as in the JSON output)
+    """
+    if isinstance(config, str):
+        config = ConfigManager(config).get_all()
+    if offices:
+        config = dict(config, patent_offices=[office.upper() for office in offices])
+    if profile is not None:
+        # Fail before any work is started
+        get_profile_config(config, profile)
+
+    own_pool = pool is None
+    if own_pool:
+        if workers > 0:
+            pool = create_worker_pool(dict(config, cpu_count=workers))
+        else:
+            pool = create_worker_pool(dict(config, cpu_count=1, executor_backend='serial'))
+        pool.start()
+
+    completed = False
+    try:
+        file_paths, folder_order = _collect_source_files(config, paths, pool)
+        if offices:
+            patent_offices = set(config['patent_offices'])
+            file_paths = [path for path in file_paths if get_group_office(get_group_key(path)) in patent_offices]
+        pool.set_context(config=config, folder_order=folder_order)
+
+        # With family fusion, batches hold whole patent families
+        family_index = None
+        if file_paths and config.get('fusion_level') == 'family':
+            family_index = build_family_index(file_paths, config, pool, persist=False)
+        # Include/exclude lists (and the sample, for the configured input) select whole families with family fusion
+        if paths is None:
+            file_paths = select_source_files(file_paths, config, family_index)
+        else:
+            file_paths = filter_by_patent_lists(file_paths, config, family_index)
+        batches = get_file_batches(file_paths, config['batch_size'], family_index) if file_paths else []
+        # Pools running in this process hand the elements over directly
+        serialize = not pool.shared_memory
+        for virtual_patent in _iter_batch_results(pool, batches, (as_dict, serialize, profile), ordered,
+                                                  config['group_timeout']):
+            if serialize and not as_dict:
+                virtual_patent = etree.fromstring(virtual_patent)
+            yield virtual_patent
+        completed = True
+    finally:
+        if own_pool:
+            # A consumer that stopped early leaves batches in flight: do not wait for them
+            if completed:
+                pool.close()
+            else:
+                pool.terminate()
+        else:
+            # Drain the shared pool so its next user does not receive our results
+            while pool.busy:
+                pool.wait_result(timeout=0.1)
+                if config['group_timeout']:
+                    pool.expire_tasks(config['group_timeout'])
+
+
+def _iter_batch_results(pool, batches, task_options, ordered, task_timeout):
+    """
+    Fuse batches on the pool and yield their virtual patents
+
+    Args:
+        pool (WorkerPool): Started pool
+        batches (list): File batches
+        task_options (tuple): (as_dict, serialize, profile) arguments of fuse_batch_task
+        ordered (bool): Yield batches in input order
+        task_timeout (float): Seconds a patent group may take before its worker is restarted (0 = no timeout)
+
+    Yields:
+        Virtual patents as returned by fuse_batch_task
+    """
+    max_ahead = pool.processes * BATCHES_AHEAD_PER_WORKER
+    next_batch = 0
+    next_to_yield = 0
+    in_flight = {}
+    finished = {}
+
+    while next_batch < len(batches) or in_flight:
+        # Keep the workers busy, but never run too far ahead of the consumer
+        while (next_batch < len(batches) and pool.idle_workers()
+               and next_batch - next_to_yield < max_ahead):
+            task_id = pool.submit(fuse_batch_task, (batches[next_batch],) + task_options)
+            in_flight[task_id] = next_batch
+            next_batch += 1
+
+        results = [pool.wait_result(timeout=0.1)]
+        if task_timeout:
+            results.extend(pool.expire_tasks(task_timeout))
+        for result in results:
+            if result is None or result['task_id'] not in in_flight:
+                continue
+            batch_index = in_flight.pop(result['task_id'])
+            if result['error']:
+                logger.error(f"Fusing batch {batch_index} failed ({len(batches[batch_index])} files): {result['error']}")
+            finished[batch_index] = result['result'] or []
+
+        if ordered:
+            while next_to_yield in finished:
+                yield from finished.pop(next_to_yield)
+                next_to_yield += 1
+        else:
+            for batch_index in sorted(finished):
+                yield from finished.pop(batch_index)
+                next_to_yield += 1
@@ -0,0 +1,775 @@
+# Licensed under the MIT License. See LICENSE-CODE in the repository root for details.
+# Copyright (c) 2025 Christos Papadopoulos
+
+"""
+Worker Pool for PatentFusion
+
+This module provides the executor used by all pipeline phases. A single pool
+is created in PatentFusion.main and shared by discovery, parsing and saving, so
+workers start (and import their modules) once per run; phases hand per-phase data
+to the workers with set_context(). Unlike multiprocessing.Pool it dispatches tasks
+one at a time to idle workers, so the driver can pause dispatching under memory
+pressure (see MemoryGovernor in memory_manager.py). Every result carries the RSS of
+the worker that produced it, and workers that exceed their memory ceiling are
+replaced after their current task. Tasks call report_progress() at every step (e.g.
+per patent group); a worker that makes no progress within the task timeout is
+restarted and its task reported as failed.
+
+Three backends share the same interface and are selected with executor_backend in
+config.ini: 'process' (WorkerPool, one process per worker), 'thread' (ThreadWorkerPool,
+worker threads in the driver process; lxml releases the GIL while parsing) and
+'serial' (SerialWorkerPool, tasks run one by one in the driver, e.g. for profiling).
+"""
+
+import os
+import time
+import types
+import queue
+import logging
+import importlib
+import threading
+import contextlib
+import multiprocessing
+import psutil
+from constants import DEFAULT_EXECUTOR_BACKEND
+from stage_metrics import StageMetrics, drain_stage_metrics
+from profiling import get_worker_profiler
+from utils import get_affinity_cores
+
+logger = logging.getLogger(__name__)
+
+# Per-process context set by the pool initializer and set_context() (e.g. config, folder_order)
+_worker_context = {}
+
+# Message type used to update the context of a running worker
+_CONTEXT_UPDATE = '__context__'
+
+# Seconds an idle worker waits for a task before checking that its driver process is still alive
+PARENT_CHECK_SECONDS = 5
+
+# Progress heartbeat of the current worker (thread-local, so thread backend workers keep their own)
+_worker_local = threading.local()
+
+# Modules imported once by every pipeline worker, so the first task does not pay for them
+WARM_IMPORTS = ['lxml.etree', 'pandas', 'tqdm', 'xml_parser', 'data_processor', 'output_manager']
+
+
+def get_worker_context():
+    """
+    Get the context dictionary of the current worker process
+
+    Returns:
+        dict: Worker context populated by the pool initializer
+    """
+    return _worker_context
+
+
+def set_worker_context(**context):
+    """
+    Store values in the context of the current worker process
+
+    Args:
+        **context: Values to store (e.g. config=config, folder_order=folder_order)
+    """
+    _worker_context.update(context)
+
+
+def report_progress():
+    """
+    Tell the pool that the current task is still making progress
+
+    The task timeout measures the time since the last call, so a long batch only times
+    out when a single step (e.g. one patent group) hangs. Does nothing outside a worker.
+    """
+    heartbeat = getattr(_worker_local, 'heartbeat', None)
+    if heartbeat is not None:
+        heartbeat.value = time.time()
+
+
+def init_pipeline_worker(config):
+    """
+    Initialize a pipeline worker: import the processing modules and store the configuration
+
+    Args:
+        config (dict): Configuration dictionary
+    """
+    for module_name in WARM_IMPORTS:
+        importlib.import_module(module_name)
+    # Create the per-worker parser up front so the first task does not pay for it
+    importlib.import_module('xml_parser').get_xml_parser()
+    set_worker_context(config=config)
+
+
+def _run_chunk(func, items):
+    """Run a function over a chunk of map() items inside a worker"""
+    return [func(item) for item in items]
+
+
+def _execute_task(worker_id, task_id, func, args, process, rss_ceiling_bytes, collection_policy):
+    """
+    Run one task and build its result dictionary
+
+    Args:
+        worker_id (int): Worker slot number
+        task_id: Task identifier
+        func (callable): Task function
+        args (tuple): Arguments for the function
+        process (psutil.Process): Process whose RSS is reported
+        rss_ceiling_bytes (int): Per-process RSS ceiling (0 disables recycling)
+        collection_policy: Optional CollectionPolicy deciding when to run the garbage collector
+
+    Returns:
+        dict: Result dictionary (task_id, worker_id, result, error, failure, rss, duration, recycle, metrics)
+    """
+    start_time = time.time()
+    report_progress()
+    # Stage metrics recorded outside a task (e.g. by the driver of a serial pool) do not count
+    drain_stage_metrics()
+    # With --profile the task runs under the worker's profiler
+    profiler = get_worker_profiler(_worker_context.get('config'), worker_id)
+    if profiler is not None:
+        profiler.start_task()
+    try:
+        result = func(*args)
+        error = None
+    except Exception as e:
+        result = None
+        error = f"{type(e).__name__}: {e}"
+    if profiler is not None:
+        profiler.finish_task()
+
+    if collection_policy is not None:
+        collection_policy.maybe_collect()
+
+    rss = process.memory_info().rss
+    return {
+        'task_id': task_id,
+        'worker_id': worker_id,
+        'result': result,
+        'error': error,
+        'failure': 'error' if error else None,
+        'rss': rss,
+        'duration': time.time() - start_time,
+        'recycle': rss_ceiling_bytes > 0 and rss > rss_ceiling_bytes,
+        'metrics': drain_stage_metrics()
+    }
+
+
+def _worker_main(worker_id, task_queue, result_queue, initializer, initargs, rss_ceiling_bytes, collection_policy,
+                 cpu_core, context, heartbeat):
+    """
+    Main loop of a worker process (or worker thread of ThreadWorkerPool)
+
+    Args:
+        worker_id (int): Worker slot number
+        task_queue: Queue with (task_id, func, args) tuples for this worker (None stops the worker)
+        result_queue: Shared queue receiving result dictionaries
+        initializer (callable): Optional function run once at worker start
+        initargs (tuple): Arguments for the initializer
+        rss_ceiling_bytes (int): Per-process RSS ceiling (0 disables recycling)
+        collection_policy: Optional CollectionPolicy deciding when to run the garbage collector
+        cpu_core (int): Core to pin this worker to (None leaves scheduling to the OS)
+        context (dict): Worker context set by earlier set_context() calls (restored after a restart)
+        heartbeat: Shared value holding the time of the worker's last report_progress() call
+    """
+    _worker_local.heartbeat = heartbeat
+    if cpu_core is not None and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, {cpu_core})
+
+    if initializer is not None:
+        initializer(*initargs)
+    set_worker_context(**context)
+
+    process = psutil.Process(os.getpid())
+    parent_pid = os.getppid()
+    while True:
+        try:
+            task = task_queue.get(timeout=PARENT_CHECK_SECONDS)
+        except queue.Empty:
+            if os.getppid() != parent_pid:
+                # The driver was killed (e.g. a worker node of a coordinated run); do not linger as an orphan
+                break
+            continue
+        if task is None:
+            break
+
+        if task[0] == _CONTEXT_UPDATE:
+            set_worker_context(**task[1])
+            continue
+
+        task_id, func, args = task
+        message = _execute_task(worker_id, task_id, func, args, process, rss_ceiling_bytes, collection_policy)
+        result_queue.put(message)
+
+        if message['recycle']:
+            # Exit after the current task so fragmented (lxml) memory is returned to the OS
+            break
+
+
+class WorkerPool:
+    """
+    Process pool with per-worker task dispatch, RSS reporting and worker recycling
+    """
+
+    # Worker and queue types of the backend
+    worker_class = multiprocessing.Process
+    queue_class = multiprocessing.Queue
+
+    # True when workers run inside the driver process and report its (shared) RSS
+    shared_memory = False
+
+    def __init__(self, processes, initializer=None, initargs=(), rss_ceiling_gb=0, collection_policy=None, pin_workers=False):
+        """
+        Initialize the worker pool
+
+        Args:
+            processes (int): Number of worker processes
+            initializer (callable, optional): Function run once in each worker at start
+            initargs (tuple): Arguments for the initializer
+            rss_ceiling_gb (float): Per-process RSS ceiling in GB; workers above it are recycled (0 disables)
+            collection_policy (CollectionPolicy, optional): Garbage collection policy used inside workers
+            pin_workers (bool): Pin each worker slot to its own core of the process' affinity mask
+        """
+        self.processes = max(1, processes)
+        self.initializer = initializer
+        self.initargs = initargs
+        self.rss_ceiling_bytes = int(rss_ceiling_gb * 1024**3)
+        self.collection_policy = collection_policy
+        self.cores = get_affinity_cores() if pin_workers else None
+        self.context = {}
+        self.result_queue = self.queue_class()
+        self.workers = {}
+        self.busy = {}
+        self.worker_rss = {}
+        self.heartbeats = {}
+        self.recycled_workers = 0
+        self.timed_out_tasks = 0
+        self.stage_metrics = StageMetrics()
+        # Tasks of run() waiting for a worker (live progress)
+        self.queue_depth = 0
+        self._next_task_id = 0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
+        return False
+
+    def _create_heartbeat(self):
+        """Create the progress heartbeat shared with a worker"""
+        return multiprocessing.Value('d', 0.0, lock=False)
+
+    def _spawn_worker(self, worker_id):
+        """Start (or restart) the worker process of a slot"""
+        task_queue = self.queue_class()
+        heartbeat = self._create_heartbeat()
+        # A restarted worker keeps the core of its slot
+        cpu_core = self.cores[worker_id % len(self.cores)] if self.cores else None
+        process = self.worker_class(
+            target=_worker_main,
+            args=(worker_id, task_queue, self.result_queue, self.initializer, self.initargs,
+                  self.rss_ceiling_bytes, self.collection_policy, cpu_core, self.context, heartbeat),
+            daemon=True
+        )
+        process.start()
+        self.workers[worker_id] = (process, task_queue)
+        self.worker_rss[worker_id] = 0
+        self.heartbeats[worker_id] = heartbeat
+
+    def _stop_worker(self, worker_id):
+        """Stop the worker of a slot immediately (used when its task timed out)"""
+        process, _ = self.workers[worker_id]
+        process.terminate()
+        process.join(timeout=5)
+
+    def start(self):
+        """Start all worker processes"""
+        for worker_id in range(self.processes):
+            self._spawn_worker(worker_id)
+
+    def set_context(self, **context):
+        """
+        Update the context of all workers (including workers started later)
+
+        Workers apply the update before any task submitted after this call.
+
+        Args:
+            **context: Values to store in every worker's context (e.g. folder_order=folder_order)
+        """
+        self.context.update(context)
+        for process, task_queue in self.workers.values():
+            if process.is_alive():
+                task_queue.put((_CONTEXT_UPDATE, context))
+
+    def idle_workers(self, max_workers=None):
+        """
+        Get the worker slots that are not running a task
+
+        Args:
+            max_workers (int, optional): Only consider the first max_workers slots
+
+        Returns:
+            list: Idle worker ids
+        """
+        limit = self.processes if max_workers is None else max_workers
+        return [worker_id for worker_id in self.workers if worker_id not in self.busy and worker_id < limit]
+
+    def worker_pids(self):
+        """
+        Get the process ids of all live workers
+
+        Returns:
+            list: Worker process ids
+        """
+        return [process.pid for process, _ in self.workers.values() if process.is_alive()]
+
+    def submit(self, func, args, task_id=None, max_workers=None):
+        """
+        Send a task to an idle worker
+
+        Args:
+            func (callable): Module-level function to run in the worker
+            args (tuple): Arguments for the function
+            task_id (optional): Identifier returned with the result (auto-generated if None)
+            max_workers (int, optional): Only use the first max_workers slots
+
+        Returns:
+            Task identifier
+
+        Raises:
+            RuntimeError: If no worker is idle
+        """
+        idle = self.idle_workers(max_workers)
+        if not idle:
+            raise RuntimeError("No idle worker available")
+
+        if task_id is None:
+            task_id = self._next_task_id
+            self._next_task_id += 1
+
+        worker_id = idle[0]
+        self.workers[worker_id][1].put((task_id, func, args))
+        self.busy[worker_id] = (task_id, time.time())
+        return task_id
+
+    def wait_result(self, timeout=None):
+        """
+        Wait for the next finished task
+
+        Recycled workers are replaced, and workers that died while running a task
+        are restarted with the task reported as failed.
+
+        Args:
+            timeout (float, optional): Seconds to wait (None waits indefinitely)
+
+        Returns:
+            dict: Result dictionary (task_id, worker_id, result, error, failure, rss, duration, recycle, metrics),
+                or None if nothing finished within the timeout
+        """
+        try:
+            message = self.result_queue.get(timeout=timeout)
+        except queue.Empty:
+            return self._check_dead_workers()
+
+        worker_id = message['worker_id']
+        if self.busy.get(worker_id, (None,))[0] != message['task_id']:
+            # Late result of a task that already timed out (its slot has a new worker)
+            logger.debug(f"Ignoring result of timed out task {message['task_id']}")
+            return None
+        self.busy.pop(worker_id, None)
+        self.worker_rss[worker_id] = message['rss']
+        self._record_metrics(message)
+
+        if message['recycle']:
+            process, _ = self.workers[worker_id]
+            process.join(timeout=10)
+            self.recycled_workers += 1
+            logger.debug(f"Recycling worker {worker_id} (RSS {message['rss'] / 1024**3:.2f} GB above ceiling)")
+            self._spawn_worker(worker_id)
+
+        return message
+
+    def _record_metrics(self, message):
+        """Add the stage metrics and duration of a finished task to the pool's run totals"""
+        self.stage_metrics.record_task(message['worker_id'], message['duration'])
+        if message['metrics']:
+            self.stage_metrics.merge(message['metrics'])
+
+    def _check_dead_workers(self):
+        """Detect busy workers that exited without reporting a result"""
+        for worker_id, (task_id, _) in list(self.busy.items()):
+            process, _ = self.workers[worker_id]
+            if not process.is_alive():
+                exit_code = getattr(process, 'exitcode', None)
+                logger.error(f"Worker {worker_id} exited unexpectedly (exit code {exit_code}) while running task {task_id}")
+                self.busy.pop(worker_id)
+                self._spawn_worker(worker_id)
+                return {
+                    'task_id': task_id,
+                    'worker_id': worker_id,
+                    'result': None,
+                    'error': f"Worker exited unexpectedly (exit code {exit_code})",
+                    'failure': 'crash',
+                    'rss': 0,
+                    'duration': 0.0,
+                    'recycle': False,
+                    'metrics': None
+                }
+        return None
+
+    def expire_tasks(self, task_timeout):
+        """
+        Restart workers whose task made no progress within task_timeout
+
+        Args:
+            task_timeout (float): Seconds a task may run without calling report_progress()
+
+        Returns:
+            list: Failure result dictionaries of the expired tasks
+        """
+        expired = []
+        now = time.time()
+        for worker_id, (task_id, start_time) in list(self.busy.items()):
+            last_progress = max(start_time, self.heartbeats[worker_id].value)
+            if now - last_progress <= task_timeout:
+                continue
+
+            logger.error(f"Task {task_id} on worker {worker_id} made no progress for {task_timeout:.0f}s; restarting the worker")
+            self.busy.pop(worker_id)
+            self._stop_worker(worker_id)
+            self._spawn_worker(worker_id)
+            self.timed_out_tasks += 1
+            expired.append({
+                'task_id': task_id,
+                'worker_id': worker_id,
+                'result': None,
+                'error': f"No progress for {task_timeout:.0f} seconds",
+                'failure': 'timeout',
+                'rss': 0,
+                'duration': now - start_time,
+                'recycle': False,
+                'metrics': None
+            })
+        return expired
+
+    def run(self, tasks, on_result, governor=None, split_task=None, on_submit=None, on_poll=None, poll_interval=0.1,
+            max_workers=None, task_timeout=None):
+        """
+        Run tasks to completion, dispatching only while the memory governor allows it
+
+        Args:
+            tasks (iterable): Iterable of (func, args) tuples
+            on_result (callable): Called with every result dictionary; may return a list of follow-up
+                (func, args) tasks, which are dispatched before the remaining tasks
+            governor (MemoryGovernor, optional): Decides when dispatching must pause and the batch scale
+            split_task (callable, optional): split_task(task, scale) -> list of smaller tasks, used when
+                the governor shrinks the batch size
+            on_submit (callable, optional): Called with (task_id, func, args) for every dispatched task
+            on_poll (callable, optional): Called about every poll_interval seconds (e.g. progress refresh)
+            poll_interval (float): Seconds between polls while waiting for results
+            max_workers (int, optional): Only use the first max_workers slots (e.g. a tuned cpu_count)
+            task_timeout (float, optional): Seconds a task may run without reporting progress before its
+                worker is restarted and the task fails with failure 'timeout' (None or 0 disables)
+        """
+        pending = list(tasks)
+        pending.reverse()
+
+        while pending or self.busy:
+            # Dispatch to idle workers while memory allows it
+            while pending and self.idle_workers(max_workers):
+                # Never pause with nothing running: waiting could not release any memory
+                if governor is not None and not governor.can_dispatch(self.worker_pids()) and self.busy:
+                    break
+                func, args = pending.pop()
+                if split_task is not None and governor is not None and governor.batch_scale < 1.0:
+                    pieces = split_task((func, args), governor.batch_scale)
+                    if len(pieces) > 1:
+                        # Dispatch the first piece now and keep the rest at the front of the queue
+                        pending.extend(reversed(pieces[1:]))
+                        func, args = pieces[0]
+                task_id = self.submit(func, args, max_workers=max_workers)
+                if on_submit is not None:
+                    on_submit(task_id, func, args)
+            self.queue_depth = len(pending)
+
+            results = [self.wait_result(timeout=poll_interval)]
+            if task_timeout:
+                results.extend(self.expire_tasks(task_timeout))
+            for result in results:
+                if result is None:
+                    continue
+                if governor is not None:
+                    governor.record_task()
+                follow_up_tasks = on_result(result)
+                if follow_up_tasks:
+                    pending.extend(reversed(follow_up_tasks))
+            if on_poll is not None:
+                on_poll()
+        self.queue_depth = 0
+
+    def map(self, func, items, chunksize=None):
+        """
+        Apply a function to every item in parallel and return the results in order
+
+        Args:
+            func (callable): Module-level function taking one item
+            items (iterable): Items to process
+            chunksize (int, optional): Items per task (default: about four tasks per worker)
+
+        Returns:
+            list: Results in the order of items
+
+        Raises:
+            RuntimeError: If any task failed
+        """
+        items = list(items)
+        if chunksize is None:
+            chunksize = max(1, len(items) // (self.processes * 4))
+        chunks = [items[start:start + chunksize] for start in range(0, len(items), chunksize)]
+
+        chunk_results = {}
+        errors = []
+
+        def on_result(result):
+            if result['error']:
+                errors.append(result['error'])
+            else:
+                chunk_results[result['task_id']] = result['result']
+
+        # Task ids are assigned in submission order, which is chunk order
+        first_task_id = self._next_task_id
+        self.run([(_run_chunk, (func, chunk)) for chunk in chunks], on_result)
+        if errors:
+            raise RuntimeError(f"{len(errors)} of {len(chunks)} tasks failed: {errors[0]}")
+
+        return [result for task_id in range(first_task_id, first_task_id + len(chunks)) for result in chunk_results[task_id]]
+
+    def close(self):
+        """Stop all workers after their current task"""
+        for process, task_queue in self.workers.values():
+            if process.is_alive():
+                task_queue.put(None)
+        for process, _ in self.workers.values():
+            process.join(timeout=30)
+            if process.is_alive():
+                process.terminate()
+        self.workers.clear()
+
+    def terminate(self):
+        """Stop all workers immediately"""
+        for process, _ in self.workers.values():
+            if process.is_alive():
+                process.terminate()
+        for process, _ in self.workers.values():
+            process.join(timeout=5)
+        self.workers.clear()
+
+
+class ThreadWorkerPool(WorkerPool):
+    """
+    Worker pool running its workers as threads of the driver process
+
+    Avoids process start-up and pickling costs; parsing scales because lxml releases
+    the GIL (and fully on free-threaded Python builds). Workers share the driver's
+    memory, so they cannot be recycled and report the RSS of the whole process.
+    """
+
+    worker_class = threading.Thread
+    queue_class = queue.Queue
+    shared_memory = True
+
+    def __init__(self, processes, initializer=None, initargs=(), rss_ceiling_gb=0, collection_policy=None, pin_workers=False):
+        # A thread cannot return its memory to the OS, so recycling is disabled
+        super().__init__(processes, initializer, initargs, 0, collection_policy, pin_workers)
+
+    def _create_heartbeat(self):
+        """Create the progress heartbeat shared with a worker thread"""
+        return types.SimpleNamespace(value=0.0)
+
+    def _stop_worker(self, worker_id):
+        """Abandon the thread of a slot (threads cannot be killed; it exits after its current task)"""
+        _, task_queue = self.workers[worker_id]
+        task_queue.put(None)
+
+    def worker_pids(self):
+        """
+        Get the process ids of the workers (none besides the driver, which the governor already measures)
+
+        Returns:
+            list: Empty list
+        """
+        return []
+
+    def close(self):
+        """Stop all worker threads after their current task"""
+        self._stop_workers(timeout=30)
+
+    def terminate(self):
+        """Stop all worker threads after their current task (threads cannot be killed)"""
+        self._stop_workers(timeout=5)
+
+    def _stop_workers(self, timeout):
+        """Ask every worker thread to exit and wait for it"""
+        for thread, task_queue in self.workers.values():
+            if thread.is_alive():
+                task_queue.put(None)
+        for thread, _ in self.workers.values():
+            thread.join(timeout=timeout)
+        self.workers.clear()
+
+
+class SerialWorkerPool(WorkerPool):
+    """
+    Worker pool running every task in the driver process, one at a time
+
+    Has no start-up cost and keeps all work in one process and thread, which makes
+    small runs, debugging and profiling simple. Task timeouts cannot interrupt the
+    driver and are not enforced.
+    """
+
+    shared_memory = True
+
+    def __init__(self, processes=1, initializer=None, initargs=(), rss_ceiling_gb=0, collection_policy=None, pin_workers=False):
+        super().__init__(1, initializer, initargs, 0, collection_policy, False)
+        self.process = psutil.Process(os.getpid())
+        self.queued_task = None
+
+    def start(self):
+        """Initialize the driver process as the only worker"""
+        if self.initializer is not None:
+            self.initializer(*self.initargs)
+        set_worker_context(**self.context)
+        self.workers = {0: None}
+
+    def set_context(self, **context):
+        """
+        Update the worker context (the driver's own)
+
+        Args:
+            **context: Values to store in the context
+        """
+        self.context.update(context)
+        set_worker_context(**context)
+
+    def worker_pids(self):
+        """
+        Get the process ids of the workers (none besides the driver, which the governor already measures)
+
+        Returns:
+            list: Empty list
+        """
+        return []
+
+    def submit(self, func, args, task_id=None, max_workers=None):
+        """
+        Queue a task; it runs on the next wait_result() call
+
+        Args:
+            func (callable): Function to run
+            args (tuple): Arguments for the function
+            task_id (optional): Identifier returned with the result (auto-generated if None)
+            max_workers (int, optional): Ignored (there is a single worker)
+
+        Returns:
+            Task identifier
+
+        Raises:
+            RuntimeError: If a task is already queued
+        """
+        if self.busy:
+            raise RuntimeError("No idle worker available")
+
+        if task_id is None:
+            task_id = self._next_task_id
+            self._next_task_id += 1
+
+        self.queued_task = (task_id, func, args)
+        self.busy[0] = (task_id, time.time())
+        return task_id
+
+    def wait_result(self, timeout=None):
+        """
+        Run the queued task
+
+        Args:
+            timeout (float, optional): Ignored (the task runs to completion)
+
+        Returns:
+            dict: Result dictionary, or None if no task is queued
+        """
+        if self.queued_task is None:
+            return None
+
+        task_id, func, args = self.queued_task
+        self.queued_task = None
+        message = _execute_task(0, task_id, func, args, self.process, 0, self.collection_policy)
+        self.busy.pop(0, None)
+        self.worker_rss[0] = message['rss']
+        self._record_metrics(message)
+        return message
+
+    def close(self):
+        """Release the worker slot"""
+        self.workers.clear()
+
+    def terminate(self):
+        """Release the worker slot and drop a queued task"""
+        self.queued_task = None
+        self.busy.clear()
+        self.workers.clear()
+
+
+# Executor backends selectable with executor_backend in config.ini
+EXECUTOR_BACKENDS = {
+    'process': WorkerPool,
+    'thread': ThreadWorkerPool,
+    'serial': SerialWorkerPool
+}
+
+
+def create_executor(processes, backend=DEFAULT_EXECUTOR_BACKEND, **options):
+    """
+    Create an (unstarted) worker pool of the selected backend
+
+    Args:
+        processes (int): Number of workers
+        backend (str): 'process', 'thread' or 'serial'
+        **options: WorkerPool options (initializer, initargs, rss_ceiling_gb, collection_policy, pin_workers)
+
+    Returns:
+        WorkerPool: Pool of the selected backend
+
+    Raises:
+        ValueError: If the backend is unknown
+    """
+    if backend not in EXECUTOR_BACKENDS:
+        raise ValueError(f"Unknown executor backend: {backend}. Must be one of: {', '.join(EXECUTOR_BACKENDS)}")
+    return EXECUTOR_BACKENDS[backend](processes, **options)
+
+
+@contextlib.contextmanager
+def use_pool(pool, create_pool):
+    """
+    Use a shared worker pool, or a temporary one if none is given
+
+    Lets phase functions run inside the run-wide pool created by PatentFusion.main
+    while still working standalone (e.g. from the command line tools).
+
+    Args:
+        pool (WorkerPool): Shared pool, or None
+        create_pool (callable): Returns an unstarted pool to use (and close) when pool is None
+
+    Yields:
+        WorkerPool: The shared pool or a started temporary pool
+    """
+    if pool is not None:
+        yield pool
+        return
+
+    with create_pool() as temporary_pool:
+        yield temporary_pool
@@ -11,13 +11,62 @@ according to configuration flags.
 import os
 import re
 import copy
+import time
 import logging
+import threading
 from lxml import etree
 from utils import truncate_text
+from archive_source import is_archive_member_path, prefetch_archive_members, release_prefetched_members, read_archive_member
+from archive_source import get_source_file_size
+from worker_pool import report_progress
+from file_system import get_group_key, get_group_office
+from family_index import read_group_family_id, get_family_key
+from merge_planner import scan_sections, plan_merge, build_partial_document, get_field_order
+from large_documents import is_large_document, parse_document_skeleton
+from stage_metrics import get_stage_metrics, StageTimer
+from profiling import count_profiled_group
+from constants import FIELD_PRIORITY_SECTIONS, FIELD_PRIORITY_ELEMENTS, FIELD_PRIORITY_ATTRIBUTES
 
 logger = logging.getLogger(__name__)
 
-def process_file_batch(file_batch, folder_order, batch_id, config, test_patents_set=None):
+# Per-worker caches (parser instance and compiled XPath expressions). lxml parsers and
+# XPath evaluators must not be shared between threads, so the caches are thread-local.
+_worker_caches = threading.local()
+
+def get_xml_parser():
+    """
+    Get the XML parser of the current worker, creating it on first use
+    
+    Returns:
+        etree.XMLParser: Recovering XML parser reused for all files parsed by this worker
+    """
+    parser = getattr(_worker_caches, 'parser', None)
+    if parser is None:
+        parser = etree.XMLParser(recover=True)
+        _worker_caches.parser = parser
+    return parser
+
+def get_compiled_xpath(expression):
+    """
+    Get a compiled XPath expression from the current worker's cache
+    
+    Args:
+        expression (str): XPath expression
+        
+    Returns:
+        etree.XPath: Compiled expression, called with the element to evaluate on
+    """
+    compiled_xpaths = getattr(_worker_caches, 'xpaths', None)
+    if compiled_xpaths is None:
+        compiled_xpaths = {}
+        _worker_caches.xpaths = compiled_xpaths
+    compiled = compiled_xpaths.get(expression)
+    if compiled is None:
+        compiled = etree.XPath(expression)
+        compiled_xpaths[expression] = compiled
+    return compiled
+
+def process_file_batch(file_batch, folder_order, batch_id, config, test_patents_set=None, failed_groups=None):
     """
     Process a batch of files and create virtual patents with full XML structure preservation
     
@@ -26,66 +75,175 @@ def process_file_batch(file_batch, folder_order, batch_id, config, test_patents_
         folder_order (dict): Dictionary mapping folder names to order indices
         batch_id (int): Batch identifier for logging
         config (dict): Configuration dictionary
-        test_patents_set (set, optional): Set of patents to skip (test dataset)
+        test_patents_set (set, optional): Group keys of patents to skip (test dataset)
+        failed_groups (list, optional): Receives (group_key, file_list, error) for every
+            patent group whose virtual patent could not be created
         
     Returns:
         list: List of virtual patent XML elements
     """
-    # Group files by patent number first
+    # Group files by patent office and number first
     patent_groups = group_files_by_patent(file_batch, test_patents_set)
+    family_fusion = config.get('fusion_level') == 'family'
+    if family_fusion:
+        # One virtual patent per patent family (batches hold whole families, see family_index.py)
+        patent_groups = group_patent_families(patent_groups)
+    
+    # Decompress archive members of this batch in one pass per archive
+    prefetch_archive_members(file_batch)
     
     # Process each patent group to create virtual patents
     virtual_patents = []
     
-    for patent_number, file_list in patent_groups.items():
-        try:
-            # Sort files by global priority
-            sorted_files = sort_files_by_priority(file_list, config['global_priority'])
-            
-            if sorted_files:
-                # Create virtual patent from sorted files
-                virtual_patent_xml = create_virtual_patent(sorted_files, folder_order, config)
-                if virtual_patent_xml is not None:
-                    virtual_patents.append(virtual_patent_xml)
-                    
-        except Exception as e:
-            logger.error(f"Error processing patent group {patent_number}: {e}")
-            continue
+    try:
+        for group_key, file_list in patent_groups.items():
+            # The worker pool's task timeout applies to each patent group
+            report_progress()
+            try:
+                # Sort files by global priority (family members by patent office first)
+                if family_fusion:
+                    sorted_files = sort_family_files(file_list, config)
+                else:
+                    sorted_files = sort_files_by_priority(file_list, config['global_priority'])
+                
+                if sorted_files:
+                    # Create virtual patent from sorted files
+                    virtual_patent_xml = create_virtual_patent(sorted_files, folder_order, config)
+                    if virtual_patent_xml is not None:
+                        if family_fusion:
+                            add_family_members(virtual_patent_xml, group_key, sorted_files)
+                        virtual_patents.append(virtual_patent_xml)
+                count_profiled_group()
+                        
+            except Exception as e:
+                logger.error(f"Error processing patent group {group_key}: {e}")
+                if failed_groups is not None:
+                    failed_groups.append((group_key, file_list, f"{type(e).__name__}: {e}"))
+                continue
+    finally:
+        # Drop any prefetched members that were not consumed (e.g. kind codes not in priority list)
+        release_prefetched_members()
     
     return virtual_patents
 
 def group_files_by_patent(file_batch, test_patents_set=None):
     """
-    Group files by patent number extracted from filename
+    Group files by patent office and number extracted from filename
     
     Args:
         file_batch (list): List of file paths
-        test_patents_set (set, optional): Set of patents to skip
+        test_patents_set (set, optional): Group keys of patents to skip
         
     Returns:
-        dict: Dictionary mapping patent_number -> list of file paths
+        dict: Dictionary mapping group key (e.g. 'EP-2615747') -> list of file paths
     """
     patent_groups = {}
     
     for file_path in file_batch:
-        try:
-            file_name = os.path.basename(file_path)
-            patent_number = file_name.split(".")[0].split("-")[1]
-            
-            # Skip if in test dataset
-            if test_patents_set and patent_number in test_patents_set:
-                continue
-                
-            if patent_number not in patent_groups:
-                patent_groups[patent_number] = []
-            patent_groups[patent_number].append(file_path)
-            
-        except Exception as e:
-            logger.debug(f"Could not extract patent number from {file_name}: {e}")
+        group_key = get_group_key(file_path)
+        if group_key == 'unparseable':
+            logger.debug(f"Could not extract patent number from {os.path.basename(file_path)}")
+            continue
+        
+        # Skip if in test dataset
+        if test_patents_set and group_key in test_patents_set:
             continue
+        
+        if group_key not in patent_groups:
+            patent_groups[group_key] = []
+        patent_groups[group_key].append(file_path)
     
     return patent_groups
 
+def group_patent_families(patent_groups):
+    """
+    Combine the patent groups of a batch into their patent families
+    
+    Args:
+        patent_groups (dict): Dictionary mapping group key -> list of file paths
+        
+    Returns:
+        dict: Dictionary mapping family key (e.g. 'FAMILY-17', or the group key for
+            groups without a family-id) -> list of file paths of all its groups
+    """
+    patent_families = {}
+    for group_key, file_list in patent_groups.items():
+        family_id = read_group_family_id(file_list)
+        family_key = get_family_key(family_id) if family_id else group_key
+        patent_families.setdefault(family_key, []).extend(file_list)
+    return patent_families
+
+def sort_family_files(file_list, config):
+    """
+    Sort the files of a patent family: publications by patent office order, and the
+    files of every publication by global priority
+    
+    Args:
+        file_list (list): File paths of the patent groups of one family
+        config (dict): Configuration dictionary (family_office_order, patent_offices, global_priority)
+        
+    Returns:
+        list: Sorted list of file paths (highest priority first), only including files with kind codes in global_priority
+    """
+    office_order = config.get('family_office_order') or config['patent_offices']
+    
+    def get_office_rank(group_key):
+        office = get_group_office(group_key)
+        return (office_order.index(office) if office in office_order else len(office_order), group_key)
+    
+    patent_groups = group_files_by_patent(file_list)
+    sorted_files = []
+    for group_key in sorted(patent_groups, key=get_office_rank):
+        sorted_files.extend(sort_files_by_priority(patent_groups[group_key], config['global_priority']))
+    return sorted_files
+
+def add_family_members(virtual_patent, family_key, sorted_files):
+    """
+    Record the family and the publications a family-level virtual patent was fused from
+    
+    Args:
+        virtual_patent: Virtual patent XML element
+        family_key (str): Family key (names the output files, removed before output like the other metadata)
+        sorted_files (list): File paths the virtual patent was created from, in priority order
+    """
+    virtual_patent.set('_family_key', family_key)
+    members = []
+    for file_path in sorted_files:
+        group_key = get_group_key(file_path)
+        if group_key not in members:
+            members.append(group_key)
+    virtual_patent.set('family-members', ','.join(members))
+
+def parse_patent_file(file_path, parser):
+    """
+    Parse a patent XML file from disk or directly from an archive member
+    
+    Args:
+        file_path (str): File path or virtual archive member path
+        parser: lxml XMLParser instance
+        
+    Returns:
+        etree.ElementTree: Parsed XML tree
+    """
+    if is_archive_member_path(file_path):
+        return etree.ElementTree(etree.fromstring(read_archive_member(file_path), parser))
+    return etree.parse(file_path, parser)
+
+def read_patent_file(file_path):
+    """
+    Read the raw bytes of a patent XML file from disk or from an archive member
+    
+    Args:
+        file_path (str): File path or virtual archive member path
+        
+    Returns:
+        bytes: File content
+    """
+    if is_archive_member_path(file_path):
+        return read_archive_member(file_path)
+    with open(file_path, 'rb') as f:
+        return f.read()
+
 def sort_files_by_priority(file_list, global_priority):
     """
     Sort files by kind code priority according to global priority list
@@ -124,6 +282,9 @@ def create_virtual_patent(sorted_files, folder_order, config):
     """
     Create a virtual patent XML from sorted files by priority
     
+    The time spent in each stage (read, parse, deepcopy, merge, finalize, filter) is
+    recorded in the stage metrics of the running task (see stage_metrics.py).
+    
     Args:
         sorted_files (list): List of file paths sorted by priority (highest first)
         folder_order (dict): Dictionary mapping folder names to order indices
@@ -137,15 +298,33 @@ def create_virtual_patent(sorted_files, folder_order, config):
     
     # Start with the highest priority file
     base_file = sorted_files[0]
+    metrics = get_stage_metrics()
+    timer = StageTimer(metrics)
     
     try:
         # Parse the base file and create the virtual patent structure
-        parser = etree.XMLParser(recover=True)
-        base_tree = etree.parse(base_file, parser)
-        base_root = base_tree.getroot()
+        parser = get_xml_parser()
+        file_kind_codes = [extract_kind_code_from_file(file_path) for file_path in sorted_files]
+        # Oversized files are parsed without their large sections, which are streamed into
+        # the outputs when they are written (see large_documents.py)
+        large_group = any(is_large_document(file_path, config) for file_path in sorted_files)
+        if large_group:
+            base_root = _parse_group_file(base_file, parser, config, metrics)
+        else:
+            contents = _read_group_files(sorted_files, metrics)
+            timer.lap('read')
+            if len(sorted_files) > 1:
+                # Scan all files of the group first, so only the sections that can end up
+                # in the virtual patent are parsed from the lower-priority files
+                scans = [scan_sections(content) if content is not None else None for content in contents]
+                merge_plan = plan_merge(file_kind_codes, scans, config)
+            base_root = etree.fromstring(contents[0], parser)
+        parsed_files = [(file_kind_codes[0], base_root)]
+        timer.lap('parse')
         
         # Create a copy of the base XML structure
         virtual_patent = copy.deepcopy(base_root)
+        timer.lap('deepcopy')
         
         # Add metadata for original directory structure (will be removed before final output)
         virtual_patent.set('_source_file_path', base_file)
@@ -159,26 +338,41 @@ def create_virtual_patent(sorted_files, folder_order, config):
         
         # Add kind-source attribute to direct children of base patent
         add_kind_source_to_direct_children(virtual_patent, base_kind_code)
+        timer.lap('merge')
         
         # Merge additional files if any
-        for additional_file in sorted_files[1:]:
+        for index in range(1, len(sorted_files)):
+            additional_file = sorted_files[index]
+            if not large_group and contents[index] is None:
+                continue
             try:
-                additional_tree = etree.parse(additional_file, parser)
-                additional_root = additional_tree.getroot()
+                if large_group:
+                    additional_root = _parse_group_file(additional_file, parser, config, metrics)
+                else:
+                    content = contents[index]
+                    if merge_plan[index] is not None:
+                        content = build_partial_document(content, scans[index], merge_plan[index])
+                    additional_root = etree.fromstring(content, parser)
+                timer.lap('parse')
                 
                 # Extract kind code
-                kind_code = extract_kind_code_from_file(additional_file)
+                kind_code = file_kind_codes[index]
                 if kind_code and kind_code not in kind_codes:
                     kind_codes.append(kind_code)
-                
+                parsed_files.append((kind_code, additional_root))
                 
                 # Merge new tags from additional file
                 merge_xml_elements(virtual_patent, additional_root, config, kind_code)
+                timer.lap('merge')
                 
             except Exception as e:
                 logger.error(f"Error merging file {additional_file}: {e}")
                 continue
         
+        # Take the fields with a field-specific priority from their highest priority kind
+        apply_field_priorities(virtual_patent, parsed_files, config)
+        timer.lap('merge')
+        
         # Update kind attributes and elements for all virtual patents
         update_kind_to_kind_merging(virtual_patent, kind_codes)
         
@@ -187,16 +381,141 @@ def create_virtual_patent(sorted_files, folder_order, config):
         
         # Reorder XML elements according to specification
         reorder_xml_elements(virtual_patent)
+        timer.lap('finalize')
         
         # Apply config-based filtering to remove unwanted elements
         filter_virtual_patent_by_config(virtual_patent, config)
+        timer.lap('filter')
         
+        metrics.count('patents_fused')
+        metrics.add_latency('fuse', get_group_key(base_file), timer.elapsed())
         return virtual_patent
         
     except Exception as e:
         logger.error(f"Error creating virtual patent from {base_file}: {e}")
         return None
 
+def _parse_group_file(file_path, parser, config, metrics):
+    """Parse a file of a group with an oversized file: oversized files without their large sections"""
+    start_time = time.perf_counter()
+    if is_large_document(file_path, config):
+        root = parse_document_skeleton(file_path)
+    else:
+        root = parse_patent_file(file_path, parser).getroot()
+    # These files are read while they are parsed
+    metrics.add_file(file_path, time.perf_counter() - start_time, get_source_file_size(file_path))
+    return root
+
+def _read_group_files(sorted_files, metrics):
+    """Read the files of a group (None for lower-priority files that cannot be read), recording each file's read time"""
+    contents = []
+    for index, file_path in enumerate(sorted_files):
+        start_time = time.perf_counter()
+        content = read_patent_file(file_path) if index == 0 else _read_additional_file(file_path)
+        if content is not None:
+            metrics.add_file(file_path, time.perf_counter() - start_time, len(content))
+        contents.append(content)
+    return contents
+
+def _read_additional_file(file_path):
+    """Read a lower-priority file of a group, or None if it cannot be read (the file is then left out)"""
+    try:
+        return read_patent_file(file_path)
+    except Exception as e:
+        logger.error(f"Error merging file {file_path}: {e}")
+        return None
+
+def _get_content_children(parent, tag):
+    """Get the children of an element with a tag that have content (as merge_element_recursive counts content)"""
+    if parent is None:
+        return []
+    return [child for child in parent
+            if child.tag == tag and ((child.text and child.text.strip()) or child.attrib or len(child) > 0)]
+
+def _replace_children(parent, tag, new_children, kind_code=None):
+    """Replace the children of an element with a tag, keeping their position (new elements are appended otherwise)"""
+    old_children = [child for child in parent if child.tag == tag]
+    position = parent.index(old_children[0]) if old_children else len(parent)
+    bibliographic_data = parent.find('bibliographic-data')
+    if not old_children and bibliographic_data is not None:
+        # New Level 1 sections go after the bibliographic data
+        position = parent.index(bibliographic_data) + 1
+    for child in old_children:
+        parent.remove(child)
+    for offset, child in enumerate(new_children):
+        if kind_code is not None:
+            child.set('kind-source', kind_code)
+        parent.insert(position + offset, child)
+
+def apply_field_priorities(virtual_patent, parsed_files, config):
+    """
+    Apply the field-specific priorities (<field>_priority in [vpatent_creation])
+    
+    A field with a priority is taken from the file of the first listed kind that has it,
+    instead of the highest global priority file. Kinds that are not listed do not
+    contribute to the field; if no listed kind has the field, it is left out. Abstracts
+    are merged from all listed kinds in field priority order (with duplicate detection).
+    
+    Args:
+        virtual_patent: Virtual patent XML element (after merging)
+        parsed_files (list): (kind_code, root element) of every merged file, base file first
+        config (dict): Configuration dictionary
+    """
+    field_priorities = config.get('field_priorities') or {}
+    if not field_priorities:
+        return
+    kind_codes = [kind_code for kind_code, _ in parsed_files]
+    
+    for field, field_priority in field_priorities.items():
+        order = get_field_order(kind_codes, field_priority)
+        
+        if field in FIELD_PRIORITY_ATTRIBUTES:
+            attribute = FIELD_PRIORITY_ATTRIBUTES[field]
+            winner = next((index for index in order if parsed_files[index][1].get(attribute, '').strip()), None)
+            if winner:
+                virtual_patent.set(attribute, parsed_files[winner][1].get(attribute))
+            continue
+        
+        if field in FIELD_PRIORITY_SECTIONS:
+            tag = FIELD_PRIORITY_SECTIONS[field]
+            parent_path = None
+        elif field in FIELD_PRIORITY_ELEMENTS:
+            parent_path, tag = ('bibliographic-data/' + FIELD_PRIORITY_ELEMENTS[field]).rsplit('/', 1)
+        else:
+            continue
+        
+        target = virtual_patent if parent_path is None else virtual_patent.find(parent_path)
+        if target is None:
+            continue
+        
+        if tag == 'abstract':
+            # Abstracts of all listed kinds, highest field priority first, without duplicates
+            abstracts = []
+            for index in order:
+                kind_code, root = parsed_files[index]
+                for abstract in _get_content_children(root, tag):
+                    if not any(is_duplicate_element(kept, abstract) for kept, _ in abstracts):
+                        abstracts.append((abstract, kind_code))
+            new_children = []
+            for abstract, kind_code in abstracts:
+                new_child = copy.deepcopy(abstract)
+                new_child.set('kind-source', kind_code)
+                new_children.append(new_child)
+            _replace_children(target, tag, new_children)
+            continue
+        
+        winner = next((index for index in order if _get_content_children(
+            parsed_files[index][1] if parent_path is None else parsed_files[index][1].find(parent_path), tag)), None)
+        if winner == 0:
+            # The base file already provided the field
+            continue
+        if winner is None:
+            _replace_children(target, tag, [])
+            continue
+        kind_code, root = parsed_files[winner]
+        source = root if parent_path is None else root.find(parent_path)
+        _replace_children(target, tag, [copy.deepcopy(child) for child in _get_content_children(source, tag)], kind_code)
+
 def filter_multi_language_content(virtual_patent, lang_setting):
     """
     Filter multi-language content based on language settings
@@ -226,7 +545,7 @@ def filter_multi_language_content(virtual_patent, lang_setting):
     multi_lang_elements = ['abstract', 'description', 'claims', 'invention-title']
     
     for element_type in multi_lang_elements:
-        elements = virtual_patent.xpath(f".//{element_type}")
+        elements = get_compiled_xpath(f".//{element_type}")(virtual_patent)
         
         if len(elements) <= 1:
             continue  # Single element, no filtering needed
@@ -286,7 +605,7 @@ def get_primary_language(virtual_patent):
     
     # Find most common language in the document
     lang_counts = {}
-    for elem in virtual_patent.xpath(".//*[@lang]"):
+    for elem in get_compiled_xpath(".//*[@lang]")(virtual_patent):
         lang = elem.get('lang', '').upper()
         if lang:
             lang_counts[lang] = lang_counts.get(lang, 0) + 1
@@ -341,10 +660,10 @@ def filter_virtual_patent_by_config(virtual_patent, config):
         if 'country' in virtual_patent.attrib:
             del virtual_patent.attrib['country']
         # Remove country attributes from all elements throughout the document
-        for elem in virtual_patent.xpath(".//*[@country]"):
+        for elem in get_compiled_xpath(".//*[@country]")(virtual_patent):
             del elem.attrib['country']
         # Remove <country> elements throughout the document
-        for elem in virtual_patent.xpath(".//country"):
+        for elem in get_compiled_xpath(".//country")(virtual_patent):
             elem.getparent().remove(elem)
     
     if not config.get('parse_date', True):
@@ -352,10 +671,10 @@ def filter_virtual_patent_by_config(virtual_patent, config):
         if 'date' in virtual_patent.attrib:
             del virtual_patent.attrib['date']
         # Remove date attributes from all elements throughout the document
-        for elem in virtual_patent.xpath(".//*[@date]"):
+        for elem in get_compiled_xpath(".//*[@date]")(virtual_patent):
             del elem.attrib['date']
         # Remove <date> elements throughout the document
-        for elem in virtual_patent.xpath(".//date"):
+        for elem in get_compiled_xpath(".//date")(virtual_patent):
             elem.getparent().remove(elem)
     
     if not config.get('parse_family_id', True):
@@ -363,10 +682,10 @@ def filter_virtual_patent_by_config(virtual_patent, config):
         if 'family-id' in virtual_patent.attrib:
             del virtual_patent.attrib['family-id']
         # Remove family-id attributes from all elements throughout the document
-        for elem in virtual_patent.xpath(".//*[@family-id]"):
+        for elem in get_compiled_xpath(".//*[@family-id]")(virtual_patent):
             del elem.attrib['family-id']
         # Remove <family-id> elements throughout the document
-        for elem in virtual_patent.xpath(".//family-id"):
+        for elem in get_compiled_xpath(".//family-id")(virtual_patent):
             elem.getparent().remove(elem)
     
     if not config.get('parse_file_reference_id', True):
@@ -374,10 +693,10 @@ def filter_virtual_patent_by_config(virtual_patent, config):
         if 'file-reference-id' in virtual_patent.attrib:
             del virtual_patent.attrib['file-reference-id']
         # Remove file-reference-id attributes from all elements throughout the document
-        for elem in virtual_patent.xpath(".//*[@file-reference-id]"):
+        for elem in get_compiled_xpath(".//*[@file-reference-id]")(virtual_patent):
             del elem.attrib['file-reference-id']
         # Remove <file-reference-id> elements throughout the document
-        for elem in virtual_patent.xpath(".//file-reference-id"):
+        for elem in get_compiled_xpath(".//file-reference-id")(virtual_patent):
             elem.getparent().remove(elem)
     
     if not config.get('parse_date_produced', True):
@@ -385,10 +704,10 @@ def filter_virtual_patent_by_config(virtual_patent, config):
         if 'date-produced' in virtual_patent.attrib:
             del virtual_patent.attrib['date-produced']
         # Remove date-produced attributes from all elements throughout the document
-        for elem in virtual_patent.xpath(".//*[@date-produced]"):
+        for elem in get_compiled_xpath(".//*[@date-produced]")(virtual_patent):
             del elem.attrib['date-produced']
         # Remove <date-produced> elements throughout the document
-        for elem in virtual_patent.xpath(".//date-produced"):
+        for elem in get_compiled_xpath(".//date-produced")(virtual_patent):
             elem.getparent().remove(elem)
     
     # Handle language filtering
@@ -397,59 +716,59 @@ def filter_virtual_patent_by_config(virtual_patent, config):
         filter_multi_language_content(virtual_patent, lang_setting)
     # Remove text content elements if disabled
     if not config.get('parse_abstract', True):
-        for elem in virtual_patent.xpath(".//abstract"):
+        for elem in get_compiled_xpath(".//abstract")(virtual_patent):
             elem.getparent().remove(elem)
     
     if not config.get('parse_claims', True):
-        for elem in virtual_patent.xpath(".//claims"):
+        for elem in get_compiled_xpath(".//claims")(virtual_patent):
             elem.getparent().remove(elem)
     
     if not config.get('parse_description', True):
-        for elem in virtual_patent.xpath(".//description"):
+        for elem in get_compiled_xpath(".//description")(virtual_patent):
             elem.getparent().remove(elem)
     
     if not config.get('parse_title', True):
-        for elem in virtual_patent.xpath(".//invention-title"):
+        for elem in get_compiled_xpath(".//invention-title")(virtual_patent):
             elem.getparent().remove(elem)
     
     # Remove classification elements if disabled
     if not config.get('parse_ipcr', True):
-        for elem in virtual_patent.xpath(".//classifications-ipcr | .//classification-ipcr"):
+        for elem in get_compiled_xpath(".//classifications-ipcr | .//classification-ipcr")(virtual_patent):
             elem.getparent().remove(elem)
     
     if not config.get('parse_cpc', True):
-        for elem in virtual_patent.xpath(".//classifications-cpc | .//classification-cpc"):
+        for elem in get_compiled_xpath(".//classifications-cpc | .//classification-cpc")(virtual_patent):
             elem.getparent().remove(elem)
     
     if not config.get('parse_main_classification', True):
-        for elem in virtual_patent.xpath(".//main-classification"):
+        for elem in get_compiled_xpath(".//main-classification")(virtual_patent):
             elem.getparent().remove(elem)
     
     if not config.get('parse_further_classification', True):
-        for elem in virtual_patent.xpath(".//further-classification"):
+        for elem in get_compiled_xpath(".//further-classification")(virtual_patent):
             elem.getparent().remove(elem)
     
     # Remove party elements if disabled
     if not config.get('parse_applicants', True):
-        for elem in virtual_patent.xpath(".//applicants"):
+        for elem in get_compiled_xpath(".//applicants")(virtual_patent):
             elem.getparent().remove(elem)
     
     if not config.get('parse_inventors', True):
-        for elem in virtual_patent.xpath(".//inventors"):
+        for elem in get_compiled_xpath(".//inventors")(virtual_patent):
             elem.getparent().remove(elem)
     
     if not config.get('parse_agents', True):
-        for elem in virtual_patent.xpath(".//agents"):
+        for elem in get_compiled_xpath(".//agents")(virtual_patent):
             elem.getparent().remove(elem)
     
     # Remove citation elements if disabled
     if not config.get('parse_citations', True):
-        for elem in virtual_patent.xpath(".//citations"):
+        for elem in get_compiled_xpath(".//citations")(virtual_patent):
             elem.getparent().remove(elem)
     
     # Remove drawings if disabled
     if not config.get('parse_drawings', True):
-        for elem in virtual_patent.xpath(".//drawings"):
+        for elem in get_compiled_xpath(".//drawings")(virtual_patent):
             elem.getparent().remove(elem)
 
 def extract_kind_code_from_file(file_path):
@@ -477,7 +796,7 @@ def transform_ucid_attributes(xml_element):
         xml_element: XML element to transform
     """
     # Transform in patent-document element
-    patent_doc = xml_element.xpath("//patent-document[@ucid]")
+    patent_doc = get_compiled_xpath("//patent-document[@ucid]")(xml_element)
     for elem in patent_doc:
         ucid = elem.get('ucid', '')
         if ucid:
@@ -566,7 +885,7 @@ def update_kind_to_kind_merging(xml_element, kind_codes):
     kind_merging_value = ','.join(kind_codes)
     
     # Update in patent-document element
-    patent_doc = xml_element.xpath("//patent-document[@kind]")
+    patent_doc = get_compiled_xpath("//patent-document[@kind]")(xml_element)
     for elem in patent_doc:
         # Always set kind="VP" for virtual patents
         elem.set('kind', 'VP')
@@ -907,15 +1226,15 @@ def reorder_xml_elements(xml_element):
     """
     try:
         # Find elements to move
-        dates_elem = xml_element.xpath(".//dates-of-public-availability")
-        search_report_elem = xml_element.xpath(".//search-report-data")
-        copyright_elem = xml_element.xpath(".//copyright")
+        dates_elem = get_compiled_xpath(".//dates-of-public-availability")(xml_element)
+        search_report_elem = get_compiled_xpath(".//search-report-data")(xml_element)
+        copyright_elem = get_compiled_xpath(".//copyright")(xml_element)
         
         # Move <dates-of-public-availability> between <priority-claims> and <technical-data>
         if dates_elem:
             dates_element = dates_elem[0]
-            priority_claims = xml_element.xpath(".//priority-claims")
-            technical_data = xml_element.xpath(".//technical-data")
+            priority_claims = get_compiled_xpath(".//priority-claims")(xml_element)
+            technical_data = get_compiled_xpath(".//technical-data")(xml_element)
             
             # Store original parent as fallback
             original_parent = dates_element.getparent()